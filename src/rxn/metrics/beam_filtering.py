@@ -0,0 +1,136 @@
+"""
+Metrics on the beams restricted to their distinct valid predictions.
+
+After canonicalization, the beams often contain the same prediction several
+times, as well as invalid predictions (empty strings, the fallback value of
+canonicalize_file). The "filtered" metrics only consider, for each sample, the
+first occurrence of each valid prediction, in the original order: top-n then
+refers to the first n distinct valid candidates.
+
+The filtering is applied to the match matrices (see match_matrix()), by
+moving the kept predictions to their position in the filtered beam.
+"""
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import round_trip_from_matches
+from .ranks import first_hit_ranks, hits_from_ranks, top_n_from_ranks
+from .utils import by_n
+
+INVALID_PREDICTION = ""
+
+
+def prediction_ids(
+    predictions: Sequence[str], multiplier: int
+) -> Tuple[np.ndarray, Dict[str, int]]:
+    """
+    Integer identifiers of the predictions, identical for identical strings.
+
+    Returns:
+        Tuple: identifiers, of shape (number of samples, multiplier), and the
+        identifier of every distinct prediction.
+    """
+    index: Dict[str, int] = {}
+    ids = np.fromiter(
+        (index.setdefault(prediction, len(index)) for prediction in predictions),
+        dtype=np.int64,
+        count=len(predictions),
+    )
+    return ids.reshape(-1, multiplier), index
+
+
+def duplicate_mask(ids: np.ndarray) -> np.ndarray:
+    """
+    Which predictions are identical to an earlier prediction of the same sample.
+
+    Args:
+        ids: prediction identifiers, of shape (samples, predictions per sample).
+    """
+    # With a stable sort, the first occurrence comes first among identical ids
+    order = np.argsort(ids, axis=1, kind="stable")
+    sorted_ids = np.take_along_axis(ids, order, axis=1)
+    sorted_duplicates = np.zeros(ids.shape, dtype=bool)
+    sorted_duplicates[:, 1:] = sorted_ids[:, 1:] == sorted_ids[:, :-1]
+
+    duplicates = np.empty_like(sorted_duplicates)
+    np.put_along_axis(duplicates, order, sorted_duplicates, axis=1)
+    return duplicates
+
+
+class FilteredBeams:
+    """
+    Distinct valid predictions of each sample.
+
+    Args:
+        predictions: predictions for all the samples (multiplier per sample).
+        multiplier: number of predictions per sample.
+    """
+
+    def __init__(self, predictions: Sequence[str], multiplier: int):
+        ids, index = prediction_ids(predictions, multiplier)
+        self._set_masks(ids, index.get(INVALID_PREDICTION))
+
+    @classmethod
+    def from_ids(
+        cls, ids: np.ndarray, multiplier: int, invalid_id: Optional[int]
+    ) -> "FilteredBeams":
+        """
+        Build the instance from prediction IDs, identical for identical
+        predictions (see GroundTruth.load_interned_predictions()).
+
+        Args:
+            ids: IDs of the predictions for all the samples.
+            multiplier: number of predictions per sample.
+            invalid_id: ID of the invalid predictions, None if there are none.
+        """
+        beams = cls.__new__(cls)
+        beams._set_masks(ids.reshape(-1, multiplier), invalid_id)
+        return beams
+
+    def _set_masks(self, ids: np.ndarray, invalid_id: Optional[int]) -> None:
+        self.invalid = (
+            ids == invalid_id if invalid_id is not None else np.zeros(ids.shape, bool)
+        )
+        self.duplicate = duplicate_mask(ids) & ~self.invalid
+        self.kept = ~(self.invalid | self.duplicate)
+        # Position of each kept prediction in the filtered beam
+        self.positions = np.cumsum(self.kept, axis=1) - 1
+
+    def compact(self, matches: np.ndarray) -> np.ndarray:
+        """
+        Match matrix of the filtered beams: the values for the kept predictions,
+        moved to their position in the filtered beam, padded with False.
+        """
+        compacted = np.zeros(matches.shape, dtype=bool)
+        rows, columns = np.nonzero(self.kept)
+        compacted[rows, self.positions[rows, columns]] = matches[rows, columns]
+        return compacted
+
+    def top_n(self, matches: np.ndarray) -> Dict[int, float]:
+        """Top-n accuracy (or coverage, for round-trip matches) of the filtered beams."""
+        return top_n_from_ranks(
+            first_hit_ranks(self.compact(matches)), multiplier=matches.shape[1]
+        )
+
+    def hits(self, matches: np.ndarray) -> np.ndarray:
+        """Per-sample values of top_n(), see hits_from_ranks()."""
+        return hits_from_ranks(
+            first_hit_ranks(self.compact(matches)), multiplier=matches.shape[1]
+        )
+
+    def round_trip(
+        self, matches: np.ndarray
+    ) -> Tuple[Dict[int, float], Dict[int, float]]:
+        """Round-trip accuracy and standard deviation of the filtered beams,
+        see round_trip_accuracy()."""
+        return round_trip_from_matches(self.compact(matches))
+
+    def invalid_rate(self) -> Dict[int, float]:
+        """Fraction of invalid predictions, by position in the beam."""
+        return by_n(self.invalid.mean(axis=0))
+
+    def duplicate_rate(self) -> Dict[int, float]:
+        """Fraction of (valid) predictions identical to an earlier prediction of
+        the same sample, by position in the beam."""
+        return by_n(self.duplicate.mean(axis=0))
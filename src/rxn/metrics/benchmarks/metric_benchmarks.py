@@ -0,0 +1,387 @@
+"""
+Benchmarks of the metrics and of the file utilities, on synthetic data.
+
+Each benchmark is run at several scales (numbers of ground truth samples).
+The wall time is the minimum over a few repetitions, and the peak memory
+(as traced by tracemalloc) is measured in a separate run, so that tracing
+does not affect the timings. The results are saved as JSON, to compare
+versions of the package with compare_benchmark_results().
+"""
+import json
+import logging
+import platform
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from rxn.utilities.files import PathLike, named_temporary_directory
+
+from .. import __version__
+from ..compression import load_lines
+from ..metrics_files import ContextFiles, ForwardFiles, RetroFiles
+from .synthetic_data import SyntheticDataConfig, SyntheticDataGenerator
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+DEFAULT_SCALES = [1000, 10000, 100000]
+
+# Benchmarks relying on RDKit for every prediction are limited to smaller scales
+_CHEMISTRY_MAX_SAMPLES = 10000
+
+# Function preparing a benchmark in a directory and returning the function to time
+BenchmarkSetup = Callable[["BenchmarkData"], Callable[[], Any]]
+
+
+class BenchmarkData:
+    """
+    Synthetic results directories for one scale, generated on first use and
+    shared by the benchmarks.
+    """
+
+    def __init__(self, directory: Path, config: SyntheticDataConfig, class_tokens: int):
+        self.directory = directory
+        self.config = config
+        self.class_tokens = class_tokens
+        self._retro: Optional[RetroFiles] = None
+        self._retro_class_tokens: Optional[RetroFiles] = None
+        self._forward: Optional[ForwardFiles] = None
+        self._context: Optional[ContextFiles] = None
+
+    @property
+    def n_samples(self) -> int:
+        return self.config.n_samples
+
+    def retro(self) -> RetroFiles:
+        if self._retro is None:
+            generator = SyntheticDataGenerator(self.config)
+            self._retro = generator.write_retro_files(self.directory / "retro")
+        return self._retro
+
+    def retro_class_tokens(self) -> RetroFiles:
+        if self._retro_class_tokens is None:
+            config = SyntheticDataConfig(**vars(self.config))
+            config.class_tokens = self.class_tokens
+            generator = SyntheticDataGenerator(config)
+            self._retro_class_tokens = generator.write_retro_files(
+                self.directory / "retro_class_tokens"
+            )
+        return self._retro_class_tokens
+
+    def forward(self) -> ForwardFiles:
+        if self._forward is None:
+            generator = SyntheticDataGenerator(self.config)
+            self._forward = generator.write_forward_files(self.directory / "forward")
+        return self._forward
+
+    def context(self) -> ContextFiles:
+        if self._context is None:
+            generator = SyntheticDataGenerator(self.config)
+            self._context = generator.write_context_files(self.directory / "context")
+        return self._context
+
+
+class Benchmark:
+    """
+    Args:
+        name: name of the benchmark.
+        setup: function preparing the benchmark, see BenchmarkSetup.
+        max_samples: largest scale to run the benchmark for.
+    """
+
+    def __init__(
+        self, name: str, setup: BenchmarkSetup, max_samples: Optional[int] = None
+    ):
+        self.name = name
+        self.setup = setup
+        self.max_samples = max_samples
+
+
+def _top_n_accuracy(data: BenchmarkData) -> Callable[[], Any]:
+    from ..metrics import top_n_accuracy
+
+    files = data.forward()
+    gt = load_lines(files.gt_tgt)
+    predictions = load_lines(files.predicted_canonical)
+    return lambda: top_n_accuracy(ground_truth=gt, predictions=predictions)
+
+
+def _round_trip_accuracy(data: BenchmarkData) -> Callable[[], Any]:
+    from ..metrics import round_trip_accuracy
+
+    files = data.retro()
+    gt = load_lines(files.gt_src)
+    predictions = load_lines(files.predicted_products_canonical)
+    return lambda: round_trip_accuracy(ground_truth=gt, predictions=predictions)
+
+
+def _coverage(data: BenchmarkData) -> Callable[[], Any]:
+    from ..metrics import coverage
+
+    files = data.retro()
+    gt = load_lines(files.gt_src)
+    predictions = load_lines(files.predicted_products_canonical)
+    return lambda: coverage(ground_truth=gt, predictions=predictions)
+
+
+def _class_diversity(data: BenchmarkData) -> Callable[[], Any]:
+    from ..metrics import class_diversity
+
+    files = data.retro()
+    gt = load_lines(files.gt_src)
+    predictions = load_lines(files.predicted_products_canonical)
+    classes = load_lines(files.predicted_classes)
+    return lambda: class_diversity(
+        ground_truth=gt, predictions=predictions, predicted_classes=classes
+    )
+
+
+def _true_reactant_accuracy(data: BenchmarkData) -> Callable[[], Any]:
+    from ..true_reactant_accuracy import true_reactant_accuracy
+
+    files = data.retro()
+    gt = load_lines(files.gt_mapped)
+    predictions = load_lines(files.predicted_mapped)
+    return lambda: true_reactant_accuracy(
+        ground_truth_mapped=gt, predictions_mapped=predictions
+    )
+
+
+def _fraction_of_identical_compounds(data: BenchmarkData) -> Callable[[], Any]:
+    from ..context_metrics import fraction_of_identical_compounds
+
+    files = data.context()
+    gt = load_lines(files.gt_tgt)
+    predictions = load_lines(files.predicted_canonical)
+    return lambda: fraction_of_identical_compounds(
+        ground_truth=gt, predictions=predictions
+    )
+
+
+def _reorder_retro_predictions_class_token(data: BenchmarkData) -> Callable[[], Any]:
+    from ..scripts.reorder_retro_predictions_class_token import (
+        reorder_retro_predictions_class_token,
+    )
+
+    files = data.retro_class_tokens()
+    return lambda: reorder_retro_predictions_class_token(
+        ground_truth_file=files.gt_src,
+        predictions_file=files.predicted_canonical,
+        confidences_file=files.predicted_precursors_log_probs,
+        fwd_predictions_file=files.predicted_products_canonical,
+        classes_predictions_file=files.predicted_classes,
+        n_class_tokens=data.class_tokens,
+    )
+
+
+def _chunk_size(data: BenchmarkData) -> int:
+    # Split into four chunks
+    return max(1, -(-data.n_samples // 4))
+
+
+def _ensure_data_dimension(data: BenchmarkData) -> Callable[[], Any]:
+    from ..scripts.ensure_data_dimension import ensure_data_dimension
+
+    files = data.retro()
+    txt_files = [files.gt_src, files.gt_tgt]
+    output_dir = data.directory / "split"
+    return lambda: ensure_data_dimension(
+        txt_files, output_dir, max_dimension=_chunk_size(data)
+    )
+
+
+def _join_data_files(data: BenchmarkData) -> Callable[[], Any]:
+    from ..scripts.ensure_data_dimension import ensure_data_dimension
+    from ..scripts.join_data_files import join_data_files
+
+    files = data.retro()
+    split_dir = data.directory / "split_to_join"
+    ensure_data_dimension(
+        [files.gt_src, files.gt_tgt], split_dir, max_dimension=_chunk_size(data)
+    )
+    joined_dir = data.directory / "joined"
+    return lambda: join_data_files(split_dir, joined_dir)
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    b.name: b
+    for b in [
+        Benchmark("top_n_accuracy", _top_n_accuracy),
+        Benchmark("round_trip_accuracy", _round_trip_accuracy),
+        Benchmark("coverage", _coverage),
+        Benchmark("class_diversity", _class_diversity),
+        Benchmark(
+            "true_reactant_accuracy",
+            _true_reactant_accuracy,
+            max_samples=_CHEMISTRY_MAX_SAMPLES,
+        ),
+        Benchmark(
+            "fraction_of_identical_compounds",
+            _fraction_of_identical_compounds,
+            max_samples=_CHEMISTRY_MAX_SAMPLES,
+        ),
+        Benchmark(
+            "reorder_retro_predictions_class_token",
+            _reorder_retro_predictions_class_token,
+        ),
+        Benchmark("ensure_data_dimension", _ensure_data_dimension),
+        Benchmark("join_data_files", _join_data_files),
+    ]
+}
+
+
+def time_function(fn: Callable[[], Any], repeats: int) -> Dict[str, float]:
+    """Wall times of a function (minimum and mean over the repetitions) and
+    peak traced memory, measured in an additional run."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "min_time_s": min(times),
+        "mean_time_s": sum(times) / len(times),
+        "peak_memory_mb": peak / 1e6,
+    }
+
+
+def run_benchmarks(
+    scales: Iterable[int] = DEFAULT_SCALES,
+    n_best: int = 10,
+    class_tokens: int = 4,
+    repeats: int = 3,
+    names: Optional[Iterable[str]] = None,
+    output_file: Optional[PathLike] = None,
+) -> Dict[str, Any]:
+    """
+    Run the benchmarks.
+
+    Args:
+        scales: numbers of ground truth samples to run the benchmarks for.
+        n_best: number of predictions per sample (and per class token).
+        class_tokens: number of class tokens, for the reordering benchmark.
+        repeats: number of timed runs for each benchmark.
+        names: benchmarks to run, defaults to all of them (see BENCHMARKS).
+        output_file: JSON file to save the results to, if given.
+
+    Returns:
+        Dictionary with the environment and the list of results.
+    """
+    if names is None:
+        names = list(BENCHMARKS)
+    benchmarks = [_get_benchmark(name) for name in names]
+
+    results: List[Dict[str, Any]] = []
+    for n_samples in scales:
+        config = SyntheticDataConfig(n_samples=n_samples, n_best=n_best)
+        with named_temporary_directory() as directory:
+            data = BenchmarkData(directory, config, class_tokens=class_tokens)
+            for benchmark in benchmarks:
+                if (
+                    benchmark.max_samples is not None
+                    and n_samples > benchmark.max_samples
+                ):
+                    logger.info(
+                        f'Skipping "{benchmark.name}" for {n_samples} samples '
+                        f"(limited to {benchmark.max_samples})."
+                    )
+                    continue
+                results.append(_run_benchmark(benchmark, data, repeats))
+
+    return make_report(
+        results,
+        output_file=output_file,
+        n_best=n_best,
+        class_tokens=class_tokens,
+        repeats=repeats,
+    )
+
+
+def make_report(
+    results: List[Dict[str, Any]], output_file: Optional[PathLike], **settings: Any
+) -> Dict[str, Any]:
+    """Report of benchmark results, with the environment and the given
+    settings, saved to the output file if given."""
+    report = {
+        "rxn_metrics_version": __version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **settings,
+        "results": results,
+    }
+    if output_file is not None:
+        with open(output_file, "wt") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f'Benchmark results saved to "{output_file}".')
+    return report
+
+
+def compare_benchmark_results(
+    baseline: Dict[str, Any], current: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """
+    Compare two benchmark reports, as returned by run_benchmarks().
+
+    Returns:
+        For each benchmark and scale present in both, the ratios of the
+        current time and memory to the baseline ones (above 1 for regressions).
+    """
+    baseline_results = {
+        (r["benchmark"], r["n_samples"]): r for r in baseline["results"]
+    }
+    comparison = []
+    for result in current["results"]:
+        reference = baseline_results.get((result["benchmark"], result["n_samples"]))
+        if reference is None:
+            continue
+        comparison.append(
+            {
+                "benchmark": result["benchmark"],
+                "n_samples": result["n_samples"],
+                "time_ratio": _ratio(result["min_time_s"], reference["min_time_s"]),
+                "memory_ratio": _ratio(
+                    result["peak_memory_mb"], reference["peak_memory_mb"]
+                ),
+            }
+        )
+    return comparison
+
+
+def _get_benchmark(name: str) -> Benchmark:
+    try:
+        return BENCHMARKS[name]
+    except KeyError:
+        raise ValueError(
+            f'Unknown benchmark "{name}" (expected one of {list(BENCHMARKS)}).'
+        )
+
+
+def _run_benchmark(
+    benchmark: Benchmark, data: BenchmarkData, repeats: int
+) -> Dict[str, Any]:
+    logger.info(f'Running "{benchmark.name}" for {data.n_samples} samples.')
+    fn = benchmark.setup(data)
+    timings = time_function(fn, repeats=repeats)
+    min_time = timings["min_time_s"]
+    return {
+        "benchmark": benchmark.name,
+        "n_samples": data.n_samples,
+        **timings,
+        "samples_per_s": data.n_samples / min_time if min_time > 0 else None,
+    }
+
+
+def _ratio(value: float, reference: float) -> Optional[float]:
+    if reference == 0:
+        return None
+    return value / reference
@@ -0,0 +1,221 @@
+"""
+End-to-end benchmarks of the retro, forward and context pipelines (preparation
+of the files, class token reordering and evaluation), with the stand-in
+translator instead of the models.
+
+The time spent in the (stand-in) translations is taken from the stage timings
+of the results directory and reported separately, so that the overhead of the
+pipeline itself (I/O, canonicalization, reordering, metrics) can be tracked
+independently of the inference.
+"""
+import logging
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from rxn.utilities.files import PathLike, named_temporary_directory
+
+from ..metrics_files import RetroFiles
+from ..run_metrics import evaluate_metrics, get_metrics_files, run_model_for_metrics
+from ..timing import load_timings
+from ..translators import StandInTranslator, use_translator
+from .metric_benchmarks import DEFAULT_SCALES, make_report
+from .synthetic_data import SyntheticDataConfig, SyntheticDataGenerator
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+PIPELINE_TASKS = ["retro", "forward", "context"]
+
+# Stages of the pipelines corresponding to model inference
+INFERENCE_STAGES = [
+    "translation",
+    "retro_translation",
+    "forward_translation",
+    "classification",
+]
+
+# Placeholder for the models, which the stand-in translator does not need
+_STAND_IN_MODEL = Path("stand-in")
+
+
+def run_pipeline(
+    task: str,
+    src_file: Path,
+    tgt_file: Path,
+    output_dir: Path,
+    n_best: int,
+    class_tokens: Optional[int] = None,
+) -> None:
+    """
+    Run the full pipeline for a task, with the translator currently in use
+    (see use_translator()).
+
+    For retro, the predictions are classified, and reordered if class tokens
+    are given.
+    """
+    if task == "retro":
+        from ..scripts.prepare_retro_metrics import prepare_retro_metrics
+        from ..scripts.reorder_retro_predictions_class_token import (
+            reorder_retro_predictions_class_token,
+        )
+
+        prepare_retro_metrics(
+            precursors_file=tgt_file,
+            products_file=src_file,
+            output_dir=output_dir,
+            retro_model=_STAND_IN_MODEL,
+            forward_model=_STAND_IN_MODEL,
+            classification_model=_STAND_IN_MODEL,
+            batch_size=64,
+            n_best=n_best,
+            gpu=False,
+            beam_size=n_best,
+            class_tokens=class_tokens,
+        )
+        if class_tokens is not None:
+            files = RetroFiles(output_dir)
+            with files.timer.stage("reorder", lines_of=files.predicted_canonical):
+                reorder_retro_predictions_class_token(
+                    ground_truth_file=files.gt_src,
+                    predictions_file=files.predicted_canonical,
+                    confidences_file=files.predicted_precursors_log_probs,
+                    fwd_predictions_file=files.predicted_products_canonical,
+                    classes_predictions_file=files.predicted_classes,
+                    n_class_tokens=class_tokens,
+                )
+    else:
+        run_model_for_metrics(
+            task=task,
+            model_path=_STAND_IN_MODEL,
+            src_file=src_file,
+            tgt_file=tgt_file,
+            output_dir=output_dir,
+            n_best=n_best,
+            beam_size=n_best,
+            batch_size=64,
+            gpu=False,
+        )
+
+    evaluate_metrics(task, output_dir)
+
+
+def run_pipeline_benchmarks(
+    scales: Iterable[int] = DEFAULT_SCALES,
+    n_best: int = 10,
+    class_tokens: Optional[int] = None,
+    lines_per_second: Optional[float] = None,
+    repeats: int = 3,
+    tasks: Optional[Iterable[str]] = None,
+    output_file: Optional[PathLike] = None,
+) -> Dict[str, Any]:
+    """
+    Run the pipeline benchmarks.
+
+    For each task and scale, "min_time_s" is the minimal time of the pipeline
+    excluding the inference, "inference_time_s" and "total_time_s" being
+    the corresponding inference and total times; "stages" gives the wall
+    times of all the stages for that run.
+
+    Args:
+        scales: numbers of ground truth samples to run the pipelines for.
+        n_best: number of predictions per sample (and per class token).
+        class_tokens: number of class tokens for the retro pipeline, if any.
+        lines_per_second: speed of the stand-in translator, None for no delay.
+        repeats: number of timed runs for each pipeline.
+        tasks: pipelines to run, defaults to all of them (see PIPELINE_TASKS).
+        output_file: JSON file to save the results to, if given.
+
+    Returns:
+        Dictionary with the environment and the list of results.
+    """
+    if tasks is None:
+        tasks = PIPELINE_TASKS
+    tasks = list(tasks)
+    for task in tasks:
+        if task not in PIPELINE_TASKS:
+            raise ValueError(
+                f'Unknown pipeline "{task}" (expected one of {PIPELINE_TASKS}).'
+            )
+
+    results: List[Dict[str, Any]] = []
+    for n_samples in scales:
+        generator = SyntheticDataGenerator(SyntheticDataConfig(n_samples=n_samples))
+        with named_temporary_directory() as directory:
+            for task in tasks:
+                src_file = directory / f"{task}_src.txt"
+                tgt_file = directory / f"{task}_tgt.txt"
+                generator.write_ground_truth(task, src_file, tgt_file)
+
+                def run(output_dir: Path) -> None:
+                    # New translator for every run, to start from the same state
+                    translator = StandInTranslator(lines_per_second=lines_per_second)
+                    with use_translator(translator):
+                        run_pipeline(
+                            task, src_file, tgt_file, output_dir, n_best, class_tokens
+                        )
+
+                logger.info(f'Running the "{task}" pipeline for {n_samples} samples.')
+                results.append(
+                    _benchmark_pipeline(task, n_samples, run, directory / task, repeats)
+                )
+
+    return make_report(
+        results,
+        output_file=output_file,
+        n_best=n_best,
+        class_tokens=class_tokens,
+        lines_per_second=lines_per_second,
+        repeats=repeats,
+    )
+
+
+def _benchmark_pipeline(
+    task: str,
+    n_samples: int,
+    run: Callable[[Path], None],
+    directory: Path,
+    repeats: int,
+) -> Dict[str, Any]:
+    runs = []
+    for i in range(repeats):
+        output_dir = directory / f"run_{i}"
+        start = time.perf_counter()
+        run(output_dir)
+        total_time = time.perf_counter() - start
+
+        timings = load_timings(get_metrics_files(task, output_dir).timings_file)
+        inference_time = sum(
+            timings[stage]["wall_time_s"]
+            for stage in INFERENCE_STAGES
+            if stage in timings
+        )
+        runs.append(
+            {
+                "min_time_s": total_time - inference_time,
+                "inference_time_s": inference_time,
+                "total_time_s": total_time,
+                "stages": {
+                    stage: values["wall_time_s"] for stage, values in timings.items()
+                },
+            }
+        )
+
+    tracemalloc.start()
+    try:
+        run(directory / "run_traced")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(runs, key=lambda r: r["min_time_s"])
+    overhead_time = best["min_time_s"]
+    return {
+        "benchmark": f"{task}_pipeline",
+        "n_samples": n_samples,
+        **best,
+        "mean_time_s": sum(r["min_time_s"] for r in runs) / len(runs),
+        "peak_memory_mb": peak / 1e6,
+        "samples_per_s": n_samples / overhead_time if overhead_time > 0 else None,
+    }
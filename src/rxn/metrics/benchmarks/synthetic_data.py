@@ -0,0 +1,317 @@
+"""
+Generation of synthetic results directories, for benchmarking.
+
+The molecules are random chains of C, N and O atoms, which keeps them valid
+(and parseable by RDKit) while being cheap to generate. A reaction combines
+one to three such molecules (the product being the concatenation of their
+SMILES), plus optional reagents. The predictions are derived from the ground
+truth with configurable rates of exact hits, duplicates and invalid SMILES.
+
+Note that the generated SMILES are not canonical; they are simply considered
+as such, the files with "canonical" in their name being copies of the raw
+predictions with empty strings for the invalid SMILES.
+"""
+import random
+from typing import Iterable, List, Optional, Tuple
+
+from rxn.utilities.files import PathLike
+
+from ..compression import dump_lines
+from ..metrics_files import ContextFiles, ForwardFiles, RetroFiles
+
+_ATOMS = ["C", "C", "C", "N", "O"]
+_VALENCES = {"C": 4, "N": 3, "O": 2}
+_REAGENTS = ["O", "CCO", "ClCCl", "CN(C)C=O", "[Na+].[OH-]", "CC(=O)O", "[Pd]"]
+_CLASSES = ["1.2.3", "1.3.7", "2.1.1", "3.1.5", "6.1.1", "7.1.1", "9.3.1"]
+_INVALID_SMILES = ["C1CC(", "CC)N", "X[Y]Z", "c1cccc"]
+# Placeholder for invalid predictions, replaced when writing the files
+_INVALID_MARKER = "<invalid>"
+
+
+class SyntheticDataConfig:
+    """
+    Settings for the generation of synthetic data.
+
+    Args:
+        n_samples: number of ground truth samples.
+        n_best: number of predictions per sample (and per class token).
+        top1_rate: fraction of samples whose first prediction is correct.
+        miss_rate: fraction of samples without any correct prediction. The
+            other samples have their correct prediction at a random later
+            position.
+        duplicate_rate: fraction of predictions duplicating an earlier one.
+        invalid_rate: fraction of predictions being invalid SMILES.
+        round_trip_rate: fraction of valid retro predictions whose forward
+            prediction gives back the ground truth product.
+        class_tokens: number of class tokens (None for a standard model).
+        seed: random seed.
+    """
+
+    def __init__(
+        self,
+        n_samples: int = 1000,
+        n_best: int = 10,
+        top1_rate: float = 0.5,
+        miss_rate: float = 0.1,
+        duplicate_rate: float = 0.05,
+        invalid_rate: float = 0.05,
+        round_trip_rate: float = 0.8,
+        class_tokens: Optional[int] = None,
+        seed: int = 42,
+    ):
+        self.n_samples = n_samples
+        self.n_best = n_best
+        self.top1_rate = top1_rate
+        self.miss_rate = miss_rate
+        self.duplicate_rate = duplicate_rate
+        self.invalid_rate = invalid_rate
+        self.round_trip_rate = round_trip_rate
+        self.class_tokens = class_tokens
+        self.seed = seed
+
+    @property
+    def n_predictions_per_sample(self) -> int:
+        return self.n_best * (self.class_tokens or 1)
+
+
+class _Molecule:
+    """Linear chain of atoms, as plain and atom-mapped SMILES."""
+
+    def __init__(self, atoms: List[str]):
+        self.atoms = atoms
+        self.smiles = "".join(atoms)
+
+    def mapped(self, first_map_number: int) -> str:
+        tokens = []
+        for i, atom in enumerate(self.atoms):
+            degree = (i > 0) + (i < len(self.atoms) - 1)
+            n_hydrogens = _VALENCES[atom] - degree
+            hydrogens = {0: "", 1: "H"}.get(n_hydrogens, f"H{n_hydrogens}")
+            tokens.append(f"[{atom}{hydrogens}:{first_map_number + i}]")
+        return "".join(tokens)
+
+
+class _Reaction:
+    def __init__(self, reactants: List[_Molecule], reagents: List[str]):
+        self.reactants = reactants
+        self.reagents = reagents
+        # Concatenating the chains bonds them together
+        self.product = "".join(r.smiles for r in reactants)
+
+    @property
+    def precursors(self) -> str:
+        return ".".join(sorted([r.smiles for r in self.reactants] + self.reagents))
+
+    @property
+    def reactants_smiles(self) -> str:
+        return ".".join(sorted(r.smiles for r in self.reactants))
+
+    def full_reaction(self) -> str:
+        return f"{self.precursors}>>{self.product}"
+
+    def mapped(self) -> str:
+        mapped_reactants = []
+        map_number = 1
+        for reactant in self.reactants:
+            mapped_reactants.append(reactant.mapped(map_number))
+            map_number += len(reactant.atoms)
+        mapped_product = "".join(mapped_reactants)
+        precursors = ".".join(mapped_reactants + self.reagents)
+        return f"{precursors}>>{mapped_product}"
+
+
+class _InvalidReaction(_Reaction):
+    def __init__(self) -> None:
+        super().__init__([], [])
+        self.product = _INVALID_MARKER
+
+    @property
+    def precursors(self) -> str:
+        return _INVALID_MARKER
+
+    @property
+    def reactants_smiles(self) -> str:
+        return _INVALID_MARKER
+
+    def full_reaction(self) -> str:
+        return _INVALID_MARKER
+
+
+_INVALID = _InvalidReaction()
+
+
+class SyntheticDataGenerator:
+    """Generator of ground truth and predictions, see SyntheticDataConfig."""
+
+    def __init__(self, config: SyntheticDataConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+
+    def molecule(self) -> _Molecule:
+        length = self.rng.randint(2, 8)
+        return _Molecule(["C"] + [self.rng.choice(_ATOMS) for _ in range(length - 1)])
+
+    def reaction(self) -> _Reaction:
+        reactants = [self.molecule() for _ in range(self.rng.randint(1, 3))]
+        reagents = self.rng.sample(_REAGENTS, self.rng.randint(0, 2))
+        return _Reaction(reactants, reagents)
+
+    def ground_truth(self) -> List[_Reaction]:
+        return [self.reaction() for _ in range(self.config.n_samples)]
+
+    def predictions(self, reactions: List[_Reaction]) -> List[_Reaction]:
+        """Predicted reactions: n_best (times the number of class tokens) per
+        ground truth reaction, _INVALID standing for invalid predictions."""
+        predictions: List[_Reaction] = []
+        for reaction in reactions:
+            predictions.extend(self._predictions_for_sample(reaction))
+        return predictions
+
+    def write_ground_truth(
+        self, task: str, src_file: PathLike, tgt_file: PathLike
+    ) -> None:
+        """Write source and target files as given to the preparation of the
+        metrics for the given task ("retro", "forward" or "context")."""
+        reactions = self.ground_truth()
+        if task == "retro":
+            sources = [r.product for r in reactions]
+            targets = [r.precursors for r in reactions]
+        elif task == "forward":
+            sources = [r.precursors for r in reactions]
+            targets = [r.product for r in reactions]
+        elif task == "context":
+            sources = [f"{r.reactants_smiles}>>{r.product}" for r in reactions]
+            targets = [r.full_reaction() for r in reactions]
+        else:
+            raise ValueError(f'Unknown task: "{task}".')
+        dump_lines(sources, src_file)
+        dump_lines(targets, tgt_file)
+
+    def write_retro_files(self, directory: PathLike) -> RetroFiles:
+        """Write the files of a results directory for retro metrics, including
+        the classes and atom-mapped reactions. With class tokens, the
+        predictions are the ones before reordering."""
+        files = RetroFiles(directory)
+        files.directory.mkdir(parents=True, exist_ok=True)
+        reactions = self.ground_truth()
+        predictions = self.predictions(reactions)
+        multiplier = self.config.n_predictions_per_sample
+
+        dump_lines((r.product for r in reactions), files.gt_src)
+        dump_lines((r.precursors for r in reactions), files.gt_tgt)
+        dump_lines((r.mapped() for r in reactions), files.gt_mapped)
+
+        raw, canonical = self._raw_and_canonical(p.precursors for p in predictions)
+        dump_lines(raw, files.predicted)
+        dump_lines(canonical, files.predicted_canonical)
+        dump_lines(
+            self._log_probs(len(reactions)), files.predicted_precursors_log_probs
+        )
+
+        forward_products = []
+        for i, prediction in enumerate(predictions):
+            gt = reactions[i // multiplier]
+            if not canonical[i]:
+                forward_products.append("")
+            elif self.rng.random() < self.config.round_trip_rate:
+                forward_products.append(gt.product)
+            else:
+                forward_products.append(prediction.product)
+        dump_lines(forward_products, files.predicted_products)
+        dump_lines(forward_products, files.predicted_products_canonical)
+        dump_lines(self._log_probs(len(reactions)), files.predicted_products_log_probs)
+
+        dump_lines(
+            ("" if not c else self.rng.choice(_CLASSES) for c in canonical),
+            files.predicted_classes,
+        )
+        dump_lines(
+            ("" if not c else p.mapped() for p, c in zip(predictions, canonical)),
+            files.predicted_mapped,
+        )
+        return files
+
+    def write_forward_files(self, directory: PathLike) -> ForwardFiles:
+        """Write the files of a results directory for forward metrics."""
+        files = ForwardFiles(directory)
+        files.directory.mkdir(parents=True, exist_ok=True)
+        reactions = self.ground_truth()
+        predictions = self.predictions(reactions)
+
+        dump_lines((r.precursors for r in reactions), files.gt_src)
+        dump_lines((r.product for r in reactions), files.gt_tgt)
+        raw, canonical = self._raw_and_canonical(p.product for p in predictions)
+        dump_lines(raw, files.predicted)
+        dump_lines(canonical, files.predicted_canonical)
+        return files
+
+    def write_context_files(self, directory: PathLike) -> ContextFiles:
+        """Write the files of a results directory for context metrics."""
+        files = ContextFiles(directory)
+        files.directory.mkdir(parents=True, exist_ok=True)
+        reactions = self.ground_truth()
+        predictions = self.predictions(reactions)
+
+        dump_lines(
+            (f"{r.reactants_smiles}>>{r.product}" for r in reactions), files.gt_src
+        )
+        dump_lines((r.full_reaction() for r in reactions), files.gt_tgt)
+        raw, canonical = self._raw_and_canonical(p.full_reaction() for p in predictions)
+        dump_lines(raw, files.predicted)
+        dump_lines(canonical, files.predicted_canonical)
+        return files
+
+    def _predictions_for_sample(self, reaction: _Reaction) -> List[_Reaction]:
+        config = self.config
+        predictions: List[_Reaction] = []
+        correct_rank = self._correct_rank()
+        for rank in range(config.n_predictions_per_sample):
+            draw = self.rng.random()
+            if rank == correct_rank:
+                predictions.append(reaction)
+            elif predictions and draw < config.duplicate_rate:
+                predictions.append(self.rng.choice(predictions))
+            elif draw < config.duplicate_rate + config.invalid_rate:
+                predictions.append(_INVALID)
+            else:
+                predictions.append(self._variant(reaction))
+        return predictions
+
+    def _correct_rank(self) -> Optional[int]:
+        """Position of the correct prediction of a sample, None if missing."""
+        config = self.config
+        draw = self.rng.random()
+        if draw < config.top1_rate:
+            return 0
+        if draw < config.top1_rate + config.miss_rate:
+            return None
+        if config.n_predictions_per_sample == 1:
+            return None
+        return self.rng.randrange(1, config.n_predictions_per_sample)
+
+    def _variant(self, reaction: _Reaction) -> _Reaction:
+        """Reaction differing from the given one by one reactant or the reagents."""
+        reactants = list(reaction.reactants)
+        if self.rng.random() < 0.5:
+            reactants[self.rng.randrange(len(reactants))] = self.molecule()
+            return _Reaction(reactants, reaction.reagents)
+        return _Reaction(reactants, self.rng.sample(_REAGENTS, self.rng.randint(0, 2)))
+
+    def _raw_and_canonical(self, smiles: Iterable[str]) -> Tuple[List[str], List[str]]:
+        raw = list(smiles)
+        canonical = ["" if s == _INVALID_MARKER else s for s in raw]
+        raw = [
+            self.rng.choice(_INVALID_SMILES) if s == _INVALID_MARKER else s for s in raw
+        ]
+        return raw, canonical
+
+    def _log_probs(self, n_samples: int) -> List[str]:
+        """Decreasing log probabilities for the n_best predictions of each
+        sample (and class token)."""
+        log_probs = []
+        for _ in range(n_samples * (self.config.class_tokens or 1)):
+            value = 0.0
+            for _ in range(self.config.n_best):
+                value -= self.rng.expovariate(2.0)
+                log_probs.append(f"{value:.4f}")
+        return log_probs
@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from rxn.utilities.files import PathLike
+
+from .compression import iterate_lines, resolve_path
+from .interning import StringTable
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class BinaryCache:
+    """
+    Binary sidecar of the text files of a results directory.
+
+    Each cached file is stored as an array of int32 IDs (.npy, memory-mapped
+    when loaded) into a string table shared by all the files of the directory.
+    Predictions are very redundant (same precursors in several beams, same
+    products or classes for many samples), so that loading from the cache is
+    much faster than parsing the text files again.
+
+    An index records the size and modification time of the text files when
+    they were cached; the cached version is only used if they are unchanged.
+    """
+
+    def __init__(self, directory: PathLike):
+        self.directory = Path(directory)
+        self.index_file = self.directory / "index.json"
+        self.strings_file = self.directory / "strings.txt"
+
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._strings: Optional[List[str]] = None
+        self._table: Optional[StringTable] = None
+        # Number of strings of the table already written to the strings file
+        self._n_saved_strings = 0
+
+    def load(self, filename: PathLike) -> Tuple[np.ndarray, List[str]]:
+        """
+        Load a text file through the cache, caching it first if necessary.
+
+        Returns:
+            Tuple: array of IDs for the lines of the file, and the string table
+            to convert them to the actual strings.
+        """
+        path = resolve_path(filename)
+        ids_file = self._ids_file(path)
+        stat = path.stat()
+        entry = self._get_index().get(path.name)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and ids_file.exists()
+        ):
+            ids: np.ndarray = np.load(ids_file, mmap_mode="r")
+            return ids, self._get_strings()
+
+        logger.info(f'Caching "{path}" to "{self.directory}".')
+        table = self._get_table()
+        ids = table.add_all(iterate_lines(path))
+        try:
+            self._save(path, ids, stat)
+        except OSError as e:
+            logger.warning(f'Could not write the binary cache for "{path}": {e}')
+        return ids, table.strings
+
+    def load_lines(self, filename: PathLike) -> List[str]:
+        """Load the lines of a text file through the cache."""
+        ids, strings = self.load(filename)
+        return [strings[i] for i in ids.tolist()]
+
+    def _ids_file(self, path: Path) -> Path:
+        return self.directory / f"{path.name}.ids.npy"
+
+    def _get_index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is None:
+            self._index = {}
+            if self.index_file.exists():
+                with open(self.index_file, "rt") as f:
+                    self._index = json.load(f)
+        return self._index
+
+    def _get_strings(self) -> List[str]:
+        if self._table is not None:
+            return self._table.strings
+        if self._strings is None:
+            self._strings = []
+            if self.strings_file.exists():
+                with open(self.strings_file, "rt") as f:
+                    # Each string is followed by a newline
+                    self._strings = f.read().split("\n")[:-1]
+            self._n_saved_strings = len(self._strings)
+        return self._strings
+
+    def _get_table(self) -> StringTable:
+        if self._table is None:
+            self._table = StringTable(self._get_strings())
+            self._strings = None
+        return self._table
+
+    def _save(self, path: Path, ids: np.ndarray, stat: os.stat_result) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        table = self._get_table()
+
+        # The string table is only ever appended to, so that the IDs of the
+        # files cached earlier stay valid.
+        with open(self.strings_file, "at") as f:
+            f.writelines(f"{s}\n" for s in table.strings[self._n_saved_strings :])
+        self._n_saved_strings = len(table)
+
+        tmp_ids_file = self.directory / f"{path.name}.tmp.npy"
+        np.save(tmp_ids_file, ids.astype(np.int32))
+        os.replace(tmp_ids_file, self._ids_file(path))
+
+        index = self._get_index()
+        index[path.name] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "n_lines": len(ids),
+        }
+        tmp_index_file = self.directory / "index.json.tmp"
+        with open(tmp_index_file, "wt") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_index_file, self.index_file)
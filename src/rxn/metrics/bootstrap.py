@@ -0,0 +1,180 @@
+"""
+Bootstrap confidence intervals for the metrics averaged over the samples.
+
+The metrics are given as per-sample arrays, of shape (samples,) or (samples,
+predictions per sample) for the top-n metrics; the metric is the mean over the
+samples (axis 0).
+
+Instead of drawing and gathering N sample indices per resample, the samples
+are grouped by identical per-sample values (for most metrics, there are only
+a few distinct rows: hit or miss at each n), and a resample is represented by
+how many times it draws each group. The means of a batch of resamples are
+then one matrix product. Each metric is grouped (and resampled) separately,
+so that one metric with many distinct values does not slow down the others.
+"""
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_N_RESAMPLES = 1000
+DEFAULT_CONFIDENCE_LEVEL = 0.95
+# Maximal number of group counts to draw at once, to limit the memory
+DEFAULT_BATCH_ELEMENTS = 2**24
+
+
+def group_samples(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Group the samples with identical values.
+
+    Args:
+        values: per-sample values, of shape (samples, columns).
+
+    Returns:
+        Tuple: distinct rows, of shape (groups, columns), and number of samples
+        in each group.
+    """
+    # Code of every row, combining the codes of its values in each column;
+    # much faster than np.unique(axis=0), which sorts the rows lexicographically
+    row_codes = np.zeros(len(values), dtype=np.int64)
+    n_codes = 1
+    for column in values.T:
+        column_values, column_codes = np.unique(column, return_inverse=True)
+        if n_codes * len(column_values) > np.iinfo(np.int64).max // 2:
+            # Too many combinations for an int64: compact the codes first
+            _, row_codes = np.unique(row_codes, return_inverse=True)
+            n_codes = int(row_codes.max()) + 1
+        row_codes = row_codes * len(column_values) + column_codes.reshape(-1)
+        n_codes *= len(column_values)
+
+    _, first_rows, counts = np.unique(row_codes, return_index=True, return_counts=True)
+    return values[first_rows], counts
+
+
+def resample_counts(
+    group_sizes: np.ndarray,
+    n_resamples: int,
+    rng: np.random.Generator,
+    batch_elements: int = DEFAULT_BATCH_ELEMENTS,
+) -> Iterator[np.ndarray]:
+    """
+    Number of times each group is drawn in bootstrap resamples, in batches.
+
+    Drawing N samples with replacement among groups of sizes s_i is a
+    multinomial draw with probabilities s_i / N. When there are about as many
+    groups as samples, drawing sample indices is cheaper.
+
+    Args:
+        group_sizes: number of samples in each group.
+        n_resamples: total number of resamples.
+        rng: random number generator.
+        batch_elements: maximal number of values per batch.
+
+    Returns:
+        Iterator over arrays of shape (resamples in the batch, groups).
+    """
+    n_groups = len(group_sizes)
+    n_samples = int(group_sizes.sum())
+    draw_indices = 2 * n_groups > n_samples
+    batch_size = max(
+        1, batch_elements // max(n_samples if draw_indices else n_groups, 1)
+    )
+    if draw_indices:
+        # Group of every sample
+        index_dtype = np.int32 if n_samples <= np.iinfo(np.int32).max else np.int64
+        sample_groups = np.repeat(np.arange(n_groups, dtype=np.int64), group_sizes)
+
+    for start in range(0, n_resamples, batch_size):
+        size = min(batch_size, n_resamples - start)
+        if not draw_indices:
+            yield rng.multinomial(n_samples, group_sizes / n_samples, size=size)
+            continue
+
+        indices = rng.integers(0, n_samples, size=(size, n_samples), dtype=index_dtype)
+        groups = sample_groups[indices]
+        # One bincount for the whole batch, with an offset per resample
+        groups += n_groups * np.arange(size)[:, np.newaxis]
+        yield np.bincount(groups.ravel(), minlength=size * n_groups).reshape(
+            size, n_groups
+        )
+
+
+def bootstrap_means(
+    values: np.ndarray,
+    n_resamples: int = DEFAULT_N_RESAMPLES,
+    seed: Optional[int] = 0,
+    batch_elements: int = DEFAULT_BATCH_ELEMENTS,
+) -> np.ndarray:
+    """
+    Means over the samples of bootstrap resamples.
+
+    Args:
+        values: per-sample values, of shape (samples, columns).
+        n_resamples: number of resamples.
+        seed: seed for the random number generator; None for a random one.
+        batch_elements: maximal number of values per batch of resamples.
+
+    Returns:
+        Array of shape (resamples, columns).
+    """
+    rows, group_sizes = group_samples(values)
+    rows = rows.astype(np.float64)
+    rng = np.random.default_rng(seed)
+
+    means = np.empty((n_resamples, values.shape[1]), dtype=np.float64)
+    start = 0
+    for counts in resample_counts(group_sizes, n_resamples, rng, batch_elements):
+        means[start : start + len(counts)] = counts @ rows
+        start += len(counts)
+    means /= len(values)
+    return means
+
+
+def bootstrap_confidence_intervals(
+    per_sample_metrics: Mapping[str, np.ndarray],
+    n_resamples: int = DEFAULT_N_RESAMPLES,
+    confidence_level: float = DEFAULT_CONFIDENCE_LEVEL,
+    seed: Optional[int] = 0,
+) -> Dict[str, Any]:
+    """
+    Percentile bootstrap confidence intervals of metrics.
+
+    Args:
+        per_sample_metrics: per-sample values of the metrics, by metric name;
+            of shape (samples,) or (samples, predictions per sample). All the
+            arrays must have the same number of samples.
+        n_resamples: number of resamples.
+        confidence_level: probability covered by the intervals.
+        seed: seed for the random number generator; None for a random one.
+
+    Raises:
+        ValueError: for a confidence level outside of (0, 1), or arrays with
+            different numbers of samples.
+
+    Returns:
+        Dictionary with the interval of each metric, by metric name: a
+        {"low": ..., "high": ...} dictionary for the metrics of shape
+        (samples,), and a dictionary of them by top-n otherwise.
+    """
+    if not 0 < confidence_level < 1:
+        raise ValueError(f"Invalid confidence level: {confidence_level}")
+    if not per_sample_metrics:
+        return {}
+    n_samples = {len(values) for values in per_sample_metrics.values()}
+    if len(n_samples) != 1:
+        raise ValueError(f"Inconsistent numbers of samples: {sorted(n_samples)}")
+    if n_samples == {0}:
+        return {}
+
+    alpha = (1 - confidence_level) / 2
+    intervals: Dict[str, Any] = {}
+    for name, values in per_sample_metrics.items():
+        means = bootstrap_means(
+            values.reshape(len(values), -1), n_resamples=n_resamples, seed=seed
+        )
+        lows, highs = np.quantile(means, [alpha, 1 - alpha], axis=0)
+        by_n = {
+            i + 1: {"low": float(low), "high": float(high)}
+            for i, (low, high) in enumerate(zip(lows, highs))
+        }
+        intervals[name] = by_n if values.ndim > 1 else by_n[1]
+    return intervals
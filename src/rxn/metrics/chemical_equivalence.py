@@ -0,0 +1,264 @@
+"""
+Top-n accuracy at several levels of chemical equivalence ("tiers"), beyond the
+exact equality of the canonical SMILES:
+
+    - "exact": identical canonical SMILES (same as top_n_accuracy());
+    - "stereo-agnostic": identical after removing the stereochemistry;
+    - "charge-normalized": identical after removing the stereochemistry and
+      neutralizing the molecules;
+    - "inchikey-connectivity": identical first block of the InChIKey, i.e.
+      same connectivity.
+
+The keys of every unique molecule are computed once with RDKit (in a process
+pool for large sets), and can be stored in a cache file to be reused by later
+evaluations. All the tiers are then evaluated from integer key IDs.
+"""
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rdkit import Chem, rdBase
+from rdkit.Chem import rdinchi
+from rdkit.Chem.MolStandardize import rdMolStandardize
+from rxn.utilities.containers import chunker
+from rxn.utilities.files import PathLike
+
+from .interning import StringTable
+from .ranks import first_hit_ranks, top_n_from_ranks
+from .utils import get_sequence_multiplier
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+TIERS = ["exact", "stereo-agnostic", "charge-normalized", "inchikey-connectivity"]
+
+# Keys of a molecule for the tiers after "exact", None for invalid molecules
+MoleculeKeys = Optional[Tuple[str, ...]]
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def molecule_keys(smiles: str) -> MoleculeKeys:
+    """Keys of a molecule (SMILES without "."), for the tiers after "exact"."""
+    try:
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            return None
+        inchi = rdinchi.MolToInchi(mol)[0]
+        connectivity = rdinchi.InchiToInchiKey(inchi).split("-")[0] if inchi else ""
+
+        Chem.RemoveStereochemistry(mol)
+        stereo_agnostic = Chem.MolToSmiles(mol)
+        neutral = rdMolStandardize.Uncharger().uncharge(mol)
+        charge_normalized = Chem.MolToSmiles(neutral)
+    except Exception as e:
+        logger.debug(f'Could not compute the keys of "{smiles}": {e}')
+        return None
+
+    # Molecules without InChI (e.g. "*") only match on the SMILES-based keys
+    return stereo_agnostic, charge_normalized, connectivity or stereo_agnostic
+
+
+def _compute_molecule_keys(molecules: List[str]) -> List[MoleculeKeys]:
+    # Silence the RDKit errors for the invalid molecules
+    block_logs = rdBase.BlockLogs()
+    try:
+        return [molecule_keys(molecule) for molecule in molecules]
+    finally:
+        del block_logs
+
+
+class MolecularKeyCache:
+    """
+    Keys of molecules for the equivalence tiers, computed only once.
+
+    Args:
+        cache_file: JSON file to load the keys computed in earlier evaluations
+            from, and to save the new ones to. Only in memory if None.
+    """
+
+    def __init__(self, cache_file: Optional[PathLike] = None):
+        self.cache_file = None if cache_file is None else Path(cache_file)
+        self._keys: Optional[Dict[str, MoleculeKeys]] = None
+
+    def get_keys(
+        self,
+        molecules: Iterable[str],
+        n_workers: int = 1,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Dict[str, MoleculeKeys]:
+        """
+        Get the keys of the given molecules, computing the missing ones.
+
+        Args:
+            molecules: molecule SMILES (possibly repeated).
+            n_workers: number of processes to compute the missing keys with.
+            chunk_size: number of molecules per task of the process pool.
+
+        Returns:
+            Dictionary with the keys of (at least) the given molecules.
+        """
+        keys = self._get_all_keys()
+        missing = sorted({m for m in molecules if m not in keys})
+        if not missing:
+            return keys
+
+        logger.info(f"Computing the equivalence keys of {len(missing)} molecules...")
+        chunks = list(chunker(missing, chunk_size=chunk_size))
+        if n_workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                results = list(executor.map(_compute_molecule_keys, chunks))
+        else:
+            results = [_compute_molecule_keys(chunk) for chunk in chunks]
+        for chunk, chunk_keys in zip(chunks, results):
+            keys.update(zip(chunk, chunk_keys))
+
+        if self.cache_file is not None:
+            try:
+                _save_keys(keys, self.cache_file)
+            except OSError as e:
+                logger.warning(f'Could not save the keys to "{self.cache_file}": {e}')
+        return keys
+
+    def _get_all_keys(self) -> Dict[str, MoleculeKeys]:
+        if self._keys is None:
+            self._keys = {}
+            if self.cache_file is not None and self.cache_file.exists():
+                with open(self.cache_file, "rt") as f:
+                    self._keys = {
+                        molecule: None if keys is None else tuple(keys)
+                        for molecule, keys in json.load(f).items()
+                    }
+        return self._keys
+
+
+def _save_keys(keys: Dict[str, MoleculeKeys], cache_file: Path) -> None:
+    # Written under a temporary name, so that an interrupted write does not
+    # leave a truncated cache behind
+    tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+    with open(tmp_file, "wt") as f:
+        json.dump(keys, f)
+    os.replace(tmp_file, cache_file)
+
+
+def tiered_accuracy(
+    ground_truth: Sequence[str],
+    predictions: Sequence[str],
+    key_cache: Optional[MolecularKeyCache] = None,
+    n_workers: int = 1,
+) -> Dict[str, Dict[int, float]]:
+    """
+    Top-n accuracy for each equivalence tier (see TIERS).
+
+    Args:
+        ground_truth: canonical SMILES of the ground truth.
+        predictions: canonical SMILES of the predictions.
+        key_cache: cache for the keys of the molecules, in memory only if None.
+        n_workers: number of processes to compute the missing keys with.
+
+    Raises:
+        ValueError: if the list sizes are incompatible, forwarded from get_sequence_multiplier().
+
+    Returns:
+        Dictionary of top-n accuracy values, by tier.
+    """
+    multiplier = get_sequence_multiplier(
+        ground_truth=ground_truth, predictions=predictions
+    )
+    ranks = tiered_first_hit_ranks(
+        ground_truth, predictions, key_cache=key_cache, n_workers=n_workers
+    )
+    return {
+        tier: top_n_from_ranks(tier_ranks, multiplier)
+        for tier, tier_ranks in ranks.items()
+    }
+
+
+def tiered_first_hit_ranks(
+    ground_truth: Sequence[str],
+    predictions: Sequence[str],
+    key_cache: Optional[MolecularKeyCache] = None,
+    n_workers: int = 1,
+) -> Dict[str, np.ndarray]:
+    """
+    First-hit ranks of the predictions for each equivalence tier (see TIERS
+    and rxn.metrics.ranks).
+
+    The ground truth and predictions are sets of molecules ("A.B"); two sets
+    are equivalent for a tier if the sorted keys of their molecules are
+    identical. Empty predictions never match, and predictions that RDKit
+    cannot parse only match for the "exact" tier.
+
+    Args:
+        ground_truth: canonical SMILES of the ground truth.
+        predictions: canonical SMILES of the predictions.
+        key_cache: cache for the keys of the molecules, in memory only if None.
+        n_workers: number of processes to compute the missing keys with.
+
+    Raises:
+        ValueError: if the list sizes are incompatible, forwarded from get_sequence_multiplier().
+
+    Returns:
+        First-hit ranks of the samples, by tier.
+    """
+    multiplier = get_sequence_multiplier(
+        ground_truth=ground_truth, predictions=predictions
+    )
+    if key_cache is None:
+        key_cache = MolecularKeyCache()
+
+    # The predictions are very redundant: work with the unique SMILES
+    unique_smiles = StringTable()
+    gt_ids = unique_smiles.add_all(ground_truth)
+    prediction_ids = unique_smiles.add_all(predictions)
+
+    keys = key_cache.get_keys(
+        (m for smiles in unique_smiles.strings for m in _molecules(smiles)),
+        n_workers=n_workers,
+    )
+    # Shape: (unique SMILES, tiers); -1 for the invalid ones
+    tier_ids = _tier_ids(unique_smiles.strings, keys)
+
+    ranks: Dict[str, np.ndarray] = {}
+    for tier_index, tier in enumerate(TIERS):
+        gt_tier_ids = tier_ids[gt_ids, tier_index]
+        predicted_tier_ids = tier_ids[prediction_ids, tier_index].reshape(
+            -1, multiplier
+        )
+        matches = (predicted_tier_ids == gt_tier_ids[:, np.newaxis]) & (
+            gt_tier_ids[:, np.newaxis] != -1
+        )
+        ranks[tier] = first_hit_ranks(matches)
+    return ranks
+
+
+def _molecules(smiles: str) -> List[str]:
+    return smiles.split(".") if smiles else []
+
+
+def _tier_ids(
+    unique_smiles: Sequence[str], molecule_keys: Dict[str, MoleculeKeys]
+) -> np.ndarray:
+    """IDs of the SMILES for every tier; identical IDs for equivalent SMILES,
+    -1 for invalid ones."""
+    tier_tables = [StringTable() for _ in TIERS]
+    ids = np.full((len(unique_smiles), len(TIERS)), -1, dtype=np.int64)
+    for i, smiles in enumerate(unique_smiles):
+        molecules = _molecules(smiles)
+        if not molecules:
+            continue
+        # The exact tier does not depend on RDKit
+        ids[i, 0] = tier_tables[0].add(smiles)
+
+        keys = [molecule_keys[m] for m in molecules]
+        valid_keys = [k for k in keys if k is not None]
+        if len(valid_keys) != len(keys):
+            continue
+        for tier_index in range(1, len(TIERS)):
+            tier_key = ".".join(sorted(k[tier_index - 1] for k in valid_keys))
+            ids[i, tier_index] = tier_tables[tier_index].add(tier_key)
+    return ids
@@ -1,7 +1,6 @@
 from typing import Optional
 
-from rxn.utilities.files import dump_list_to_file, iterate_lines_from_file
-
+from .compression import dump_lines, iterate_lines
 from .metrics_files import RetroFiles
 
 
@@ -19,16 +18,17 @@ def maybe_prepare_class_token_files(
 
     class_token_products = (
         f"{convert_class_token_idx_for_translation_models(class_token_idx)}{line}"
-        for line in iterate_lines_from_file(retro_files.gt_src)
+        for line in iterate_lines(retro_files.gt_src)
         for class_token_idx in range(class_tokens)
     )
     class_token_precursors = (
-        line
-        for line in iterate_lines_from_file(retro_files.gt_tgt)
-        for _ in range(class_tokens)
+        line for line in iterate_lines(retro_files.gt_tgt) for _ in range(class_tokens)
+    )
+    dump_lines(class_token_products, retro_files.class_token_products)
+    dump_lines(class_token_precursors, retro_files.class_token_precursors)
+    retro_files.record(
+        retro_files.class_token_products, retro_files.class_token_precursors
     )
-    dump_list_to_file(class_token_products, retro_files.class_token_products)
-    dump_list_to_file(class_token_precursors, retro_files.class_token_precursors)
 
 
 def convert_class_token_idx_for_translation_models(class_token_idx: int) -> str:
@@ -3,15 +3,16 @@ from pathlib import Path
 from typing import Optional, Union
 
 from rxn.chemutils.tokenization import file_is_tokenized, tokenize_file
-from rxn.onmt_utils import translate
-from rxn.utilities.files import dump_list_to_file, is_path_exists_or_creatable
+from rxn.utilities.files import is_path_exists_or_creatable
 
+from .compression import dump_lines
 from .metrics_files import RetroFiles
 from .tokenize_file import (
     classification_file_is_tokenized,
     detokenize_classification_file,
     tokenize_classification_file,
 )
+from .translators import get_translator
 from .utils import combine_precursors_and_products_from_files
 
 logger = logging.getLogger(__name__)
@@ -31,22 +32,25 @@ def maybe_classify_predictions(
     if classification_model is None:
         return
 
-    create_rxn_from_files(
-        retro_files.predicted_canonical,
-        retro_files.predicted_products_canonical,
-        retro_files.predicted_rxn_canonical,
-    )
-
-    classification_translation(
-        src_file=retro_files.predicted_rxn_canonical,
-        tgt_file=None,
-        pred_file=retro_files.predicted_classes,
-        model=classification_model,
-        n_best=1,
-        beam_size=5,
-        batch_size=batch_size,
-        gpu=gpu,
-    )
+    with retro_files.timer.stage(
+        "classification", lines_of=retro_files.predicted_classes
+    ):
+        create_rxn_from_files(
+            retro_files.predicted_canonical,
+            retro_files.predicted_products_canonical,
+            retro_files.predicted_rxn_canonical,
+        )
+
+        get_translator().classify(
+            src_file=retro_files.predicted_rxn_canonical,
+            pred_file=retro_files.predicted_classes,
+            model=classification_model,
+            batch_size=batch_size,
+            gpu=gpu,
+        )
+        retro_files.record(
+            retro_files.predicted_rxn_canonical, retro_files.predicted_classes
+        )
 
 
 def create_rxn_from_files(
@@ -57,7 +61,7 @@ def create_rxn_from_files(
     logger.info(
         f'Combining files "{input_file_precursors}" and "{input_file_products}" -> "{output_file}".'
     )
-    dump_list_to_file(
+    dump_lines(
         combine_precursors_and_products_from_files(
             precursors_file=input_file_precursors,
             products_file=input_file_products,
@@ -96,6 +100,10 @@ def classification_translation(
         gpu: whether to use the GPU.
         max_length: maximum sequence length.
     """
+    # Imported here so that the pipelines can run with other translators
+    # without OpenNMT, see rxn.metrics.translators.
+    from rxn.onmt_utils import translate
+
     if not is_path_exists_or_creatable(pred_file):
         raise RuntimeError(f'The file "{pred_file}" cannot be created.')
 
@@ -0,0 +1,193 @@
+"""
+Transparent reading and writing of compressed text files.
+
+The compression is determined from the file extension (".gz" for gzip, ".zst"
+for zstd; the latter requires the "zstandard" package). When a file does not
+exist, readers look for a compressed variant of it (f.i. "gt_src.txt.gz" for
+"gt_src.txt"), so that results directories can be compressed as a whole.
+
+Compressed files are decompressed in a background thread, so that the
+decompression overlaps with the parsing of the lines.
+"""
+import codecs
+import gzip
+import io
+import itertools
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import IO, Any, Callable, Generator, Iterable, Iterator, List, Optional
+
+from rxn.utilities.files import PathLike, dump_list_to_file, iterate_lines_from_file
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+GZIP_EXTENSION = ".gz"
+ZSTD_EXTENSION = ".zst"
+COMPRESSED_EXTENSIONS = [GZIP_EXTENSION, ZSTD_EXTENSION]
+
+# Characters stripped from the end of the lines, as by
+# rxn.utilities.files.iterate_lines_from_file (see also LineIndex)
+LINE_ENDINGS = "\r\n"
+
+_BLOCK_SIZE = 1 << 20
+# Maximal number of decompressed blocks waiting to be parsed
+_QUEUE_SIZE = 16
+
+
+def compression_of(filename: PathLike) -> Optional[str]:
+    """Get the compression extension of a file, None if it is not compressed."""
+    suffix = Path(filename).suffix
+    return suffix if suffix in COMPRESSED_EXTENSIONS else None
+
+
+def resolve_path(filename: PathLike) -> Path:
+    """
+    Get the path of the file to read: the file itself if it exists, or else
+    its compressed variant, if any.
+    """
+    path = Path(filename)
+    if path.exists():
+        return path
+    for extension in COMPRESSED_EXTENSIONS:
+        compressed = Path(str(path) + extension)
+        if compressed.exists():
+            return compressed
+    return path
+
+
+def exists(filename: PathLike) -> bool:
+    """Whether a file exists, in plain or compressed form."""
+    return resolve_path(filename).exists()
+
+
+def open_binary(filename: PathLike, mode: str = "rb") -> IO[bytes]:
+    """Open a file in binary mode ("rb" or "wb"), (de)compressing it if needed."""
+    compression = compression_of(filename)
+    if compression == GZIP_EXTENSION:
+        # Level 6 compresses almost as well as 9, several times faster
+        return gzip.open(filename, mode, compresslevel=6)  # type: ignore
+    if compression == ZSTD_EXTENSION:
+        return _open_zstd(filename, mode)
+    return open(filename, mode)
+
+
+def iterate_lines(filename: PathLike) -> Generator[str, None, None]:
+    """
+    Iterate over the lines of a (possibly compressed) file, without the line
+    endings; equivalent to rxn.utilities.files.iterate_lines_from_file.
+    """
+    path = resolve_path(filename)
+    if compression_of(path) is None:
+        yield from iterate_lines_from_file(path)
+        return
+
+    # Universal newlines, as when reading the plain files in text mode; the
+    # decoder keeps the incomplete characters and "\r" at the end of a block
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder("utf-8")(), translate=True
+    )
+    blocks = _iterate_blocks_in_background(lambda: open_binary(path))
+    remainder = ""
+    for text in itertools.chain(
+        (decoder.decode(block) for block in blocks), [decoder.decode(b"", final=True)]
+    ):
+        lines = (remainder + text).split("\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line.rstrip(LINE_ENDINGS)
+    if remainder:
+        yield remainder.rstrip(LINE_ENDINGS)
+
+
+def load_lines(filename: PathLike) -> List[str]:
+    """Load the lines of a (possibly compressed) file."""
+    return list(iterate_lines(filename))
+
+
+def iterate_blocks(filename: PathLike) -> Iterator[bytes]:
+    """Iterate over the (decompressed) content of a file, by blocks."""
+    path = resolve_path(filename)
+    if compression_of(path) is None:
+        with open(path, "rb") as f:
+            yield from iter(lambda: f.read(_BLOCK_SIZE), b"")
+        return
+    yield from _iterate_blocks_in_background(lambda: open_binary(path))
+
+
+def dump_lines(lines: Iterable[str], filename: PathLike) -> None:
+    """Write lines to a file, compressed according to its extension;
+    equivalent to rxn.utilities.files.dump_list_to_file."""
+    if compression_of(filename) is None:
+        dump_list_to_file(lines, filename)
+        return
+
+    with open_binary(filename, "wb") as f:
+        for line in lines:
+            f.write(f"{line}\n".encode())
+
+
+def _open_zstd(filename: PathLike, mode: str) -> IO[bytes]:
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError(
+            f'The package "zstandard" is needed to read or write "{filename}".'
+        ) from e
+
+    stream: IO[bytes]
+    if "w" in mode:
+        stream = zstandard.ZstdCompressor(threads=-1).stream_writer(
+            open(filename, "wb"), closefd=True
+        )
+    else:
+        stream = zstandard.ZstdDecompressor().stream_reader(
+            open(filename, "rb"), closefd=True, read_across_frames=True
+        )
+    return stream
+
+
+class _EndOfFile:
+    pass
+
+
+def _iterate_blocks_in_background(open_fn: Callable[[], IO[bytes]]) -> Iterator[bytes]:
+    """Read (and decompress) the blocks of a file in a separate thread."""
+    blocks: "queue.Queue[Any]" = queue.Queue(maxsize=_QUEUE_SIZE)
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        # Give up if the consumer stopped iterating
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            with open_fn() as f:
+                for block in iter(lambda: f.read(_BLOCK_SIZE), b""):
+                    if not put(block):
+                        return
+            put(_EndOfFile())
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = blocks.get()
+            if isinstance(item, _EndOfFile):
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
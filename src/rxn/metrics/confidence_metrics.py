@@ -0,0 +1,156 @@
+"""
+Metrics relying on the confidences (log probabilities) of the predictions:
+selective prediction curves and calibration.
+
+A selective prediction curve gives, for every confidence threshold, the
+fraction of the predictions above the threshold (coverage) and the fraction of
+those that are correct. All the thresholds are computed at once, by sorting
+the predictions by decreasing confidence and accumulating the correct ones.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_CURVE_POINTS = 20
+DEFAULT_CALIBRATION_BINS = 10
+# Decimals of the curve values written to the metrics file
+CURVE_DECIMALS = 6
+
+
+def selective_prediction_curve(
+    confidences: np.ndarray, correct: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Accuracy-coverage curve over all the confidence thresholds.
+
+    Args:
+        confidences: confidences of the predictions (any monotonic score, such
+            as log probabilities).
+        correct: whether the predictions are correct, same shape.
+
+    Returns:
+        Tuple: thresholds (in decreasing order), coverage and accuracy of the
+        predictions with a confidence greater than or equal to each threshold.
+    """
+    confidences = np.asarray(confidences).reshape(-1)
+    correct = np.asarray(correct, dtype=bool).reshape(-1)
+    order = np.argsort(-confidences, kind="stable")
+    sorted_confidences = confidences[order]
+    n_correct = np.cumsum(correct[order])
+    n_selected = np.arange(1, len(order) + 1)
+
+    # Predictions with identical confidences are selected together: keep the
+    # last position of each group of identical values only.
+    last_of_group = np.append(sorted_confidences[1:] != sorted_confidences[:-1], True)
+    thresholds = sorted_confidences[last_of_group]
+    coverage = n_selected[last_of_group] / len(order)
+    accuracy = n_correct[last_of_group] / n_selected[last_of_group]
+    return thresholds, coverage, accuracy
+
+
+def summarize_curve(
+    thresholds: np.ndarray,
+    coverage: np.ndarray,
+    accuracy: np.ndarray,
+    n_points: int = DEFAULT_CURVE_POINTS,
+) -> Dict[str, Any]:
+    """
+    Summary of a selective prediction curve, for the metrics file: the points
+    reaching regularly spaced coverage values, and the area under the curve.
+    """
+    levels = np.linspace(1 / n_points, 1.0, n_points)
+    # First point reaching each level (small tolerance for rounding errors)
+    indices = np.unique(np.searchsorted(coverage, levels - 1e-9, side="left"))
+    indices = indices[indices < len(coverage)]
+    coverage_steps = np.diff(coverage, prepend=0.0)
+    return {
+        "threshold": _to_list(thresholds[indices]),
+        "coverage": _to_list(coverage[indices]),
+        "accuracy": _to_list(accuracy[indices]),
+        "area": float(np.sum(accuracy * coverage_steps)),
+    }
+
+
+def expected_calibration_error(
+    probabilities: np.ndarray,
+    correct: np.ndarray,
+    n_bins: int = DEFAULT_CALIBRATION_BINS,
+) -> float:
+    """
+    Expected calibration error: difference between the confidence and the
+    accuracy, averaged over equal-width confidence bins weighted by their
+    number of predictions.
+
+    Args:
+        probabilities: confidences of the predictions, between 0 and 1.
+        correct: whether the predictions are correct, same shape.
+        n_bins: number of bins.
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float64).reshape(-1)
+    correct = np.asarray(correct, dtype=np.float64).reshape(-1)
+    if len(probabilities) == 0:
+        return 0.0
+    bins = np.clip((probabilities * n_bins).astype(np.int64), 0, n_bins - 1)
+    confidence_sums = np.bincount(bins, weights=probabilities, minlength=n_bins)
+    correct_sums = np.bincount(bins, weights=correct, minlength=n_bins)
+    return float(np.sum(np.abs(correct_sums - confidence_sums)) / len(probabilities))
+
+
+def retro_confidence_metrics(
+    top1_correct: np.ndarray,
+    top1_log_probs: np.ndarray,
+    round_trip_correct: np.ndarray,
+    retro_log_probs: np.ndarray,
+    forward_log_probs: Optional[np.ndarray] = None,
+    n_points: int = DEFAULT_CURVE_POINTS,
+) -> Dict[str, Any]:
+    """
+    Confidence-based metrics for retro models.
+
+    Args:
+        top1_correct: whether the first prediction of each sample is correct.
+        top1_log_probs: retro log probabilities of these predictions.
+        round_trip_correct: for every prediction, whether the forward model
+            gives back the ground truth product.
+        retro_log_probs: retro log probabilities of all the predictions.
+        forward_log_probs: forward log probabilities of all the predictions,
+            if available.
+        n_points: number of points of the curves in the metrics.
+
+    Returns:
+        Dictionary with:
+            - "accuracy-coverage": top-1 accuracy depending on the fraction of
+              samples kept, from the retro confidence;
+            - "round-trip-coverage": round-trip accuracy depending on the
+              fraction of predictions kept, from the retro confidence;
+            - "expected-calibration-error": for the retro top-1 predictions;
+            - "round-trip-expected-calibration-error": for the forward
+              predictions, if their log probabilities are given.
+    """
+    if top1_correct.size == 0:
+        return {}
+
+    metrics: Dict[str, Any] = {
+        "accuracy-coverage": summarize_curve(
+            *selective_prediction_curve(top1_log_probs, top1_correct),
+            n_points=n_points,
+        ),
+        "round-trip-coverage": summarize_curve(
+            *selective_prediction_curve(retro_log_probs, round_trip_correct),
+            n_points=n_points,
+        ),
+        "expected-calibration-error": expected_calibration_error(
+            np.exp(top1_log_probs), top1_correct
+        ),
+    }
+    if forward_log_probs is not None:
+        metrics["round-trip-expected-calibration-error"] = expected_calibration_error(
+            np.exp(forward_log_probs), round_trip_correct
+        )
+    return metrics
+
+
+def _to_list(values: np.ndarray) -> List[float]:
+    # Rounded, so that float32 values are written as "-0.0254" instead of
+    # "-0.025399999693036079"
+    return [round(float(v), CURVE_DECIMALS) for v in values]
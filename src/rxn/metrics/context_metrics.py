@@ -1,14 +1,30 @@
-from typing import Any, Dict, Iterable, List, Sequence
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
 
 import numpy as np
 from rxn.chemutils.reaction_smiles import parse_any_reaction_smiles
 from rxn.utilities.containers import chunker
-from rxn.utilities.files import PathLike, iterate_lines_from_file
+from rxn.utilities.files import PathLike
 
-from .metrics import top_n_accuracy
+from .beam_filtering import FilteredBeams
+from .binary_cache import BinaryCache
+from .compression import iterate_lines
+from .ground_truth import GroundTruth, SampleGroups
 from .metrics_calculator import MetricsCalculator
 from .metrics_files import ContextFiles, MetricsFiles
-from .utils import get_sequence_multiplier
+from .profiling import profile_hook
+from .ranks import (
+    first_hit_ranks,
+    hits_from_ranks,
+    rank_metrics,
+    reciprocal_ranks,
+    top_n_from_ranks,
+)
+from .utils import (
+    by_n,
+    get_sequence_multiplier,
+    match_matrix,
+    match_matrix_from_ids,
+)
 
 
 class ContextMetrics(MetricsCalculator):
@@ -19,28 +35,121 @@ class ContextMetrics(MetricsCalculator):
     Note: all files are expected to be standardized (canonicalized, sorted, etc.).
     """
 
-    def __init__(self, gt_tgt: Iterable[str], predicted_context: Iterable[str]):
+    def __init__(
+        self,
+        gt_tgt: Iterable[str],
+        predicted_context: Iterable[str],
+        gt_compound_groups: Optional[Sequence[SampleGroups]] = None,
+    ):
         self.gt_tgt = list(gt_tgt)
         self.predicted_context = list(predicted_context)
+        self.gt_compound_groups = gt_compound_groups
+        self._match_matrix: Optional[np.ndarray] = None
+        self._first_hit_ranks: Optional[Dict[str, np.ndarray]] = None
+        self._filtered_beams: Optional[FilteredBeams] = None
+        self._identical_fractions: Optional[np.ndarray] = None
 
     def get_metrics(self) -> Dict[str, Any]:
-        topn = top_n_accuracy(
-            ground_truth=self.gt_tgt, predictions=self.predicted_context
-        )
-        partial_match = fraction_of_identical_compounds(
+        multiplier = self._multiplier()
+        ranks = self.first_hit_ranks()["context"]
+        beams = self.filtered_beams()
+        partial_match = self.identical_fractions().mean(axis=0)
+
+        return {
+            "accuracy": top_n_from_ranks(ranks, multiplier),
+            "partial_match": by_n(partial_match),
+            "rank": rank_metrics(ranks),
+            "accuracy-filtered": beams.top_n(self.matches()),
+            "invalid-rate": beams.invalid_rate(),
+            "duplicate-rate": beams.duplicate_rate(),
+        }
+
+    def _per_sample_functions(self) -> Dict[str, Callable[[], np.ndarray]]:
+        def ranks() -> np.ndarray:
+            return self.first_hit_ranks()["context"]
+
+        return {
+            "accuracy": lambda: hits_from_ranks(ranks(), self._multiplier()),
+            "partial_match": self.identical_fractions,
+            "rank.mrr": lambda: reciprocal_ranks(ranks()),
+            "accuracy-filtered": lambda: self.filtered_beams().hits(self.matches()),
+            "invalid-rate": lambda: self.filtered_beams().invalid,
+            "duplicate-rate": lambda: self.filtered_beams().duplicate,
+        }
+
+    def first_hit_ranks(self) -> Dict[str, np.ndarray]:
+        if self._first_hit_ranks is None:
+            self._first_hit_ranks = {"context": first_hit_ranks(self.matches())}
+        return self._first_hit_ranks
+
+    def matches(self) -> np.ndarray:
+        """Match matrix of the predictions, computed once."""
+        if self._match_matrix is None:
+            self._match_matrix = match_matrix(self.gt_tgt, self.predicted_context)
+        return self._match_matrix
+
+    def filtered_beams(self) -> FilteredBeams:
+        """Distinct valid predictions, computed once."""
+        if self._filtered_beams is None:
+            self._filtered_beams = FilteredBeams(
+                self.predicted_context, self._multiplier()
+            )
+        return self._filtered_beams
+
+    def identical_fractions(self) -> np.ndarray:
+        """Fraction of identical compounds of every prediction, computed once."""
+        if self._identical_fractions is None:
+            self._identical_fractions = identical_fractions(
+                ground_truth=self.gt_tgt,
+                predictions=self.predicted_context,
+                ground_truth_groups=self.gt_compound_groups,
+            )
+        return self._identical_fractions
+
+    def _multiplier(self) -> int:
+        return get_sequence_multiplier(
             ground_truth=self.gt_tgt, predictions=self.predicted_context
         )
 
-        return {"accuracy": topn, "partial_match": partial_match}
-
     @classmethod
-    def from_metrics_files(cls, metrics_files: MetricsFiles) -> "ContextMetrics":
+    def from_metrics_files(
+        cls,
+        metrics_files: MetricsFiles,
+        ground_truth: Optional[GroundTruth] = None,
+        use_binary_cache: bool = False,
+    ) -> "ContextMetrics":
         if not isinstance(metrics_files, ContextFiles):
             raise ValueError("Invalid type provided")
-        return cls.from_raw_files(
-            gt_tgt_file=metrics_files.gt_tgt,
-            predicted_context_file=metrics_files.predicted_canonical,
+        if ground_truth is None:
+            ground_truth = GroundTruth.from_metrics_files(metrics_files)
+        gt_tgt = ground_truth.tgt
+        gt_compound_groups = context_compound_groups(ground_truth)
+        if not use_binary_cache:
+            return cls(
+                gt_tgt=gt_tgt,
+                predicted_context=ground_truth.load_predictions(
+                    metrics_files.predicted_canonical
+                ),
+                gt_compound_groups=gt_compound_groups,
+            )
+
+        predictions = ground_truth.load_interned_predictions(
+            metrics_files.predicted_canonical,
+            BinaryCache(metrics_files.binary_cache_dir),
+        )
+        metrics = cls(
+            gt_tgt=gt_tgt,
+            predicted_context=predictions.lines,
+            gt_compound_groups=gt_compound_groups,
         )
+        # Compared through their IDs, without comparing the strings
+        metrics._match_matrix = match_matrix_from_ids(
+            ground_truth.tgt_ids, predictions.ids
+        )
+        metrics._filtered_beams = FilteredBeams.from_ids(
+            predictions.ids, metrics._multiplier(), predictions.empty_id
+        )
+        return metrics
 
     @classmethod
     def from_raw_files(
@@ -49,11 +158,29 @@ class ContextMetrics(MetricsCalculator):
         predicted_context_file: PathLike,
     ) -> "ContextMetrics":
         return cls(
-            gt_tgt=iterate_lines_from_file(gt_tgt_file),
-            predicted_context=iterate_lines_from_file(predicted_context_file),
+            gt_tgt=iterate_lines(gt_tgt_file),
+            predicted_context=iterate_lines(predicted_context_file),
         )
 
 
+def compound_groups(reaction_smiles: str) -> SampleGroups:
+    """Get the compounds of a reaction SMILES, as a list of groups (reactants,
+    agents, products). None if the reaction SMILES cannot be parsed."""
+    try:
+        return [list(group) for group in parse_any_reaction_smiles(reaction_smiles)]
+    except Exception:
+        return None
+
+
+def context_compound_groups(ground_truth: GroundTruth) -> List[SampleGroups]:
+    """Compounds of every ground-truth reaction (see compound_groups()), parsed
+    only once for a ground truth and stored with it."""
+    return ground_truth.derived(
+        "context_compound_groups",
+        lambda: [compound_groups(gt) for gt in ground_truth.tgt],
+    )
+
+
 def identical_fraction(ground_truth: str, prediction: str) -> float:
     """For context prediction models, fraction of compounds that are identical to
     the ground truth.
@@ -62,53 +189,93 @@ def identical_fraction(ground_truth: str, prediction: str) -> float:
     implementation for getting an idea of how the models behave.
 
     As denominator, takes the size of whichever list is larger."""
-    try:
-        gt_reaction = parse_any_reaction_smiles(ground_truth)
-        pred_reaction = parse_any_reaction_smiles(prediction)
+    return identical_fraction_of_groups(
+        compound_groups(ground_truth), compound_groups(prediction)
+    )
 
-        n_compounds_tot = 0
-        n_compounds_match = 0
 
-        for gt_group, pred_group in zip(gt_reaction, pred_reaction):
-            gt_compounds = set(gt_group)
-            pred_compounds = set(pred_group)
-            overlap = gt_compounds.intersection(pred_compounds)
-            n_compounds_tot += max(len(gt_compounds), len(pred_compounds))
-            n_compounds_match += len(overlap)
+def identical_fraction_of_groups(
+    ground_truth: SampleGroups, prediction: SampleGroups
+) -> float:
+    """Same as identical_fraction(), for reactions already split into
+    compound groups with compound_groups()."""
+    if ground_truth is None or prediction is None:
+        return 0.0
 
-        if n_compounds_tot == 0:
-            return 1.0
-        return n_compounds_match / n_compounds_tot
+    n_compounds_tot = 0
+    n_compounds_match = 0
 
-    except Exception:
-        return 0.0
+    for gt_group, pred_group in zip(ground_truth, prediction):
+        gt_compounds = set(gt_group)
+        pred_compounds = set(pred_group)
+        overlap = gt_compounds.intersection(pred_compounds)
+        n_compounds_tot += max(len(gt_compounds), len(pred_compounds))
+        n_compounds_match += len(overlap)
+
+    if n_compounds_tot == 0:
+        return 1.0
+    return n_compounds_match / n_compounds_tot
 
 
 def fraction_of_identical_compounds(
-    ground_truth: Sequence[str], predictions: Sequence[str]
+    ground_truth: Sequence[str],
+    predictions: Sequence[str],
+    ground_truth_groups: Optional[Sequence[SampleGroups]] = None,
 ) -> Dict[int, float]:
     """
     Compute the fraction of identical compounds, split by n-th predictions.
 
+    Args:
+        ground_truth: ground truth reaction SMILES.
+        predictions: predicted reaction SMILES.
+        ground_truth_groups: the ground truth already parsed with
+            compound_groups(), if available.
+
     Raises:
         ValueError: if the list sizes are incompatible, forwarded from get_sequence_multiplier().
 
     Returns:
         Dictionary for the fraction of identical compounds, by top-n.
     """
+    overlaps = identical_fractions(ground_truth, predictions, ground_truth_groups)
+    return by_n(overlaps.mean(axis=0))
+
+
+@profile_hook("fraction_of_identical_compounds")
+def identical_fractions(
+    ground_truth: Sequence[str],
+    predictions: Sequence[str],
+    ground_truth_groups: Optional[Sequence[SampleGroups]] = None,
+) -> np.ndarray:
+    """
+    Fraction of identical compounds of every prediction, see
+    fraction_of_identical_compounds().
+
+    Returns:
+        Array of shape (samples, predictions per sample).
+    """
     multiplier = get_sequence_multiplier(
         ground_truth=ground_truth, predictions=predictions
     )
 
-    # we will get, for each prediction of each "n", the portion that is matching
-    overlap_for_n: List[List[float]] = [[] for _ in range(multiplier)]
+    # we will get, for each sample and each prediction, the portion that is matching
+    overlaps = np.zeros((len(ground_truth), multiplier), dtype=np.float64)
+
+    if ground_truth_groups is None:
+        ground_truth_groups = [compound_groups(gt) for gt in ground_truth]
+
+    # The predictions are often repeated: parse each one only once
+    parsed_predictions: Dict[str, SampleGroups] = {}
 
     # We will process sample by sample - for that, we need to chunk the predictions
     prediction_chunks = chunker(predictions, chunk_size=multiplier)
-    for gt, predictions in zip(ground_truth, prediction_chunks):
+    for sample, (gt_groups, predictions) in enumerate(
+        zip(ground_truth_groups, prediction_chunks)
+    ):
         for i, prediction in enumerate(predictions):
-            overlap = identical_fraction(gt, prediction)
-            overlap_for_n[i].append(overlap)
-
-    accuracy = {i + 1: float(np.mean(overlap_for_n[i])) for i in range(multiplier)}
-    return accuracy
+            if prediction not in parsed_predictions:
+                parsed_predictions[prediction] = compound_groups(prediction)
+            overlaps[sample, i] = identical_fraction_of_groups(
+                gt_groups, parsed_predictions[prediction]
+            )
+    return overlaps
@@ -0,0 +1,243 @@
+"""
+Options of the evaluation of the metrics, shared by evaluate_metrics(), the
+batch evaluation and the corresponding scripts, so that evaluating several
+results directories in one go gives the same metrics files as evaluating them
+one by one.
+"""
+import functools
+from typing import Any, Callable, Optional, Sequence
+
+import click
+from rxn.utilities.files import PathLike
+
+from .bootstrap import DEFAULT_CONFIDENCE_LEVEL
+
+
+class EvaluationOptions:
+    """
+    Which metrics to compute in addition to the default ones, and how.
+
+    Args:
+        gt_cache_dir: directory where to cache the interned ground truth (and
+            the data derived from it) for later evaluations, see GroundTruth.
+        use_binary_cache: whether to load the predictions through the binary
+            cache of the results directory, see BinaryCache, and the log
+            probabilities through their ".npy" cache. They are created at the
+            first evaluation, and make the later ones faster.
+        with_tiered_accuracy: whether to add the accuracy for several levels
+            of chemical equivalence (forward and retro only), see
+            rxn.metrics.chemical_equivalence. It requires RDKit.
+        key_cache_file: file to cache the keys of the molecules for the tiered
+            accuracy in; defaults to a file in the results directory. Sharing
+            it between evaluations avoids computing the keys again.
+        with_similarity: whether to add the fingerprint similarity of the
+            predictions to the ground truth (forward and retro only), see
+            rxn.metrics.fingerprint_similarity. It requires RDKit.
+        n_rdkit_workers: number of processes to compute the keys of the
+            molecules and the fingerprints with.
+        n_bootstrap: number of bootstrap resamples for the confidence intervals
+            of the metrics averaged over the samples (or over the distinct
+            products, for the multi-reference metrics), see
+            MetricsCalculator.confidence_intervals(). No intervals if 0.
+        confidence_level: probability covered by the confidence intervals.
+        with_strata: whether to add the metrics for strata of the samples
+            (reaction class, product size, input length, number of
+            precursors), see rxn.metrics.stratification. It requires RDKit.
+        overlap_index_dir: if given, index of the training set (see
+            rxn.metrics.overlap_index) to add the metrics for the samples whose
+            product (or precursors) were seen in training, and for the others.
+        with_multi_reference: whether to add the accuracy over the distinct
+            products, counting a prediction as correct if it matches any of
+            the precursors recorded for its product (retro only), see
+            rxn.metrics.multi_reference.
+        hit_at: values of k for which to add the fraction of samples with a
+            correct prediction among the first k (hit@k) for every family of
+            first-hit ranks, see rxn.metrics.ranks.
+    """
+
+    def __init__(
+        self,
+        gt_cache_dir: Optional[PathLike] = None,
+        use_binary_cache: bool = False,
+        with_tiered_accuracy: bool = False,
+        key_cache_file: Optional[PathLike] = None,
+        with_similarity: bool = False,
+        n_rdkit_workers: int = 1,
+        n_bootstrap: int = 0,
+        confidence_level: float = DEFAULT_CONFIDENCE_LEVEL,
+        with_strata: bool = False,
+        overlap_index_dir: Optional[PathLike] = None,
+        with_multi_reference: bool = False,
+        hit_at: Sequence[int] = (),
+    ):
+        self.gt_cache_dir = gt_cache_dir
+        self.use_binary_cache = use_binary_cache
+        self.with_tiered_accuracy = with_tiered_accuracy
+        self.key_cache_file = key_cache_file
+        self.with_similarity = with_similarity
+        self.n_rdkit_workers = n_rdkit_workers
+        self.n_bootstrap = n_bootstrap
+        self.confidence_level = confidence_level
+        self.with_strata = with_strata
+        self.overlap_index_dir = overlap_index_dir
+        self.with_multi_reference = with_multi_reference
+        self.hit_at = list(hit_at)
+
+    @property
+    def needs_ground_truth(self) -> bool:
+        """Whether the evaluation needs the interned ground truth, where the
+        strata and the overlap labels are stored."""
+        return self.with_strata or self.overlap_index_dir is not None
+
+
+_OPTIONS = [
+    click.option(
+        "--gt_cache_dir",
+        envvar="RXN_METRICS_GT_CACHE_DIR",
+        default=None,
+        help=(
+            "Directory where to cache the interned ground truths, so that later "
+            "evaluations on the same test set skip loading and processing them. "
+            "Can also be set with the RXN_METRICS_GT_CACHE_DIR environment "
+            "variable."
+        ),
+    ),
+    click.option(
+        "--binary_cache",
+        is_flag=True,
+        help=(
+            "If given, load the predictions through the binary cache of the "
+            "results directories, created at the first evaluation."
+        ),
+    ),
+    click.option(
+        "--tiered_accuracy",
+        is_flag=True,
+        help=(
+            "If given, add the accuracy for several levels of chemical "
+            "equivalence (stereo-agnostic, charge-normalized, InChIKey "
+            "connectivity); forward and retro only."
+        ),
+    ),
+    click.option(
+        "--key_cache_file",
+        envvar="RXN_METRICS_KEY_CACHE_FILE",
+        default=None,
+        help=(
+            "File where to cache the keys of the molecules for the tiered "
+            "accuracy, to share them between evaluations. Defaults to a file in "
+            "the results directory. Can also be set with the "
+            "RXN_METRICS_KEY_CACHE_FILE environment variable."
+        ),
+    ),
+    click.option(
+        "--similarity",
+        is_flag=True,
+        help=(
+            "If given, add the fingerprint (Tanimoto) similarity of the "
+            "predictions to the ground truth; forward and retro only."
+        ),
+    ),
+    click.option(
+        "--rdkit_workers",
+        default=1,
+        type=int,
+        help=(
+            "Number of processes to compute the keys of the molecules and the "
+            "fingerprints with."
+        ),
+    ),
+    click.option(
+        "--bootstrap",
+        default=0,
+        type=int,
+        help=(
+            "Number of bootstrap resamples for the confidence intervals of the "
+            "metrics averaged over the samples. No intervals if 0."
+        ),
+    ),
+    click.option(
+        "--confidence_level",
+        default=DEFAULT_CONFIDENCE_LEVEL,
+        type=float,
+        help="Probability covered by the bootstrap confidence intervals.",
+    ),
+    click.option(
+        "--strata",
+        is_flag=True,
+        help=(
+            "If given, add the metrics for strata of the samples: reaction class "
+            "(from gt_classes.txt, if present), product heavy atoms, input "
+            "length, and number of precursors."
+        ),
+    ),
+    click.option(
+        "--overlap_index",
+        default=None,
+        help=(
+            "Index of the training set (see rxn-build-overlap-index); if given, "
+            "add the metrics for the samples whose product or precursors were "
+            "seen in training, and for the novel ones."
+        ),
+    ),
+    click.option(
+        "--multi_reference",
+        is_flag=True,
+        help=(
+            "If given, add the accuracy over the distinct products, counting a "
+            "prediction as correct if it matches any of the precursors recorded "
+            "for the product; retro only."
+        ),
+    ),
+    click.option(
+        "--hit_at",
+        default="",
+        help=(
+            "Comma-separated values of k (f.i. 3,5,50) for which to add the "
+            "fraction of samples with a correct prediction among the first k "
+            "(hit@k)."
+        ),
+    ),
+]
+
+
+def evaluation_options(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Click options of the evaluation for the scripts, given to the command
+    as a single EvaluationOptions "options" argument."""
+
+    @functools.wraps(fn)
+    def wrapper(
+        *args: Any,
+        gt_cache_dir: Optional[str],
+        binary_cache: bool,
+        tiered_accuracy: bool,
+        key_cache_file: Optional[str],
+        similarity: bool,
+        rdkit_workers: int,
+        bootstrap: int,
+        confidence_level: float,
+        strata: bool,
+        overlap_index: Optional[str],
+        multi_reference: bool,
+        hit_at: str,
+        **kwargs: Any,
+    ) -> Any:
+        options = EvaluationOptions(
+            gt_cache_dir=gt_cache_dir,
+            use_binary_cache=binary_cache,
+            with_tiered_accuracy=tiered_accuracy,
+            key_cache_file=key_cache_file,
+            with_similarity=similarity,
+            n_rdkit_workers=rdkit_workers,
+            n_bootstrap=bootstrap,
+            confidence_level=confidence_level,
+            with_strata=strata,
+            overlap_index_dir=overlap_index,
+            with_multi_reference=multi_reference,
+            hit_at=[int(k) for k in hit_at.split(",") if k],
+        )
+        return fn(*args, options=options, **kwargs)
+
+    for option in reversed(_OPTIONS):
+        wrapper = option(wrapper)
+    return wrapper
@@ -0,0 +1,219 @@
+"""
+Partial credit for the predictions that are not exactly correct: Tanimoto
+similarity between the Morgan fingerprints of the predictions and of the
+ground truth.
+
+The fingerprints of the unique SMILES are computed once with RDKit (in a
+process pool for large sets) and stored as packed uint64 bit arrays; the
+similarities are then computed with a vectorized popcount, for blocks of
+samples at a time.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+from rdkit import Chem, rdBase
+from rdkit.Chem import rdFingerprintGenerator
+from rxn.utilities.containers import chunker
+
+from .interning import StringTable
+from .utils import by_n, get_sequence_multiplier
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+FINGERPRINT_RADIUS = 2
+FINGERPRINT_BITS = 2048
+DEFAULT_THRESHOLDS = (0.5, 0.7, 0.9)
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_BLOCK_SIZE = 10000
+
+# Number of bits set in every byte value, for numpy versions without bitwise_count
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def fingerprints(smiles: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Morgan fingerprints of SMILES (possibly with several molecules).
+
+    Returns:
+        Tuple: packed fingerprints, uint64 array of shape
+        (len(smiles), FINGERPRINT_BITS // 64), and whether each SMILES is valid.
+        The fingerprints of the invalid SMILES are empty.
+    """
+    generator = rdFingerprintGenerator.GetMorganGenerator(
+        radius=FINGERPRINT_RADIUS, fpSize=FINGERPRINT_BITS
+    )
+    packed = np.zeros((len(smiles), FINGERPRINT_BITS // 8), dtype=np.uint8)
+    valid = np.zeros(len(smiles), dtype=bool)
+
+    # Silence the RDKit errors for the invalid SMILES
+    block_logs = rdBase.BlockLogs()
+    try:
+        for i, s in enumerate(smiles):
+            mol = Chem.MolFromSmiles(s) if s else None
+            if mol is None:
+                continue
+            packed[i] = np.packbits(generator.GetFingerprintAsNumPy(mol))
+            valid[i] = True
+    finally:
+        del block_logs
+    return packed.view(np.uint64), valid
+
+
+def parallel_fingerprints(
+    smiles: Sequence[str], n_workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Same as fingerprints(), in a pool of processes."""
+    chunks = list(chunker(smiles, chunk_size=chunk_size))
+    if n_workers <= 1 or len(chunks) <= 1:
+        return fingerprints(smiles)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(fingerprints, chunks))
+    return (
+        np.concatenate([packed for packed, _ in results]),
+        np.concatenate([valid for _, valid in results]),
+    )
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """Number of bits set, summed over the last axis of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        counts = np.bitwise_count(values)
+    else:
+        counts = _BYTE_POPCOUNT[values.view(np.uint8)]
+    total: np.ndarray = counts.sum(axis=-1, dtype=np.int64)
+    return total
+
+
+def tanimoto_matrix(
+    packed: np.ndarray,
+    gt_ids: np.ndarray,
+    prediction_ids: np.ndarray,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> np.ndarray:
+    """
+    Tanimoto similarity of the predictions to the ground truth of their sample.
+
+    Args:
+        packed: packed fingerprints of the unique SMILES, shape (U, W).
+        gt_ids: index of the ground truth of every sample in the fingerprints,
+            shape (N,).
+        prediction_ids: index of the predictions in the fingerprints, shape (N, k).
+        block_size: number of samples to process at once, to limit the memory.
+
+    Returns:
+        Array of shape (N, k). 0 when both fingerprints are empty.
+    """
+    bit_counts = popcount(packed)
+    similarities = np.zeros(prediction_ids.shape, dtype=np.float64)
+    for start in range(0, len(gt_ids), block_size):
+        block_gt = gt_ids[start : start + block_size, np.newaxis]
+        block_predictions = prediction_ids[start : start + block_size]
+
+        intersection = popcount(packed[block_gt] & packed[block_predictions])
+        union = bit_counts[block_gt] + bit_counts[block_predictions] - intersection
+        np.divide(
+            intersection,
+            union,
+            out=similarities[start : start + block_size],
+            where=union > 0,
+        )
+    return similarities
+
+
+def best_similarities(
+    ground_truth: Sequence[str], predictions: Sequence[str], n_workers: int = 1
+) -> np.ndarray:
+    """
+    Highest fingerprint similarity to the ground truth among the first n
+    predictions of every sample.
+
+    Args:
+        ground_truth: SMILES of the ground truth.
+        predictions: SMILES of the predictions.
+        n_workers: number of processes to compute the fingerprints with.
+
+    Raises:
+        ValueError: if the list sizes are incompatible, forwarded from get_sequence_multiplier().
+
+    Returns:
+        Array of shape (samples, predictions per sample), by top-n.
+    """
+    multiplier = get_sequence_multiplier(
+        ground_truth=ground_truth, predictions=predictions
+    )
+
+    # The fingerprints are computed once per unique SMILES
+    unique_smiles = StringTable()
+    gt_ids = unique_smiles.add_all(ground_truth)
+    prediction_ids = unique_smiles.add_all(predictions).reshape(-1, multiplier)
+    logger.info(f"Computing the fingerprints of {len(unique_smiles)} SMILES...")
+    packed, _ = parallel_fingerprints(unique_smiles.strings, n_workers=n_workers)
+
+    similarities = tanimoto_matrix(packed, gt_ids, prediction_ids)
+    best: np.ndarray = np.maximum.accumulate(similarities, axis=1)
+    return best
+
+
+def similarity_per_sample(
+    best_at_n: np.ndarray, thresholds: Iterable[float] = DEFAULT_THRESHOLDS
+) -> Dict[str, np.ndarray]:
+    """
+    Per-sample values of the similarity metrics (see similarity_metrics()),
+    by metric name; the names of the hit rates are "similarity-hit-rate.{threshold}".
+
+    Args:
+        best_at_n: highest similarities, see best_similarities().
+        thresholds: similarity thresholds to compute the hits for.
+    """
+    per_sample = {"mean-best-similarity": best_at_n}
+    for threshold in thresholds:
+        per_sample[f"similarity-hit-rate.{threshold}"] = best_at_n >= threshold
+    return per_sample
+
+
+def similarity_metrics(
+    ground_truth: Sequence[str],
+    predictions: Sequence[str],
+    thresholds: Iterable[float] = DEFAULT_THRESHOLDS,
+    n_workers: int = 1,
+) -> Dict[str, Any]:
+    """
+    Fingerprint similarity of the predictions to the ground truth.
+
+    Args:
+        ground_truth: SMILES of the ground truth.
+        predictions: SMILES of the predictions.
+        thresholds: similarity thresholds to compute the hit rates for.
+        n_workers: number of processes to compute the fingerprints with.
+
+    Raises:
+        ValueError: if the list sizes are incompatible, forwarded from get_sequence_multiplier().
+
+    Returns:
+        Dictionary with:
+            - "mean-best-similarity": mean, over the samples, of the highest
+              similarity among the first n predictions, by top-n;
+            - "similarity-hit-rate": for each threshold, fraction of the samples
+              with a similarity at least equal to it among the first n
+              predictions, by top-n.
+    """
+    best_at_n = best_similarities(ground_truth, predictions, n_workers=n_workers)
+    return summarize_similarities(best_at_n, thresholds)
+
+
+def summarize_similarities(
+    best_at_n: np.ndarray, thresholds: Iterable[float] = DEFAULT_THRESHOLDS
+) -> Dict[str, Any]:
+    """Similarity metrics (see similarity_metrics()) from the highest
+    similarities of the samples, see best_similarities()."""
+    return {
+        "mean-best-similarity": by_n(best_at_n.mean(axis=0)),
+        "similarity-hit-rate": {
+            str(threshold): by_n((best_at_n >= threshold).mean(axis=0))
+            for threshold in thresholds
+        },
+    }
@@ -1,10 +1,23 @@
-from typing import Any, Dict, Iterable
+from typing import Any, Callable, Dict, Iterable, Optional
 
-from rxn.utilities.files import PathLike, iterate_lines_from_file
+import numpy as np
+from rxn.utilities.files import PathLike
 
-from .metrics import top_n_accuracy
-from .metrics_calculator import MetricsCalculator
+from .beam_filtering import FilteredBeams
+from .binary_cache import BinaryCache
+from .compression import iterate_lines
+from .evaluation_options import EvaluationOptions
+from .ground_truth import GroundTruth
+from .metrics_calculator import MetricsCalculator, chemistry_metrics, precomputed
 from .metrics_files import ForwardFiles, MetricsFiles
+from .ranks import (
+    first_hit_ranks,
+    hits_from_ranks,
+    rank_metrics,
+    reciprocal_ranks,
+    top_n_from_ranks,
+)
+from .utils import get_sequence_multiplier, match_matrix, match_matrix_from_ids
 
 
 class ForwardMetrics(MetricsCalculator):
@@ -18,22 +31,103 @@ class ForwardMetrics(MetricsCalculator):
     def __init__(self, gt_products: Iterable[str], predicted_products: Iterable[str]):
         self.gt_products = list(gt_products)
         self.predicted_products = list(predicted_products)
+        self._match_matrix: Optional[np.ndarray] = None
+        self._first_hit_ranks: Optional[Dict[str, np.ndarray]] = None
+        self._filtered_beams: Optional[FilteredBeams] = None
+        self._optional_per_sample: Dict[str, np.ndarray] = {}
 
     def get_metrics(self) -> Dict[str, Any]:
-        topn = top_n_accuracy(
-            ground_truth=self.gt_products, predictions=self.predicted_products
+        multiplier = self._multiplier()
+        ranks = self.first_hit_ranks()["products"]
+        beams = self.filtered_beams()
+
+        return {
+            "accuracy": top_n_from_ranks(ranks, multiplier),
+            "rank": rank_metrics(ranks),
+            "accuracy-filtered": beams.top_n(self.matches()),
+            "invalid-rate": beams.invalid_rate(),
+            "duplicate-rate": beams.duplicate_rate(),
+        }
+
+    def _per_sample_functions(self) -> Dict[str, Callable[[], np.ndarray]]:
+        def ranks() -> np.ndarray:
+            return self.first_hit_ranks()["products"]
+
+        return {
+            "accuracy": lambda: hits_from_ranks(ranks(), self._multiplier()),
+            "rank.mrr": lambda: reciprocal_ranks(ranks()),
+            "accuracy-filtered": lambda: self.filtered_beams().hits(self.matches()),
+            "invalid-rate": lambda: self.filtered_beams().invalid,
+            "duplicate-rate": lambda: self.filtered_beams().duplicate,
+            **precomputed(self._optional_per_sample),
+        }
+
+    def optional_metrics(
+        self, options: EvaluationOptions, metrics_files: MetricsFiles
+    ) -> Dict[str, Any]:
+        metrics, self._optional_per_sample = chemistry_metrics(
+            self.gt_products, self.predicted_products, options, metrics_files
         )
+        return metrics
+
+    def first_hit_ranks(self) -> Dict[str, np.ndarray]:
+        if self._first_hit_ranks is None:
+            self._first_hit_ranks = {"products": first_hit_ranks(self.matches())}
+        return self._first_hit_ranks
+
+    def matches(self) -> np.ndarray:
+        """Match matrix of the predictions, computed once."""
+        if self._match_matrix is None:
+            self._match_matrix = match_matrix(self.gt_products, self.predicted_products)
+        return self._match_matrix
+
+    def filtered_beams(self) -> FilteredBeams:
+        """Distinct valid predictions, computed once."""
+        if self._filtered_beams is None:
+            self._filtered_beams = FilteredBeams(
+                self.predicted_products, self._multiplier()
+            )
+        return self._filtered_beams
 
-        return {"accuracy": topn}
+    def _multiplier(self) -> int:
+        return get_sequence_multiplier(
+            ground_truth=self.gt_products, predictions=self.predicted_products
+        )
 
     @classmethod
-    def from_metrics_files(cls, metrics_files: MetricsFiles) -> "ForwardMetrics":
+    def from_metrics_files(
+        cls,
+        metrics_files: MetricsFiles,
+        ground_truth: Optional[GroundTruth] = None,
+        use_binary_cache: bool = False,
+    ) -> "ForwardMetrics":
         if not isinstance(metrics_files, ForwardFiles):
             raise ValueError("Invalid type provided")
-        return cls.from_raw_files(
-            gt_products_file=metrics_files.gt_tgt,
-            predicted_products_file=metrics_files.predicted_canonical,
+        if ground_truth is None:
+            ground_truth = GroundTruth.from_metrics_files(metrics_files)
+        if not use_binary_cache:
+            return cls(
+                gt_products=ground_truth.tgt,
+                predicted_products=ground_truth.load_predictions(
+                    metrics_files.predicted_canonical
+                ),
+            )
+
+        predictions = ground_truth.load_interned_predictions(
+            metrics_files.predicted_canonical,
+            BinaryCache(metrics_files.binary_cache_dir),
+        )
+        metrics = cls(
+            gt_products=ground_truth.tgt, predicted_products=predictions.lines
+        )
+        # Compared through their IDs, without comparing the strings
+        metrics._match_matrix = match_matrix_from_ids(
+            ground_truth.tgt_ids, predictions.ids
+        )
+        metrics._filtered_beams = FilteredBeams.from_ids(
+            predictions.ids, metrics._multiplier(), predictions.empty_id
         )
+        return metrics
 
     @classmethod
     def from_raw_files(
@@ -42,6 +136,6 @@ class ForwardMetrics(MetricsCalculator):
         predicted_products_file: PathLike,
     ) -> "ForwardMetrics":
         return cls(
-            gt_products=iterate_lines_from_file(gt_products_file),
-            predicted_products=iterate_lines_from_file(predicted_products_file),
+            gt_products=iterate_lines(gt_products_file),
+            predicted_products=iterate_lines(predicted_products_file),
         )
@@ -0,0 +1,362 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from rxn.utilities.files import PathLike
+
+from .binary_cache import BinaryCache
+from .compression import iterate_lines
+from .interning import StringTable
+from .metrics_files import MetricsFiles
+from .utils import combine_hashes, hash_files
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Per-sample data derived from the ground truth: for each sample, a list of
+# groups of strings (f.i. the compounds of the reactants, agents, products),
+# or None if it could not be determined.
+SampleGroups = Optional[List[List[str]]]
+
+_FORMAT_VERSION = 1
+
+
+class InternedPredictions(NamedTuple):
+    """Predictions loaded through a binary cache, see
+    GroundTruth.load_interned_predictions()."""
+
+    lines: List[str]
+    # ID of every line, comparable to the IDs of the ground truth
+    ids: np.ndarray
+    # ID of the empty string, i.e. of the invalid predictions
+    empty_id: int
+
+
+class GroundTruth:
+    """
+    Ground truth (source and target) of a test set, with interned strings.
+
+    Loading it once and sharing it between the evaluations of several results
+    directories avoids re-reading and re-processing the same files. The
+    predictions loaded with it are interned against the same string table, so
+    that they share the string objects of the ground truth.
+
+    If a storage directory is given, the ground truth (and the data derived
+    from it, see derived()) is persisted there, see GroundTruth.save().
+    """
+
+    def __init__(
+        self,
+        table: StringTable,
+        src_ids: np.ndarray,
+        tgt_ids: np.ndarray,
+        content_hash: str,
+        storage_dir: Optional[Path] = None,
+    ):
+        self.table = table
+        self.src_ids = src_ids
+        self.tgt_ids = tgt_ids
+        self.content_hash = content_hash
+        self.storage_dir = storage_dir
+
+        self.src: List[str] = table.lookup(src_ids.tolist())
+        self.tgt: List[str] = table.lookup(tgt_ids.tolist())
+
+        self._derived: Dict[str, List[SampleGroups]] = {}
+
+    @property
+    def n_samples(self) -> int:
+        return len(self.src_ids)
+
+    def load_predictions(
+        self, filename: PathLike, binary_cache: Optional[BinaryCache] = None
+    ) -> List[str]:
+        """Load a file of predictions, interned with the ground truth strings.
+
+        Args:
+            filename: file to load.
+            binary_cache: if given, cache to load the file through.
+        """
+        if binary_cache is None:
+            return self.table.share(iterate_lines(filename))
+        return self.load_interned_predictions(filename, binary_cache).lines
+
+    def load_interned_predictions(
+        self, filename: PathLike, binary_cache: BinaryCache
+    ) -> InternedPredictions:
+        """
+        Load a file of predictions through a binary cache, with the IDs of the
+        lines, so that they can be compared to the ground truth (src_ids,
+        tgt_ids) and to each other without comparing the strings.
+
+        The strings of the ground truth keep their ID in the ground truth
+        table, and the other ones get IDs from len(self.table) on. The
+        strings are looked up once per distinct string of the cache, not
+        once per line.
+        """
+        cache_ids, strings = binary_cache.load(filename)
+        n_table = len(self.table)
+        id_map = np.fromiter(
+            (self.table.get_id(s) for s in strings), dtype=np.int64, count=len(strings)
+        )
+        absent = np.flatnonzero(id_map < 0)
+        id_map[absent] = n_table + absent
+
+        ids = id_map[cache_ids]
+        all_strings = self.table.strings + strings
+        try:
+            empty_id = int(id_map[strings.index("")])
+        except ValueError:
+            # No empty string: an ID that no line has
+            empty_id = n_table + len(strings)
+        return InternedPredictions(
+            lines=[all_strings[i] for i in ids.tolist()], ids=ids, empty_id=empty_id
+        )
+
+    def derived(
+        self, name: str, compute: Callable[[], Sequence[SampleGroups]]
+    ) -> List[SampleGroups]:
+        """
+        Get per-sample data derived from the ground truth, computing it only if
+        it is neither in memory nor in the storage directory.
+
+        Args:
+            name: name under which to store the derived data. It must identify
+                the computation uniquely for this ground truth.
+            compute: function computing the derived data if needed.
+        """
+        if name in self._derived:
+            return self._derived[name]
+
+        values: Optional[List[SampleGroups]] = None
+        if self.storage_dir is not None:
+            values = self._load_derived(name)
+        if values is None:
+            logger.info(f'Computing "{name}" for the ground truth...')
+            values = list(compute())
+            if self.storage_dir is not None:
+                self._save_derived(name, values)
+
+        self._derived[name] = values
+        return values
+
+    @classmethod
+    def from_files(
+        cls,
+        src_file: PathLike,
+        tgt_file: PathLike,
+        content_hash: Optional[str] = None,
+    ) -> "GroundTruth":
+        """
+        Load the ground truth from its source and target files.
+
+        Args:
+            src_file: ground truth source.
+            tgt_file: ground truth target.
+            content_hash: hash of the files, if known already (see
+                ground_truth_hash()); computed otherwise.
+        """
+        if content_hash is None:
+            content_hash = hash_files(src_file, tgt_file)
+        table = StringTable()
+        return cls(
+            table=table,
+            src_ids=table.add_all(iterate_lines(src_file)),
+            tgt_ids=table.add_all(iterate_lines(tgt_file)),
+            content_hash=content_hash,
+        )
+
+    @classmethod
+    def from_metrics_files(
+        cls,
+        metrics_files: MetricsFiles,
+        cache_dir: Optional[PathLike] = None,
+        content_hash: Optional[str] = None,
+    ) -> "GroundTruth":
+        """
+        Load the ground truth of a results directory.
+
+        Args:
+            metrics_files: location of the ground truth files.
+            cache_dir: if given, directory where the interned ground truths are
+                cached, keyed by the hash of the ground truth files. Test sets
+                already in the cache are loaded from there directly.
+            content_hash: hash of the ground truth files, if known already
+                (f.i. from group_by_ground_truth()); computed otherwise, see
+                ground_truth_hash().
+        """
+        if content_hash is None:
+            content_hash = ground_truth_hash(metrics_files)
+        if cache_dir is None:
+            return cls.from_files(
+                metrics_files.gt_src, metrics_files.gt_tgt, content_hash=content_hash
+            )
+
+        entry = Path(cache_dir) / content_hash
+        if (entry / "meta.json").exists():
+            logger.info(f'Loading the cached ground truth from "{entry}".')
+            return cls.load(entry)
+
+        ground_truth = cls.from_files(
+            metrics_files.gt_src, metrics_files.gt_tgt, content_hash=content_hash
+        )
+        ground_truth.save(entry)
+        return ground_truth
+
+    def save(self, directory: Path) -> None:
+        """
+        Save to the given directory, which becomes the storage directory.
+
+        Written to a temporary directory first, so that concurrent processes
+        never see incomplete entries.
+
+        The files are:
+            - strings.txt: the string table, one string per line;
+            - src_ids.npy, tgt_ids.npy: the int32 IDs of the source and target;
+            - meta.json: format version, hash and number of samples;
+            - {name}.*.npy, {name}.strings.txt: arrays and strings for the
+              derived data, see _save_derived().
+        """
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=directory.parent))
+        _save_strings(self.table, tmp_dir / "strings.txt")
+        np.save(tmp_dir / "src_ids.npy", self.src_ids)
+        np.save(tmp_dir / "tgt_ids.npy", self.tgt_ids)
+        meta = {
+            "version": _FORMAT_VERSION,
+            "content_hash": self.content_hash,
+            "n_samples": self.n_samples,
+        }
+        with open(tmp_dir / "meta.json", "wt") as f:
+            json.dump(meta, f, indent=2)
+
+        try:
+            os.replace(tmp_dir, directory)
+        except OSError:
+            # Created by another process in the meantime
+            shutil.rmtree(tmp_dir)
+        self.storage_dir = directory
+
+    @classmethod
+    def load(cls, directory: Path) -> "GroundTruth":
+        """Load from a directory written with GroundTruth.save(); the ID
+        arrays are memory-mapped."""
+        with open(directory / "meta.json", "rt") as f:
+            meta = json.load(f)
+        if meta["version"] != _FORMAT_VERSION:
+            raise RuntimeError(
+                f'Unsupported ground truth format in "{directory}": '
+                f'{meta["version"]} (expected: {_FORMAT_VERSION}).'
+            )
+
+        return cls(
+            table=_load_strings(directory / "strings.txt"),
+            src_ids=np.load(directory / "src_ids.npy", mmap_mode="r"),
+            tgt_ids=np.load(directory / "tgt_ids.npy", mmap_mode="r"),
+            content_hash=meta["content_hash"],
+            storage_dir=directory,
+        )
+
+    def _save_derived(self, name: str, values: Sequence[SampleGroups]) -> None:
+        """
+        Save the derived data as ragged arrays of string IDs: for each sample,
+        the offsets of its groups; for each group, the offsets of its strings.
+
+        The IDs refer to a string table of the derived data only, so that the
+        string table of the ground truth (possibly shared with other processes
+        through the cache) is never rewritten. The validity array is written
+        last, and marks complete data.
+        """
+        assert self.storage_dir is not None
+        table = StringTable()
+        valid = np.array([v is not None for v in values], dtype=bool)
+        sample_offsets = [0]
+        group_offsets = [0]
+        string_ids: List[int] = []
+        for groups in values:
+            for group in groups or []:
+                string_ids.extend(table.add(s) for s in group)
+                group_offsets.append(len(string_ids))
+            sample_offsets.append(len(group_offsets) - 1)
+
+        # The strings must be saved before the IDs referring to them
+        _save_strings(table, self._derived_strings_file(name))
+        arrays: Dict[str, np.ndarray] = {
+            "sample_offsets": np.array(sample_offsets, dtype=np.int64),
+            "group_offsets": np.array(group_offsets, dtype=np.int64),
+            "string_ids": np.array(string_ids, dtype=np.int32),
+            "valid": valid,
+        }
+        for key, array in arrays.items():
+            tmp_file = self.storage_dir / f"{name}.{key}.tmp.npy"
+            np.save(tmp_file, array)
+            os.replace(tmp_file, self.storage_dir / f"{name}.{key}.npy")
+
+    def _load_derived(self, name: str) -> Optional[List[SampleGroups]]:
+        assert self.storage_dir is not None
+        directory = self.storage_dir
+        strings_file = self._derived_strings_file(name)
+        if not (directory / f"{name}.valid.npy").exists() or not strings_file.exists():
+            return None
+
+        def load(key: str) -> np.ndarray:
+            array: np.ndarray = np.load(directory / f"{name}.{key}.npy", mmap_mode="r")
+            return array
+
+        valid, sample_offsets, group_offsets = (
+            load("valid"),
+            load("sample_offsets").tolist(),
+            load("group_offsets").tolist(),
+        )
+        # Interned with the ground truth strings, without extending its table
+        strings = self.table.share(
+            _load_strings(strings_file).lookup(load("string_ids").tolist())
+        )
+
+        values: List[SampleGroups] = []
+        for i, is_valid in enumerate(valid.tolist()):
+            if not is_valid:
+                values.append(None)
+                continue
+            values.append(
+                [
+                    strings[group_offsets[g] : group_offsets[g + 1]]
+                    for g in range(sample_offsets[i], sample_offsets[i + 1])
+                ]
+            )
+        return values
+
+    def _derived_strings_file(self, name: str) -> Path:
+        assert self.storage_dir is not None
+        return self.storage_dir / f"{name}.strings.txt"
+
+
+def ground_truth_hash(metrics_files: MetricsFiles) -> str:
+    """Hash of the content of the ground truth files, for grouping results
+    directories relying on the same test set.
+
+    The file hashes are taken from the manifest of the results directory
+    if it is up to date, and computed otherwise; the manifest is not modified."""
+    manifest = metrics_files.manifest
+    return combine_hashes(
+        manifest.content_hash(metrics_files.gt_src),
+        manifest.content_hash(metrics_files.gt_tgt),
+    )
+
+
+def _save_strings(table: StringTable, filename: Path) -> None:
+    tmp_file = filename.with_suffix(".tmp")
+    with open(tmp_file, "wt") as f:
+        f.writelines(f"{s}\n" for s in table.strings)
+    os.replace(tmp_file, filename)
+
+
+def _load_strings(filename: Path) -> StringTable:
+    with open(filename, "rt") as f:
+        # Each string is followed by a newline, hence the last empty element
+        return StringTable(f.read().split("\n")[:-1])
@@ -0,0 +1,59 @@
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class StringTable:
+    """
+    Table of unique strings, giving each of them an integer ID.
+
+    Interning the (typically very redundant) SMILES strings of the ground truth
+    and predictions allows to store them only once in memory, and makes
+    equality checks between them cheaper.
+    """
+
+    def __init__(self, strings: Optional[Iterable[str]] = None):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+        if strings is not None:
+            for string in strings:
+                self.add(string)
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def __contains__(self, value: str) -> bool:
+        return value in self._ids
+
+    def add(self, value: str) -> int:
+        """Add a string to the table (if not present already), and return its ID."""
+        idx = self._ids.get(value)
+        if idx is None:
+            idx = len(self.strings)
+            self._ids[value] = idx
+            self.strings.append(value)
+        return idx
+
+    def add_all(self, values: Iterable[str]) -> np.ndarray:
+        """Add several strings to the table, and return the array of their IDs."""
+        return np.fromiter((self.add(v) for v in values), dtype=np.int32)
+
+    def get_id(self, value: str) -> int:
+        """Get the ID of a string, -1 if it is not in the table."""
+        return self._ids.get(value, -1)
+
+    def lookup(self, ids: Iterable[int]) -> List[str]:
+        """Get the strings corresponding to the given IDs."""
+        strings = self.strings
+        return [strings[idx] for idx in ids]
+
+    def share(self, values: Iterable[str]) -> List[str]:
+        """
+        Replace the given strings by the identical string objects of the table.
+
+        Strings not present in the table are returned as such, and the table
+        is not modified.
+        """
+        strings = self.strings
+        ids = self._ids
+        return [strings[ids[v]] if v in ids else v for v in values]
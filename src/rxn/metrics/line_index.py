@@ -0,0 +1,214 @@
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from rxn.utilities.files import PathLike
+
+from .compression import LINE_ENDINGS, exists
+from .metrics_files import MetricsFiles
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class LineIndex:
+    """
+    Random access to the lines of a text file.
+
+    The byte offsets of the line starts are stored as a uint64 array (with the
+    file size as last element), memory-mapped when loaded from disk, so that
+    any line can be read without scanning the file.
+    """
+
+    def __init__(self, filename: PathLike, offsets: np.ndarray):
+        self.filename = Path(filename)
+        self.offsets = offsets
+        self._mmap: Optional[mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def line(self, idx: int) -> str:
+        """Get the line with the given index (without the line ending)."""
+        return self.lines(idx, idx + 1)[0]
+
+    def lines(self, start: int, stop: int) -> List[str]:
+        """Get the lines in the range [start, stop)."""
+        if not 0 <= start <= stop <= len(self):
+            raise IndexError(
+                f'Invalid range [{start}, {stop}) for "{self.filename}" '
+                f"with {len(self)} lines."
+            )
+        offsets = self.offsets[start : stop + 1].tolist()
+        data = self._get_mmap()[offsets[0] : offsets[-1]]
+        base = offsets[0]
+        return [
+            data[begin - base : end - base].decode().rstrip(LINE_ENDINGS)
+            for begin, end in zip(offsets, offsets[1:])
+        ]
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _get_mmap(self) -> Any:
+        if self._mmap is None:
+            if self.offsets[-1] == 0:
+                # Empty files cannot be memory-mapped
+                return b""
+            with open(self.filename, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    @classmethod
+    def build(cls, filename: PathLike) -> "LineIndex":
+        """Build the index by scanning the file once."""
+        return cls(filename, compute_line_offsets(filename))
+
+
+def compute_line_offsets(filename: PathLike) -> np.ndarray:
+    """
+    Byte offsets of the starts of the lines of a file, followed by the file size.
+
+    A last line without trailing newline counts as a line, consistently with
+    rxn.utilities.files.count_lines.
+    """
+    chunks = [np.zeros(1, dtype=np.uint64)]
+    position = 0
+    last_byte = b"\n"
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+            chunks.append((newlines + position + 1).astype(np.uint64))
+            position += len(block)
+            last_byte = block[-1:]
+    if last_byte != b"\n":
+        chunks.append(np.array([position], dtype=np.uint64))
+    return np.concatenate(chunks)
+
+
+class LineIndexCache:
+    """
+    Directory of line indices, one .npy file per indexed text file.
+
+    An index records the size and modification time of the text files when
+    they were indexed; the stored offsets are only used if they are unchanged.
+    """
+
+    def __init__(self, directory: PathLike):
+        self.directory = Path(directory)
+        self.index_file = self.directory / "index.json"
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def get(self, filename: PathLike) -> LineIndex:
+        """Get the line index of a text file, building it first if necessary."""
+        path = Path(filename)
+        offsets_file = self._offsets_file(path)
+        stat = path.stat()
+        entry = self._get_index().get(path.name)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and offsets_file.exists()
+        ):
+            offsets: np.ndarray = np.load(offsets_file, mmap_mode="r")
+            return LineIndex(path, offsets)
+
+        logger.info(f'Indexing the lines of "{path}".')
+        line_index = LineIndex.build(path)
+        try:
+            self._save(path, line_index.offsets, stat)
+        except OSError as e:
+            logger.warning(f'Could not write the line index for "{path}": {e}')
+        return line_index
+
+    def _offsets_file(self, path: Path) -> Path:
+        return self.directory / f"{path.name}.offsets.npy"
+
+    def _get_index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is None:
+            self._index = {}
+            if self.index_file.exists():
+                with open(self.index_file, "rt") as f:
+                    self._index = json.load(f)
+        return self._index
+
+    def _save(self, path: Path, offsets: np.ndarray, stat: os.stat_result) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_offsets_file = self.directory / f"{path.name}.tmp.npy"
+        np.save(tmp_offsets_file, offsets)
+        os.replace(tmp_offsets_file, self._offsets_file(path))
+
+        index = self._get_index()
+        index[path.name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        tmp_index_file = self.directory / "index.json.tmp"
+        with open(tmp_index_file, "wt") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_index_file, self.index_file)
+
+
+class SampleLookup:
+    """
+    Look up all the lines relating to given samples in the text files of a
+    results directory: ground truth, predictions (n_best per sample), forward
+    predictions, classes, atom mappings, etc.
+
+    The files are aligned with the ground truth source; the number of lines
+    per sample of each file is given by its multiplier relative to it.
+    Compressed files do not allow random access and are not considered.
+
+    Raises:
+        ValueError: if the ground truth source is missing, or compressed.
+    """
+
+    def __init__(self, metrics_files: MetricsFiles):
+        gt_src = metrics_files.gt_src
+        if not gt_src.exists():
+            if exists(gt_src):
+                raise ValueError(
+                    f'Cannot look up the samples of "{metrics_files.directory}": '
+                    "compressed results directories are not supported."
+                )
+            raise ValueError(f'No ground truth source "{gt_src}".')
+
+        self.metrics_files = metrics_files
+        cache = LineIndexCache(metrics_files.line_index_dir)
+        self.indices: Dict[str, LineIndex] = {
+            path.name: cache.get(path) for path in metrics_files.text_files()
+        }
+        self.n_samples = len(self.indices[metrics_files.gt_src.name])
+
+        self.multipliers: Dict[str, int] = {}
+        for name, line_index in self.indices.items():
+            n_lines = len(line_index)
+            if self.n_samples == 0 or n_lines % self.n_samples != 0:
+                logger.warning(f'Ignoring "{name}": not aligned with the samples.')
+                continue
+            self.multipliers[name] = n_lines // self.n_samples
+
+    def sample(self, idx: int) -> Dict[str, List[str]]:
+        """Get the lines of every file for the sample with the given index."""
+        return self.samples(idx, idx + 1)[0]
+
+    def samples(self, start: int, stop: int) -> List[Dict[str, List[str]]]:
+        """Get the lines of every file for the samples in the range [start, stop)."""
+        if not 0 <= start <= stop <= self.n_samples:
+            raise IndexError(
+                f"Invalid sample range [{start}, {stop}) for {self.n_samples} samples."
+            )
+        results: List[Dict[str, List[str]]] = [{} for _ in range(start, stop)]
+        for name, multiplier in self.multipliers.items():
+            lines = self.indices[name].lines(start * multiplier, stop * multiplier)
+            for i, result in enumerate(results):
+                result[name] = lines[i * multiplier : (i + 1) * multiplier]
+        return results
+
+    def close(self) -> None:
+        for line_index in self.indices.values():
+            line_index.close()
@@ -0,0 +1,103 @@
+"""
+Loading of the log probabilities written next to the predictions (files
+ending with ".tokenized_log_probs", one value per prediction).
+"""
+import logging
+import os
+from pathlib import Path
+from typing import Any, Type
+
+import numpy as np
+from rxn.utilities.containers import chunker
+from rxn.utilities.files import PathLike
+
+from .compression import iterate_lines, resolve_path
+from .manifest import line_count
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+LOG_PROBS_CACHE_SUFFIX = ".npy"
+DEFAULT_CHUNK_SIZE = 100000
+
+
+def load_log_probs(
+    filename: PathLike,
+    multiplier: int,
+    use_cache: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    dtype: Type[np.floating[Any]] = np.float32,
+) -> np.ndarray:
+    """
+    Load a log probability file into a (float32) array of shape (N, multiplier),
+    N being the number of samples.
+
+    Args:
+        filename: log probability file (possibly compressed).
+        multiplier: number of predictions per sample.
+        use_cache: whether to load the values from a ".npy" file next to the
+            log probability file, and to create it if necessary. It is used
+            only if more recent than the log probability file.
+        chunk_size: number of lines to parse at once.
+        dtype: type of the values; np.float64 to keep the full precision of
+            the files, for instance to sort them (the cache is then separate).
+
+    Raises:
+        ValueError: if the number of lines is not a multiple of the multiplier,
+            or for lines that are not numbers.
+    """
+    path = resolve_path(filename)
+    cache_file = log_probs_cache_file(path, dtype)
+    if use_cache and _cache_is_valid(path, cache_file):
+        values: np.ndarray = np.load(cache_file)
+    else:
+        values = _parse_log_probs(path, chunk_size, dtype)
+        if use_cache:
+            try:
+                _save_cache(values, cache_file)
+            except OSError as e:
+                logger.warning(
+                    f'Could not cache the log probabilities of "{path}": {e}'
+                )
+
+    if multiplier <= 0 or len(values) % multiplier != 0:
+        raise ValueError(
+            f'The number of log probabilities in "{path}" ({len(values)}) is not '
+            f"a multiple of {multiplier}."
+        )
+    return values.reshape(-1, multiplier)
+
+
+def log_probs_cache_file(
+    filename: PathLike, dtype: Type[np.floating[Any]] = np.float32
+) -> Path:
+    """Location of the ".npy" cache for a log probability file, f.i.
+    ".float64.npy" for other types than float32."""
+    infix = "" if dtype is np.float32 else f".{np.dtype(dtype).name}"
+    return Path(str(filename) + infix + LOG_PROBS_CACHE_SUFFIX)
+
+
+def _parse_log_probs(
+    path: Path, chunk_size: int, dtype: Type[np.floating[Any]]
+) -> np.ndarray:
+    """Parse the values chunk by chunk, into a preallocated array."""
+    values = np.empty(line_count(path), dtype=dtype)
+    start = 0
+    for chunk in chunker(iterate_lines(path), chunk_size=chunk_size):
+        values[start : start + len(chunk)] = np.array(chunk, dtype=dtype)
+        start += len(chunk)
+    return values
+
+
+def _cache_is_valid(path: Path, cache_file: Path) -> bool:
+    if not cache_file.exists():
+        return False
+    return cache_file.stat().st_mtime_ns >= path.stat().st_mtime_ns
+
+
+def _save_cache(values: np.ndarray, cache_file: Path) -> None:
+    # Written under a temporary name, so that an interrupted write does not
+    # leave a truncated cache behind. np.save appends ".npy" if missing.
+    tmp_file = cache_file.with_name(cache_file.name + ".tmp.npy")
+    np.save(tmp_file, values)
+    os.replace(tmp_file, cache_file)
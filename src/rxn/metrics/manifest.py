@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from rxn.utilities.files import PathLike
+from rxn.utilities.misc import get_multiplier
+
+from .compression import iterate_blocks, resolve_path
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+class FilesManifest:
+    """
+    Manifest of the files of a results directory: for each file, its number of
+    lines, byte size, content hash (SHA-256), and multiplier relative to a
+    reference file (typically the ground truth source).
+
+    Entries are recorded when the files are written; they are only trusted if
+    the size and modification time of the file are unchanged, and recomputed
+    (in one pass over the file) otherwise. Counting the lines of a file or
+    checking the number of predictions per sample is then a simple lookup.
+    Only record() modifies the manifest.
+    """
+
+    def __init__(self, manifest_file: PathLike):
+        self.manifest_file = Path(manifest_file)
+        self.directory = self.manifest_file.parent
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def record(
+        self, filename: PathLike, reference: Optional[PathLike] = None
+    ) -> Dict[str, Any]:
+        """
+        Record (or update) the entry for a file, and save the manifest.
+
+        Args:
+            filename: file to record.
+            reference: file to determine the multiplier relative to, if any.
+        """
+        path = resolve_path(filename)
+        stat = path.stat()
+        n_lines, content_hash = _scan_file(path)
+        entry: Dict[str, Any] = {
+            "n_lines": n_lines,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": content_hash,
+        }
+        if reference is not None:
+            entry["multiplier"] = self._recorded_multiplier(path, n_lines, reference)
+
+        self._get_entries()[self._key(path)] = entry
+        try:
+            self._save()
+        except OSError as e:
+            logger.warning(f'Could not write the manifest "{self.manifest_file}": {e}')
+        return entry
+
+    def count_lines(self, filename: PathLike) -> int:
+        """Number of lines of a file, counted if it has no up-to-date entry."""
+        entry = self.lookup(filename)
+        if entry is None:
+            return _count_newlines(resolve_path(filename))
+        n_lines: int = entry["n_lines"]
+        return n_lines
+
+    def content_hash(self, filename: PathLike) -> str:
+        """SHA-256 hash of the (decompressed) content of a file, computed if
+        it has no up-to-date entry."""
+        entry = self.lookup(filename)
+        if entry is None:
+            return _scan_file(resolve_path(filename))[1]
+        sha256: str = entry["sha256"]
+        return sha256
+
+    def multiplier(self, filename: PathLike, reference: PathLike) -> int:
+        """
+        Get the number of lines of a file per line of the reference file.
+
+        Raises:
+            ValueError: if the number of lines is not a multiple of the one
+                of the reference file (forwarded from get_multiplier).
+        """
+        return get_multiplier(self.count_lines(reference), self.count_lines(filename))
+
+    def lookup(self, filename: PathLike) -> Optional[Dict[str, Any]]:
+        """Get the entry for a file if it is up to date, without recording it."""
+        path = resolve_path(filename)
+        entry = self._get_entries().get(self._key(path))
+        if entry is None:
+            return None
+        stat = path.stat()
+        if entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            return None
+        return entry
+
+    def _recorded_multiplier(
+        self, path: Path, n_lines: int, reference: PathLike
+    ) -> Optional[int]:
+        n_reference = self.count_lines(reference)
+        if not n_reference:
+            return None
+        try:
+            return get_multiplier(n_reference, n_lines)
+        except ValueError as e:
+            # The file is still recorded, for its line count and hash
+            logger.warning(f'No multiplier for "{path}": {e}')
+            return None
+
+    def _key(self, path: Path) -> str:
+        # Files of the results directory are recorded by name, so that the
+        # manifest stays valid when the directory is moved.
+        if path.parent.resolve() == self.directory.resolve():
+            return path.name
+        return str(path.resolve())
+
+    def _get_entries(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = _load_entries(self.manifest_file)
+        return self._entries
+
+    def _save(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.manifest_file.with_suffix(".json.tmp")
+        with open(tmp_file, "wt") as f:
+            json.dump(self._get_entries(), f, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.manifest_file)
+
+
+def line_count(filename: PathLike) -> int:
+    """
+    Number of lines of a file, looked up in the manifest of its directory if
+    it has an up-to-date entry there, and counted otherwise (without
+    hashing the content, which is only needed when recording the file).
+
+    The manifest is not modified.
+    """
+    path = resolve_path(filename)
+    manifest = FilesManifest(path.parent / MANIFEST_FILE_NAME)
+    entry = manifest.lookup(path)
+    if entry is not None:
+        n_lines: int = entry["n_lines"]
+        return n_lines
+    return _count_newlines(path)
+
+
+def line_multiplier(filename: PathLike, reference: PathLike) -> int:
+    """
+    Number of lines of a file per line of the reference file, from their
+    line counts (see line_count()).
+
+    Raises:
+        ValueError: if the number of lines is not a multiple of the one of the
+            reference file (forwarded from get_multiplier).
+    """
+    return get_multiplier(line_count(reference), line_count(filename))
+
+
+def content_hash(filename: PathLike) -> str:
+    """
+    SHA-256 hash of the (decompressed) content of a file, looked up in the
+    manifest of its directory if it has an up-to-date entry there, and
+    computed otherwise.
+
+    The manifest is not modified.
+    """
+    path = resolve_path(filename)
+    entry = FilesManifest(path.parent / MANIFEST_FILE_NAME).lookup(path)
+    if entry is not None:
+        sha256: str = entry["sha256"]
+        return sha256
+    return _scan_file(path)[1]
+
+
+def _load_entries(manifest_file: Path) -> Dict[str, Dict[str, Any]]:
+    if not manifest_file.exists():
+        return {}
+    with open(manifest_file, "rt") as f:
+        entries: Dict[str, Dict[str, Any]] = json.load(f)
+    return entries
+
+
+def _scan_file(path: Path) -> Tuple[int, str]:
+    """Number of lines and SHA-256 hash of the (decompressed) content of a
+    file, in a single pass."""
+    sha = hashlib.sha256()
+    n_lines = _count_newlines(path, update_hash=sha.update)
+    return n_lines, sha.hexdigest()
+
+
+def _count_newlines(
+    path: Path, update_hash: Optional[Callable[[bytes], None]] = None
+) -> int:
+    """Number of lines of the (decompressed) content of a file, passing its
+    blocks to update_hash if given.
+
+    The number of lines is consistent with rxn.utilities.files.count_lines:
+    a last line without trailing newline counts as well."""
+    n_newlines = 0
+    last_block = b""
+    for block in iterate_blocks(path):
+        if update_hash is not None:
+            update_hash(block)
+        n_newlines += block.count(b"\n")
+        last_block = block
+    if last_block and not last_block.endswith(b"\n"):
+        n_newlines += 1
+    return n_newlines
@@ -2,12 +2,13 @@
 Definition of the different metrics.
 """
 
-from typing import Dict, List, Sequence, Tuple, TypeVar
+from typing import Dict, Sequence, Tuple, TypeVar
 
 import numpy as np
 from rxn.utilities.containers import chunker
 
-from .utils import get_sequence_multiplier
+from .ranks import first_hit_ranks_from_predictions, top_n_from_ranks
+from .utils import by_n, get_sequence_multiplier, match_matrix
 
 T = TypeVar("T")
 
@@ -28,18 +29,9 @@ def top_n_accuracy(
         ground_truth=ground_truth, predictions=predictions
     )
 
-    # we will count, for each "n", how many predictions are correct
-    correct_for_topn: List[int] = [0 for _ in range(multiplier)]
-
-    # We will process sample by sample - for that, we need to chunk the predictions
-    prediction_chunks = chunker(predictions, chunk_size=multiplier)
-
-    for gt, predictions in zip(ground_truth, prediction_chunks):
-        for i in range(multiplier):
-            correct = gt in predictions[: i + 1]
-            correct_for_topn[i] += int(correct)
-
-    return {i + 1: correct_for_topn[i] / len(ground_truth) for i in range(multiplier)}
+    # All the top-n values follow from the position of the first correct prediction
+    ranks = first_hit_ranks_from_predictions(ground_truth, predictions)
+    return top_n_from_ranks(ranks, multiplier)
 
 
 def round_trip_accuracy(
@@ -56,30 +48,29 @@ def round_trip_accuracy(
         Here the standard deviation is the measure of how much the average round-trip accuracy can change from
         one sample to the other.
     """
-    multiplier = get_sequence_multiplier(
-        ground_truth=ground_truth, predictions=predictions
-    )
+    return round_trip_from_matches(match_matrix(ground_truth, predictions))
 
-    # we will get, for each prediction of each "n", how many predictions among the "n" are correct
-    correct_for_n: List[List[int]] = [[] for _ in range(multiplier)]
 
-    # We will process sample by sample - for that, we need to chunk the predictions
-    prediction_chunks = chunker(predictions, chunk_size=multiplier)
-    for gt, predictions in zip(ground_truth, prediction_chunks):
-        correct_values = 0
-        for i, prediction in enumerate(predictions):
-            correct = gt == prediction
-            correct_values += int(correct)
-            correct_for_n[i].append(correct_values)
+def round_trip_from_matches(
+    matches: np.ndarray,
+) -> Tuple[Dict[int, float], Dict[int, float]]:
+    """
+    Same as round_trip_accuracy(), from the match matrix of the round-trip
+    predictions (see match_matrix()).
+    """
+    per_sample = round_trip_per_sample(matches)
+    return by_n(per_sample.mean(axis=0)), by_n(per_sample.std(axis=0))
 
-    # Note: for the "n"-th value, we must divide by "n=i+1" because the list elements were not averaged.
-    accuracy = {
-        i + 1: float(np.mean(correct_for_n[i])) / (i + 1) for i in range(multiplier)
-    }
-    std_dev = {
-        i + 1: float(np.std(correct_for_n[i])) / (i + 1) for i in range(multiplier)
-    }
-    return accuracy, std_dev
+
+def round_trip_per_sample(matches: np.ndarray) -> np.ndarray:
+    """
+    For each sample and each "n", the fraction of correct round-trip
+    predictions among the first n; of shape (samples, predictions per sample).
+    """
+    # For each sample and each "n", how many predictions among the "n" are correct
+    correct_for_n = np.cumsum(matches, axis=1)
+    fractions: np.ndarray = correct_for_n / np.arange(1, matches.shape[1] + 1)
+    return fractions
 
 
 def coverage(ground_truth: Sequence[T], predictions: Sequence[T]) -> Dict[int, float]:
@@ -96,22 +87,9 @@ def coverage(ground_truth: Sequence[T], predictions: Sequence[T]) -> Dict[int, f
         ground_truth=ground_truth, predictions=predictions
     )
 
-    # we will count, for each "n", if there is at list one correct prediction
-    one_correct_for_n: List[int] = [0 for _ in range(multiplier)]
-
-    # We will process sample by sample - for that, we need to chunk the predictions
-    prediction_chunks = chunker(predictions, chunk_size=multiplier)
-
-    for gt, predictions in zip(ground_truth, prediction_chunks):
-        found_correct = 0
-        for i, prediction in enumerate(predictions):
-            if gt == prediction:
-                found_correct = 1
-            one_correct_for_n[i] += found_correct
-
-    # Note: the total number of predictions to take into account for the "n"-th (= "i+1"th)
-    # value is ALWAYS "len(ground_truth)".
-    return {i + 1: one_correct_for_n[i] / len(ground_truth) for i in range(multiplier)}
+    # A sample is covered at "n" if its first correct prediction is among the first n
+    ranks = first_hit_ranks_from_predictions(ground_truth, predictions)
+    return top_n_from_ranks(ranks, multiplier)
 
 
 def class_diversity(
@@ -130,6 +108,31 @@ def class_diversity(
         Here the standard deviation is the measure of how much the average class diversity can change from
         one sample to the other.
     """
+    per_sample = class_diversity_per_sample(
+        ground_truth=ground_truth,
+        predictions=predictions,
+        predicted_classes=predicted_classes,
+    )
+    # Note: the total number of predictions to take into account for the "n"-th (= "i+1"th)
+    # value is "len(ground_truth)". A value < 1 is the consequence of having incorrect predictions
+    return by_n(per_sample.mean(axis=0)), by_n(per_sample.std(axis=0))
+
+
+def class_diversity_per_sample(
+    ground_truth: Sequence[T],
+    predictions: Sequence[T],
+    predicted_classes: Sequence[str],
+) -> np.ndarray:
+    """
+    For each sample and each "n", the number of distinct superclasses among
+    the correct predictions of the first n, see class_diversity().
+
+    Raises:
+        ValueError: if the list sizes are incompatible, forwarded from get_sequence_multiplier().
+
+    Returns:
+        Array of shape (samples, predictions per sample).
+    """
     multiplier = get_sequence_multiplier(
         ground_truth=ground_truth, predictions=predictions
     )
@@ -139,8 +142,8 @@ def class_diversity(
         long_class.split(".")[0] for long_class in predicted_classes
     ]
 
-    # we will get, for each prediction of each "n", how many predictions among the "n" are correct
-    classes_for_n: List[List[int]] = [[] for _ in range(multiplier)]
+    # we will get, for each sample and each "n", how many distinct classes the correct predictions have
+    classes_for_n = np.zeros((len(ground_truth), multiplier), dtype=np.int64)
 
     # We will process sample by sample - for that, we need to chunk the predictions and the classes
     predictions_and_classes = zip(predictions, predicted_superclasses)
@@ -148,17 +151,12 @@ def class_diversity(
         predictions_and_classes, chunk_size=multiplier
     )
 
-    for gt, preds_and_classes in zip(ground_truth, prediction_and_classes_chunks):
+    for sample, (gt, preds_and_classes) in enumerate(
+        zip(ground_truth, prediction_and_classes_chunks)
+    ):
         classes = set()
         for i, (pred, pred_class) in enumerate(preds_and_classes):
             if gt == pred and pred_class != "":
                 classes.add(pred_class)
-            classes_for_n[i].append(len(classes))
-
-    # Note: the total number of predictions to take into account for the "n"-th (= "i+1"th)
-    # value is "len(ground_truth)". A value < 1 is the consequence of having incorrect predictions
-    classdiversity = {
-        i + 1: float(np.mean(classes_for_n[i])) for i in range(multiplier)
-    }
-    std_dev = {i + 1: float(np.std(classes_for_n[i])) for i in range(multiplier)}
-    return classdiversity, std_dev
+            classes_for_n[sample, i] = len(classes)
+    return classes_for_n
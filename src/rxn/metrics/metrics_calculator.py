@@ -1,7 +1,31 @@
+import functools
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Type, TypeVar
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
+import numpy as np
+
+from .bootstrap import (
+    DEFAULT_CONFIDENCE_LEVEL,
+    DEFAULT_N_RESAMPLES,
+    bootstrap_confidence_intervals,
+)
+from .evaluation_options import EvaluationOptions
+from .ground_truth import GroundTruth
 from .metrics_files import MetricsFiles
+from .profiling import profiled
+from .ranks import hits_from_ranks, top_n_from_ranks
+from .utils import get_sequence_multiplier
 
 CalculatorT = TypeVar("CalculatorT", bound="MetricsCalculator")
 
@@ -18,9 +42,154 @@ class MetricsCalculator(ABC):
         Note: the paths to ground truth and prediction are to be set in the
         constructor of the derived class."""
 
+    def first_hit_ranks(self) -> Dict[str, np.ndarray]:
+        """First-hit ranks for the families of metrics of the calculator (see
+        rxn.metrics.ranks), by family name. Empty if not applicable.
+
+        Note: the derived classes compute them only once, also when called
+        from get_metrics()."""
+        return {}
+
+    def per_sample_metrics(
+        self, names: Optional[Collection[str]] = None
+    ) -> Dict[str, np.ndarray]:
+        """Per-sample values of the metrics that are means over the samples,
+        for the bootstrap confidence intervals (see rxn.metrics.bootstrap) and
+        the strata. Of shape (samples, predictions per sample) for the top-n
+        metrics, (samples,) otherwise.
+
+        The names are the keys of the metrics in get_metrics() and
+        optional_metrics(), joined with dots for the nested ones (f.i.
+        "rank.mrr"). The optional metrics are included once computed.
+
+        Args:
+            names: if given, compute only these metrics (the names not
+                available for the calculator are ignored)."""
+        return {
+            name: compute()
+            for name, compute in self._per_sample_functions().items()
+            if names is None or name in names
+        }
+
+    def _per_sample_functions(self) -> Dict[str, Callable[[], np.ndarray]]:
+        """Functions computing the per-sample values of the metrics, by name,
+        see per_sample_metrics()."""
+        return {}
+
+    def optional_metrics(
+        self, options: EvaluationOptions, metrics_files: MetricsFiles
+    ) -> Dict[str, Any]:
+        """Metrics enabled in the evaluation options (tiered accuracy,
+        similarity, multi-reference metrics), in addition to the ones of
+        get_metrics(). Empty if none of them applies to the calculator.
+
+        Args:
+            options: evaluation options.
+            metrics_files: location of the ground truth and prediction files,
+                for the default cache file of the molecular keys."""
+        return {}
+
+    def confidence_intervals(
+        self,
+        n_resamples: int = DEFAULT_N_RESAMPLES,
+        confidence_level: float = DEFAULT_CONFIDENCE_LEVEL,
+    ) -> Dict[str, Any]:
+        """Bootstrap confidence intervals of the metrics that are means over
+        the samples, by the names of per_sample_metrics(), see
+        bootstrap_confidence_intervals().
+
+        The other metrics (f.i. the standard deviations, the mean and median
+        ranks, or the calibration errors and curves from the confidence of
+        the predictions) have no intervals."""
+        return bootstrap_confidence_intervals(
+            self.per_sample_metrics(),
+            n_resamples=n_resamples,
+            confidence_level=confidence_level,
+        )
+
     @classmethod
     @abstractmethod
     def from_metrics_files(
-        cls: Type[CalculatorT], metrics_files: MetricsFiles
+        cls: Type[CalculatorT],
+        metrics_files: MetricsFiles,
+        ground_truth: Optional[GroundTruth] = None,
+        use_binary_cache: bool = False,
     ) -> CalculatorT:
-        """Build the instance from the MetricsFiles object."""
+        """Build the instance from the MetricsFiles object.
+
+        Args:
+            metrics_files: location of the ground truth and prediction files.
+            ground_truth: already loaded ground truth, for instance when it is
+                shared between several results directories. If not given, it
+                is loaded from the files.
+            use_binary_cache: whether to load the predictions through the
+                binary cache of the results directory (created if necessary).
+        """
+
+
+def precomputed(
+    values: Mapping[str, np.ndarray]
+) -> Dict[str, Callable[[], np.ndarray]]:
+    """Per-sample functions (see MetricsCalculator._per_sample_functions())
+    returning values computed already."""
+    return {name: functools.partial(_identity, array) for name, array in values.items()}
+
+
+def _identity(array: np.ndarray) -> np.ndarray:
+    return array
+
+
+def chemistry_metrics(
+    ground_truth: Sequence[str],
+    predictions: Sequence[str],
+    options: EvaluationOptions,
+    metrics_files: MetricsFiles,
+) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """
+    Tiered accuracy and fingerprint similarity of the predictions, if enabled
+    in the evaluation options (see rxn.metrics.chemical_equivalence and
+    rxn.metrics.fingerprint_similarity).
+
+    Returns:
+        Tuple: the metrics, and their per-sample values (see
+        MetricsCalculator.per_sample_metrics()).
+    """
+    metrics: Dict[str, Any] = {}
+    per_sample: Dict[str, np.ndarray] = {}
+    if options.with_tiered_accuracy:
+        # Imported here, as it loads RDKit
+        from .chemical_equivalence import MolecularKeyCache, tiered_first_hit_ranks
+
+        key_cache_file = options.key_cache_file or metrics_files.molecular_keys_file
+        multiplier = get_sequence_multiplier(
+            ground_truth=ground_truth, predictions=predictions
+        )
+        with profiled("tiered_accuracy"):
+            tiered_ranks = tiered_first_hit_ranks(
+                ground_truth,
+                predictions,
+                key_cache=MolecularKeyCache(key_cache_file),
+                n_workers=options.n_rdkit_workers,
+            )
+        if tiered_ranks:
+            metrics["tiered-accuracy"] = {
+                tier: top_n_from_ranks(ranks, multiplier)
+                for tier, ranks in tiered_ranks.items()
+            }
+        for tier, ranks in tiered_ranks.items():
+            per_sample[f"tiered-accuracy.{tier}"] = hits_from_ranks(ranks, multiplier)
+    if options.with_similarity:
+        # Imported here, as it loads RDKit
+        from .fingerprint_similarity import (
+            best_similarities,
+            similarity_per_sample,
+            summarize_similarities,
+        )
+
+        with profiled("similarity_metrics"):
+            best_at_n = best_similarities(
+                ground_truth, predictions, n_workers=options.n_rdkit_workers
+            )
+        metrics.update(summarize_similarities(best_at_n))
+        per_sample.update(similarity_per_sample(best_at_n))
+    return metrics, per_sample
@@ -1,9 +1,23 @@
 from pathlib import Path
+from typing import List, Tuple
 
 from rxn.utilities.files import PathLike
 
+from .manifest import MANIFEST_FILE_NAME, FilesManifest
+from .timing import StageTimer
+
 
 class MetricsFiles:
+    # Attributes of the text files, starting with the ground truth source;
+    # extended by the subclasses defining more text files
+    _TEXT_FILES: Tuple[str, ...] = (
+        "gt_src",
+        "gt_tgt",
+        "predicted",
+        "predicted_canonical",
+        "gt_classes",
+    )
+
     def __init__(
         self,
         directory: PathLike,
@@ -15,10 +29,31 @@ class MetricsFiles:
         self.directory = Path(directory)
         self.log_file = self.directory / "log.txt"
         self.metrics_file = self.directory / "metrics.json"
+        self.timings_file = self.directory / "timings.json"
+        self.first_hit_ranks_file = self.directory / "first_hit_ranks.npz"
+        self.molecular_keys_file = self.directory / "molecular_keys.json"
+        self.binary_cache_dir = self.directory / "binary_cache"
+        self.line_index_dir = self.directory / "line_index"
+        self.manifest = FilesManifest(self.directory / MANIFEST_FILE_NAME)
+        self.timer = StageTimer(self.timings_file)
         self.gt_src = self.directory / gt_src
         self.gt_tgt = self.directory / gt_tgt
         self.predicted = self.directory / predicted
         self.predicted_canonical = self.directory / predicted_canonical
+        # Optional reaction class of every ground-truth sample, for the strata
+        self.gt_classes = self.directory / "gt_classes.txt"
+
+    def text_files(self) -> List[Path]:
+        """Existing text files of the results directory known to this class,
+        starting with the ground truth source."""
+        paths: List[Path] = [getattr(self, name) for name in self._TEXT_FILES]
+        return [path for path in paths if path.is_file()]
+
+    def record(self, *paths: PathLike) -> None:
+        """Record freshly written files in the manifest, with their multiplier
+        relative to the ground truth source."""
+        for path in paths:
+            self.manifest.record(path, reference=self.gt_src)
 
 
 class RetroFiles(MetricsFiles):
@@ -28,6 +63,18 @@ class RetroFiles(MetricsFiles):
     """
 
     _REORDERED_FILE_EXTENSION = ".reordered"
+    _TEXT_FILES = MetricsFiles._TEXT_FILES + (
+        "class_token_products",
+        "class_token_precursors",
+        "predicted_precursors_log_probs",
+        "predicted_products",
+        "predicted_products_canonical",
+        "predicted_products_log_probs",
+        "predicted_rxn_canonical",
+        "predicted_classes",
+        "gt_mapped",
+        "predicted_mapped",
+    )
 
     def __init__(self, directory: PathLike):
         super().__init__(
@@ -0,0 +1,168 @@
+"""
+Metrics for ground truths recording several references for the same input,
+typically a retro test set where a product appears in several samples with
+different precursors.
+
+The samples are grouped by canonical product (see canonical_sources()), as
+the same product may be written differently in several samples, and the references recorded for every product are stored as sorted
+(product, reference) keys, so that checking whether a prediction matches any
+reference of its product is one binary search. The metrics are computed once
+per distinct product, on the predictions of its first sample: with
+deterministic translations (see translate_unique_sources()), all the samples
+of a product have the same predictions.
+"""
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+from rxn.utilities.misc import get_multiplier
+
+from .ground_truth import GroundTruth, SampleGroups
+from .interning import StringTable
+from .ranks import (
+    first_hit_ranks,
+    hits_from_ranks,
+    rank_metrics,
+    reciprocal_ranks,
+    top_n_from_ranks,
+)
+
+
+class ReferenceIndex:
+    """
+    Index of the references recorded for every distinct input.
+
+    The inputs are grouped by identical strings: they are expected to be
+    canonical, see canonical_sources().
+
+    Args:
+        inputs: input of every sample (f.i. the products, for retro).
+        references: reference of every sample (f.i. the precursors, for retro).
+
+    Raises:
+        ValueError: if the numbers of inputs and references differ.
+    """
+
+    def __init__(self, inputs: Iterable[str], references: Iterable[str]):
+        input_table = StringTable()
+        self.input_ids = input_table.add_all(inputs).astype(np.int64)
+        self.n_inputs = len(input_table)
+
+        self._references = StringTable()
+        reference_ids = self._references.add_all(references).astype(np.int64)
+        if len(reference_ids) != len(self.input_ids):
+            raise ValueError(
+                f"Got {len(reference_ids)} references for {len(self.input_ids)} inputs."
+            )
+        self._keys = np.unique(self.input_ids * self._n_keys + reference_ids)
+
+        # The IDs are given in order of first occurrence
+        _, self.first_samples = np.unique(self.input_ids, return_index=True)
+
+    @property
+    def n_samples(self) -> int:
+        return len(self.input_ids)
+
+    @property
+    def _n_keys(self) -> int:
+        # Number of key values per input
+        return max(len(self._references), 1)
+
+    def references_per_input(self) -> np.ndarray:
+        """Number of distinct references of every distinct input."""
+        counts: np.ndarray = np.bincount(
+            self._keys // self._n_keys, minlength=self.n_inputs
+        )
+        return counts
+
+    def matches(self, predictions: Sequence[str]) -> np.ndarray:
+        """
+        Whether the predictions match any reference of their input.
+
+        Args:
+            predictions: predictions for all the samples, the same number for
+                every sample.
+
+        Returns:
+            Boolean matrix of shape (distinct inputs, predictions per sample),
+            for the predictions of the first sample of every input.
+        """
+        multiplier = get_multiplier(self.n_samples, len(predictions))
+        positions = (
+            self.first_samples[:, np.newaxis] * multiplier + np.arange(multiplier)
+        ).ravel()
+        prediction_ids = np.fromiter(
+            (self._references.get_id(predictions[i]) for i in positions.tolist()),
+            dtype=np.int64,
+            count=len(positions),
+        ).reshape(self.n_inputs, multiplier)
+
+        queries = np.arange(self.n_inputs)[:, np.newaxis] * self._n_keys + np.maximum(
+            prediction_ids, 0
+        )
+        if len(self._keys) == 0:
+            return np.zeros(queries.shape, dtype=bool)
+        found = np.searchsorted(self._keys, queries)
+        matches: np.ndarray = (prediction_ids >= 0) & (
+            self._keys[np.minimum(found, len(self._keys) - 1)] == queries
+        )
+        return matches
+
+
+def canonical_sources(ground_truth: GroundTruth) -> List[str]:
+    """
+    Canonical ground-truth source of every sample (see
+    overlap_index.standardize()), computed only once for a ground truth and
+    stored with it.
+    """
+
+    def compute() -> List[SampleGroups]:
+        # Imported here, as it loads RDKit
+        from .overlap_index import standardize
+
+        return [[[standardize(src)]] for src in ground_truth.src]
+
+    derived = ground_truth.derived("canonical_src", compute)
+    return [groups[0][0] if groups else "" for groups in derived]
+
+
+def multi_reference_metrics(
+    index: ReferenceIndex, predictions: Sequence[str]
+) -> Dict[str, Any]:
+    """
+    Top-n accuracy and rank metrics over the distinct inputs, where a
+    prediction is correct if it matches any reference of its input.
+
+    Returns:
+        Dictionary with the accuracy ("multi-reference-accuracy"), the rank
+        metrics ("multi-reference-rank", see rank_metrics()), the number of
+        distinct inputs, and their mean number of references. Empty if there
+        are no samples.
+    """
+    if index.n_inputs == 0:
+        return {}
+    matches = index.matches(predictions)
+    ranks = first_hit_ranks(matches)
+    return {
+        "multi-reference-accuracy": top_n_from_ranks(ranks, matches.shape[1]),
+        "multi-reference-rank": rank_metrics(ranks),
+        "n-distinct-inputs": index.n_inputs,
+        "references-per-input": float(index.references_per_input().mean()),
+    }
+
+
+def multi_reference_per_input(
+    index: ReferenceIndex, predictions: Sequence[str]
+) -> Dict[str, np.ndarray]:
+    """
+    Per-input values of the multi-reference metrics that are means over the
+    distinct inputs (see multi_reference_metrics()), for their bootstrap
+    confidence intervals: of shape (distinct inputs, predictions per sample)
+    for the accuracy, (distinct inputs,) for the mean reciprocal rank
+    ("multi-reference-rank.mrr").
+    """
+    matches = index.matches(predictions)
+    ranks = first_hit_ranks(matches)
+    return {
+        "multi-reference-accuracy": hits_from_ranks(ranks, matches.shape[1]),
+        "multi-reference-rank.mrr": reciprocal_ranks(ranks),
+    }
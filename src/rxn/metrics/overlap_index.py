@@ -0,0 +1,221 @@
+"""
+Index of the SMILES of a training set, to split the test samples into the
+ones whose product (or precursor set) was seen during training and the
+novel ones.
+
+The index stores 64-bit hashes of the (detokenized, standardized) SMILES as
+sorted uint64 arrays, one per kind ("products", "precursors"), in ".npy"
+files. They are memory-mapped for the lookups, which are binary searches;
+tens of millions of training reactions take a few hundred MB on disk. With
+64-bit hashes, the probability of a false "seen" is negligible (about 1e-11
+per lookup for 1e8 indexed SMILES).
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+from rxn.utilities.containers import chunker
+from rxn.utilities.files import PathLike
+
+from .compression import iterate_lines
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+KINDS = ["products", "precursors"]
+SEEN_LABEL = "seen"
+NOVEL_LABEL = "novel"
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+_FORMAT_VERSION = 1
+
+
+def smiles_hash(smiles: str) -> int:
+    """Stable 64-bit hash of a SMILES string (independent of PYTHONHASHSEED)."""
+    digest = hashlib.blake2b(smiles.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def hash_smiles(smiles: Iterable[str]) -> np.ndarray:
+    """Hashes of SMILES strings, as a uint64 array."""
+    return np.fromiter((smiles_hash(s) for s in smiles), dtype=np.uint64)
+
+
+def standardize(smiles: str) -> str:
+    """Detokenized SMILES, canonicalized with sorted molecules like the
+    predictions (see canonicalize_file); unchanged if it cannot be parsed."""
+    from rxn.chemutils.miscellaneous import canonicalize_any
+
+    smiles = _detokenize(smiles)
+    return canonicalize_any(smiles, fallback_value=smiles, sort_molecules=True)
+
+
+def _detokenize(smiles: str) -> str:
+    return "".join(smiles.split())
+
+
+def _unique_hashes(lines: List[str], canonicalize: bool = False) -> np.ndarray:
+    """Sorted unique hashes of a chunk of lines."""
+    transform = standardize if canonicalize else _detokenize
+    hashes = hash_smiles(transform(line) for line in lines)
+    unique: np.ndarray = np.unique(hashes)
+    return unique
+
+
+def build_hash_array(
+    lines: Iterable[str],
+    canonicalize: bool = False,
+    n_workers: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> np.ndarray:
+    """
+    Sorted array of the distinct hashes of SMILES strings.
+
+    The lines are processed by chunks, deduplicated chunk by chunk, so that
+    only the (8-byte) hashes are kept in memory.
+
+    Args:
+        lines: SMILES strings, possibly tokenized.
+        canonicalize: whether to canonicalize the SMILES first (with RDKit);
+            not needed if they are standardized already.
+        n_workers: number of processes to hash (and canonicalize) with.
+        chunk_size: number of lines per chunk.
+    """
+    chunks: Iterator[List[str]] = chunker(lines, chunk_size=chunk_size)
+    compute = functools.partial(_unique_hashes, canonicalize=canonicalize)
+    arrays: List[np.ndarray] = []
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            # A few chunks per worker at a time, to bound the memory
+            for window in chunker(chunks, chunk_size=2 * n_workers):
+                arrays.extend(executor.map(compute, window))
+    else:
+        arrays = [compute(chunk) for chunk in chunks]
+
+    if not arrays:
+        return np.zeros(0, dtype=np.uint64)
+    unique: np.ndarray = np.unique(np.concatenate(arrays))
+    return unique
+
+
+class OverlapIndex:
+    """
+    Index of the SMILES of a training set, see the module docstring.
+
+    Args:
+        directory: directory of the index, see build_overlap_index().
+    """
+
+    def __init__(self, directory: PathLike):
+        self.directory = Path(directory)
+        with open(self.directory / "meta.json", "rt") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != _FORMAT_VERSION:
+            raise ValueError(f'Unsupported overlap index in "{self.directory}".')
+        self._hashes: Dict[str, np.ndarray] = {}
+
+    @property
+    def kinds(self) -> List[str]:
+        """Kinds of SMILES in the index ("products", "precursors")."""
+        return [kind for kind in KINDS if kind in self.meta["counts"]]
+
+    def hashes(self, kind: str) -> np.ndarray:
+        """Sorted hashes of one kind of SMILES, memory-mapped."""
+        if kind not in self._hashes:
+            self._hashes[kind] = np.load(self.directory / f"{kind}.npy", mmap_mode="r")
+        return self._hashes[kind]
+
+    def contains(self, kind: str, smiles: Sequence[str]) -> np.ndarray:
+        """
+        Whether SMILES strings are in the index.
+
+        Args:
+            kind: kind of SMILES ("products", "precursors").
+            smiles: standardized SMILES strings.
+
+        Returns:
+            Boolean array, one value per SMILES.
+        """
+        hashes = self.hashes(kind)
+        queries = hash_smiles(smiles)
+        if len(hashes) == 0:
+            return np.zeros(len(queries), dtype=bool)
+        positions = np.searchsorted(hashes, queries)
+        found: np.ndarray = hashes[np.minimum(positions, len(hashes) - 1)] == queries
+        return found
+
+    def labels(self, kind: str, smiles: Sequence[str]) -> List[str]:
+        """SEEN_LABEL or NOVEL_LABEL for each SMILES."""
+        return [
+            SEEN_LABEL if seen else NOVEL_LABEL
+            for seen in self.contains(kind, smiles).tolist()
+        ]
+
+
+def build_overlap_index(
+    directory: PathLike,
+    products_file: Optional[PathLike] = None,
+    precursors_file: Optional[PathLike] = None,
+    canonicalize: bool = False,
+    n_workers: int = 1,
+) -> OverlapIndex:
+    """
+    Build the overlap index of a training set.
+
+    Args:
+        directory: directory to write the index to (created if necessary).
+        products_file: training products, one (set of) product(s) per line.
+        precursors_file: training precursors, one set of precursors per line.
+        canonicalize: whether to canonicalize the SMILES (with RDKit); not
+            needed if the training files are standardized like the test set.
+        n_workers: number of processes to hash (and canonicalize) with.
+
+    Raises:
+        ValueError: if no file is given.
+    """
+    files = {"products": products_file, "precursors": precursors_file}
+    if all(filename is None for filename in files.values()):
+        raise ValueError("At least one training file is needed for the index.")
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    counts: Dict[str, int] = {}
+    for kind, filename in files.items():
+        if filename is None:
+            continue
+        logger.info(f'Hashing the training {kind} from "{filename}"...')
+        hashes = build_hash_array(
+            iterate_lines(filename), canonicalize=canonicalize, n_workers=n_workers
+        )
+        # Written under a temporary name, so that an interrupted build does
+        # not leave a truncated array behind
+        tmp_file = directory / f"{kind}.tmp.npy"
+        np.save(tmp_file, hashes)
+        os.replace(tmp_file, directory / f"{kind}.npy")
+        counts[kind] = len(hashes)
+        logger.info(f"Indexed {len(hashes)} distinct training {kind}.")
+
+    with open(directory / "meta.json", "wt") as f:
+        json.dump({"format_version": _FORMAT_VERSION, "counts": counts}, f, indent=2)
+    return OverlapIndex(directory)
+
+
+def overlap_labels(
+    index: OverlapIndex, products: Sequence[str], precursors: Sequence[str]
+) -> Dict[str, List[str]]:
+    """
+    Whether the ground-truth products and precursors of the test samples were
+    seen in the training set.
+
+    Returns:
+        SEEN_LABEL or NOVEL_LABEL for every sample, by kind of SMILES (only
+        the kinds in the index).
+    """
+    smiles = {"products": products, "precursors": precursors}
+    return {kind: index.labels(kind, smiles[kind]) for kind in index.kinds}
@@ -0,0 +1,237 @@
+"""
+Opt-in profiling of the evaluation stages.
+
+Profiling is activated with the RXN_METRICS_PROFILE environment variable (or
+the --profile option of the evaluation scripts):
+    - "cprofile": deterministic profiling with cProfile, written to
+      "<stage>.pstats" files (to inspect with pstats or snakeviz);
+    - "sample": statistical profiling, sampling the stack of the profiled
+      thread at regular intervals (RXN_METRICS_PROFILE_INTERVAL, in seconds),
+      written to "<stage>.collapsed" files (one "frame;frame;... count" line
+      per distinct stack, for flame graph tools).
+
+The profiles are written to the "profiles" subdirectory of the results
+directory being evaluated (or to RXN_METRICS_PROFILE_DIR if set), and are
+accumulated over the calls of a stage in the same process.
+RXN_METRICS_PROFILE_STAGES optionally restricts profiling to a
+comma-separated list of stages.
+"""
+import cProfile
+import functools
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from types import FrameType
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import click
+from rxn.utilities.files import PathLike
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+PROFILE_ENV_VAR = "RXN_METRICS_PROFILE"
+PROFILE_DIR_ENV_VAR = "RXN_METRICS_PROFILE_DIR"
+PROFILE_STAGES_ENV_VAR = "RXN_METRICS_PROFILE_STAGES"
+PROFILE_INTERVAL_ENV_VAR = "RXN_METRICS_PROFILE_INTERVAL"
+PROFILE_MODES = ["cprofile", "sample"]
+PROFILES_DIR_NAME = "profiles"
+
+_DEFAULT_SAMPLING_INTERVAL = 0.005
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Directory for the profiles, set for the results directory being evaluated
+_default_directory: Optional[Path] = None
+# Profiles accumulated over the calls of the stages, by output file
+_cprofiles: Dict[Path, cProfile.Profile] = {}
+_stack_counts: Dict[Path, "Counter[str]"] = {}
+# Only one cProfile profiler can be active at a time
+_cprofile_active = False
+
+
+def profiling_mode() -> Optional[str]:
+    """Profiling mode from the environment, None if profiling is deactivated."""
+    mode = os.environ.get(PROFILE_ENV_VAR, "").strip().lower()
+    if not mode:
+        return None
+    if mode not in PROFILE_MODES:
+        raise ValueError(
+            f'Invalid value for {PROFILE_ENV_VAR}: "{mode}" '
+            f"(expected one of {PROFILE_MODES})."
+        )
+    return mode
+
+
+def enable_profiling(mode: Optional[str]) -> None:
+    """Activate profiling for this process (and the processes it spawns)."""
+    if mode is not None:
+        os.environ[PROFILE_ENV_VAR] = mode
+
+
+def profile_option(fn: F) -> F:
+    """Click option "--profile" for the scripts, to pass to enable_profiling()."""
+    option = click.option(
+        "--profile",
+        type=click.Choice(PROFILE_MODES),
+        default=None,
+        help=(
+            "If given, profile the evaluation stages and write the profiles to "
+            f"the results directory. Can also be set with {PROFILE_ENV_VAR}."
+        ),
+    )
+    return option(fn)
+
+
+@contextmanager
+def profiling_directory(results_dir: PathLike) -> Iterator[None]:
+    """Write the profiles of the stages run in this context to the profiles
+    subdirectory of the given results directory."""
+    global _default_directory
+    previous = _default_directory
+    _default_directory = Path(results_dir) / PROFILES_DIR_NAME
+    try:
+        yield
+    finally:
+        _default_directory = previous
+
+
+@contextmanager
+def profiled(stage: str, directory: Optional[PathLike] = None) -> Iterator[None]:
+    """
+    Profile the code run in this context, if profiling is activated.
+
+    Args:
+        stage: name of the stage, used for the name of the profile file.
+        directory: where to write the profile; defaults to the directory set
+            with profiling_directory(), or to the current directory.
+    """
+    mode = profiling_mode()
+    if mode is None or not _stage_is_selected(stage):
+        yield
+        return
+
+    output_dir = _output_directory(directory)
+    if mode == "cprofile":
+        with _cprofiled(stage, output_dir):
+            yield
+    else:
+        with _sampled(stage, output_dir):
+            yield
+
+
+def profile_hook(stage: str) -> Callable[[F], F]:
+    """Decorator profiling every call of a function, see profiled()."""
+
+    def decorator(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with profiled(stage):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def _stage_is_selected(stage: str) -> bool:
+    stages = os.environ.get(PROFILE_STAGES_ENV_VAR, "")
+    if not stages.strip():
+        return True
+    return stage in {s.strip() for s in stages.split(",")}
+
+
+def _output_directory(directory: Optional[PathLike]) -> Path:
+    from_env = os.environ.get(PROFILE_DIR_ENV_VAR)
+    if from_env:
+        return Path(from_env)
+    if directory is not None:
+        return Path(directory)
+    if _default_directory is not None:
+        return _default_directory
+    return Path.cwd() / PROFILES_DIR_NAME
+
+
+@contextmanager
+def _cprofiled(stage: str, output_dir: Path) -> Iterator[None]:
+    global _cprofile_active
+    if _cprofile_active:
+        # Nested stage: already covered by the enclosing profile
+        logger.debug(f'Not profiling "{stage}" separately (nested stage).')
+        yield
+        return
+
+    output_file = output_dir / f"{stage}.pstats"
+    profile = _cprofiles.setdefault(output_file, cProfile.Profile())
+    _cprofile_active = True
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        _cprofile_active = False
+        output_dir.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(str(output_file))
+        logger.info(f'Profile of "{stage}" written to "{output_file}".')
+
+
+@contextmanager
+def _sampled(stage: str, output_dir: Path) -> Iterator[None]:
+    output_file = output_dir / f"{stage}.collapsed"
+    counts = _stack_counts.setdefault(output_file, Counter())
+    interval = float(
+        os.environ.get(PROFILE_INTERVAL_ENV_VAR, _DEFAULT_SAMPLING_INTERVAL)
+    )
+    sampler = _StackSampler(threading.get_ident(), interval)
+    sampler.start()
+    try:
+        yield
+    finally:
+        counts.update(sampler.stop())
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with open(output_file, "wt") as f:
+            for stack, count in sorted(counts.items()):
+                f.write(f"{stack} {count}\n")
+        logger.info(f'Sampled profile of "{stage}" written to "{output_file}".')
+
+
+class _StackSampler:
+    """Sample the stack of a thread at regular intervals, from a background
+    thread."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._counts: "Counter[str]" = Counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> "Counter[str]":
+        self._stop.set()
+        self._thread.join()
+        return self._counts
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._counts[_collapse(frame)] += 1
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    """Collapsed representation of a stack, from the outermost frame."""
+    frames: List[Tuple[str, str]] = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append((os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    return ";".join(
+        f"{function} ({filename})" for filename, function in reversed(frames)
+    )
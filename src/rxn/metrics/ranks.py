@@ -0,0 +1,141 @@
+"""
+First-hit ranks: for each sample, the (0-based) position of the first correct
+prediction, NO_HIT if none of the predictions is correct.
+
+They are computed once per family of metrics (precursors, products, true
+reactants, context); the top-n accuracies, the coverage and the rank-based
+metrics (mean reciprocal rank, mean and median rank, hit@k) are derived from
+them in one pass over the samples.
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterable, Mapping, Sequence, TypeVar
+
+import numpy as np
+from rxn.utilities.files import PathLike
+
+from .utils import match_matrix
+
+T = TypeVar("T")
+
+NO_HIT = -1
+RANK_DTYPE = np.int16
+
+
+def first_hit_ranks(matches: np.ndarray) -> np.ndarray:
+    """
+    First-hit ranks from a match matrix.
+
+    Args:
+        matches: boolean matrix of shape (number of samples, predictions per
+            sample), see match_matrix().
+
+    Raises:
+        ValueError: if there are too many predictions per sample for the rank type.
+
+    Returns:
+        int16 array with the rank of the first correct prediction of each
+        sample, NO_HIT for the samples without any.
+    """
+    multiplier = matches.shape[1]
+    if multiplier > np.iinfo(RANK_DTYPE).max:
+        raise ValueError(
+            f"Too many predictions per sample ({multiplier}) for first-hit ranks."
+        )
+    ranks: np.ndarray = np.argmax(matches, axis=1).astype(RANK_DTYPE)
+    ranks[~matches.any(axis=1)] = NO_HIT
+    return ranks
+
+
+def first_hit_ranks_from_predictions(
+    ground_truth: Sequence[T], predictions: Sequence[T]
+) -> np.ndarray:
+    """
+    First-hit ranks of predictions, by comparison with the ground truth.
+
+    Raises:
+        ValueError: if the list sizes are incompatible, forwarded from get_sequence_multiplier().
+    """
+    return first_hit_ranks(match_matrix(ground_truth, predictions))
+
+
+def top_n_from_ranks(ranks: np.ndarray, multiplier: int) -> Dict[int, float]:
+    """
+    Fraction of the samples with a correct prediction among the first n, for
+    n from 1 to the number of predictions per sample.
+
+    This is the top-n accuracy (or the coverage, for round-trip matches).
+    """
+    hits = np.bincount(ranks[ranks != NO_HIT], minlength=multiplier)[:multiplier]
+    fractions = np.cumsum(hits) / len(ranks)
+    return {n: float(fractions[n - 1]) for n in range(1, multiplier + 1)}
+
+
+def hits_from_ranks(ranks: np.ndarray, multiplier: int) -> np.ndarray:
+    """
+    Whether each sample has a correct prediction among the first n, for n
+    from 1 to the number of predictions per sample.
+
+    Returns:
+        Boolean array of shape (number of samples, multiplier); its mean over
+        the samples is the top-n accuracy.
+    """
+    hits: np.ndarray = (ranks[:, np.newaxis] != NO_HIT) & (
+        ranks[:, np.newaxis] < np.arange(1, multiplier + 1)
+    )
+    return hits
+
+
+def reciprocal_ranks(ranks: np.ndarray) -> np.ndarray:
+    """Reciprocal of the (1-based) first-hit rank of each sample, 0 for the
+    samples without hit; its mean is the mean reciprocal rank."""
+    reciprocal = np.zeros(len(ranks), dtype=np.float64)
+    hit = ranks != NO_HIT
+    reciprocal[hit] = 1 / (ranks[hit].astype(np.float64) + 1)
+    return reciprocal
+
+
+def hit_at_k(ranks: np.ndarray, k: int) -> float:
+    """Fraction of the samples with a correct prediction among the first k."""
+    return float(np.mean((ranks != NO_HIT) & (ranks < k)))
+
+
+def rank_metrics(ranks: np.ndarray, ks: Iterable[int] = ()) -> Dict[str, Any]:
+    """
+    Rank-based metrics.
+
+    Args:
+        ranks: first-hit ranks.
+        ks: values of k to compute hit@k for (in addition to the top-n
+            accuracies, they may exceed the number of predictions per sample).
+
+    Returns:
+        Dictionary with:
+            - "mrr": mean reciprocal rank, counting 0 for the samples without hit;
+            - "mean-rank", "median-rank": mean and median (1-based) rank of the
+              first correct prediction, over the samples with a hit; None if
+              there is no hit at all;
+            - "hit@k" for the given values of k.
+    """
+    hit = ranks != NO_HIT
+    one_based = ranks[hit].astype(np.float64) + 1
+
+    metrics: Dict[str, Any] = {
+        "mrr": float(np.sum(1 / one_based) / len(ranks)),
+        "mean-rank": float(np.mean(one_based)) if hit.any() else None,
+        "median-rank": float(np.median(one_based)) if hit.any() else None,
+    }
+    for k in ks:
+        metrics[f"hit@{k}"] = hit_at_k(ranks, k)
+    return metrics
+
+
+def save_first_hit_ranks(filename: PathLike, ranks: Mapping[str, np.ndarray]) -> None:
+    """Save the first-hit ranks of several families of metrics to a ".npz" file."""
+    arrays: Dict[str, Any] = dict(ranks)
+    np.savez(Path(filename), **arrays)
+
+
+def load_first_hit_ranks(filename: PathLike) -> Dict[str, np.ndarray]:
+    """Load the first-hit ranks saved with save_first_hit_ranks()."""
+    with np.load(Path(filename)) as data:
+        return {family: data[family] for family in data.files}
@@ -0,0 +1,192 @@
+"""
+Re-ranking of the retro predictions with a score combining the retro and
+forward log probabilities and the round-trip success, and evaluation of the
+re-ranked predictions.
+
+The match matrices (which predictions are correct, which ones give back the
+product) are computed once; re-ranking then only permutes their columns, so
+that a whole grid of weightings is evaluated without re-running the pipeline
+or comparing strings again.
+"""
+import itertools
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from rxn.utilities.files import PathLike
+
+from .metrics import round_trip_from_matches
+from .metrics_files import RetroFiles
+from .ranks import first_hit_ranks, top_n_from_ranks
+from .retro_metrics import RetroMetrics
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class RerankingWeights:
+    """
+    Weights of the re-ranking score:
+        retro * retro log prob + forward * forward log prob
+        + round_trip * (1 if the forward prediction is the product, else 0)
+    """
+
+    def __init__(
+        self, retro: float = 1.0, forward: float = 0.0, round_trip: float = 0.0
+    ):
+        self.retro = retro
+        self.forward = forward
+        self.round_trip = round_trip
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "retro": self.retro,
+            "forward": self.forward,
+            "round_trip": self.round_trip,
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f"RerankingWeights(retro={self.retro}, forward={self.forward}, "
+            f"round_trip={self.round_trip})"
+        )
+
+
+def weights_grid(
+    retro: Iterable[float], forward: Iterable[float], round_trip: Iterable[float]
+) -> List[RerankingWeights]:
+    """All the combinations of the given weight values."""
+    return [
+        RerankingWeights(retro=r, forward=f, round_trip=rt)
+        for r, f, rt in itertools.product(retro, forward, round_trip)
+    ]
+
+
+class Reranker:
+    """
+    Evaluation of re-ranked retro predictions.
+
+    Args:
+        accuracy_matches: whether each prediction is the ground truth, shape
+            (samples, predictions per sample).
+        round_trip_matches: whether the forward prediction of each prediction
+            is the ground truth product, same shape.
+        retro_log_probs: log probabilities of the retro predictions, same shape.
+        forward_log_probs: log probabilities of the forward predictions, if
+            available, same shape.
+    """
+
+    def __init__(
+        self,
+        accuracy_matches: np.ndarray,
+        round_trip_matches: np.ndarray,
+        retro_log_probs: np.ndarray,
+        forward_log_probs: Optional[np.ndarray] = None,
+    ):
+        self.accuracy_matches = accuracy_matches
+        self.round_trip_matches = round_trip_matches
+        self.retro_log_probs = retro_log_probs.astype(np.float64)
+        self.forward_log_probs = (
+            None if forward_log_probs is None else forward_log_probs.astype(np.float64)
+        )
+
+    @classmethod
+    def from_retro_metrics(cls, retro_metrics: RetroMetrics) -> "Reranker":
+        """
+        Raises:
+            ValueError: if the retro log probabilities are not available.
+        """
+        if retro_metrics.predicted_precursors_log_probs is None:
+            raise ValueError("Re-ranking requires the retro log probabilities.")
+        return cls(
+            accuracy_matches=retro_metrics.matches("precursors"),
+            round_trip_matches=retro_metrics.matches("products"),
+            retro_log_probs=retro_metrics.predicted_precursors_log_probs,
+            forward_log_probs=retro_metrics.predicted_products_log_probs,
+        )
+
+    def scores(self, weights: RerankingWeights) -> np.ndarray:
+        """
+        Raises:
+            ValueError: for a forward weight without forward log probabilities.
+        """
+        scores = weights.retro * self.retro_log_probs
+        if weights.forward != 0:
+            if self.forward_log_probs is None:
+                raise ValueError(
+                    "A forward weight requires the forward log probabilities."
+                )
+            scores = scores + weights.forward * self.forward_log_probs
+        if weights.round_trip != 0:
+            scores = scores + weights.round_trip * self.round_trip_matches
+        return scores
+
+    def order(self, weights: RerankingWeights) -> np.ndarray:
+        """Indices of the predictions of each sample, by decreasing score.
+        The sort is stable, so that ties keep the original beam order."""
+        return np.argsort(-self.scores(weights), axis=1, kind="stable")
+
+    def evaluate(self, weights: RerankingWeights) -> Dict[str, Any]:
+        """Top-n accuracy, round-trip accuracy and coverage of the re-ranked
+        predictions, as in RetroMetrics."""
+        order = self.order(weights)
+        accuracy_matches = np.take_along_axis(self.accuracy_matches, order, axis=1)
+        round_trip_matches = np.take_along_axis(self.round_trip_matches, order, axis=1)
+        multiplier = order.shape[1]
+
+        return {
+            "weights": weights.as_dict(),
+            "accuracy": top_n_from_ranks(first_hit_ranks(accuracy_matches), multiplier),
+            "round-trip": round_trip_from_matches(round_trip_matches)[0],
+            "coverage": top_n_from_ranks(
+                first_hit_ranks(round_trip_matches), multiplier
+            ),
+        }
+
+    def sweep(self, grid: Iterable[RerankingWeights]) -> List[Dict[str, Any]]:
+        """Evaluate the re-ranking for every weighting of the grid."""
+        return [self.evaluate(weights) for weights in grid]
+
+
+def best_weights(
+    results: List[Dict[str, Any]], metric: str = "accuracy", n: int = 1
+) -> Dict[str, Any]:
+    """Result of a sweep with the highest value for the given metric and top-n;
+    the first one in case of ties."""
+    return max(results, key=lambda result: result[metric][n])
+
+
+def rerank_retro_results(
+    results_dir: PathLike,
+    grid: Iterable[RerankingWeights],
+    output_file: Optional[PathLike] = None,
+    use_binary_cache: bool = False,
+) -> Dict[str, Any]:
+    """
+    Evaluate the re-ranking of the predictions of a retro results directory
+    (see prepare_retro_metrics) for a grid of weightings.
+
+    Args:
+        results_dir: retro results directory, with the log probabilities.
+        grid: weightings to evaluate, see weights_grid().
+        output_file: JSON file to save the results to, if given.
+        use_binary_cache: whether to load the files through the binary cache.
+
+    Returns:
+        Dictionary with the results for all the weightings ("results") and the
+        one with the best top-1 accuracy ("best").
+    """
+    retro_metrics = RetroMetrics.from_metrics_files(
+        RetroFiles(results_dir), use_binary_cache=use_binary_cache
+    )
+    reranker = Reranker.from_retro_metrics(retro_metrics)
+    results = reranker.sweep(grid)
+    if not results:
+        raise ValueError("No weights to evaluate the re-ranking for.")
+    report = {"results": results, "best": best_weights(results)}
+
+    if output_file is not None:
+        with open(output_file, "wt") as f:
+            json.dump(report, f, indent=2)
+    return report
@@ -1,11 +1,45 @@
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
-from rxn.utilities.files import PathLike, iterate_lines_from_file, load_list_from_file
+import numpy as np
+from rxn.utilities.files import PathLike
+from rxn.utilities.misc import get_multiplier
 
-from .metrics import class_diversity, coverage, round_trip_accuracy, top_n_accuracy
-from .metrics_calculator import MetricsCalculator
+from .beam_filtering import FilteredBeams
+from .binary_cache import BinaryCache
+from .bootstrap import (
+    DEFAULT_CONFIDENCE_LEVEL,
+    DEFAULT_N_RESAMPLES,
+    bootstrap_confidence_intervals,
+)
+from .compression import exists, iterate_lines, load_lines
+from .confidence_metrics import retro_confidence_metrics
+from .evaluation_options import EvaluationOptions
+from .ground_truth import GroundTruth, InternedPredictions, SampleGroups
+from .log_probs import load_log_probs
+from .manifest import line_count
+from .metrics import (
+    class_diversity,
+    class_diversity_per_sample,
+    round_trip_from_matches,
+    round_trip_per_sample,
+)
+from .metrics_calculator import MetricsCalculator, chemistry_metrics, precomputed
 from .metrics_files import MetricsFiles, RetroFiles
-from .true_reactant_accuracy import true_reactant_accuracy
+from .multi_reference import (
+    ReferenceIndex,
+    canonical_sources,
+    multi_reference_metrics,
+    multi_reference_per_input,
+)
+from .profiling import profiled
+from .ranks import (
+    first_hit_ranks,
+    hits_from_ranks,
+    rank_metrics,
+    reciprocal_ranks,
+    top_n_from_ranks,
+)
+from .utils import get_sequence_multiplier, match_matrix, match_matrix_from_ids
 
 
 class RetroMetrics(MetricsCalculator):
@@ -25,7 +59,21 @@ class RetroMetrics(MetricsCalculator):
         predicted_classes: Optional[List[str]] = None,
         gt_mapped_rxns: Optional[List[str]] = None,
         predicted_mapped_rxns: Optional[List[str]] = None,
+        gt_true_reactants: Optional[List[Optional[List[str]]]] = None,
+        predicted_precursors_log_probs: Optional[np.ndarray] = None,
+        predicted_products_log_probs: Optional[np.ndarray] = None,
+        ground_truth: Optional[GroundTruth] = None,
     ):
+        """
+        Args:
+            predicted_precursors_log_probs: log probabilities of the retro
+                predictions, of shape (samples, predictions per sample).
+            predicted_products_log_probs: log probabilities of the forward
+                predictions, same shape.
+            ground_truth: ground truth of gt_products and gt_precursors, if
+                available, to store the canonical products with it.
+            (other arguments: ground truth and predictions, self-explanatory)
+        """
         self.gt_products = list(gt_products)
         self.gt_precursors = list(gt_precursors)
         self.predicted_products = list(predicted_products)
@@ -34,17 +82,25 @@ class RetroMetrics(MetricsCalculator):
         self.predicted_classes = predicted_classes
         self.gt_mapped_rxns = gt_mapped_rxns
         self.predicted_mapped_rxns = predicted_mapped_rxns
+        self.gt_true_reactants = gt_true_reactants
+        self.predicted_precursors_log_probs = predicted_precursors_log_probs
+        self.predicted_products_log_probs = predicted_products_log_probs
+        self.ground_truth = ground_truth
+
+        self._match_matrices: Dict[str, np.ndarray] = {}
+        self._first_hit_ranks: Dict[str, np.ndarray] = {}
+        self._filtered_beams: Optional[FilteredBeams] = None
+        self._optional_per_sample: Dict[str, np.ndarray] = {}
+        self._reference_index: Optional[ReferenceIndex] = None
 
     def get_metrics(self) -> Dict[str, Any]:
-        topn = top_n_accuracy(
-            ground_truth=self.gt_precursors, predictions=self.predicted_precursors
-        )
-        roundtrip, roundtrip_std = round_trip_accuracy(
-            ground_truth=self.gt_products, predictions=self.predicted_products
-        )
-        cov = coverage(
-            ground_truth=self.gt_products, predictions=self.predicted_products
-        )
+        multiplier = self._multiplier()
+        ranks = self.first_hit_ranks()
+
+        topn = top_n_from_ranks(ranks["precursors"], multiplier)
+        roundtrip, roundtrip_std = round_trip_from_matches(self.matches("products"))
+        cov = top_n_from_ranks(ranks["products"], multiplier)
+        beams = self.filtered_beams()
         if self.predicted_classes is not None:
             classdiversity, classdiversity_std = class_diversity(
                 ground_truth=self.gt_products,
@@ -53,12 +109,11 @@ class RetroMetrics(MetricsCalculator):
             )
         else:
             classdiversity, classdiversity_std = {}, {}
-        if self.gt_mapped_rxns is not None and self.predicted_mapped_rxns is not None:
-            reactant_accuracy = true_reactant_accuracy(
-                self.gt_mapped_rxns, self.predicted_mapped_rxns
-            )
+        if "true_reactants" in ranks:
+            reactant_accuracy = top_n_from_ranks(ranks["true_reactants"], multiplier)
+            reactant_rank = rank_metrics(ranks["true_reactants"])
         else:
-            reactant_accuracy = {}
+            reactant_accuracy, reactant_rank = {}, {}
 
         return {
             "accuracy": topn,
@@ -68,45 +123,296 @@ class RetroMetrics(MetricsCalculator):
             "class-diversity": classdiversity,
             "class-diversity-std": classdiversity_std,
             "true-reactant-accuracy": reactant_accuracy,
+            "rank": rank_metrics(ranks["precursors"]),
+            "round-trip-rank": rank_metrics(ranks["products"]),
+            "true-reactant-rank": reactant_rank,
+            "accuracy-filtered": beams.top_n(self.matches("precursors")),
+            "round-trip-filtered": beams.round_trip(self.matches("products"))[0],
+            "coverage-filtered": beams.top_n(self.matches("products")),
+            "invalid-rate": beams.invalid_rate(),
+            "duplicate-rate": beams.duplicate_rate(),
+            **self._confidence_metrics(),
         }
 
+    def _per_sample_functions(self) -> Dict[str, Callable[[], np.ndarray]]:
+        multiplier = self._multiplier()
+        predicted_classes = self.predicted_classes
+
+        functions: Dict[str, Callable[[], np.ndarray]] = {
+            "accuracy": lambda: hits_from_ranks(
+                self.family_ranks("precursors"), multiplier
+            ),
+            "round-trip": lambda: round_trip_per_sample(self.matches("products")),
+            "coverage": lambda: hits_from_ranks(
+                self.family_ranks("products"), multiplier
+            ),
+        }
+        if predicted_classes is not None:
+            functions["class-diversity"] = lambda: class_diversity_per_sample(
+                ground_truth=self.gt_products,
+                predictions=self.predicted_products,
+                predicted_classes=predicted_classes,
+            )
+        if self._with_true_reactants():
+            functions["true-reactant-accuracy"] = lambda: hits_from_ranks(
+                self.family_ranks("true_reactants"), multiplier
+            )
+            functions["true-reactant-rank.mrr"] = lambda: reciprocal_ranks(
+                self.family_ranks("true_reactants")
+            )
+        functions.update(
+            {
+                "rank.mrr": lambda: reciprocal_ranks(self.family_ranks("precursors")),
+                "round-trip-rank.mrr": lambda: reciprocal_ranks(
+                    self.family_ranks("products")
+                ),
+                "accuracy-filtered": lambda: self.filtered_beams().hits(
+                    self.matches("precursors")
+                ),
+                "round-trip-filtered": lambda: round_trip_per_sample(
+                    self.filtered_beams().compact(self.matches("products"))
+                ),
+                "coverage-filtered": lambda: self.filtered_beams().hits(
+                    self.matches("products")
+                ),
+                "invalid-rate": lambda: self.filtered_beams().invalid,
+                "duplicate-rate": lambda: self.filtered_beams().duplicate,
+                **precomputed(self._optional_per_sample),
+            }
+        )
+        return functions
+
+    def optional_metrics(
+        self, options: EvaluationOptions, metrics_files: MetricsFiles
+    ) -> Dict[str, Any]:
+        metrics, self._optional_per_sample = chemistry_metrics(
+            self.gt_precursors, self.predicted_precursors, options, metrics_files
+        )
+        if options.with_multi_reference:
+            with profiled("multi_reference_metrics"):
+                metrics.update(self.multi_reference_metrics())
+        return metrics
+
+    def confidence_intervals(
+        self,
+        n_resamples: int = DEFAULT_N_RESAMPLES,
+        confidence_level: float = DEFAULT_CONFIDENCE_LEVEL,
+    ) -> Dict[str, Any]:
+        """Same as in the base class, with the intervals of the multi-reference
+        metrics once computed; for these, the distinct products are resampled
+        instead of the samples."""
+        intervals = super().confidence_intervals(n_resamples, confidence_level)
+        if self._reference_index is not None:
+            intervals.update(
+                bootstrap_confidence_intervals(
+                    multi_reference_per_input(
+                        self._reference_index, self.predicted_precursors
+                    ),
+                    n_resamples=n_resamples,
+                    confidence_level=confidence_level,
+                )
+            )
+        return intervals
+
+    def multi_reference_metrics(self) -> Dict[str, Any]:
+        """Accuracy over the distinct products, a prediction being correct if
+        it matches any of the precursors recorded for its product. The
+        products are canonicalized, to group the ones written differently."""
+        return multi_reference_metrics(
+            self.reference_index(), self.predicted_precursors
+        )
+
+    def reference_index(self) -> ReferenceIndex:
+        """Precursors recorded for every canonical product, computed once."""
+        if self._reference_index is not None:
+            return self._reference_index
+        if self.ground_truth is not None:
+            products = canonical_sources(self.ground_truth)
+        else:
+            # Imported here, as it loads RDKit
+            from .overlap_index import standardize
+
+            products = [standardize(product) for product in self.gt_products]
+        self._reference_index = ReferenceIndex(products, self.gt_precursors)
+        return self._reference_index
+
+    def first_hit_ranks(self) -> Dict[str, np.ndarray]:
+        """First-hit ranks of the precursors (accuracy), of the products
+        (coverage), and of the true reactants if the mapped reactions are given."""
+        families = ["precursors", "products"]
+        if self._with_true_reactants():
+            families.append("true_reactants")
+        return {family: self.family_ranks(family) for family in families}
+
+    def family_ranks(self, family: str) -> np.ndarray:
+        """First-hit ranks of the "precursors", "products" or "true_reactants"
+        (see first_hit_ranks()), computed once."""
+        if family in self._first_hit_ranks:
+            return self._first_hit_ranks[family]
+
+        if family == "true_reactants":
+            assert self.gt_mapped_rxns is not None
+            assert self.predicted_mapped_rxns is not None
+            # Imported here, as it loads RDKit
+            from .true_reactant_accuracy import true_reactant_first_hit_ranks
+
+            ranks = true_reactant_first_hit_ranks(
+                self.gt_mapped_rxns,
+                self.predicted_mapped_rxns,
+                ground_truth_true_reactants=self.gt_true_reactants,
+            )
+        else:
+            ranks = first_hit_ranks(self.matches(family))
+        self._first_hit_ranks[family] = ranks
+        return ranks
+
+    def _with_true_reactants(self) -> bool:
+        return (
+            self.gt_mapped_rxns is not None and self.predicted_mapped_rxns is not None
+        )
+
+    def matches(self, family: str) -> np.ndarray:
+        """Match matrix of the "precursors" or "products", computed once."""
+        if family not in self._match_matrices:
+            if family == "precursors":
+                ground_truth, predictions = (
+                    self.gt_precursors,
+                    self.predicted_precursors,
+                )
+            else:
+                ground_truth, predictions = self.gt_products, self.predicted_products
+            self._match_matrices[family] = match_matrix(ground_truth, predictions)
+        return self._match_matrices[family]
+
+    def filtered_beams(self) -> FilteredBeams:
+        """Distinct valid retro predictions, computed once."""
+        if self._filtered_beams is None:
+            self._filtered_beams = FilteredBeams(
+                self.predicted_precursors, self._multiplier()
+            )
+        return self._filtered_beams
+
+    def _multiplier(self) -> int:
+        return get_sequence_multiplier(
+            ground_truth=self.gt_precursors, predictions=self.predicted_precursors
+        )
+
+    def _confidence_metrics(self) -> Dict[str, Any]:
+        """Selective prediction and calibration metrics, if the log
+        probabilities of the retro predictions are available."""
+        log_probs = self.predicted_precursors_log_probs
+        if log_probs is None:
+            return {}
+
+        accuracy_matches = self.matches("precursors")
+        round_trip_matches = self.matches("products")
+        return retro_confidence_metrics(
+            top1_correct=accuracy_matches[:, 0],
+            top1_log_probs=log_probs[:, 0],
+            round_trip_correct=round_trip_matches,
+            retro_log_probs=log_probs,
+            forward_log_probs=self.predicted_products_log_probs,
+        )
+
     @classmethod
-    def from_metrics_files(cls, metrics_files: MetricsFiles) -> "RetroMetrics":
+    def from_metrics_files(
+        cls,
+        metrics_files: MetricsFiles,
+        ground_truth: Optional[GroundTruth] = None,
+        use_binary_cache: bool = False,
+    ) -> "RetroMetrics":
         if not isinstance(metrics_files, RetroFiles):
             raise ValueError("Invalid type provided")
+        if ground_truth is None:
+            ground_truth = GroundTruth.from_metrics_files(metrics_files)
+        binary_cache = (
+            BinaryCache(metrics_files.binary_cache_dir) if use_binary_cache else None
+        )
 
         # Whether to use the reordered files - for class token
         # To determine whether True or False, we check if the reordered files exist
-        reordered = RetroFiles.reordered(metrics_files.predicted_canonical).exists()
-        mapped = (
-            metrics_files.gt_mapped.exists() and metrics_files.predicted_mapped.exists()
+        reordered = exists(RetroFiles.reordered(metrics_files.predicted_canonical))
+        mapped = exists(metrics_files.gt_mapped) and exists(
+            metrics_files.predicted_mapped
         )
+        gt_mapped_rxns = _maybe_load_lines(metrics_files.gt_mapped if mapped else None)
 
-        return cls.from_raw_files(
-            gt_precursors_file=metrics_files.gt_tgt,
-            gt_products_file=metrics_files.gt_src,
-            predicted_precursors_file=(
-                metrics_files.predicted_canonical
-                if not reordered
-                else RetroFiles.reordered(metrics_files.predicted_canonical)
-            ),
-            predicted_products_file=(
-                metrics_files.predicted_products_canonical
-                if not reordered
-                else RetroFiles.reordered(metrics_files.predicted_products_canonical)
+        predicted_precursors_file = metrics_files.predicted_canonical
+        predicted_products_file = metrics_files.predicted_products_canonical
+        predicted_classes_file = metrics_files.predicted_classes
+        precursors_log_probs_file = metrics_files.predicted_precursors_log_probs
+        products_log_probs_file = metrics_files.predicted_products_log_probs
+        if reordered:
+            predicted_precursors_file = RetroFiles.reordered(predicted_precursors_file)
+            predicted_products_file = RetroFiles.reordered(predicted_products_file)
+            predicted_classes_file = RetroFiles.reordered(predicted_classes_file)
+            precursors_log_probs_file = RetroFiles.reordered(precursors_log_probs_file)
+            products_log_probs_file = RetroFiles.reordered(products_log_probs_file)
+
+        predicted_classes: Optional[List[str]] = None
+        if exists(metrics_files.predicted_classes):
+            predicted_classes = (
+                load_lines(predicted_classes_file)
+                if binary_cache is None
+                else binary_cache.load_lines(predicted_classes_file)
+            )
+
+        interned_precursors: Optional[InternedPredictions] = None
+        interned_products: Optional[InternedPredictions] = None
+        if binary_cache is None:
+            predicted_precursors = ground_truth.load_predictions(
+                predicted_precursors_file
+            )
+            predicted_products = ground_truth.load_predictions(predicted_products_file)
+        else:
+            interned_precursors = ground_truth.load_interned_predictions(
+                predicted_precursors_file, binary_cache
+            )
+            interned_products = ground_truth.load_interned_predictions(
+                predicted_products_file, binary_cache
+            )
+            predicted_precursors = interned_precursors.lines
+            predicted_products = interned_products.lines
+
+        metrics = cls(
+            gt_precursors=ground_truth.tgt,
+            gt_products=ground_truth.src,
+            predicted_precursors=predicted_precursors,
+            predicted_products=predicted_products,
+            predicted_classes=predicted_classes,
+            gt_mapped_rxns=gt_mapped_rxns,
+            predicted_mapped_rxns=_maybe_load_lines(
+                metrics_files.predicted_mapped if mapped else None
             ),
-            predicted_classes_file=(
+            gt_true_reactants=(
                 None
-                if not metrics_files.predicted_classes.exists()
-                else metrics_files.predicted_classes
-                if not reordered
-                else RetroFiles.reordered(metrics_files.predicted_classes)
+                if gt_mapped_rxns is None
+                else gt_true_reactants(metrics_files, ground_truth, gt_mapped_rxns)
             ),
-            gt_mapped_rxns_file=metrics_files.gt_mapped if mapped else None,
-            predicted_mapped_rxns_file=(
-                metrics_files.predicted_mapped if mapped else None
+            predicted_precursors_log_probs=_maybe_load_log_probs(
+                precursors_log_probs_file, ground_truth.n_samples, use_binary_cache
+            ),
+            predicted_products_log_probs=_maybe_load_log_probs(
+                products_log_probs_file, ground_truth.n_samples, use_binary_cache
             ),
+            ground_truth=ground_truth,
         )
+        if interned_precursors is not None and interned_products is not None:
+            # Compared through their IDs, without comparing the strings
+            metrics._match_matrices = {
+                "precursors": match_matrix_from_ids(
+                    ground_truth.tgt_ids, interned_precursors.ids
+                ),
+                "products": match_matrix_from_ids(
+                    ground_truth.src_ids, interned_products.ids
+                ),
+            }
+            metrics._filtered_beams = FilteredBeams.from_ids(
+                interned_precursors.ids,
+                metrics._multiplier(),
+                interned_precursors.empty_id,
+            )
+        return metrics
 
     @classmethod
     def from_raw_files(
@@ -119,18 +425,58 @@ class RetroMetrics(MetricsCalculator):
         gt_mapped_rxns_file: Optional[PathLike] = None,
         predicted_mapped_rxns_file: Optional[PathLike] = None,
     ) -> "RetroMetrics":
-        # to simplify because it is called multiple times.
-        def maybe_load_lines(filename: Optional[PathLike]) -> Optional[List[str]]:
-            if filename is None:
-                return None
-            return load_list_from_file(filename)
-
         return cls(
-            gt_precursors=iterate_lines_from_file(gt_precursors_file),
-            gt_products=iterate_lines_from_file(gt_products_file),
-            predicted_precursors=iterate_lines_from_file(predicted_precursors_file),
-            predicted_products=iterate_lines_from_file(predicted_products_file),
-            predicted_classes=maybe_load_lines(predicted_classes_file),
-            gt_mapped_rxns=maybe_load_lines(gt_mapped_rxns_file),
-            predicted_mapped_rxns=maybe_load_lines(predicted_mapped_rxns_file),
+            gt_precursors=iterate_lines(gt_precursors_file),
+            gt_products=iterate_lines(gt_products_file),
+            predicted_precursors=iterate_lines(predicted_precursors_file),
+            predicted_products=iterate_lines(predicted_products_file),
+            predicted_classes=_maybe_load_lines(predicted_classes_file),
+            gt_mapped_rxns=_maybe_load_lines(gt_mapped_rxns_file),
+            predicted_mapped_rxns=_maybe_load_lines(predicted_mapped_rxns_file),
+        )
+
+
+def _maybe_load_lines(filename: Optional[PathLike]) -> Optional[List[str]]:
+    if filename is None:
+        return None
+    return load_lines(filename)
+
+
+def _maybe_load_log_probs(
+    filename: PathLike, n_samples: int, use_cache: bool
+) -> Optional[np.ndarray]:
+    """Load a log probability file, if it exists, see load_log_probs()."""
+    if n_samples == 0 or not exists(filename):
+        return None
+    multiplier = get_multiplier(n_samples, line_count(filename))
+    return load_log_probs(filename, multiplier, use_cache=use_cache)
+
+
+def gt_true_reactants(
+    metrics_files: RetroFiles,
+    ground_truth: GroundTruth,
+    gt_mapped_rxns: Optional[List[str]] = None,
+) -> List[Optional[List[str]]]:
+    """Get the true reactants of the ground truth; they are computed only once
+    for a given ground truth and mapping, and stored with the ground truth.
+
+    Args:
+        metrics_files: results directory with the mapped ground truth.
+        ground_truth: ground truth, where the true reactants are stored.
+        gt_mapped_rxns: mapped ground-truth reactions, if loaded already."""
+    gt_mapped_hash = metrics_files.manifest.content_hash(metrics_files.gt_mapped)
+
+    def compute() -> List[SampleGroups]:
+        from .true_reactant_accuracy import get_standardized_true_reactants
+
+        mapped_rxns = (
+            load_lines(metrics_files.gt_mapped)
+            if gt_mapped_rxns is None
+            else gt_mapped_rxns
         )
+        true_reactants = (get_standardized_true_reactants(r) for r in mapped_rxns)
+        # One group per sample
+        return [None if tr is None else [tr] for tr in true_reactants]
+
+    derived = ground_truth.derived(f"true_reactants_{gt_mapped_hash[:16]}", compute)
+    return [None if groups is None else groups[0] for groups in derived]
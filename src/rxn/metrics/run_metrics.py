@@ -1,22 +1,36 @@
 """
 Functions to launch metrics calculations on forward, retro, or context models.
+
+Note: the imports of the chemistry and translation packages (RDKit, OpenNMT,
+torch) are deferred to the functions needing them, so that evaluating metrics
+from existing prediction files starts quickly.
 """
+import importlib
 import json
 import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, Type
+from typing import Dict, Iterable, List, Optional, Type
 
-from rxn.chemutils.miscellaneous import canonicalize_file
-from rxn.chemutils.tokenization import copy_as_detokenized
-from rxn.onmt_models import rxn_translation
 from rxn.utilities.files import PathLike, ensure_directory_exists_and_is_empty
 from rxn.utilities.logging import setup_console_and_file_logger
 
-from .context_metrics import ContextMetrics
-from .forward_metrics import ForwardMetrics
+from .compression import exists
+from .evaluation_options import EvaluationOptions
+from .ground_truth import GroundTruth, ground_truth_hash
 from .metrics_calculator import MetricsCalculator
 from .metrics_files import ContextFiles, ForwardFiles, MetricsFiles, RetroFiles
-from .retro_metrics import RetroMetrics
+from .multi_reference import canonical_sources
+from .overlap_index import OverlapIndex, overlap_labels
+from .profiling import profiled, profiling_directory
+from .ranks import hit_at_k, save_first_hit_ranks
+from .stratification import (
+    products_and_precursors,
+    stratified_metrics,
+    stratum_labels,
+)
+from .translation import DEFAULT_SEGMENT_SIZE, resumable_rxn_translation
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -26,10 +40,12 @@ _FILES_MAPPING: Dict[str, Type[MetricsFiles]] = {
     "context": ContextFiles,
     "retro": RetroFiles,
 }
-_CALCULATOR_MAPPING: Dict[str, Type[MetricsCalculator]] = {
-    "forward": ForwardMetrics,
-    "context": ContextMetrics,
-    "retro": RetroMetrics,
+# Given as module and class names, so that only the calculator for the
+# requested task is imported.
+_CALCULATOR_MAPPING: Dict[str, str] = {
+    "forward": "rxn.metrics.forward_metrics.ForwardMetrics",
+    "context": "rxn.metrics.context_metrics.ContextMetrics",
+    "retro": "rxn.metrics.retro_metrics.RetroMetrics",
 }
 
 
@@ -37,16 +53,103 @@ def get_metrics_files(task: str, files_path: PathLike) -> MetricsFiles:
     return _FILES_MAPPING[task](files_path)
 
 
-def get_metrics_calculator(task: str, files: MetricsFiles) -> MetricsCalculator:
-    return _CALCULATOR_MAPPING[task].from_metrics_files(files)
+def get_metrics_calculator_class(task: str) -> Type[MetricsCalculator]:
+    module_name, class_name = _CALCULATOR_MAPPING[task].rsplit(".", 1)
+    calculator_class: Type[MetricsCalculator] = getattr(
+        importlib.import_module(module_name), class_name
+    )
+    return calculator_class
+
+
+def get_metrics_calculator(
+    task: str,
+    files: MetricsFiles,
+    ground_truth: Optional[GroundTruth] = None,
+    use_binary_cache: bool = False,
+) -> MetricsCalculator:
+    return get_metrics_calculator_class(task).from_metrics_files(
+        files, ground_truth=ground_truth, use_binary_cache=use_binary_cache
+    )
+
+
+def evaluate_metrics(
+    task: str,
+    files_path: PathLike,
+    ground_truth: Optional[GroundTruth] = None,
+    options: Optional[EvaluationOptions] = None,
+) -> None:
+    """
+    Evaluate the metrics for a results directory and save them to its metrics file.
 
+    Args:
+        task: the kind of metrics to compute ("forward", "retro", "context").
+        files_path: results directory.
+        ground_truth: already loaded ground truth, if available.
+        options: which metrics to compute in addition to the default ones,
+            and how. Defaults to EvaluationOptions().
+    """
+    if options is None:
+        options = EvaluationOptions()
 
-def evaluate_metrics(task: str, files_path: PathLike) -> None:
     logger.info(f"Evaluating the {task} metrics...")
     files = get_metrics_files(task, files_path)
-    calculator = get_metrics_calculator(task, files)
+    timer = files.timer
+    with profiling_directory(files.directory):
+        with timer.stage("evaluation_loading", lines_of=files.gt_src):
+            with profiled("evaluation_loading"):
+                # The strata are stored with the ground truth
+                if ground_truth is None and (
+                    options.gt_cache_dir is not None or options.needs_ground_truth
+                ):
+                    ground_truth = GroundTruth.from_metrics_files(
+                        files, cache_dir=options.gt_cache_dir
+                    )
+                calculator = get_metrics_calculator(
+                    task,
+                    files,
+                    ground_truth=ground_truth,
+                    use_binary_cache=options.use_binary_cache,
+                )
 
-    metrics_dict = calculator.get_metrics()
+        with timer.stage("evaluation_metrics", lines_of=files.gt_src):
+            with profiled("get_metrics"):
+                metrics_dict = calculator.get_metrics()
+            if options.hit_at:
+                metrics_dict["hit-at-k"] = {
+                    family: {f"hit@{k}": hit_at_k(ranks, k) for k in options.hit_at}
+                    for family, ranks in calculator.first_hit_ranks().items()
+                }
+            metrics_dict.update(calculator.optional_metrics(options, files))
+            if options.needs_ground_truth:
+                per_sample_metrics = calculator.per_sample_metrics()
+            if options.n_bootstrap > 0:
+                with profiled("confidence_intervals"):
+                    intervals = calculator.confidence_intervals(
+                        n_resamples=options.n_bootstrap,
+                        confidence_level=options.confidence_level,
+                    )
+                if intervals:
+                    metrics_dict["confidence-intervals"] = {
+                        "confidence-level": options.confidence_level,
+                        "n-resamples": options.n_bootstrap,
+                        **intervals,
+                    }
+            if options.with_strata:
+                assert ground_truth is not None
+                with profiled("stratified_metrics"):
+                    metrics_dict["strata"] = stratified_metrics(
+                        stratum_labels(task, files, ground_truth), per_sample_metrics
+                    )
+            if options.overlap_index_dir is not None:
+                assert ground_truth is not None
+                with profiled("train_overlap_metrics"):
+                    labels = overlap_labels(
+                        OverlapIndex(options.overlap_index_dir),
+                        *products_and_precursors(task, ground_truth),
+                    )
+                    metrics_dict["train-overlap"] = stratified_metrics(
+                        labels, per_sample_metrics
+                    )
 
     if files.metrics_file.exists():
         logger.warning(f'Overwriting "{files.metrics_file}"!')
@@ -54,9 +157,153 @@ def evaluate_metrics(task: str, files_path: PathLike) -> None:
     with open(files.metrics_file, "wt") as f:
         json.dump(metrics_dict, f, indent=2)
 
+    # Saved for later analyses, see rxn.metrics.ranks
+    ranks = calculator.first_hit_ranks()
+    if ranks:
+        save_first_hit_ranks(files.first_hit_ranks_file, ranks)
+
     logger.info(f'Evaluating the {task} metrics... Saved to "{files.metrics_file}".')
 
 
+# Ground truth shared by the worker processes of evaluate_metrics_for_directories
+_shared_ground_truth: Optional[GroundTruth] = None
+
+
+def _set_shared_ground_truth(ground_truth: GroundTruth) -> None:
+    global _shared_ground_truth
+    _shared_ground_truth = ground_truth
+
+
+def _evaluate_with_shared_ground_truth(
+    task: str, files_path: Path, options: EvaluationOptions
+) -> None:
+    evaluate_metrics(
+        task, files_path, ground_truth=_shared_ground_truth, options=options
+    )
+
+
+def prepare_derived_data(
+    task: str,
+    files: MetricsFiles,
+    ground_truth: GroundTruth,
+    options: EvaluationOptions,
+) -> None:
+    """
+    Compute the data derived from the ground truth (see GroundTruth.derived())
+    that the evaluation of the results directory will need, so that the
+    evaluations sharing the ground truth find it ready.
+
+    Args:
+        task: the kind of metrics to compute ("forward", "retro", "context").
+        files: results directory, for the optional files of the ground truth
+            (reaction classes, mapped reactions).
+        ground_truth: ground truth, where the derived data is stored.
+        options: evaluation options, determining which data is needed.
+    """
+    if isinstance(files, ContextFiles):
+        from .context_metrics import context_compound_groups
+
+        context_compound_groups(ground_truth)
+    if isinstance(files, RetroFiles):
+        from .retro_metrics import gt_true_reactants
+
+        if exists(files.gt_mapped) and exists(files.predicted_mapped):
+            gt_true_reactants(files, ground_truth)
+        if options.with_multi_reference:
+            canonical_sources(ground_truth)
+    if options.with_strata:
+        stratum_labels(task, files, ground_truth)
+
+
+def group_by_ground_truth(
+    task: str, directories: Iterable[PathLike]
+) -> Dict[str, List[Path]]:
+    """Group results directories by the hash of their ground truth files."""
+    groups: Dict[str, List[Path]] = defaultdict(list)
+    for directory in directories:
+        files = get_metrics_files(task, directory)
+        groups[ground_truth_hash(files)].append(files.directory)
+    return dict(groups)
+
+
+def evaluate_metrics_for_directories(
+    task: str,
+    directories: Iterable[PathLike],
+    n_workers: int = 1,
+    options: Optional[EvaluationOptions] = None,
+) -> None:
+    """
+    Evaluate the metrics for several results directories in one process (or
+    in a pool of processes).
+
+    The directories relying on the same ground truth are evaluated together:
+    their ground truth is loaded and interned only once. Each directory gets
+    its own metrics file, identical to the one from evaluate_metrics() with
+    the same options.
+
+    Args:
+        task: the kind of metrics to compute ("forward", "retro", "context").
+        directories: results directories.
+        n_workers: number of processes to evaluate the directories with.
+        options: which metrics to compute in addition to the default ones,
+            and how, for all the directories. Defaults to EvaluationOptions().
+    """
+    if options is None:
+        options = EvaluationOptions()
+
+    groups = group_by_ground_truth(task, directories)
+    logger.info(
+        f"Evaluating {sum(len(d) for d in groups.values())} directories, "
+        f"relying on {len(groups)} distinct ground truth(s)."
+    )
+
+    for content_hash, group_directories in groups.items():
+        ground_truth = GroundTruth.from_metrics_files(
+            get_metrics_files(task, group_directories[0]),
+            cache_dir=options.gt_cache_dir,
+            content_hash=content_hash,
+        )
+
+        if n_workers <= 1:
+            for directory in group_directories:
+                evaluate_metrics(
+                    task, directory, ground_truth=ground_truth, options=options
+                )
+            continue
+
+        # Computed before forking, instead of once per worker process
+        prepare_derived_data(
+            task, get_metrics_files(task, group_directories[0]), ground_truth, options
+        )
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_set_shared_ground_truth,
+            initargs=(ground_truth,),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _evaluate_with_shared_ground_truth,
+                    task,
+                    directory,
+                    options,
+                )
+                for directory in group_directories
+            ]
+            # Raise the first exception, if any
+            for future in futures:
+                future.result()
+
+
+def prepare_output_directory(output_dir: Path, resume: bool) -> None:
+    """Make sure that the output directory exists.
+
+    When not resuming a previous run, the directory must be empty."""
+    if resume:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    else:
+        ensure_directory_exists_and_is_empty(output_dir)
+
+
 def run_model_for_metrics(
     task: str,
     model_path: Path,
@@ -68,31 +315,57 @@ def run_model_for_metrics(
     batch_size: int,
     gpu: bool,
     initialize_logger: bool = False,
+    resume: bool = False,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    deduplicate: bool = True,
 ) -> None:
-    ensure_directory_exists_and_is_empty(output_dir)
+    """
+    Translate the ground truth source and canonicalize the predictions, for
+    the forward or context metrics.
+
+    Args:
+        deduplicate: whether to translate each distinct source line only once,
+            and to expand the predictions to all the source lines before the
+            canonicalization (see translate_unique_sources()). The files are
+            the same as without it, since the beam search is deterministic.
+        (other arguments: self-explanatory, see the prepare-metrics scripts)
+    """
+    from rxn.chemutils.miscellaneous import canonicalize_file
+    from rxn.chemutils.tokenization import copy_as_detokenized
+
+    prepare_output_directory(output_dir, resume)
     files = get_metrics_files(task, output_dir)
 
     if initialize_logger:
         setup_console_and_file_logger(files.log_file)
 
-    copy_as_detokenized(src_file, files.gt_src)
-    copy_as_detokenized(tgt_file, files.gt_tgt)
-
-    # context prediction
-    rxn_translation(
-        src_file=files.gt_src,
-        tgt_file=files.gt_tgt,
-        pred_file=files.predicted,
-        model=model_path,
-        n_best=n_best,
-        beam_size=beam_size,
-        batch_size=batch_size,
-        gpu=gpu,
-    )
+    with files.timer.stage("run_model_for_metrics", lines_of=files.gt_src):
+        with files.timer.stage("copy_ground_truth", lines_of=files.gt_src):
+            copy_as_detokenized(src_file, files.gt_src)
+            copy_as_detokenized(tgt_file, files.gt_tgt)
+            files.record(files.gt_src, files.gt_tgt)
 
-    canonicalize_file(
-        files.predicted,
-        files.predicted_canonical,
-        fallback_value="",
-        sort_molecules=True,
-    )
+        # context prediction
+        with files.timer.stage("translation", lines_of=files.predicted):
+            resumable_rxn_translation(
+                src_file=files.gt_src,
+                tgt_file=files.gt_tgt,
+                pred_file=files.predicted,
+                model=model_path,
+                n_best=n_best,
+                beam_size=beam_size,
+                batch_size=batch_size,
+                gpu=gpu,
+                segment_size=segment_size,
+                deduplicate=deduplicate,
+            )
+            files.record(files.predicted)
+
+        with files.timer.stage("canonicalization", lines_of=files.predicted_canonical):
+            canonicalize_file(
+                files.predicted,
+                files.predicted_canonical,
+                fallback_value="",
+                sort_molecules=True,
+            )
+            files.record(files.predicted_canonical)
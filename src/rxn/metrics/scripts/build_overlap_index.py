@@ -0,0 +1,61 @@
+from pathlib import Path
+from typing import Optional
+
+import click
+from rxn.utilities.logging import setup_console_logger
+
+from rxn.metrics.overlap_index import build_overlap_index
+
+
+@click.command(context_settings={"show_default": True})
+@click.option(
+    "--output_dir",
+    "-o",
+    required=True,
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Directory to write the index to.",
+)
+@click.option(
+    "--products_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Training products, one per line (possibly tokenized).",
+)
+@click.option(
+    "--precursors_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Training precursors, one set per line (possibly tokenized).",
+)
+@click.option(
+    "--canonicalize",
+    is_flag=True,
+    help=(
+        "If given, canonicalize the training SMILES with RDKit. Not needed if "
+        "they are standardized like the test sets already."
+    ),
+)
+@click.option(
+    "--n_workers", default=1, type=int, help="Number of processes for the hashing."
+)
+def main(
+    output_dir: Path,
+    products_file: Optional[Path],
+    precursors_file: Optional[Path],
+    canonicalize: bool,
+    n_workers: int,
+) -> None:
+    """Build the index of the SMILES of a training set, for the metrics on the
+    test samples seen in training (see the --overlap_index option of
+    rxn-evaluate-metrics)."""
+    setup_console_logger()
+
+    build_overlap_index(
+        output_dir,
+        products_file=products_file,
+        precursors_file=precursors_file,
+        canonicalize=canonicalize,
+        n_workers=n_workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import json
+import logging
+from pathlib import Path
+from typing import Optional, Tuple
+
+import click
+from rxn.utilities.logging import setup_console_logger
+
+from rxn.metrics.bootstrap import DEFAULT_CONFIDENCE_LEVEL, DEFAULT_N_RESAMPLES
+from rxn.metrics.scripts.rxn_evaluate_metrics_batch import expand_directories
+from rxn.metrics.significance import (
+    DEFAULT_COMPARED_METRICS,
+    compare_results_directories,
+)
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+@click.command(context_settings={"show_default": True})
+@click.option(
+    "--task", required=True, type=click.Choice(["forward", "retro", "context"])
+)
+@click.option(
+    "--baseline",
+    required=True,
+    help="Results directory that the other ones are compared to.",
+)
+@click.argument("results_dirs", nargs=-1, required=True)
+@click.option(
+    "--output",
+    "-o",
+    required=True,
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="JSON file for the comparisons.",
+)
+@click.option(
+    "--metrics",
+    default=",".join(DEFAULT_COMPARED_METRICS),
+    help="Comma-separated names of the metrics to compare.",
+)
+@click.option(
+    "--bootstrap",
+    default=DEFAULT_N_RESAMPLES,
+    type=int,
+    help="Number of paired bootstrap resamples.",
+)
+@click.option(
+    "--confidence_level",
+    default=DEFAULT_CONFIDENCE_LEVEL,
+    type=float,
+    help="Probability covered by the confidence intervals of the differences.",
+)
+@click.option(
+    "--gt_cache_dir",
+    envvar="RXN_METRICS_GT_CACHE_DIR",
+    default=None,
+    help=(
+        "Directory where to cache the interned ground truths. Can also be set "
+        "with the RXN_METRICS_GT_CACHE_DIR environment variable."
+    ),
+)
+@click.option(
+    "--binary_cache",
+    is_flag=True,
+    help=(
+        "If given, load the predictions through the binary cache of the results "
+        "directories, created at the first evaluation."
+    ),
+)
+def main(
+    task: str,
+    baseline: str,
+    results_dirs: Tuple[str, ...],
+    output: Path,
+    metrics: str,
+    bootstrap: int,
+    confidence_level: float,
+    gt_cache_dir: Optional[str],
+    binary_cache: bool,
+) -> None:
+    """Compare results directories to a baseline with paired significance
+    tests (McNemar and paired bootstrap), for the top-n values of the metrics.
+
+    The results directories must rely on the same ground truth as the baseline;
+    it is loaded only once.
+
+    Usage example:
+        - rxn-compare-metrics --task retro --baseline base -o cmp.json "sweep/*"
+    """
+    setup_console_logger()
+
+    pairs = [
+        (baseline, directory)
+        for directory in expand_directories(results_dirs)
+        if directory != baseline
+    ]
+    comparisons = compare_results_directories(
+        task,
+        pairs,
+        metrics=metrics.split(","),
+        n_resamples=bootstrap,
+        confidence_level=confidence_level,
+        gt_cache_dir=gt_cache_dir,
+        use_binary_cache=binary_cache,
+    )
+
+    with open(output, "wt") as f:
+        json.dump(comparisons, f, indent=2)
+
+    for comparison in comparisons:
+        top1 = comparison["metrics"].get("accuracy", {}).get(1)
+        if top1 is None:
+            continue
+        logger.info(
+            f'{comparison["b"]}: top-1 accuracy {top1["b"]:.4f} '
+            f'({top1["delta"]:+.4f} vs baseline, bootstrap p={top1["bootstrap-p-value"]:.3g}, '
+            f'McNemar p={top1["mcnemar-p-value"]:.3g})'
+        )
+    logger.info(f'Comparisons of {len(comparisons)} directories saved to "{output}".')
+
+
+if __name__ == "__main__":
+    main()
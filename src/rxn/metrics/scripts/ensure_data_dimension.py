@@ -4,14 +4,13 @@ from pathlib import Path
 from typing import Iterable, Tuple
 
 import click
-from rxn.utilities.files import (
-    PathLike,
-    count_lines,
-    dump_list_to_file,
-    load_list_from_file,
-)
+from rxn.utilities.containers import chunker
+from rxn.utilities.files import PathLike
 from rxn.utilities.logging import setup_console_logger
 
+from rxn.metrics.compression import dump_lines, iterate_lines
+from rxn.metrics.manifest import line_count
+
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
@@ -20,7 +19,7 @@ def ensure_data_dimension(
     txt_files: Iterable[PathLike], output_dir: PathLike, max_dimension: int
 ) -> None:
     # Check the lengths of the files and ensure they are all the same
-    file_length = [count_lines(txt_file) for txt_file in txt_files]
+    file_length = [line_count(txt_file) for txt_file in txt_files]
     if len(set(file_length)) != 1:
         raise ValueError("The files provided have not the same number of lines.")
 
@@ -39,19 +38,16 @@ def ensure_data_dimension(
     )
 
     for txt_file in txt_files:
-        file_content = load_list_from_file(txt_file)
         file_name = Path(txt_file).name
-        for chunk_no, chunk_start in enumerate(range(0, file_length[0], max_dimension)):
+        chunks = chunker(iterate_lines(txt_file), chunk_size=max_dimension)
+        for chunk_no, chunk in enumerate(chunks):
             # create a sub_directory
             sub_directory = Path(new_output_dir) / f"chunk_{chunk_no}"
             sub_directory.mkdir(parents=True, exist_ok=True)
             logger.info(f"Created directory {sub_directory} . Saving files .")
 
             # save all subfiles
-            dump_list_to_file(
-                file_content[chunk_start : chunk_start + max_dimension],
-                Path(sub_directory) / file_name,
-            )
+            dump_lines(chunk, Path(sub_directory) / file_name)
 
 
 @click.command(context_settings={"show_default": True})
@@ -29,6 +29,9 @@ def sorted_chunk_directories(input_path: Path) -> List[Path]:
 def join_data_files(input_dir: PathLike, output_dir: PathLike) -> None:
     """
     Joining files with `shutil`, reference: https://stackoverflow.com/a/27077437
+
+    This also works for gzip- or zstd-compressed files: a concatenation of
+    compressed streams is a valid compressed file.
     """
     raise_if_paths_are_identical(input_dir, output_dir)
     output_path = Path(output_dir)
@@ -0,0 +1,45 @@
+import json
+from typing import Tuple
+
+import click
+from rxn.utilities.logging import setup_console_logger
+
+from rxn.metrics.line_index import SampleLookup
+from rxn.metrics.run_metrics import get_metrics_files
+
+
+def parse_sample_range(value: str) -> Tuple[int, int]:
+    """Parse a sample index ("12") or range ("10:20", end excluded)."""
+    if ":" in value:
+        start, stop = value.split(":")
+        return int(start), int(stop)
+    return int(value), int(value) + 1
+
+
+@click.command(context_settings={"show_default": True})
+@click.option(
+    "--task", required=True, type=click.Choice(["forward", "retro", "context"])
+)
+@click.option("--results_dir", required=True, help="Where the predictions are stored")
+@click.argument("samples", nargs=-1, required=True)
+def main(task: str, results_dir: str, samples: Tuple[str, ...]) -> None:
+    """
+    Print all the lines relating to the given samples (ground truth,
+    predictions, forward predictions, etc.), as one JSON object per sample.
+
+    The samples are given as indices ("12") or ranges ("10:20", end excluded).
+    The line offsets of the files are indexed at the first call, so that
+    later lookups do not need to scan the files.
+    """
+    setup_console_logger()
+
+    lookup = SampleLookup(get_metrics_files(task, results_dir))
+    for sample_range in samples:
+        start, stop = parse_sample_range(sample_range)
+        for idx, lines in enumerate(lookup.samples(start, stop), start):
+            print(json.dumps({"sample": idx, "lines": lines}))
+    lookup.close()
+
+
+if __name__ == "__main__":
+    main()
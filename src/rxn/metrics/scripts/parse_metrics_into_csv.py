@@ -7,32 +7,48 @@ import click
 import pandas as pd
 from rxn.utilities.logging import setup_console_logger
 
+from rxn.metrics.timing import load_timings
+
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
-def get_metric_from_dir(directory: Path) -> Dict[str, Any]:
+def get_metric_from_dir(directory: Path, with_timings: bool = False) -> Dict[str, Any]:
     """Get the metrics from the metrics.json file in the given directory; a key
-    is added for the directory name."""
+    is added for the directory name.
+
+    If with_timings is True, the stage timings from the timings.json file (if
+    any) are added under the "timings" key."""
     with open(directory / "metrics.json", "rt") as f:
         d = json.load(f)
-        return {"name": directory.name, **d}
+    if with_timings:
+        d["timings"] = load_timings(directory / "timings.json")
+    return {"name": directory.name, **d}
 
 
 @click.command()
 @click.option("--csv", required=True, help="Where to save the csv")
+@click.option(
+    "--with_timings",
+    is_flag=True,
+    help="If given, add the stage timings (wall time, CPU time, etc.) as columns.",
+)
 @click.argument("directories", nargs=-1)
-def main(csv: str, directories: Tuple[str, ...]) -> None:
+def main(csv: str, with_timings: bool, directories: Tuple[str, ...]) -> None:
     """Parse the metrics from several directories and collect them into a CSV.
 
     Usage examples:
         - rxn-parse-metrics-into-csv --csv metrics.csv dir1 dir2 dir3
         - rxn-parse-metrics-into-csv --csv metrics.csv dir* other_dir
         - rxn-parse-metrics-into-csv --csv metrics.csv *
+        - rxn-parse-metrics-into-csv --csv metrics.csv --with_timings dir*
     """
     setup_console_logger()
 
-    metrics_dicts = [get_metric_from_dir(Path(directory)) for directory in directories]
+    metrics_dicts = [
+        get_metric_from_dir(Path(directory), with_timings=with_timings)
+        for directory in directories
+    ]
 
     # Note: this flattens the nested dict directly, joining the keys with underscores
     df = pd.json_normalize(metrics_dicts, sep="_")
@@ -1,8 +1,11 @@
 from pathlib import Path
+from typing import Optional
 
 import click
 
+from rxn.metrics.profiling import enable_profiling, profile_option
 from rxn.metrics.run_metrics import evaluate_metrics, run_model_for_metrics
+from rxn.metrics.translation import DEFAULT_SEGMENT_SIZE
 
 
 @click.command(context_settings={"show_default": True})
@@ -38,6 +41,21 @@ from rxn.metrics.run_metrics import evaluate_metrics, run_model_for_metrics
 @click.option(
     "--no_metrics", is_flag=True, help="If given, the metrics will not be computed."
 )
+@click.option(
+    "--resume",
+    is_flag=True,
+    help=(
+        "If given, resume an interrupted run in the same output directory "
+        "instead of requiring it to be empty."
+    ),
+)
+@click.option(
+    "--segment_size",
+    default=DEFAULT_SEGMENT_SIZE,
+    type=int,
+    help="Number of samples to translate per checkpointed segment.",
+)
+@profile_option
 def main(
     precursors_file: Path,
     products_file: Path,
@@ -47,9 +65,13 @@ def main(
     n_best: int,
     gpu: bool,
     no_metrics: bool,
+    resume: bool,
+    segment_size: int,
+    profile: Optional[str],
 ) -> None:
     """Starting from the ground truth files and forward model, generate the
     translation files needed for the metrics, and calculate the default metrics."""
+    enable_profiling(profile)
 
     run_model_for_metrics(
         task="forward",
@@ -62,6 +84,8 @@ def main(
         batch_size=batch_size,
         gpu=gpu,
         initialize_logger=True,
+        resume=resume,
+        segment_size=segment_size,
     )
 
     if not no_metrics:
@@ -5,14 +5,14 @@ from typing import Optional
 import click
 from rxn.chemutils.miscellaneous import canonicalize_file
 from rxn.chemutils.tokenization import copy_as_detokenized
-from rxn.onmt_models import rxn_translation
-from rxn.utilities.files import ensure_directory_exists_and_is_empty
 from rxn.utilities.logging import setup_console_and_file_logger
 
 from rxn.metrics.class_tokens import maybe_prepare_class_token_files
 from rxn.metrics.classification_translation import maybe_classify_predictions
 from rxn.metrics.metrics_files import RetroFiles
-from rxn.metrics.run_metrics import evaluate_metrics
+from rxn.metrics.profiling import enable_profiling, profile_option
+from rxn.metrics.run_metrics import evaluate_metrics, prepare_output_directory
+from rxn.metrics.translation import DEFAULT_SEGMENT_SIZE, resumable_rxn_translation
 from rxn.metrics.true_reactant_accuracy import (
     maybe_determine_true_reactants,
     true_reactant_environment_check,
@@ -22,6 +22,125 @@ logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
+def prepare_retro_metrics(
+    precursors_file: Path,
+    products_file: Path,
+    output_dir: Path,
+    retro_model: Path,
+    forward_model: Path,
+    classification_model: Optional[Path],
+    batch_size: int,
+    n_best: int,
+    gpu: bool,
+    beam_size: int,
+    class_tokens: Optional[int] = None,
+    with_true_reactant_accuracy: bool = False,
+    rxnmapper_batch_size: int = 8,
+    resume: bool = False,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    initialize_logger: bool = False,
+    deduplicate: bool = True,
+) -> None:
+    """Generate the translation files needed for the retro metrics, see main().
+
+    With deduplicate, each distinct source line of the retro and forward
+    translations (products, and canonical retro predictions) is translated
+    only once, see translate_unique_sources(); the files are the same as
+    without it, since the beam search is deterministic."""
+    true_reactant_environment_check(with_true_reactant_accuracy)
+
+    prepare_output_directory(output_dir, resume)
+    retro_files = RetroFiles(output_dir)
+
+    if initialize_logger:
+        setup_console_and_file_logger(retro_files.log_file)
+
+    timer = retro_files.timer
+    with timer.stage("prepare_retro_metrics", lines_of=retro_files.gt_src):
+        with timer.stage("copy_ground_truth", lines_of=retro_files.gt_src):
+            copy_as_detokenized(products_file, retro_files.gt_src)
+            copy_as_detokenized(precursors_file, retro_files.gt_tgt)
+            retro_files.record(retro_files.gt_src, retro_files.gt_tgt)
+
+        maybe_prepare_class_token_files(class_tokens, retro_files)
+
+        # retro
+        with timer.stage("retro_translation", lines_of=retro_files.predicted):
+            resumable_rxn_translation(
+                src_file=(
+                    retro_files.gt_src
+                    if class_tokens is None
+                    else retro_files.class_token_products
+                ),
+                tgt_file=(
+                    retro_files.gt_tgt
+                    if class_tokens is None
+                    else retro_files.class_token_precursors
+                ),
+                pred_file=retro_files.predicted,
+                model=retro_model,
+                n_best=n_best,
+                beam_size=beam_size,
+                batch_size=batch_size,
+                gpu=gpu,
+                # Keep the class token variants of a sample in the same segment
+                segment_size=segment_size * (class_tokens or 1),
+                deduplicate=deduplicate,
+            )
+            retro_files.record(
+                retro_files.predicted, retro_files.predicted_precursors_log_probs
+            )
+
+        with timer.stage(
+            "retro_canonicalization", lines_of=retro_files.predicted_canonical
+        ):
+            canonicalize_file(
+                retro_files.predicted,
+                retro_files.predicted_canonical,
+                fallback_value="",
+                sort_molecules=True,
+            )
+            retro_files.record(retro_files.predicted_canonical)
+
+        # Forward
+        with timer.stage(
+            "forward_translation", lines_of=retro_files.predicted_products
+        ):
+            resumable_rxn_translation(
+                src_file=retro_files.predicted_canonical,
+                tgt_file=None,
+                pred_file=retro_files.predicted_products,
+                model=forward_model,
+                n_best=1,
+                beam_size=10,
+                batch_size=batch_size,
+                gpu=gpu,
+                # n_best predictions per sample and class token
+                segment_size=segment_size * n_best * (class_tokens or 1),
+                deduplicate=deduplicate,
+            )
+            retro_files.record(
+                retro_files.predicted_products,
+                retro_files.predicted_products_log_probs,
+            )
+
+        with timer.stage(
+            "forward_canonicalization",
+            lines_of=retro_files.predicted_products_canonical,
+        ):
+            canonicalize_file(
+                retro_files.predicted_products,
+                retro_files.predicted_products_canonical,
+                fallback_value="",
+            )
+            retro_files.record(retro_files.predicted_products_canonical)
+
+        maybe_classify_predictions(classification_model, retro_files, batch_size, gpu)
+        maybe_determine_true_reactants(
+            with_true_reactant_accuracy, retro_files, rxnmapper_batch_size
+        )
+
+
 @click.command(context_settings={"show_default": True})
 @click.option(
     "--precursors_file",
@@ -70,6 +189,20 @@ logger.addHandler(logging.NullHandler())
 @click.option(
     "--no_metrics", is_flag=True, help="If given, the metrics will not be computed."
 )
+@click.option(
+    "--resume",
+    is_flag=True,
+    help=(
+        "If given, resume an interrupted run in the same output directory "
+        "instead of requiring it to be empty."
+    ),
+)
+@click.option(
+    "--segment_size",
+    default=DEFAULT_SEGMENT_SIZE,
+    type=int,
+    help="Number of samples to translate per checkpointed segment.",
+)
 @click.option(
     "--beam_size", default=15, type=int, help="Beam size for retro (> n_best)."
 )
@@ -93,6 +226,7 @@ logger.addHandler(logging.NullHandler())
         "only if the true reactant accuracy is activated."
     ),
 )
+@profile_option
 def main(
     precursors_file: Path,
     products_file: Path,
@@ -108,70 +242,32 @@ def main(
     class_tokens: Optional[int],
     with_true_reactant_accuracy: bool,
     rxnmapper_batch_size: int,
+    resume: bool,
+    segment_size: int,
+    profile: Optional[str],
 ) -> None:
     """Starting from the ground truth files and two models (retro, forward),
     generate the translation files needed for the metrics, and calculate the default metrics.
     """
-    true_reactant_environment_check(with_true_reactant_accuracy)
-
-    ensure_directory_exists_and_is_empty(output_dir)
-    retro_files = RetroFiles(output_dir)
-
-    setup_console_and_file_logger(retro_files.log_file)
-
-    copy_as_detokenized(products_file, retro_files.gt_src)
-    copy_as_detokenized(precursors_file, retro_files.gt_tgt)
-
-    maybe_prepare_class_token_files(class_tokens, retro_files)
-
-    # retro
-    rxn_translation(
-        src_file=(
-            retro_files.gt_src
-            if class_tokens is None
-            else retro_files.class_token_products
-        ),
-        tgt_file=(
-            retro_files.gt_tgt
-            if class_tokens is None
-            else retro_files.class_token_precursors
-        ),
-        pred_file=retro_files.predicted,
-        model=retro_model,
-        n_best=n_best,
-        beam_size=beam_size,
-        batch_size=batch_size,
-        gpu=gpu,
-    )
-
-    canonicalize_file(
-        retro_files.predicted,
-        retro_files.predicted_canonical,
-        fallback_value="",
-        sort_molecules=True,
-    )
+    enable_profiling(profile)
 
-    # Forward
-    rxn_translation(
-        src_file=retro_files.predicted_canonical,
-        tgt_file=None,
-        pred_file=retro_files.predicted_products,
-        model=forward_model,
-        n_best=1,
-        beam_size=10,
+    prepare_retro_metrics(
+        precursors_file=precursors_file,
+        products_file=products_file,
+        output_dir=output_dir,
+        retro_model=retro_model,
+        forward_model=forward_model,
+        classification_model=classification_model,
         batch_size=batch_size,
+        n_best=n_best,
         gpu=gpu,
-    )
-
-    canonicalize_file(
-        retro_files.predicted_products,
-        retro_files.predicted_products_canonical,
-        fallback_value="",
-    )
-
-    maybe_classify_predictions(classification_model, retro_files, batch_size, gpu)
-    maybe_determine_true_reactants(
-        with_true_reactant_accuracy, retro_files, rxnmapper_batch_size
+        beam_size=beam_size,
+        class_tokens=class_tokens,
+        with_true_reactant_accuracy=with_true_reactant_accuracy,
+        rxnmapper_batch_size=rxnmapper_batch_size,
+        resume=resume,
+        segment_size=segment_size,
+        initialize_logger=True,
     )
 
     if not no_metrics:
@@ -1,18 +1,26 @@
 import logging
 from pathlib import Path
-from typing import List, Tuple, Union
+from typing import Optional, Union
 
 import click
-from rxn.utilities.containers import chunker
-from rxn.utilities.files import dump_list_to_file, load_list_from_file
+import numpy as np
 
+from rxn.metrics.compression import dump_lines, load_lines
+from rxn.metrics.log_probs import load_log_probs
+from rxn.metrics.manifest import line_multiplier
 from rxn.metrics.metrics_files import RetroFiles
-from rxn.metrics.utils import get_sequence_multiplier
+from rxn.metrics.profiling import (
+    enable_profiling,
+    profile_hook,
+    profile_option,
+    profiling_directory,
+)
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
+@profile_hook("reorder_retro_predictions")
 def reorder_retro_predictions_class_token(
     ground_truth_file: Union[str, Path],
     predictions_file: Union[str, Path],
@@ -20,6 +28,7 @@ def reorder_retro_predictions_class_token(
     fwd_predictions_file: Union[str, Path],
     classes_predictions_file: Union[str, Path],
     n_class_tokens: int,
+    use_cache: bool = False,
 ) -> None:
     """
     Reorder the retro-preditions generated from a class-token model.
@@ -42,74 +51,82 @@ def reorder_retro_predictions_class_token(
         x   -> sorted([top1 prediction('[i] x') for i in number_class_tokens])
             -> sorted([top2 prediction('[i] x') for i in number_class_tokens])
             ...
+
+    The reordering is done on the confidences parsed into an array, see
+    load_log_probs(); with use_cache, they are cached next to the confidences file.
     """
     logger.info(
         f'Reordering file "{predictions_file}", based on {n_class_tokens} class tokens.'
     )
 
-    # We load the files and chunk the confidences
-    ground_truth = load_list_from_file(ground_truth_file)
-    predictions = load_list_from_file(predictions_file)
-    confidences = load_list_from_file(confidences_file)
-    fwd_predictions = load_list_from_file(fwd_predictions_file)
-    classes_predictions = load_list_from_file(classes_predictions_file)
+    # Get the exact multiplier, from the line counts
+    multiplier = line_multiplier(predictions_file, reference=ground_truth_file)
 
-    # Get the exact multiplier
-    multiplier = get_sequence_multiplier(
-        ground_truth=ground_truth, predictions=predictions
-    )
+    # We load the files; the confidences are only parsed to compute the order
+    predictions = load_lines(predictions_file)
+    confidences = load_lines(confidences_file)
+    fwd_predictions = load_lines(fwd_predictions_file)
+    classes_predictions = load_lines(classes_predictions_file)
 
     if multiplier % n_class_tokens != 0:
         raise ValueError(
             f"The number of predictions ('{multiplier}') is not an exact "
             f"multiple of the number of class tokens '({n_class_tokens})'"
         )
-    topx_per_class_token = int(multiplier / n_class_tokens)
-    predictions_and_confidences = zip(
-        predictions, confidences, fwd_predictions, classes_predictions
-    )
 
-    predictions_and_confidences_chunks = chunker(
-        predictions_and_confidences, chunk_size=multiplier
+    # Full precision, so that distinct confidences are never sorted as ties
+    log_probs = load_log_probs(
+        confidences_file, multiplier, use_cache=use_cache, dtype=np.float64
     )
+    if log_probs.size != len(predictions):
+        raise ValueError(
+            f"The number of confidences ({log_probs.size}) does not match the "
+            f"number of predictions ({len(predictions)})."
+        )
+    order = class_token_order(log_probs, n_class_tokens)
 
-    # we will reorder the predictions class-token wise using the confidence
-    predictions_and_confidences_reordered: List[Tuple[str, str, str, str]] = []
-
-    for pred_and_conf in predictions_and_confidences_chunks:
-        for topn in range(topx_per_class_token):
-            # For each class token take the topn prediction and reorder them based on the
-            # (negative) confidence (index x[1])
-            topn_per_class_token = [
-                chunk[topn]
-                for chunk in chunker(pred_and_conf, chunk_size=topx_per_class_token)
-            ]
-            reordered = sorted(
-                topn_per_class_token, key=lambda x: float(x[1]), reverse=True
-            )
-            predictions_and_confidences_reordered.extend(reordered)
-
-    dump_list_to_file(
-        (pred for pred, _, _, _ in predictions_and_confidences_reordered),
-        RetroFiles.reordered(predictions_file),
-    )
-    dump_list_to_file(
-        (conf for _, conf, _, _ in predictions_and_confidences_reordered),
-        RetroFiles.reordered(confidences_file),
-    )
-    dump_list_to_file(
-        (fwd_pred for _, _, fwd_pred, _ in predictions_and_confidences_reordered),
+    dump_lines((predictions[i] for i in order), RetroFiles.reordered(predictions_file))
+    dump_lines((confidences[i] for i in order), RetroFiles.reordered(confidences_file))
+    dump_lines(
+        (fwd_predictions[i] for i in order),
         RetroFiles.reordered(fwd_predictions_file),
     )
-    dump_list_to_file(
-        (
-            classes_pred
-            for _, _, _, classes_pred in predictions_and_confidences_reordered
-        ),
+    dump_lines(
+        (classes_predictions[i] for i in order),
         RetroFiles.reordered(classes_predictions_file),
     )
 
 
+def class_token_order(confidences: np.ndarray, n_class_tokens: int) -> np.ndarray:
+    """
+    Order of the predictions after reordering them class-token wise, see
+    reorder_retro_predictions_class_token().
+
+    Args:
+        confidences: log probabilities, of shape (number of samples,
+            number of predictions per sample).
+        n_class_tokens: number of class tokens.
+
+    Returns:
+        The indices of the predictions (in the flattened array) in their new order.
+    """
+    n_samples, multiplier = confidences.shape
+    topx_per_class_token = multiplier // n_class_tokens
+
+    # Shape: (sample, topn, class token)
+    by_topn = confidences.reshape(
+        n_samples, n_class_tokens, topx_per_class_token
+    ).transpose(0, 2, 1)
+    # Stable, to keep the class token order for identical confidences
+    class_token_ranks = np.argsort(-by_topn, axis=2, kind="stable")
+
+    sample_offsets = np.arange(n_samples)[:, None, None] * multiplier
+    topn_offsets = np.arange(topx_per_class_token)[None, :, None]
+    order = sample_offsets + class_token_ranks * topx_per_class_token + topn_offsets
+    flat_order: np.ndarray = order.reshape(-1)
+    return flat_order
+
+
 @click.command()
 @click.option(
     "--ground_truth_file", "-g", required=True, help="File with ground truth."
@@ -135,6 +152,12 @@ def reorder_retro_predictions_class_token(
 @click.option(
     "--n_class_tokens", "-n", required=True, type=int, help="Number of class tokens."
 )
+@click.option(
+    "--cache_log_probs",
+    is_flag=True,
+    help="If given, cache the parsed confidences next to the confidences file.",
+)
+@profile_option
 def main(
     ground_truth_file: str,
     predictions_file: str,
@@ -142,19 +165,25 @@ def main(
     fwd_predictions_file: str,
     classes_predictions_file: str,
     n_class_tokens: int,
+    cache_log_probs: bool,
+    profile: Optional[str],
 ) -> None:
+    enable_profiling(profile)
+
     logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level="INFO")
 
     # Note: we put the actual code in a separate function, so that it can be
     # called also as a Python function.
-    reorder_retro_predictions_class_token(
-        ground_truth_file=ground_truth_file,
-        predictions_file=predictions_file,
-        confidences_file=confidences_file,
-        fwd_predictions_file=fwd_predictions_file,
-        classes_predictions_file=classes_predictions_file,
-        n_class_tokens=n_class_tokens,
-    )
+    with profiling_directory(Path(predictions_file).parent):
+        reorder_retro_predictions_class_token(
+            ground_truth_file=ground_truth_file,
+            predictions_file=predictions_file,
+            confidences_file=confidences_file,
+            fwd_predictions_file=fwd_predictions_file,
+            classes_predictions_file=classes_predictions_file,
+            n_class_tokens=n_class_tokens,
+            use_cache=cache_log_probs,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+import click
+from rxn.utilities.logging import setup_console_logger
+
+from rxn.metrics.reranking import rerank_retro_results, weights_grid
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def _parse_weights(value: str) -> List[float]:
+    return [float(weight) for weight in value.split(",")]
+
+
+@click.command()
+@click.option(
+    "--results_dir",
+    "-r",
+    required=True,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="Retro results directory, with the log probabilities.",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help='JSON file for the results. Defaults to "reranking.json" in the results directory.',
+)
+@click.option(
+    "--retro_weights",
+    default="1",
+    help="Comma-separated weights of the retro log probabilities.",
+)
+@click.option(
+    "--forward_weights",
+    default="0",
+    help="Comma-separated weights of the forward log probabilities.",
+)
+@click.option(
+    "--round_trip_weights",
+    default="0,1",
+    help="Comma-separated weights of the round-trip success.",
+)
+@click.option(
+    "--binary_cache",
+    is_flag=True,
+    help="If given, load the files through the binary cache of the results directory.",
+)
+def main(
+    results_dir: Path,
+    output: Optional[Path],
+    retro_weights: str,
+    forward_weights: str,
+    round_trip_weights: str,
+    binary_cache: bool,
+) -> None:
+    """Evaluate the re-ranking of retro predictions for a grid of weightings
+    of the retro log probabilities, forward log probabilities and round-trip
+    success."""
+    setup_console_logger()
+
+    if output is None:
+        output = results_dir / "reranking.json"
+
+    grid = weights_grid(
+        retro=_parse_weights(retro_weights),
+        forward=_parse_weights(forward_weights),
+        round_trip=_parse_weights(round_trip_weights),
+    )
+    report = rerank_retro_results(
+        results_dir, grid, output_file=output, use_binary_cache=binary_cache
+    )
+
+    best = report["best"]
+    logger.info(
+        f"Best top-1 accuracy: {best['accuracy'][1]:.4f}, for the weights "
+        f"{best['weights']}."
+    )
+    logger.info(f'Results for {len(grid)} weightings saved to "{output}".')
+
+
+if __name__ == "__main__":
+    main()
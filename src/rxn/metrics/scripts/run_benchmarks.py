@@ -0,0 +1,132 @@
+import json
+import logging
+from typing import Optional, Tuple
+
+import click
+from rxn.utilities.logging import setup_console_logger
+
+from rxn.metrics.benchmarks.metric_benchmarks import (
+    BENCHMARKS,
+    DEFAULT_SCALES,
+    compare_benchmark_results,
+    run_benchmarks,
+)
+from rxn.metrics.benchmarks.pipeline_benchmarks import run_pipeline_benchmarks
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+@click.command(context_settings={"show_default": True})
+@click.option("--output", "-o", required=True, help="JSON file for the results.")
+@click.option(
+    "--scales",
+    default=",".join(str(scale) for scale in DEFAULT_SCALES),
+    help="Comma-separated numbers of ground truth samples.",
+)
+@click.option(
+    "--n_best", default=10, type=int, help="Number of predictions per sample."
+)
+@click.option(
+    "--class_tokens",
+    default=4,
+    type=int,
+    help="Number of class tokens, for the reordering and retro pipeline benchmarks.",
+)
+@click.option("--repeats", default=3, type=int, help="Number of timed runs.")
+@click.option(
+    "--benchmark",
+    "benchmarks",
+    multiple=True,
+    type=click.Choice(list(BENCHMARKS)),
+    help="Benchmark to run (can be given several times). Defaults to all of them.",
+)
+@click.option(
+    "--pipelines",
+    is_flag=True,
+    help=(
+        "If given, benchmark the full retro, forward and context pipelines "
+        "with a stand-in translator instead of the individual functions."
+    ),
+)
+@click.option(
+    "--translation_speed",
+    type=float,
+    default=None,
+    help="Lines per second of the stand-in translator (default: no delay).",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True),
+    help="Results of a previous run, to compare the time and memory to.",
+)
+def main(
+    output: str,
+    scales: str,
+    n_best: int,
+    class_tokens: int,
+    repeats: int,
+    benchmarks: Tuple[str, ...],
+    pipelines: bool,
+    translation_speed: Optional[float],
+    baseline: Optional[str],
+) -> None:
+    """Benchmark the metrics and file utilities on synthetic data.
+
+    The results (time, throughput and peak memory for each benchmark and
+    scale) are saved as JSON; give the results of another version of the
+    package with --baseline to compare them. With --pipelines, the time is
+    the one of the pipeline excluding the (stand-in) inference."""
+    setup_console_logger()
+
+    scale_values = [int(scale) for scale in scales.split(",")]
+    if pipelines:
+        if benchmarks:
+            raise click.UsageError("--benchmark cannot be combined with --pipelines.")
+        report = run_pipeline_benchmarks(
+            scales=scale_values,
+            n_best=n_best,
+            class_tokens=class_tokens,
+            lines_per_second=translation_speed,
+            repeats=repeats,
+            output_file=output,
+        )
+    else:
+        report = run_benchmarks(
+            scales=scale_values,
+            n_best=n_best,
+            class_tokens=class_tokens,
+            repeats=repeats,
+            names=benchmarks if benchmarks else None,
+            output_file=output,
+        )
+
+    for result in report["results"]:
+        logger.info(
+            f"{result['benchmark']:>40} {result['n_samples']:>8}: "
+            f"{result['min_time_s']:.4f} s, {result['peak_memory_mb']:.1f} MB"
+        )
+
+    if baseline is None:
+        return
+    with open(baseline, "rt") as f:
+        baseline_report = json.load(f)
+    logger.info(
+        f"Comparison to version {baseline_report['rxn_metrics_version']} "
+        "(ratios above 1 are regressions):"
+    )
+    for comparison in compare_benchmark_results(baseline_report, report):
+        logger.info(
+            f"{comparison['benchmark']:>40} {comparison['n_samples']:>8}: "
+            f"time {_format_ratio(comparison['time_ratio'])}, "
+            f"memory {_format_ratio(comparison['memory_ratio'])}"
+        )
+
+
+def _format_ratio(ratio: Optional[float]) -> str:
+    # None if the baseline value is zero
+    return "n/a" if ratio is None else f"x{ratio:.2f}"
+
+
+if __name__ == "__main__":
+    main()
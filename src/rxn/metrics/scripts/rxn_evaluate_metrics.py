@@ -1,6 +1,10 @@
+from typing import Optional
+
 import click
 from rxn.utilities.logging import setup_console_logger
 
+from rxn.metrics.evaluation_options import EvaluationOptions, evaluation_options
+from rxn.metrics.profiling import enable_profiling, profile_option
 from rxn.metrics.run_metrics import evaluate_metrics
 
 
@@ -11,12 +15,20 @@ from rxn.metrics.run_metrics import evaluate_metrics
 @click.option(
     "--results_dir", required=True, help="Where the retro predictions are stored"
 )
-def main(task: str, results_dir: str) -> None:
+@evaluation_options
+@profile_option
+def main(
+    task: str,
+    results_dir: str,
+    options: EvaluationOptions,
+    profile: Optional[str],
+) -> None:
     """Evaluate the metrics (the predictions must have been generated already!)"""
 
     setup_console_logger()
+    enable_profiling(profile)
 
-    evaluate_metrics(task, results_dir)
+    evaluate_metrics(task, results_dir, options=options)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+import glob
+from typing import List, Optional, Tuple
+
+import click
+from rxn.utilities.logging import setup_console_logger
+
+from rxn.metrics.evaluation_options import EvaluationOptions, evaluation_options
+from rxn.metrics.profiling import enable_profiling, profile_option
+from rxn.metrics.run_metrics import evaluate_metrics_for_directories
+
+
+def expand_directories(patterns: Tuple[str, ...]) -> List[str]:
+    """Expand the glob patterns (the other values are kept as is), keeping
+    the order and removing duplicates."""
+    directories: List[str] = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        directories.extend(d for d in matches if d not in directories)
+    return directories
+
+
+@click.command(context_settings={"show_default": True})
+@click.option(
+    "--task", required=True, type=click.Choice(["forward", "retro", "context"])
+)
+@click.option(
+    "--n_workers", default=1, type=int, help="Number of processes for the evaluation"
+)
+@click.argument("results_dirs", nargs=-1, required=True)
+@evaluation_options
+@profile_option
+def main(
+    task: str,
+    n_workers: int,
+    results_dirs: Tuple[str, ...],
+    options: EvaluationOptions,
+    profile: Optional[str],
+) -> None:
+    """Evaluate the metrics for several results directories in one go (the
+    predictions must have been generated already!).
+
+    The ground truth is loaded only once for all the directories sharing it.
+    The options of the evaluation are the same as for rxn-evaluate-metrics.
+
+    Usage examples:
+        - rxn-evaluate-metrics-batch --task retro dir1 dir2 dir3
+        - rxn-evaluate-metrics-batch --task retro --n_workers 8 "sweep/*"
+    """
+    setup_console_logger()
+    enable_profiling(profile)
+
+    evaluate_metrics_for_directories(
+        task,
+        expand_directories(results_dirs),
+        n_workers=n_workers,
+        options=options,
+    )
+
+
+if __name__ == "__main__":
+    main()
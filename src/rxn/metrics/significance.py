@@ -0,0 +1,248 @@
+"""
+Paired significance tests between the results of two models on the same
+ground truth.
+
+For every top-n value of the compared metrics, the per-sample values of the
+two models (see MetricsCalculator.per_sample_metrics()) give:
+
+    - the paired bootstrap distribution of the difference "b - a", with its
+      confidence interval and a two-sided p-value;
+    - for the metrics with binary per-sample values (top-n accuracy,
+      coverage, round-trip at n=1), McNemar's test on the samples where only
+      one of the models is correct.
+"""
+import logging
+import math
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from rxn.utilities.files import PathLike
+
+from .bootstrap import DEFAULT_CONFIDENCE_LEVEL, DEFAULT_N_RESAMPLES, bootstrap_means
+from .ground_truth import GroundTruth, ground_truth_hash
+from .run_metrics import get_metrics_calculator, get_metrics_files
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+DEFAULT_COMPARED_METRICS = ("accuracy", "round-trip", "coverage")
+
+# Below this number of discordant samples, McNemar's test uses the exact
+# binomial distribution instead of the chi-squared approximation
+_EXACT_MCNEMAR_LIMIT = 25
+
+
+def mcnemar_p_value(only_a: int, only_b: int) -> float:
+    """
+    Two-sided p-value of McNemar's test.
+
+    Args:
+        only_a: number of samples where only the first model is correct.
+        only_b: number of samples where only the second model is correct.
+    """
+    n_discordant = only_a + only_b
+    if n_discordant == 0:
+        return 1.0
+    if n_discordant < _EXACT_MCNEMAR_LIMIT:
+        # Binomial coefficients, computed iteratively (no math.comb in Python 3.6)
+        tail, coefficient = 0, 1
+        for i in range(min(only_a, only_b) + 1):
+            tail += coefficient
+            coefficient = coefficient * (n_discordant - i) // (i + 1)
+        return min(1.0, 2 * tail / float(2**n_discordant))
+
+    # Chi-squared with one degree of freedom and continuity correction
+    statistic = (abs(only_a - only_b) - 1) ** 2 / n_discordant
+    return math.erfc(math.sqrt(statistic / 2))
+
+
+def compare_per_sample_values(
+    values_a: np.ndarray,
+    values_b: np.ndarray,
+    n_resamples: int = DEFAULT_N_RESAMPLES,
+    confidence_level: float = DEFAULT_CONFIDENCE_LEVEL,
+    seed: Optional[int] = 0,
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Compare the per-sample values of one metric for two models.
+
+    Args:
+        values_a: per-sample values of the first model, of shape (samples,
+            predictions per sample).
+        values_b: same for the second model.
+        n_resamples: number of bootstrap resamples.
+        confidence_level: probability covered by the confidence intervals.
+        seed: seed for the random number generator; None for a random one.
+
+    Raises:
+        ValueError: if the shapes of the arrays differ.
+
+    Returns:
+        Dictionary, by top-n, with the values of the metric ("a", "b"), their
+        difference ("delta", "b - a") and its confidence interval
+        ("delta-low", "delta-high"), and the p-values ("bootstrap-p-value",
+        "mcnemar-p-value" for binary values; None otherwise).
+    """
+    if values_a.shape != values_b.shape:
+        raise ValueError(
+            f"Incompatible per-sample values: {values_a.shape} vs {values_b.shape}"
+        )
+    a = values_a.astype(np.float64)
+    b = values_b.astype(np.float64)
+
+    # The difference is resampled per sample, which keeps the pairing
+    delta_means = bootstrap_means(b - a, n_resamples=n_resamples, seed=seed)
+    alpha = (1 - confidence_level) / 2
+    lows, highs = np.quantile(delta_means, [alpha, 1 - alpha], axis=0)
+    bootstrap_p_values = np.minimum(
+        1.0,
+        2
+        * np.minimum((delta_means <= 0).mean(axis=0), (delta_means >= 0).mean(axis=0)),
+    )
+
+    binary = ((a == 0) | (a == 1)).all(axis=0) & ((b == 0) | (b == 1)).all(axis=0)
+    only_a = ((a == 1) & (b == 0)).sum(axis=0)
+    only_b = ((a == 0) & (b == 1)).sum(axis=0)
+
+    mean_a = a.mean(axis=0)
+    mean_b = b.mean(axis=0)
+    return {
+        i
+        + 1: {
+            "a": float(mean_a[i]),
+            "b": float(mean_b[i]),
+            "delta": float(mean_b[i] - mean_a[i]),
+            "delta-low": float(lows[i]),
+            "delta-high": float(highs[i]),
+            "bootstrap-p-value": float(bootstrap_p_values[i]),
+            "mcnemar-p-value": (
+                mcnemar_p_value(int(only_a[i]), int(only_b[i])) if binary[i] else None
+            ),
+        }
+        for i in range(a.shape[1])
+    }
+
+
+def compare_per_sample_metrics(
+    per_sample_a: Mapping[str, np.ndarray],
+    per_sample_b: Mapping[str, np.ndarray],
+    metrics: Iterable[str] = DEFAULT_COMPARED_METRICS,
+    n_resamples: int = DEFAULT_N_RESAMPLES,
+    confidence_level: float = DEFAULT_CONFIDENCE_LEVEL,
+    seed: Optional[int] = 0,
+) -> Dict[str, Dict[int, Dict[str, Any]]]:
+    """
+    Compare several metrics of two models, see compare_per_sample_values().
+
+    The metrics not available for both models are skipped.
+    """
+    comparison = {}
+    for metric in metrics:
+        if metric not in per_sample_a or metric not in per_sample_b:
+            continue
+        values_a, values_b = per_sample_a[metric], per_sample_b[metric]
+        comparison[metric] = compare_per_sample_values(
+            values_a.reshape(len(values_a), -1),
+            values_b.reshape(len(values_b), -1),
+            n_resamples=n_resamples,
+            confidence_level=confidence_level,
+            seed=seed,
+        )
+    return comparison
+
+
+def compare_results_directories(
+    task: str,
+    pairs: Sequence[Tuple[PathLike, PathLike]],
+    metrics: Iterable[str] = DEFAULT_COMPARED_METRICS,
+    n_resamples: int = DEFAULT_N_RESAMPLES,
+    confidence_level: float = DEFAULT_CONFIDENCE_LEVEL,
+    gt_cache_dir: Optional[PathLike] = None,
+    use_binary_cache: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Compare pairs of results directories.
+
+    The ground truth is loaded and interned only once for all the directories
+    sharing it, and the per-sample values of the compared metrics are computed
+    only once for every directory, also when it appears in several pairs (for
+    instance, a baseline compared to all the models of a sweep). They are
+    released after the last pair of the directory.
+
+    Args:
+        task: the kind of metrics to compute ("forward", "retro", "context").
+        pairs: pairs of results directories to compare.
+        metrics: names of the metrics to compare.
+        n_resamples: number of bootstrap resamples.
+        confidence_level: probability covered by the confidence intervals.
+        gt_cache_dir: directory where to cache the interned ground truths.
+        use_binary_cache: whether to load the predictions through the binary
+            cache of the results directories.
+
+    Raises:
+        ValueError: if the directories of a pair rely on different ground truths.
+
+    Returns:
+        One dictionary per pair, in the same order, with the directories ("a",
+        "b") and the comparison of the metrics ("metrics"), see
+        compare_per_sample_values().
+    """
+    metrics = list(metrics)
+
+    # Pairs by ground truth hash, to load each ground truth only once
+    pairs_by_hash: Dict[str, List[int]] = {}
+    for index, (directory_a, directory_b) in enumerate(pairs):
+        hash_a = ground_truth_hash(get_metrics_files(task, directory_a))
+        if ground_truth_hash(get_metrics_files(task, directory_b)) != hash_a:
+            raise ValueError(
+                f'Cannot compare "{directory_a}" and "{directory_b}": '
+                "their ground truths differ."
+            )
+        pairs_by_hash.setdefault(hash_a, []).append(index)
+
+    results: List[Dict[str, Any]] = [{} for _ in pairs]
+    for content_hash, indices in pairs_by_hash.items():
+        ground_truth = GroundTruth.from_metrics_files(
+            get_metrics_files(task, pairs[indices[0]][0]),
+            cache_dir=gt_cache_dir,
+            content_hash=content_hash,
+        )
+        # Number of pairs still to compare for every directory: the per-sample
+        # metrics are kept only until its last pair (f.i. for a baseline)
+        remaining_pairs = Counter(
+            str(directory) for index in indices for directory in pairs[index]
+        )
+        per_sample: Dict[str, Dict[str, np.ndarray]] = {}
+
+        def get_per_sample(directory: PathLike) -> Dict[str, np.ndarray]:
+            key = str(directory)
+            if key not in per_sample:
+                logger.info(f'Computing the per-sample metrics of "{directory}"...')
+                calculator = get_metrics_calculator(
+                    task,
+                    get_metrics_files(task, directory),
+                    ground_truth=ground_truth,
+                    use_binary_cache=use_binary_cache,
+                )
+                per_sample[key] = calculator.per_sample_metrics(names=metrics)
+            return per_sample[key]
+
+        for index in indices:
+            directory_a, directory_b = pairs[index]
+            results[index] = {
+                "a": str(directory_a),
+                "b": str(directory_b),
+                "metrics": compare_per_sample_metrics(
+                    get_per_sample(directory_a),
+                    get_per_sample(directory_b),
+                    metrics=metrics,
+                    n_resamples=n_resamples,
+                    confidence_level=confidence_level,
+                ),
+            }
+            for directory in (directory_a, directory_b):
+                remaining_pairs[str(directory)] -= 1
+                if remaining_pairs[str(directory)] == 0:
+                    per_sample.pop(str(directory), None)
+    return results
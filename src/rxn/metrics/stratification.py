@@ -0,0 +1,250 @@
+"""
+Metrics split into strata of the ground-truth samples.
+
+Every sample gets one label per stratification:
+
+    - "reaction-class": superclass of the ground-truth reaction, from the
+      optional "gt_classes.txt" file of the results directory (one class per
+      sample, f.i. "1.2.3");
+    - "product-heavy-atoms": bin of the number of heavy atoms of the
+      ground-truth product(s);
+    - "input-length": bin of the number of tokens of the model input (ground
+      truth source);
+    - "n-precursors": number of molecules in the ground-truth precursors.
+
+The labels are computed once per ground truth (and stored with it if it is
+cached, see GroundTruth.derived()). All the metrics of every stratum are then
+obtained from the per-sample metrics of the calculator (see
+MetricsCalculator.per_sample_metrics()) with one grouped sum (np.bincount)
+per metric, instead of an evaluation per subset.
+"""
+import logging
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+from .compression import exists, load_lines
+from .ground_truth import GroundTruth, SampleGroups
+from .interning import StringTable
+from .metrics_files import MetricsFiles
+from .utils import by_n
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+INVALID_LABEL = "invalid"
+
+# Lower bounds of the bins; the last bin is open-ended
+HEAVY_ATOM_BINS = [0, 10, 20, 30, 40, 50]
+INPUT_LENGTH_BINS = [0, 25, 50, 75, 100, 150, 200]
+MAX_PRECURSORS_LABEL = 5
+
+# Version of the label computations, part of the names under which they are
+# stored with the ground truth
+_LABELS_VERSION = 1
+
+
+def bin_label(value: int, bins: Sequence[int]) -> str:
+    """Label of the bin of a value, f.i. "10-19", or "50+" for the last bin."""
+    index = int(np.searchsorted(bins, value, side="right")) - 1
+    if index < 0:
+        return INVALID_LABEL
+    if index == len(bins) - 1:
+        return f"{bins[index]}+"
+    return f"{bins[index]}-{bins[index + 1] - 1}"
+
+
+def heavy_atom_label(smiles: str) -> str:
+    """Bin of the number of heavy atoms of a SMILES (possibly with several
+    molecules)."""
+    from rdkit import Chem, rdBase
+
+    # Silence the RDKit errors for the invalid SMILES
+    block_logs = rdBase.BlockLogs()
+    try:
+        mol = Chem.MolFromSmiles(smiles) if smiles else None
+    finally:
+        del block_logs
+    if mol is None:
+        return INVALID_LABEL
+    return bin_label(mol.GetNumHeavyAtoms(), HEAVY_ATOM_BINS)
+
+
+def input_length_label(smiles: str) -> str:
+    """Bin of the number of tokens of a (reaction) SMILES."""
+    from rxn.chemutils.tokenization import TokenizationError, to_tokens
+
+    try:
+        n_tokens = len(to_tokens(smiles))
+    except TokenizationError:
+        return INVALID_LABEL
+    return bin_label(n_tokens, INPUT_LENGTH_BINS)
+
+
+def n_precursors_label(smiles: str) -> str:
+    """Number of molecules of a SMILES, "5+" from MAX_PRECURSORS_LABEL on."""
+    if not smiles:
+        return INVALID_LABEL
+    n_molecules = smiles.count(".") + 1
+    if n_molecules >= MAX_PRECURSORS_LABEL:
+        return f"{MAX_PRECURSORS_LABEL}+"
+    return str(n_molecules)
+
+
+def products_and_precursors(
+    task: str, ground_truth: GroundTruth
+) -> Tuple[List[str], List[str]]:
+    """Ground-truth products and precursors of every sample, for a task."""
+    if task == "forward":
+        return ground_truth.tgt, ground_truth.src
+    if task == "retro":
+        return ground_truth.src, ground_truth.tgt
+
+    # Context: parts of the ground-truth reaction (reactants, agents, products)
+    from .context_metrics import context_compound_groups
+
+    groups = context_compound_groups(ground_truth)
+    # Sorted molecules, as in the standardized SMILES (see canonicalize_file)
+    products = ["" if g is None else ".".join(sorted(g[-1])) for g in groups]
+    precursors = ["" if g is None else ".".join(sorted(g[0] + g[1])) for g in groups]
+    return products, precursors
+
+
+def stratum_labels(
+    task: str, files: MetricsFiles, ground_truth: GroundTruth
+) -> Dict[str, List[str]]:
+    """
+    Labels of the samples for every stratification.
+
+    Args:
+        task: the kind of metrics ("forward", "retro", "context").
+        files: results directory, for the optional reaction classes.
+        ground_truth: ground truth, where the labels are stored.
+
+    Raises:
+        ValueError: if the class file does not have one line per sample.
+
+    Returns:
+        Labels of the samples, by stratification name.
+    """
+    labels: Dict[str, List[str]] = {}
+    if exists(files.gt_classes):
+        classes = load_lines(files.gt_classes)
+        if len(classes) != ground_truth.n_samples:
+            raise ValueError(
+                f'"{files.gt_classes}" has {len(classes)} lines, expected '
+                f"{ground_truth.n_samples}."
+            )
+        labels["reaction-class"] = [c.split(".")[0] or INVALID_LABEL for c in classes]
+
+    products, precursors = products_and_precursors(task, ground_truth)
+    labels["product-heavy-atoms"] = _cached_labels(
+        ground_truth, f"{task}_product_heavy_atoms", products, heavy_atom_label
+    )
+    labels["input-length"] = _cached_labels(
+        ground_truth, "input_length", ground_truth.src, input_length_label
+    )
+    labels["n-precursors"] = [n_precursors_label(p) for p in precursors]
+    return labels
+
+
+def _cached_labels(
+    ground_truth: GroundTruth,
+    name: str,
+    values: Sequence[str],
+    compute_label: Callable[[str], str],
+) -> List[str]:
+    """Labels of the samples, computed once per ground truth and once per
+    distinct value."""
+
+    def compute() -> List[SampleGroups]:
+        label_by_value: Dict[str, str] = {}
+        for value in values:
+            if value not in label_by_value:
+                label_by_value[value] = compute_label(value)
+        # One group with one string per sample, see SampleGroups
+        return [[[label_by_value[value]]] for value in values]
+
+    derived = ground_truth.derived(f"strata_{name}_v{_LABELS_VERSION}", compute)
+    return [INVALID_LABEL if groups is None else groups[0][0] for groups in derived]
+
+
+def grouped_means(
+    codes: np.ndarray, n_groups: int, values: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Means of per-sample values for groups of samples.
+
+    Args:
+        codes: group of every sample, from 0 to n_groups - 1.
+        n_groups: number of groups.
+        values: per-sample values, of shape (samples,) or (samples, columns).
+
+    Returns:
+        Tuple: means, of shape (n_groups,) or (n_groups, columns), NaN for the
+        empty groups; and number of samples per group.
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    columns = values.reshape(len(values), -1)
+    n_columns = columns.shape[1]
+    # One bincount for all the columns, with one bin per (group, column)
+    bins = codes[:, np.newaxis] * n_columns + np.arange(n_columns)
+    sums = np.bincount(
+        bins.ravel(),
+        weights=columns.astype(np.float64).ravel(),
+        minlength=n_groups * n_columns,
+    ).reshape(n_groups, n_columns)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts[:, np.newaxis]
+    return means.reshape((n_groups,) + values.shape[1:]), counts
+
+
+def stratified_metrics(
+    labels: Mapping[str, Sequence[str]], per_sample_metrics: Mapping[str, np.ndarray]
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Metrics averaged over the samples of every stratum.
+
+    Args:
+        labels: labels of the samples, by stratification name.
+        per_sample_metrics: per-sample values of the metrics, by metric name,
+            see MetricsCalculator.per_sample_metrics().
+
+    Returns:
+        For every stratification and every label (sorted): the number of
+        samples ("count") and the metrics, as dictionaries by top-n for the
+        per-sample values of shape (samples, predictions per sample).
+    """
+    results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for stratification, sample_labels in labels.items():
+        table = StringTable()
+        codes = table.add_all(sample_labels).astype(np.int64)
+        n_labels = len(table)
+
+        strata: List[Dict[str, Any]] = [{} for _ in range(n_labels)]
+        counts = np.bincount(codes, minlength=n_labels)
+        for code in range(n_labels):
+            strata[code]["count"] = int(counts[code])
+        for metric, values in per_sample_metrics.items():
+            means, _ = grouped_means(codes, n_labels, values)
+            for code in range(n_labels):
+                strata[code][metric] = (
+                    by_n(means[code]) if values.ndim > 1 else float(means[code])
+                )
+
+        results[stratification] = {
+            label: strata[table.get_id(label)]
+            for label in sorted(table.strings, key=_label_order)
+        }
+    return results
+
+
+def _label_order(label: str) -> Tuple[int, float, str]:
+    """Numeric labels and bins ("2", "10-19", "50+") in increasing order,
+    then the other ones."""
+    prefix = label.split("-")[0].rstrip("+")
+    try:
+        return 0, float(prefix), label
+    except ValueError:
+        return 1, 0.0, label
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from rxn.utilities.files import PathLike
+
+from .manifest import line_count
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class StageTimer:
+    """
+    Record the wall time, CPU time, throughput and peak memory of the stages
+    of a pipeline into a JSON file (typically "timings.json" in the results
+    directory).
+
+    The peak memory is a high-water mark of the process: "process_peak_rss_mb"
+    is the peak so far (possibly reached in an earlier stage), and
+    "peak_rss_increase_mb" by how much the stage raised it (0 if the stage
+    stayed below the earlier peak).
+
+    The file is updated at the end of each stage, so that the timings of the
+    completed stages are available even if a later stage fails. Stages run
+    again overwrite the previous timings.
+    """
+
+    def __init__(self, timings_file: PathLike):
+        self.timings_file = Path(timings_file)
+
+    @contextmanager
+    def stage(self, name: str, lines_of: Optional[PathLike] = None) -> Iterator[None]:
+        """
+        Context manager timing a stage.
+
+        Args:
+            name: name of the stage.
+            lines_of: file whose number of lines (after the stage) gives the
+                throughput, typically the output of the stage.
+        """
+        start_wall = time.perf_counter()
+        start_cpu = _cpu_time()
+        start_rss = _peak_rss_mb()
+
+        yield
+
+        wall_time = time.perf_counter() - start_wall
+        timings: Dict[str, Any] = {
+            "wall_time_s": wall_time,
+            "cpu_time_s": _cpu_time() - start_cpu,
+        }
+        if lines_of is not None:
+            n_lines = line_count(lines_of)
+            timings["n_lines"] = n_lines
+            timings["lines_per_s"] = n_lines / wall_time if wall_time > 0 else None
+        peak_rss = _peak_rss_mb()
+        if peak_rss:
+            timings["process_peak_rss_mb"] = peak_rss["self"]
+            timings["process_peak_rss_children_mb"] = peak_rss["children"]
+            timings["peak_rss_increase_mb"] = peak_rss["self"] - start_rss["self"]
+
+        logger.info(f'Stage "{name}" completed in {wall_time:.1f} s.')
+        try:
+            self._save(name, timings)
+        except OSError as e:
+            logger.warning(f'Could not write the timings to "{self.timings_file}": {e}')
+
+    def _save(self, name: str, timings: Dict[str, Any]) -> None:
+        stages = load_timings(self.timings_file)
+        stages[name] = timings
+
+        self.timings_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.timings_file.with_suffix(".json.tmp")
+        with open(tmp_file, "wt") as f:
+            json.dump(stages, f, indent=2)
+        os.replace(tmp_file, self.timings_file)
+
+
+def load_timings(timings_file: PathLike) -> Dict[str, Dict[str, Any]]:
+    """Load the timings of the stages, empty if the file does not exist."""
+    if not Path(timings_file).exists():
+        return {}
+    with open(timings_file, "rt") as f:
+        stages: Dict[str, Dict[str, Any]] = json.load(f)
+    return stages
+
+
+def _cpu_time() -> float:
+    """CPU time of the process and of its (terminated) child processes, such
+    as translations run as external commands."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _peak_rss_mb() -> Dict[str, float]:
+    """Peak resident set size since the start of the process ("self") and of
+    its terminated child processes ("children"), in MB.
+
+    Empty on platforms without the resource module."""
+    try:
+        import resource
+    except ImportError:
+        return {}
+
+    # Given in kilobytes on Linux, in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 1e6,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 1e6,
+    }
@@ -1,11 +1,8 @@
 import logging
 
-from rxn.utilities.files import (
-    PathLike,
-    dump_list_to_file,
-    iterate_lines_from_file,
-    raise_if_paths_are_identical,
-)
+from rxn.utilities.files import PathLike, raise_if_paths_are_identical
+
+from .compression import dump_lines, iterate_lines
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -86,9 +83,9 @@ def detokenize_classification_file(
 
     detokenized = (
         detokenize_class_line(line, invalid_placeholder)
-        for line in iterate_lines_from_file(input_file)
+        for line in iterate_lines(input_file)
     )
-    dump_list_to_file(detokenized, output_file)
+    dump_lines(detokenized, output_file)
 
 
 def tokenize_classification_file(
@@ -99,9 +96,9 @@ def tokenize_classification_file(
 
     tokenized = (
         tokenize_class_line(line, invalid_placeholder)
-        for line in iterate_lines_from_file(input_file)
+        for line in iterate_lines(input_file)
     )
-    dump_list_to_file(tokenized, output_file)
+    dump_lines(tokenized, output_file)
 
 
 def classification_string_is_tokenized(classification_line: str) -> bool:
@@ -133,7 +130,7 @@ def classification_file_is_tokenized(filepath: PathLike) -> bool:
     Args:
         filepath: path to the file.
     """
-    for line in iterate_lines_from_file(filepath):
+    for line in iterate_lines(filepath):
         # Ignore empty lines
         if line == "":
             continue
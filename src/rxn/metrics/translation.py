@@ -0,0 +1,382 @@
+"""
+Translation in sample-aligned segments, with a progress manifest allowing to
+resume interrupted runs; optionally, each distinct source line is translated
+only once.
+"""
+import json
+import logging
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from rxn.utilities.containers import chunker
+from rxn.utilities.files import PathLike, dump_list_to_file
+
+from .compression import iterate_lines
+from .interning import StringTable
+from .manifest import content_hash, line_count
+from .translators import get_translator
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+DEFAULT_SEGMENT_SIZE = 10000
+
+# Suffixes of the files written by rxn_translation next to the prediction file.
+_PREDICTION_SUFFIXES = ["", ".tokenized", ".tokenized_log_probs"]
+
+# Signature: (src_file, tgt_file, pred_file) -> None
+TranslateFn = Callable[[Path, Optional[Path], Path], None]
+
+
+class TranslationProgress:
+    """
+    Progress manifest for a segmented translation.
+
+    The manifest is stored as JSON in the segment directory and is rewritten
+    atomically every time a segment is completed, so that it always reflects
+    the segments whose predictions are complete on disk.
+    """
+
+    def __init__(self, manifest_file: Path, settings: Dict[str, Any]):
+        self.manifest_file = manifest_file
+        self.settings = settings
+        self.completed: List[int] = []
+        self.finalized = False
+
+    @classmethod
+    def load_or_create(
+        cls, manifest_file: Path, settings: Dict[str, Any]
+    ) -> "TranslationProgress":
+        """
+        Load the manifest if it exists, or create an empty one.
+
+        Raises:
+            RuntimeError: if an existing manifest was created with different
+                settings than the current ones.
+        """
+        progress = cls(manifest_file, settings)
+        if not manifest_file.exists():
+            return progress
+
+        with open(manifest_file, "rt") as f:
+            content = json.load(f)
+        if content["settings"] != settings:
+            raise RuntimeError(
+                f'Cannot resume the translation from "{manifest_file}": it was '
+                f'started with different settings ({content["settings"]}, '
+                f"now: {settings})."
+            )
+        progress.completed = content["completed"]
+        progress.finalized = content["finalized"]
+        return progress
+
+    def mark_completed(self, segment_idx: int) -> None:
+        self.completed.append(segment_idx)
+        self.save()
+
+    def mark_finalized(self) -> None:
+        self.finalized = True
+        self.save()
+
+    def save(self) -> None:
+        content = {
+            "settings": self.settings,
+            "completed": sorted(self.completed),
+            "finalized": self.finalized,
+        }
+        tmp_file = self.manifest_file.with_suffix(".tmp")
+        with open(tmp_file, "wt") as f:
+            json.dump(content, f, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+
+def segment_directory(pred_file: PathLike) -> Path:
+    """Directory where the segments and progress manifest for a prediction file are stored."""
+    return Path(str(pred_file) + ".segments")
+
+
+def translate_in_segments(
+    src_file: PathLike,
+    tgt_file: Optional[PathLike],
+    pred_file: PathLike,
+    translate_fn: TranslateFn,
+    settings: Dict[str, Any],
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+) -> None:
+    """
+    Translate a source file segment by segment, skipping the segments that
+    were completed in a previous (interrupted) run.
+
+    The segments are aligned on the source lines, so that the predictions for
+    a given sample are never split across segments. Once all segments are
+    done, the predictions (and the associated tokenized and log-prob files,
+    if present) are concatenated, which gives the same files as translating
+    the source file in one go.
+
+    Args:
+        src_file: source file.
+        tgt_file: target file (optional), split alongside the source file.
+        pred_file: file where to save the predictions.
+        translate_fn: function translating one segment.
+        settings: translation settings; a run can only be resumed if they are
+            identical to the ones of the previous run, and for the same source
+            and target content.
+        segment_size: number of source lines per segment.
+    """
+    pred_file = Path(pred_file)
+    work_dir = segment_directory(pred_file)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    n_src = line_count(src_file)
+    n_segments = max(1, math.ceil(n_src / segment_size))
+    progress = TranslationProgress.load_or_create(
+        work_dir / "progress.json",
+        settings={
+            **settings,
+            "n_src_lines": n_src,
+            # Segments of other inputs with the same number of lines are stale
+            "src_sha256": content_hash(src_file),
+            "tgt_sha256": None if tgt_file is None else content_hash(tgt_file),
+            "segment_size": segment_size,
+        },
+    )
+
+    if progress.finalized and pred_file.exists():
+        logger.info(f'Translation to "{pred_file}" already complete; skipping.')
+        return
+
+    if progress.completed:
+        logger.info(
+            f'Resuming translation to "{pred_file}": {len(progress.completed)} '
+            f"of {n_segments} segments already done."
+        )
+
+    remaining = [i for i in range(n_segments) if i not in progress.completed]
+    _write_segment_inputs(src_file, work_dir, "src", segment_size, remaining)
+    if tgt_file is not None:
+        _write_segment_inputs(tgt_file, work_dir, "tgt", segment_size, remaining)
+
+    for segment_idx in remaining:
+        segment_src = _segment_input_file(work_dir, "src", segment_idx)
+        segment_tgt = (
+            None
+            if tgt_file is None
+            else _segment_input_file(work_dir, "tgt", segment_idx)
+        )
+
+        logger.info(f"Translating segment {segment_idx + 1}/{n_segments}...")
+        translate_fn(
+            segment_src, segment_tgt, _segment_pred_file(work_dir, segment_idx)
+        )
+        progress.mark_completed(segment_idx)
+
+    _concatenate_segments(work_dir, n_segments, pred_file)
+    progress.mark_finalized()
+
+    # Only the manifest is kept, to know that the translation is complete.
+    for path in work_dir.iterdir():
+        if path != progress.manifest_file:
+            path.unlink()
+
+
+def unique_source_directory(pred_file: PathLike) -> Path:
+    """Directory where the distinct source lines for a prediction file, and
+    their predictions, are stored."""
+    return Path(str(pred_file) + ".unique")
+
+
+def translate_unique_sources(
+    src_file: PathLike,
+    tgt_file: Optional[PathLike],
+    pred_file: PathLike,
+    translate_fn: TranslateFn,
+    n_best: int,
+) -> None:
+    """
+    Translate each distinct source line only once.
+
+    The distinct source lines (with the target line of their first occurrence)
+    are translated into the directory given by unique_source_directory(), and
+    their predictions (and the associated tokenized and log-prob files, if
+    present) are then expanded to n_best lines per line of the source file.
+    For deterministic translations, this gives the same files as translating
+    the source file in one go.
+
+    The predictions of the distinct source lines are kept, so that a resumed
+    run only needs to expand them again (see translate_in_segments()).
+
+    Args:
+        src_file: source file.
+        tgt_file: target file (optional).
+        pred_file: file where to save the predictions.
+        translate_fn: function translating the distinct source lines.
+        n_best: number of predictions per source line.
+    """
+    pred_file = Path(pred_file)
+    table = StringTable()
+    source_ids = table.add_all(iterate_lines(src_file))
+    if len(table) == len(source_ids):
+        translate_fn(Path(src_file), _optional_path(tgt_file), pred_file)
+        return
+
+    logger.info(
+        f"Translating {len(table)} distinct source lines instead of "
+        f"{len(source_ids)}."
+    )
+    work_dir = unique_source_directory(pred_file)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    unique_src = work_dir / "src.txt"
+    dump_list_to_file(table.strings, unique_src)
+    unique_tgt: Optional[Path] = None
+    if tgt_file is not None:
+        # The IDs are given in order of first occurrence
+        _, first_lines = np.unique(source_ids, return_index=True)
+        targets = list(iterate_lines(tgt_file))
+        unique_tgt = work_dir / "tgt.txt"
+        dump_list_to_file([targets[i] for i in first_lines], unique_tgt)
+
+    unique_pred = work_dir / "pred.txt"
+    translate_fn(unique_src, unique_tgt, unique_pred)
+    _expand_predictions(unique_pred, pred_file, source_ids, n_best)
+
+
+def resumable_rxn_translation(
+    src_file: PathLike,
+    tgt_file: Optional[PathLike],
+    pred_file: PathLike,
+    model: PathLike,
+    n_best: int,
+    beam_size: int,
+    batch_size: int,
+    gpu: bool,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    deduplicate: bool = False,
+) -> None:
+    """
+    Resumable equivalent of rxn_translation, see translate_in_segments().
+
+    The translation is done by the translator from get_translator().
+
+    Args:
+        deduplicate: whether to translate each distinct source line only once,
+            see translate_unique_sources(); segment_size then refers to the
+            distinct source lines.
+        (other arguments: see rxn_translation and translate_in_segments())
+    """
+    translator = get_translator()
+
+    def translate_segment(src: Path, tgt: Optional[Path], pred: Path) -> None:
+        translator.translate(
+            src_file=src,
+            tgt_file=tgt,
+            pred_file=pred,
+            model=model,
+            n_best=n_best,
+            beam_size=beam_size,
+            batch_size=batch_size,
+            gpu=gpu,
+        )
+
+    def translate(src: Path, tgt: Optional[Path], pred: Path) -> None:
+        translate_in_segments(
+            src_file=src,
+            tgt_file=tgt,
+            pred_file=pred,
+            translate_fn=translate_segment,
+            settings={
+                "model": str(model),
+                "n_best": n_best,
+                "beam_size": beam_size,
+                "with_tgt": tgt is not None,
+            },
+            segment_size=segment_size,
+        )
+
+    if deduplicate:
+        translate_unique_sources(src_file, tgt_file, pred_file, translate, n_best)
+    else:
+        translate(Path(src_file), _optional_path(tgt_file), Path(pred_file))
+
+
+def _optional_path(filename: Optional[PathLike]) -> Optional[Path]:
+    return None if filename is None else Path(filename)
+
+
+def _write_segment_inputs(
+    filename: PathLike,
+    work_dir: Path,
+    prefix: str,
+    segment_size: int,
+    segment_indices: List[int],
+) -> None:
+    """Split the given file into segments, in one pass, writing only the
+    segments with the given indices."""
+    to_write = set(segment_indices)
+    chunks = chunker(iterate_lines(filename), chunk_size=segment_size)
+    for segment_idx, chunk in enumerate(chunks):
+        if segment_idx in to_write:
+            dump_list_to_file(chunk, _segment_input_file(work_dir, prefix, segment_idx))
+
+    # Empty source file: there is one (empty) segment anyway.
+    if 0 in to_write and not _segment_input_file(work_dir, prefix, 0).exists():
+        dump_list_to_file([], _segment_input_file(work_dir, prefix, 0))
+
+
+def _segment_input_file(work_dir: Path, prefix: str, segment_idx: int) -> Path:
+    return work_dir / f"{prefix}_{segment_idx}.txt"
+
+
+def _segment_pred_file(work_dir: Path, segment_idx: int) -> Path:
+    return work_dir / f"pred_{segment_idx}.txt"
+
+
+def _concatenate_segments(work_dir: Path, n_segments: int, pred_file: Path) -> None:
+    for suffix in _PREDICTION_SUFFIXES:
+        segment_files = [
+            Path(str(_segment_pred_file(work_dir, i)) + suffix)
+            for i in range(n_segments)
+        ]
+        if not all(segment_file.exists() for segment_file in segment_files):
+            continue
+
+        with open(str(pred_file) + suffix, "wb") as f_out:
+            for segment_file in segment_files:
+                with open(segment_file, "rb") as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+
+
+def _expand_predictions(
+    unique_pred_file: Path, pred_file: Path, source_ids: np.ndarray, n_best: int
+) -> None:
+    """Write the n_best predictions of the distinct source line of every source
+    line, for the prediction file and the associated files."""
+    for suffix in _PREDICTION_SUFFIXES:
+        unique_file = Path(str(unique_pred_file) + suffix)
+        if not unique_file.exists():
+            continue
+        lines = _read_lines(unique_file)
+        n_unique = int(source_ids.max()) + 1
+        if len(lines) != n_unique * n_best:
+            raise RuntimeError(
+                f'"{unique_file}" has {len(lines)} lines, expected {n_best} per '
+                f"distinct source line ({n_unique * n_best})."
+            )
+        blocks = [
+            "".join(lines[i * n_best : (i + 1) * n_best]) for i in range(n_unique)
+        ]
+
+        # Written under a temporary name and renamed, as for the manifest
+        tmp_file = Path(str(pred_file) + suffix + ".tmp")
+        with open(tmp_file, "wt") as f:
+            f.writelines(blocks[source_id] for source_id in source_ids.tolist())
+        os.replace(tmp_file, str(pred_file) + suffix)
+
+
+def _read_lines(filename: Path) -> List[str]:
+    """Lines of a file, with their (possibly added) line ending."""
+    with open(filename, "rt") as f:
+        return [line if line.endswith("\n") else line + "\n" for line in f]
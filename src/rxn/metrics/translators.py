@@ -0,0 +1,328 @@
+"""
+Backends for the translations done when preparing the metrics.
+
+By default, the translations rely on OpenNMT models (OnmtTranslator). The
+StandInTranslator emits deterministic, plausible predictions without any
+model, so that the preparation pipelines can be run (and benchmarked)
+without models or GPU. The backend is selected with use_translator(), or
+with the RXN_METRICS_TRANSLATOR environment variable ("onmt" or "stand-in").
+"""
+import logging
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Type
+
+from rxn.utilities.files import PathLike
+
+from .compression import dump_lines, iterate_lines
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+TRANSLATOR_ENV_VAR = "RXN_METRICS_TRANSLATOR"
+
+# Suffix of the log probabilities written by rxn_translation next to the predictions
+LOG_PROBS_SUFFIX = ".tokenized_log_probs"
+
+
+class Translator(ABC):
+    """
+    Interface for the translations needed by the preparation of the metrics.
+    """
+
+    @abstractmethod
+    def translate(
+        self,
+        src_file: PathLike,
+        tgt_file: Optional[PathLike],
+        pred_file: PathLike,
+        model: PathLike,
+        n_best: int,
+        beam_size: int,
+        batch_size: int,
+        gpu: bool,
+    ) -> None:
+        """
+        Translate the (detokenized) source file, with the same outputs as
+        rxn_translation from rxn-onmt-models: n_best detokenized predictions
+        per source line in pred_file, and their log probabilities in the file
+        with the LOG_PROBS_SUFFIX suffix.
+        """
+
+    @abstractmethod
+    def classify(
+        self,
+        src_file: PathLike,
+        pred_file: PathLike,
+        model: PathLike,
+        batch_size: int,
+        gpu: bool,
+    ) -> None:
+        """Classify the reactions of the source file, one class (such as
+        "1.2.3") per line in pred_file."""
+
+
+class OnmtTranslator(Translator):
+    """Translation with OpenNMT models, see rxn-onmt-models and rxn-onmt-utils."""
+
+    def translate(
+        self,
+        src_file: PathLike,
+        tgt_file: Optional[PathLike],
+        pred_file: PathLike,
+        model: PathLike,
+        n_best: int,
+        beam_size: int,
+        batch_size: int,
+        gpu: bool,
+    ) -> None:
+        from rxn.onmt_models import rxn_translation
+
+        rxn_translation(
+            src_file=src_file,
+            tgt_file=tgt_file,
+            pred_file=pred_file,
+            model=model,
+            n_best=n_best,
+            beam_size=beam_size,
+            batch_size=batch_size,
+            gpu=gpu,
+        )
+
+    def classify(
+        self,
+        src_file: PathLike,
+        pred_file: PathLike,
+        model: PathLike,
+        batch_size: int,
+        gpu: bool,
+    ) -> None:
+        from .classification_translation import classification_translation
+
+        classification_translation(
+            src_file=Path(src_file),
+            tgt_file=None,
+            pred_file=Path(pred_file),
+            model=Path(model),
+            n_best=1,
+            beam_size=5,
+            batch_size=batch_size,
+            gpu=gpu,
+        )
+
+
+class StandInTranslator(Translator):
+    """
+    Deterministic replacement for the models, emitting plausible beams.
+
+    The expected output for a source line is the target line if a target file
+    is given, and the source line otherwise. For source lines that were
+    themselves predicted earlier by this translator (for instance, the forward
+    translation of retro predictions), the expected output is the source they
+    were predicted from, so that round trips succeed. These are matched on
+    the sorted characters of the SMILES, which is insensitive to the
+    reordering of the molecules by the canonicalization. The sources are only
+    remembered for the predictions of the translations with a target file, and
+    only until the next such translation following one without target file,
+    i.e. for one round trip.
+
+    The beams contain the expected output at the first position for a
+    fraction top1_rate of the samples, not at all for a fraction miss_rate,
+    and at a random later position for the others, and variants of it with one compound removed, replaced or
+    added otherwise; a fraction invalid_rate of the predictions are invalid.
+    Apart from the round trips, the predictions only depend on the seed and
+    on the source and target lines.
+
+    Args:
+        lines_per_second: number of source lines translated per second, to
+            emulate the duration of the inference. None for no delay.
+        top1_rate: fraction of samples whose first prediction is the
+            expected one.
+        miss_rate: fraction of samples without the expected prediction.
+        invalid_rate: fraction of invalid predictions.
+        seed: random seed.
+    """
+
+    _COMPOUNDS = ["O", "CCO", "ClCCl", "CN(C)C=O", "CC(=O)O", "[Na+].[OH-]", "[Pd]"]
+    _CLASSES = ["1.2.3", "1.3.7", "2.1.1", "3.1.5", "6.1.1", "7.1.1", "9.3.1"]
+
+    def __init__(
+        self,
+        lines_per_second: Optional[float] = None,
+        top1_rate: float = 0.5,
+        miss_rate: float = 0.1,
+        invalid_rate: float = 0.05,
+        seed: int = 42,
+    ):
+        self.lines_per_second = lines_per_second
+        self.top1_rate = top1_rate
+        self.miss_rate = miss_rate
+        self.invalid_rate = invalid_rate
+        self.seed = seed
+        # Source of the predictions of the current round trip, by signature
+        self._origins: Dict[str, str] = {}
+        # Whether the origins were looked up since they were recorded
+        self._origins_used = False
+
+    def translate(
+        self,
+        src_file: PathLike,
+        tgt_file: Optional[PathLike],
+        pred_file: PathLike,
+        model: PathLike,
+        n_best: int,
+        beam_size: int,
+        batch_size: int,
+        gpu: bool,
+    ) -> None:
+        start = time.perf_counter()
+        if tgt_file is None:
+            self._origins_used = True
+        elif self._origins_used:
+            # Start of a new round trip
+            self._origins.clear()
+            self._origins_used = False
+        sources = list(iterate_lines(src_file))
+        targets: List[Optional[str]] = (
+            list(iterate_lines(tgt_file))
+            if tgt_file is not None
+            else [None] * len(sources)
+        )
+
+        predictions: List[str] = []
+        log_probs: List[str] = []
+        for source, target in zip(sources, targets):
+            rng = self._rng(source)
+            beam = self._beam(rng, source, target, n_best)
+            predictions.extend(beam)
+            value = 0.0
+            for _ in beam:
+                value -= rng.expovariate(2.0)
+                log_probs.append(f"{value:.4f}")
+
+        dump_lines(predictions, pred_file)
+        dump_lines(log_probs, str(pred_file) + LOG_PROBS_SUFFIX)
+        self._wait(start, len(sources))
+
+    def classify(
+        self,
+        src_file: PathLike,
+        pred_file: PathLike,
+        model: PathLike,
+        batch_size: int,
+        gpu: bool,
+    ) -> None:
+        start = time.perf_counter()
+        classes = [
+            self._rng(line).choice(self._CLASSES) for line in iterate_lines(src_file)
+        ]
+        dump_lines(classes, pred_file)
+        self._wait(start, len(classes))
+
+    def _rng(self, line: str) -> random.Random:
+        # Seeding with a string is deterministic, independently of PYTHONHASHSEED
+        return random.Random(f"{self.seed}:{line}")
+
+    def _beam(
+        self, rng: random.Random, source: str, target: Optional[str], n_best: int
+    ) -> List[str]:
+        record_origins = target is not None
+        if target is None:
+            target = self._origins.get(_signature(source), source)
+
+        draw = rng.random()
+        expected_rank: Optional[int] = None
+        if draw < self.top1_rate:
+            expected_rank = 0
+        elif draw >= self.top1_rate + self.miss_rate and n_best > 1:
+            expected_rank = rng.randrange(1, n_best)
+
+        beam = []
+        for rank in range(n_best):
+            if rank == expected_rank:
+                prediction = target
+            elif rng.random() < self.invalid_rate:
+                prediction = target + "("
+            else:
+                prediction = self._variant(rng, target)
+            beam.append(prediction)
+            if record_origins:
+                self._origins[_signature(prediction)] = source
+        return beam
+
+    def _variant(self, rng: random.Random, smiles: str) -> str:
+        """Variant of a SMILES (or of the precursors of a reaction SMILES), with
+        one compound removed, replaced or added."""
+        precursors, arrow, product = smiles.rpartition(">>")
+        if not arrow:
+            precursors = product
+        compounds = precursors.split(".") if precursors else []
+
+        choice = rng.random()
+        if len(compounds) > 1 and choice < 1 / 3:
+            del compounds[rng.randrange(len(compounds))]
+        elif compounds and choice < 2 / 3:
+            compounds[rng.randrange(len(compounds))] = rng.choice(self._COMPOUNDS)
+        else:
+            compounds.append(rng.choice(self._COMPOUNDS))
+
+        variant = ".".join(compounds)
+        return f"{variant}>>{product}" if arrow else variant
+
+    def _wait(self, start: float, n_lines: int) -> None:
+        """Sleep so that the call lasts as long as the configured speed implies."""
+        if self.lines_per_second is None:
+            return
+        remaining = n_lines / self.lines_per_second - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+def _signature(smiles: str) -> str:
+    return "".join(sorted(smiles))
+
+
+_TRANSLATORS: Dict[str, Type[Translator]] = {
+    "onmt": OnmtTranslator,
+    "stand-in": StandInTranslator,
+}
+
+# Translator set with use_translator(), overriding the environment
+_translator: Optional[Translator] = None
+# Translators selected from the environment; kept for the whole process, so
+# that the stand-in translator remembers its earlier predictions
+_translators_from_env: Dict[str, Translator] = {}
+
+
+def get_translator() -> Translator:
+    """Translator to use for the preparation of the metrics."""
+    if _translator is not None:
+        return _translator
+
+    name = os.environ.get(TRANSLATOR_ENV_VAR, "onmt").strip().lower()
+    if name not in _TRANSLATORS:
+        raise ValueError(
+            f'Invalid value for {TRANSLATOR_ENV_VAR}: "{name}" '
+            f"(expected one of {list(_TRANSLATORS)})."
+        )
+    if name not in _translators_from_env:
+        if name == "stand-in":
+            logger.warning("Using the stand-in translator: the predictions are fake!")
+        _translators_from_env[name] = _TRANSLATORS[name]()
+    return _translators_from_env[name]
+
+
+@contextmanager
+def use_translator(translator: Translator) -> Iterator[None]:
+    """Use the given translator for the translations run in this context."""
+    global _translator
+    previous = _translator
+    _translator = translator
+    try:
+        yield
+    finally:
+        _translator = previous
@@ -2,14 +2,17 @@ import importlib.util
 import logging
 from typing import Dict, List, Optional, Sequence
 
+import numpy as np
 from rxn.chemutils.conversion import canonicalize_smiles
 from rxn.chemutils.miscellaneous import smiles_has_atom_mapping
 from rxn.chemutils.reaction_smiles import parse_any_reaction_smiles
 from rxn.chemutils.utils import remove_atom_mapping
 from rxn.utilities.containers import chunker
-from rxn.utilities.files import dump_list_to_file
 
+from .compression import dump_lines
 from .metrics_files import RetroFiles
+from .profiling import profile_hook
+from .ranks import first_hit_ranks, top_n_from_ranks
 from .utils import combine_precursors_and_products_from_files, get_sequence_multiplier
 
 logger = logging.getLogger(__name__)
@@ -55,24 +58,28 @@ def maybe_determine_true_reactants(
         "the ground truth and predicted reactions will be atom-mapped."
     )
 
-    mapper = BatchedMapper(batch_size=batch_size)
+    with retro_files.timer.stage(
+        "true_reactants", lines_of=retro_files.predicted_mapped
+    ):
+        mapper = BatchedMapper(batch_size=batch_size)
 
-    logger.info("Atom-mapping the ground truth reactions...")
-    gt_reactions = combine_precursors_and_products_from_files(
-        precursors_file=retro_files.gt_tgt, products_file=retro_files.gt_src
-    )
-    dump_list_to_file(mapper.map_reactions(gt_reactions), retro_files.gt_mapped)
-    logger.info("Atom-mapping the ground truth reactions... Done.")
+        logger.info("Atom-mapping the ground truth reactions...")
+        gt_reactions = combine_precursors_and_products_from_files(
+            precursors_file=retro_files.gt_tgt, products_file=retro_files.gt_src
+        )
+        dump_lines(mapper.map_reactions(gt_reactions), retro_files.gt_mapped)
+        logger.info("Atom-mapping the ground truth reactions... Done.")
 
-    logger.info("Atom-mapping the predicted reactions...")
-    predicted_reactions = combine_precursors_and_products_from_files(
-        precursors_file=retro_files.predicted_canonical,
-        products_file=retro_files.gt_src,
-    )
-    dump_list_to_file(
-        mapper.map_reactions(predicted_reactions), retro_files.predicted_mapped
-    )
-    logger.info("Atom-mapping the predicted reactions... Done.")
+        logger.info("Atom-mapping the predicted reactions...")
+        predicted_reactions = combine_precursors_and_products_from_files(
+            precursors_file=retro_files.predicted_canonical,
+            products_file=retro_files.gt_src,
+        )
+        dump_lines(
+            mapper.map_reactions(predicted_reactions), retro_files.predicted_mapped
+        )
+        logger.info("Atom-mapping the predicted reactions... Done.")
+        retro_files.record(retro_files.gt_mapped, retro_files.predicted_mapped)
 
     # Reset the logger level
     rxnmapper_logger.setLevel(old_logger_level)
@@ -103,7 +110,9 @@ def get_standardized_true_reactants(mapped_rxn_smiles: str) -> Optional[List[str
 
 
 def true_reactant_accuracy(
-    ground_truth_mapped: Sequence[str], predictions_mapped: Sequence[str]
+    ground_truth_mapped: Sequence[str],
+    predictions_mapped: Sequence[str],
+    ground_truth_true_reactants: Optional[Sequence[Optional[List[str]]]] = None,
 ) -> Dict[int, float]:
     """
     Compute the top-n "true reactant" accuracy values (i.e. discarding reagents).
@@ -111,6 +120,8 @@ def true_reactant_accuracy(
     Args:
         ground_truth_mapped: list of atom-mapped reactions from the ground truth.
         predictions_mapped: list of atom-mapped reactions from the predictions.
+        ground_truth_true_reactants: the true reactants of the ground truth,
+            from get_standardized_true_reactants(), if already available.
 
     Raises:
         ValueError: if the list sizes are incompatible, forwarded from get_sequence_multiplier().
@@ -121,25 +132,49 @@ def true_reactant_accuracy(
     multiplier = get_sequence_multiplier(
         ground_truth=ground_truth_mapped, predictions=predictions_mapped
     )
+    ranks = true_reactant_first_hit_ranks(
+        ground_truth_mapped,
+        predictions_mapped,
+        ground_truth_true_reactants=ground_truth_true_reactants,
+    )
+    return top_n_from_ranks(ranks, multiplier)
 
-    # we will count, for each "n", how many predictions are correct
-    correct_for_topn: List[int] = [0 for _ in range(multiplier)]
 
-    # We will process sample by sample - for that, we need to chunk the predictions
-    prediction_chunks = chunker(predictions_mapped, chunk_size=multiplier)
+@profile_hook("true_reactant_accuracy")
+def true_reactant_first_hit_ranks(
+    ground_truth_mapped: Sequence[str],
+    predictions_mapped: Sequence[str],
+    ground_truth_true_reactants: Optional[Sequence[Optional[List[str]]]] = None,
+) -> np.ndarray:
+    """
+    First-hit ranks for the "true reactants", see true_reactant_accuracy()
+    for the arguments and rxn.metrics.ranks for the ranks.
+
+    Raises:
+        ValueError: if the list sizes are incompatible, forwarded from get_sequence_multiplier().
+    """
+    multiplier = get_sequence_multiplier(
+        ground_truth=ground_truth_mapped, predictions=predictions_mapped
+    )
 
-    for gt, predictions in zip(ground_truth_mapped, prediction_chunks):
-        gt_true_reactants = get_standardized_true_reactants(gt)
+    if ground_truth_true_reactants is None:
+        ground_truth_true_reactants = [
+            get_standardized_true_reactants(gt) for gt in ground_truth_mapped
+        ]
+
+    matches = np.zeros((len(ground_truth_mapped), multiplier), dtype=bool)
 
+    # We will process sample by sample - for that, we need to chunk the predictions
+    prediction_chunks = chunker(predictions_mapped, chunk_size=multiplier)
+    for i, (gt_true_reactants, predictions) in enumerate(
+        zip(ground_truth_true_reactants, prediction_chunks)
+    ):
         # if the ground truth has no mapping info: count as a negative
         if gt_true_reactants is None:
             continue
 
-        pred_true_reactants = [get_standardized_true_reactants(p) for p in predictions]
-        for i in range(multiplier):
-            correct = gt_true_reactants in pred_true_reactants[: i + 1]
-            correct_for_topn[i] += int(correct)
+        matches[i] = [
+            get_standardized_true_reactants(p) == gt_true_reactants for p in predictions
+        ]
 
-    return {
-        i + 1: correct_for_topn[i] / len(ground_truth_mapped) for i in range(multiplier)
-    }
+    return first_hit_ranks(matches)
@@ -1,10 +1,13 @@
-from typing import Iterator, Sequence, TypeVar
+import hashlib
+from typing import Dict, Iterable, Iterator, Sequence, TypeVar
 
-from rxn.chemutils.reaction_combiner import ReactionCombiner
-from rxn.chemutils.reaction_smiles import ReactionFormat
-from rxn.utilities.files import PathLike, count_lines, iterate_lines_from_file
+import numpy as np
+from rxn.utilities.files import PathLike
 from rxn.utilities.misc import get_multiplier, get_multipliers
 
+from .compression import iterate_blocks, iterate_lines
+from .manifest import line_count
+
 T = TypeVar("T")
 
 
@@ -26,6 +29,10 @@ def combine_precursors_and_products(
     Returns:
         iterator over reaction SMILES.
     """
+    # Imported here, as it loads RDKit
+    from rxn.chemutils.reaction_combiner import ReactionCombiner
+    from rxn.chemutils.reaction_smiles import ReactionFormat
+
     combiner = ReactionCombiner(reaction_format=ReactionFormat.STANDARD_WITH_TILDE)
 
     precursor_multiplier, product_multiplier = get_multipliers(
@@ -50,12 +57,12 @@ def combine_precursors_and_products_from_files(
     Returns:
         iterator over reaction SMILES.
     """
-    n_precursors = count_lines(precursors_file)
-    n_products = count_lines(products_file)
+    n_precursors = line_count(precursors_file)
+    n_products = line_count(products_file)
 
     yield from combine_precursors_and_products(
-        precursors=iterate_lines_from_file(precursors_file),
-        products=iterate_lines_from_file(products_file),
+        precursors=iterate_lines(precursors_file),
+        products=iterate_lines(products_file),
         total_precursors=n_precursors,
         total_products=n_products,
     )
@@ -73,3 +80,78 @@ def get_sequence_multiplier(ground_truth: Sequence[T], predictions: Sequence[T])
     n_pred = len(predictions)
 
     return get_multiplier(n_gt, n_pred)
+
+
+def match_matrix(ground_truth: Sequence[T], predictions: Sequence[T]) -> np.ndarray:
+    """
+    Boolean matrix of shape (number of samples, predictions per sample),
+    telling which predictions are equal to the ground truth of their sample.
+
+    Raises:
+        ValueError: if the list sizes are incompatible, forwarded from get_sequence_multiplier().
+    """
+    multiplier = get_sequence_multiplier(
+        ground_truth=ground_truth, predictions=predictions
+    )
+    matches = np.fromiter(
+        (
+            gt == prediction
+            for i, gt in enumerate(ground_truth)
+            for prediction in predictions[i * multiplier : (i + 1) * multiplier]
+        ),
+        dtype=bool,
+        count=len(predictions),
+    )
+    return matches.reshape(len(ground_truth), multiplier)
+
+
+def match_matrix_from_ids(
+    ground_truth_ids: np.ndarray, prediction_ids: np.ndarray
+) -> np.ndarray:
+    """
+    Same as match_matrix(), for strings given as IDs into a common string
+    table (see GroundTruth.load_interned_predictions()).
+
+    Raises:
+        ValueError: if the array sizes are incompatible, forwarded from get_multiplier().
+    """
+    multiplier = get_multiplier(len(ground_truth_ids), len(prediction_ids))
+    matches: np.ndarray = (
+        prediction_ids.reshape(len(ground_truth_ids), multiplier)
+        == ground_truth_ids[:, np.newaxis]
+    )
+    return matches
+
+
+def by_n(values: Iterable[float]) -> Dict[int, float]:
+    """
+    Dictionary of values by top-n, from the values for n = 1, 2, ...
+
+    Args:
+        values: values ordered by n, typically the mean of a per-sample
+            array over its first axis.
+    """
+    return {n: float(value) for n, value in enumerate(values, 1)}
+
+
+def hash_file(filename: PathLike) -> str:
+    """Get the SHA-256 hash of the (decompressed) content of a file."""
+    sha = hashlib.sha256()
+    for block in iterate_blocks(filename):
+        sha.update(block)
+    return sha.hexdigest()
+
+
+def combine_hashes(*hashes: str) -> str:
+    """Combine several hashes into one; the order matters."""
+    return hashlib.sha256("\0".join(hashes).encode()).hexdigest()
+
+
+def hash_files(*filenames: PathLike) -> str:
+    """
+    Get a hash of the content of one or several files.
+
+    Files with identical content give the same hash, independently of their
+    location or modification time.
+    """
+    return combine_hashes(*(hash_file(filename) for filename in filenames))
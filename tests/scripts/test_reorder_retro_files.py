@@ -1,6 +1,7 @@
 import tempfile
 from pathlib import Path
 
+import pytest
 from rxn.utilities.files import dump_list_to_file, load_list_from_file
 
 from rxn.metrics.metrics_files import RetroFiles
@@ -58,3 +59,58 @@ def test_reorder_retro_files() -> None:
         assert load_list_from_file(
             RetroFiles.reordered(temporary_path / "class_pred.txt")
         ) == ["5.5", "1.1", "2.2", "6.6", "3.3", "7.7", "8.8", "4.4"]
+
+
+def test_reorder_retro_files_with_close_confidences() -> None:
+    # Confidences differing by less than the float32 precision must not be
+    # considered as ties (which would keep the class token order)
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        temporary_path = Path(temporary_dir)
+        files = {
+            name: temporary_path / f"{name}.txt"
+            for name in ["gt", "pred", "conf", "fwd_pred", "class_pred"]
+        }
+        dump_list_to_file(["A"], files["gt"])
+        dump_list_to_file(["1", "2"], files["pred"])
+        dump_list_to_file(["-1.00000001", "-1.0"], files["conf"])
+        dump_list_to_file(["11", "22"], files["fwd_pred"])
+        dump_list_to_file(["1.1", "2.2"], files["class_pred"])
+
+        for use_cache in [False, True]:
+            reorder_retro_predictions_class_token(
+                ground_truth_file=files["gt"],
+                predictions_file=files["pred"],
+                confidences_file=files["conf"],
+                fwd_predictions_file=files["fwd_pred"],
+                classes_predictions_file=files["class_pred"],
+                n_class_tokens=2,
+                use_cache=use_cache,
+            )
+            assert load_list_from_file(RetroFiles.reordered(files["pred"])) == [
+                "2",
+                "1",
+            ]
+
+
+def test_reorder_retro_files_with_missing_confidences() -> None:
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        temporary_path = Path(temporary_dir)
+        files = {
+            name: temporary_path / f"{name}.txt"
+            for name in ["gt", "pred", "conf", "fwd_pred", "class_pred"]
+        }
+        dump_list_to_file(["A", "B"], files["gt"])
+        dump_list_to_file(["1", "2", "3", "4"], files["pred"])
+        dump_list_to_file(["-1.0", "-2.0"], files["conf"])
+        dump_list_to_file(["11", "22", "33", "44"], files["fwd_pred"])
+        dump_list_to_file(["1.1", "2.2", "3.3", "4.4"], files["class_pred"])
+
+        with pytest.raises(ValueError, match=r"confidences \(2\) .* predictions \(4\)"):
+            reorder_retro_predictions_class_token(
+                ground_truth_file=files["gt"],
+                predictions_file=files["pred"],
+                confidences_file=files["conf"],
+                fwd_predictions_file=files["fwd_pred"],
+                classes_predictions_file=files["class_pred"],
+                n_class_tokens=2,
+            )
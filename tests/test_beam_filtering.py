@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from rxn.metrics.beam_filtering import FilteredBeams, duplicate_mask, prediction_ids
+from rxn.metrics.metrics import round_trip_accuracy, top_n_accuracy
+from rxn.metrics.retro_metrics import RetroMetrics
+from rxn.metrics.utils import match_matrix
+
+
+def test_prediction_ids_and_duplicate_mask() -> None:
+    ids, index = prediction_ids(["A", "B", "A", "B", "B", "C"], multiplier=3)
+    assert ids.tolist() == [[0, 1, 0], [1, 1, 2]]
+    assert index == {"A": 0, "B": 1, "C": 2}
+
+    assert duplicate_mask(ids).tolist() == [[False, False, True], [False, True, False]]
+
+
+def test_filtered_beams() -> None:
+    predictions = ["A", "", "A", "B", "", "", "C", "C", "D"]
+    beams = FilteredBeams(predictions, multiplier=3)
+
+    assert beams.invalid.tolist() == [
+        [False, True, False],
+        [False, True, True],
+        [False, False, False],
+    ]
+    # The repeated invalid predictions are not counted as duplicates
+    assert beams.duplicate.tolist() == [
+        [False, False, True],
+        [False, False, False],
+        [False, True, False],
+    ]
+    assert beams.invalid_rate() == pytest.approx({1: 0.0, 2: 2 / 3, 3: 1 / 3})
+    assert beams.duplicate_rate() == pytest.approx({1: 0.0, 2: 1 / 3, 3: 1 / 3})
+
+    matches = match_matrix(["X", "B", "D"], predictions)
+    assert beams.compact(matches).tolist() == [
+        [False, False, False],
+        [True, False, False],
+        [False, True, False],
+    ]
+
+
+def test_filtered_metrics_match_metrics_on_filtered_beams() -> None:
+    rng = np.random.default_rng(1)
+    multiplier = 5
+    ground_truth = [str(i) for i in range(50)]
+    candidates = ground_truth + ["", "x", "y"]
+    predictions = [
+        candidates[i] for i in rng.integers(0, len(candidates), 50 * multiplier)
+    ]
+    # Ground truth in the beams more often
+    predictions = [
+        ground_truth[i // multiplier] if rng.random() < 0.2 else p
+        for i, p in enumerate(predictions)
+    ]
+
+    beams = FilteredBeams(predictions, multiplier)
+    matches = match_matrix(ground_truth, predictions)
+
+    # Filtered beams, padded with a value that never matches
+    filtered = []
+    for i in range(len(ground_truth)):
+        beam = []
+        for p in predictions[i * multiplier : (i + 1) * multiplier]:
+            if p != "" and p not in beam:
+                beam.append(p)
+        filtered.extend(beam + ["-"] * (multiplier - len(beam)))
+
+    assert beams.top_n(matches) == pytest.approx(top_n_accuracy(ground_truth, filtered))
+    assert beams.round_trip(matches)[0] == pytest.approx(
+        round_trip_accuracy(ground_truth, filtered)[0]
+    )
+
+
+def test_retro_filtered_metrics() -> None:
+    metrics = RetroMetrics(
+        gt_precursors=["A", "B"],
+        gt_products=["P", "Q"],
+        predicted_precursors=["X", "X", "A", "", "X", "B"],
+        predicted_products=["P", "P", "P", "", "Z", "Q"],
+    ).get_metrics()
+
+    assert metrics["accuracy"] == pytest.approx({1: 0.0, 2: 0.0, 3: 1.0})
+    assert metrics["accuracy-filtered"] == pytest.approx({1: 0.0, 2: 1.0, 3: 1.0})
+    assert metrics["coverage-filtered"] == pytest.approx({1: 0.5, 2: 1.0, 3: 1.0})
+    assert metrics["round-trip-filtered"] == pytest.approx({1: 0.5, 2: 0.75, 3: 0.5})
+    assert metrics["invalid-rate"] == pytest.approx({1: 0.5, 2: 0.0, 3: 0.0})
+    assert metrics["duplicate-rate"] == pytest.approx({1: 0.0, 2: 0.5, 3: 0.0})
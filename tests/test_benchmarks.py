@@ -0,0 +1,103 @@
+import json
+
+import pytest
+from rxn.utilities.files import named_temporary_directory
+
+from rxn.metrics.benchmarks.metric_benchmarks import (
+    BENCHMARKS,
+    compare_benchmark_results,
+    run_benchmarks,
+)
+from rxn.metrics.benchmarks.pipeline_benchmarks import run_pipeline_benchmarks
+from rxn.metrics.benchmarks.synthetic_data import (
+    SyntheticDataConfig,
+    SyntheticDataGenerator,
+)
+from rxn.metrics.compression import load_lines
+from rxn.metrics.run_metrics import evaluate_metrics
+
+
+def test_synthetic_retro_files() -> None:
+    config = SyntheticDataConfig(n_samples=20, n_best=3, top1_rate=1.0, seed=1)
+    with named_temporary_directory() as tmp_dir:
+        files = SyntheticDataGenerator(config).write_retro_files(tmp_dir)
+
+        gt = load_lines(files.gt_tgt)
+        predictions = load_lines(files.predicted_canonical)
+        assert len(gt) == 20
+        assert len(predictions) == 60
+        assert len(load_lines(files.predicted_mapped)) == 60
+        # top1_rate=1: all the first predictions are correct
+        assert predictions[::3] == gt
+
+        evaluate_metrics("retro", tmp_dir)
+        with open(files.metrics_file, "rt") as f:
+            assert json.load(f)["accuracy"]["1"] == 1.0
+
+
+def test_synthetic_miss_rate() -> None:
+    def samples_with_hit(miss_rate: float) -> int:
+        config = SyntheticDataConfig(
+            n_samples=100, n_best=3, top1_rate=0.0, miss_rate=miss_rate
+        )
+        with named_temporary_directory() as tmp_dir:
+            files = SyntheticDataGenerator(config).write_retro_files(tmp_dir)
+            gt = load_lines(files.gt_tgt)
+            predictions = load_lines(files.predicted_canonical)
+        return sum(
+            target in predictions[i * 3 : (i + 1) * 3] for i, target in enumerate(gt)
+        )
+
+    # Without misses, every sample has its correct prediction
+    assert samples_with_hit(miss_rate=0.0) == 100
+    # Only the variants may coincide with the ground truth
+    assert samples_with_hit(miss_rate=1.0) < 50
+
+
+def test_synthetic_data_is_reproducible() -> None:
+    config = SyntheticDataConfig(n_samples=10, n_best=2, class_tokens=2)
+    with named_temporary_directory() as tmp_dir:
+        files_1 = SyntheticDataGenerator(config).write_retro_files(tmp_dir / "1")
+        files_2 = SyntheticDataGenerator(config).write_retro_files(tmp_dir / "2")
+        assert load_lines(files_1.predicted) == load_lines(files_2.predicted)
+        assert len(load_lines(files_1.predicted)) == 40
+
+
+def test_run_and_compare_benchmarks() -> None:
+    with named_temporary_directory() as tmp_dir:
+        output_file = tmp_dir / "benchmarks.json"
+        report = run_benchmarks(
+            scales=[10, 20],
+            n_best=4,
+            class_tokens=2,
+            repeats=1,
+            output_file=output_file,
+        )
+
+        with open(output_file, "rt") as f:
+            assert json.load(f) == report
+        results = report["results"]
+        assert len(results) == 2 * len(BENCHMARKS)
+        assert {r["benchmark"] for r in results} == set(BENCHMARKS)
+        assert all(r["min_time_s"] >= 0 and r["peak_memory_mb"] >= 0 for r in results)
+
+        comparison = compare_benchmark_results(report, report)
+        assert len(comparison) == len(results)
+        assert all(c["time_ratio"] in (1.0, None) for c in comparison)
+
+
+def test_pipeline_benchmarks() -> None:
+    report = run_pipeline_benchmarks(scales=[10], n_best=2, class_tokens=2, repeats=1)
+
+    results = report["results"]
+    assert [r["benchmark"] for r in results] == [
+        "retro_pipeline",
+        "forward_pipeline",
+        "context_pipeline",
+    ]
+    retro = results[0]
+    assert "reorder" in retro["stages"]
+    assert retro["inference_time_s"] > 0
+    assert retro["total_time_s"] == pytest.approx(
+        retro["min_time_s"] + retro["inference_time_s"]
+    )
@@ -0,0 +1,141 @@
+import os
+from typing import Callable, Type
+
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.benchmarks.synthetic_data import (
+    SyntheticDataConfig,
+    SyntheticDataGenerator,
+)
+from rxn.metrics.binary_cache import BinaryCache
+from rxn.metrics.context_metrics import ContextMetrics
+from rxn.metrics.evaluation_options import EvaluationOptions
+from rxn.metrics.forward_metrics import ForwardMetrics
+from rxn.metrics.ground_truth import GroundTruth
+from rxn.metrics.metrics_calculator import MetricsCalculator
+from rxn.metrics.metrics_files import ForwardFiles, MetricsFiles
+from rxn.metrics.retro_metrics import RetroMetrics
+from rxn.metrics.run_metrics import evaluate_metrics
+
+
+def test_binary_cache() -> None:
+    with named_temporary_directory() as tmp_dir:
+        file_a = tmp_dir / "a.txt"
+        file_b = tmp_dir / "b.txt"
+        dump_list_to_file(["CC", "", "CC", "CCO"], file_a)
+        dump_list_to_file(["CCO", "N"], file_b)
+
+        cache = BinaryCache(tmp_dir / "cache")
+        assert cache.load_lines(file_a) == ["CC", "", "CC", "CCO"]
+        assert cache.load_lines(file_b) == ["CCO", "N"]
+
+        # A new instance loads the memory-mapped IDs, from a shared table
+        cache = BinaryCache(tmp_dir / "cache")
+        ids, strings = cache.load(file_a)
+        assert isinstance(ids, np.memmap)
+        assert ids.tolist() == [0, 1, 0, 2]
+        assert cache.load_lines(file_b) == ["CCO", "N"]
+        assert strings == ["CC", "", "CCO", "N"]
+
+
+def test_binary_cache_is_updated_for_modified_files() -> None:
+    with named_temporary_directory() as tmp_dir:
+        file_a = tmp_dir / "a.txt"
+        dump_list_to_file(["CC", "CCO"], file_a)
+        assert BinaryCache(tmp_dir / "cache").load_lines(file_a) == ["CC", "CCO"]
+
+        dump_list_to_file(["N", "CC", "O"], file_a)
+        # Make sure that the modification time differs
+        stat = file_a.stat()
+        os.utime(file_a, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+        cache = BinaryCache(tmp_dir / "cache")
+        assert cache.load_lines(file_a) == ["N", "CC", "O"]
+        assert BinaryCache(tmp_dir / "cache").load_lines(file_a) == ["N", "CC", "O"]
+
+
+def test_metrics_with_binary_cache() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = ForwardFiles(tmp_dir)
+        dump_list_to_file(["C.O", "N.O"], files.gt_src)
+        dump_list_to_file(["CO", "NO"], files.gt_tgt)
+        dump_list_to_file(["CO", "C", "N", "NO"], files.predicted_canonical)
+
+        expected = {
+            "accuracy": {1: 0.5, 2: 1.0},
+            "rank": {"mrr": 0.75, "mean-rank": 1.5, "median-rank": 1.5},
+            "accuracy-filtered": {1: 0.5, 2: 1.0},
+            "invalid-rate": {1: 0.0, 2: 0.0},
+            "duplicate-rate": {1: 0.0, 2: 0.0},
+        }
+        for _ in range(2):
+            calculator = ForwardMetrics.from_metrics_files(files, use_binary_cache=True)
+            assert calculator.get_metrics() == expected
+        assert (files.binary_cache_dir / "index.json").exists()
+
+
+def test_interned_predictions() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = ForwardFiles(tmp_dir)
+        dump_list_to_file(["C.O", "N.O"], files.gt_src)
+        dump_list_to_file(["CO", "NO"], files.gt_tgt)
+        dump_list_to_file(["CO", "", "X", "NO", "X", ""], files.predicted_canonical)
+        ground_truth = GroundTruth.from_metrics_files(files)
+
+        predictions = ground_truth.load_interned_predictions(
+            files.predicted_canonical, BinaryCache(files.binary_cache_dir)
+        )
+
+        assert predictions.lines == ["CO", "", "X", "NO", "X", ""]
+        ids = predictions.ids.tolist()
+        # Ground truth strings keep their ID
+        assert ids[0] == ground_truth.tgt_ids[0]
+        assert ids[3] == ground_truth.tgt_ids[1]
+        # Other strings get new IDs, identical for identical strings
+        assert ids[2] == ids[4] >= len(ground_truth.table)
+        assert ids[1] == ids[5] == predictions.empty_id
+        assert len(set(ids)) == 4
+
+
+@pytest.mark.parametrize(
+    "calculator_class, write_files",
+    [
+        (RetroMetrics, SyntheticDataGenerator.write_retro_files),
+        (ForwardMetrics, SyntheticDataGenerator.write_forward_files),
+        (ContextMetrics, SyntheticDataGenerator.write_context_files),
+    ],
+)
+def test_metrics_are_identical_with_binary_cache(
+    calculator_class: Type[MetricsCalculator], write_files: Callable[..., MetricsFiles]
+) -> None:
+    config = SyntheticDataConfig(
+        n_samples=30, n_best=4, duplicate_rate=0.2, invalid_rate=0.2
+    )
+    with named_temporary_directory() as tmp_dir:
+        files = write_files(SyntheticDataGenerator(config), tmp_dir)
+
+        without_cache = calculator_class.from_metrics_files(files)
+        with_cache = calculator_class.from_metrics_files(files, use_binary_cache=True)
+
+        assert with_cache.get_metrics() == without_cache.get_metrics()
+        per_sample = without_cache.per_sample_metrics()
+        for name, values in with_cache.per_sample_metrics().items():
+            np.testing.assert_array_equal(values, per_sample[name])
+
+
+def test_binary_cache_is_opt_in() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = ForwardFiles(tmp_dir)
+        dump_list_to_file(["C.O", "N.O"], files.gt_src)
+        dump_list_to_file(["CO", "NO"], files.gt_tgt)
+        dump_list_to_file(["CO", "C", "N", "NO"], files.predicted_canonical)
+
+        evaluate_metrics("forward", tmp_dir)
+        assert not files.binary_cache_dir.exists()
+
+        evaluate_metrics(
+            "forward", tmp_dir, options=EvaluationOptions(use_binary_cache=True)
+        )
+        assert files.binary_cache_dir.exists()
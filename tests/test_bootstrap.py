@@ -0,0 +1,185 @@
+import json
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.bootstrap import (
+    bootstrap_confidence_intervals,
+    bootstrap_means,
+    group_samples,
+    resample_counts,
+)
+from rxn.metrics.evaluation_options import EvaluationOptions
+from rxn.metrics.metrics_files import ForwardFiles, RetroFiles
+from rxn.metrics.multi_reference import multi_reference_per_input
+from rxn.metrics.retro_metrics import RetroMetrics
+from rxn.metrics.run_metrics import evaluate_metrics
+from rxn.metrics.utils import by_n
+
+
+def test_group_samples() -> None:
+    values = np.random.default_rng(0).integers(0, 3, size=(200, 4))
+    rows, counts = group_samples(values)
+    expected_rows, expected_counts = np.unique(values, axis=0, return_counts=True)
+    assert np.array_equal(rows, expected_rows)
+    assert np.array_equal(counts, expected_counts)
+
+
+@pytest.mark.parametrize("group_sizes", [[5, 1, 14], [1] * 20])
+def test_resample_counts(group_sizes: List[int]) -> None:
+    rng = np.random.default_rng(0)
+    batches = list(
+        resample_counts(np.array(group_sizes), 25, rng=rng, batch_elements=30)
+    )
+    assert len(batches) > 1
+    counts = np.concatenate(batches)
+    assert counts.shape == (25, len(group_sizes))
+    assert (counts.sum(axis=1) == 20).all()
+
+
+def test_bootstrap_means() -> None:
+    assert np.array_equal(
+        bootstrap_means(np.full((10, 2), 0.5), 7), np.full((7, 2), 0.5)
+    )
+
+    values = np.random.default_rng(0).random((500, 2))
+    means = bootstrap_means(values, 2000)
+    assert means.shape == (2000, 2)
+    np.testing.assert_allclose(means.mean(axis=0), values.mean(axis=0), atol=2e-3)
+    np.testing.assert_allclose(
+        means.std(axis=0), values.std(axis=0) / np.sqrt(500), rtol=0.1
+    )
+
+
+def test_bootstrap_confidence_intervals() -> None:
+    rng = np.random.default_rng(0)
+    per_sample = {
+        "accuracy": rng.random((300, 3)) < [0.2, 0.5, 0.8],
+        "mrr": rng.random(300),
+    }
+    intervals = bootstrap_confidence_intervals(per_sample, n_resamples=500)
+
+    assert list(intervals) == ["accuracy", "mrr"]
+    assert list(intervals["accuracy"]) == [1, 2, 3]
+    for metric, values in per_sample.items():
+        means = np.atleast_1d(values.mean(axis=0))
+        metric_intervals = intervals[metric]
+        if values.ndim == 1:
+            metric_intervals = {1: metric_intervals}
+        for n, mean in enumerate(means, 1):
+            assert metric_intervals[n]["low"] < mean < metric_intervals[n]["high"]
+
+    # Reproducible with the same seed, narrower for a lower confidence level
+    assert bootstrap_confidence_intervals(per_sample, n_resamples=500) == intervals
+    narrow = bootstrap_confidence_intervals(
+        per_sample, n_resamples=500, confidence_level=0.5
+    )
+    assert narrow["mrr"]["low"] > intervals["mrr"]["low"]
+    assert narrow["mrr"]["high"] < intervals["mrr"]["high"]
+
+
+def test_bootstrap_confidence_intervals_errors() -> None:
+    assert bootstrap_confidence_intervals({}) == {}
+    with pytest.raises(ValueError):
+        bootstrap_confidence_intervals({"a": np.zeros(3)}, confidence_level=1.0)
+    with pytest.raises(ValueError):
+        bootstrap_confidence_intervals({"a": np.zeros(3), "b": np.zeros(4)})
+
+
+def metric_value(metrics: Dict[str, Any], name: str) -> Any:
+    """Value of a metric, from its name in the per-sample metrics."""
+    key, _, nested_key = name.partition(".")
+    return metrics[key][nested_key] if nested_key else metrics[key]
+
+
+def assert_consistent(metrics: Dict[str, Any], values: np.ndarray, name: str) -> None:
+    means = values.mean(axis=0)
+    expected = by_n(means) if values.ndim > 1 else float(means)
+    assert metric_value(metrics, name) == pytest.approx(expected), name
+
+
+def test_per_sample_metrics_are_consistent_with_metrics() -> None:
+    calculator = RetroMetrics(
+        gt_precursors=["A.B", "C", "D"],
+        gt_products=["X", "Y", "Z"],
+        predicted_precursors=["A.B", "E", "", "C", "C", "A.B", "F", "D", "D"],
+        predicted_products=["X", "X", "", "U", "Y", "Y", "Z", "Z", "W"],
+        predicted_classes=["1.2", "2.1", "", "1.1", "3", "3", "1", "2", "2"],
+    )
+    metrics = calculator.get_metrics()
+    per_sample = calculator.per_sample_metrics()
+
+    assert {"class-diversity", "rank.mrr", "round-trip-rank.mrr"} <= set(per_sample)
+    for name, values in per_sample.items():
+        assert_consistent(metrics, values, name)
+
+
+def test_per_sample_metrics_of_optional_metrics() -> None:
+    calculator = RetroMetrics(
+        gt_precursors=["CC.O", "CCO", "CC.O"],
+        gt_products=["CCOC", "CCOC(C)=O", "CCOC"],
+        predicted_precursors=["CCO", "CC.O", "C", "CCO", "O.CC", "N"],
+        predicted_products=["CCOC"] * 6,
+    )
+    options = EvaluationOptions(
+        with_tiered_accuracy=True, with_similarity=True, with_multi_reference=True
+    )
+    with named_temporary_directory() as tmp_dir:
+        metrics = calculator.optional_metrics(options, RetroFiles(tmp_dir))
+    per_sample = calculator.per_sample_metrics()
+
+    assert {"tiered-accuracy.exact", "mean-best-similarity"} <= set(per_sample)
+    for name in ["tiered-accuracy.exact", "mean-best-similarity"]:
+        assert_consistent(metrics, per_sample[name], name)
+    for name in [name for name in per_sample if name.startswith("similarity-")]:
+        assert_consistent(metrics, per_sample[name], name)
+
+    # The multi-reference metrics are means over the distinct products
+    per_input = multi_reference_per_input(
+        calculator.reference_index(), calculator.predicted_precursors
+    )
+    for name, values in per_input.items():
+        assert_consistent(metrics, values, name)
+
+    intervals = calculator.confidence_intervals(n_resamples=20)
+    assert set(intervals) == set(per_sample) | set(per_input)
+
+
+def test_evaluate_metrics_with_confidence_intervals() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = ForwardFiles(tmp_dir)
+        dump_list_to_file(["A", "B", "C", "D"], files.gt_src)
+        dump_list_to_file(["E", "F", "G", "H"], files.gt_tgt)
+        dump_list_to_file(
+            ["E", "X", "Y", "F", "", "G", "Y", "Y"], files.predicted_canonical
+        )
+
+        evaluate_metrics("forward", tmp_dir)
+        with open(files.metrics_file, "rt") as f:
+            assert "confidence-intervals" not in json.load(f)
+
+        evaluate_metrics(
+            "forward",
+            tmp_dir,
+            options=EvaluationOptions(n_bootstrap=200, confidence_level=0.9),
+        )
+        with open(files.metrics_file, "rt") as f:
+            metrics = json.load(f)
+
+    intervals = metrics["confidence-intervals"]
+    assert intervals["confidence-level"] == 0.9
+    assert intervals["n-resamples"] == 200
+    assert set(intervals) >= {
+        "accuracy",
+        "rank.mrr",
+        "accuracy-filtered",
+        "invalid-rate",
+    }
+    for n, accuracy in metrics["accuracy"].items():
+        assert (
+            intervals["accuracy"][n]["low"]
+            <= accuracy
+            <= intervals["accuracy"][n]["high"]
+        )
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.chemical_equivalence import (
+    MolecularKeyCache,
+    molecule_keys,
+    tiered_accuracy,
+)
+from rxn.metrics.evaluation_options import EvaluationOptions
+from rxn.metrics.metrics_files import ForwardFiles
+from rxn.metrics.run_metrics import evaluate_metrics
+
+
+def test_molecule_keys() -> None:
+    assert molecule_keys("C[C@H](N)O") == ("CC(N)O", "CC(N)O", "UJPKMTDFFUTLGM")
+    assert molecule_keys("C[NH3+]") == ("C[NH3+]", "CN", "BAVYZALUXZFZLV")
+    assert molecule_keys("invalid") is None
+
+
+def test_tiered_accuracy() -> None:
+    ground_truth = ["C[C@H](N)O.CC(=O)[O-]", "CCO", "C[C@@H](O)Cl"]
+    predictions = [
+        *["CC(N)O.CC(=O)O", "C[C@H](N)O.CC(=O)[O-]"],
+        *["", "CCO"],
+        *["C[C@H](O)Cl", "invalid"],
+    ]
+
+    accuracy = tiered_accuracy(ground_truth, predictions)
+
+    assert accuracy["exact"] == pytest.approx({1: 0.0, 2: 2 / 3})
+    assert accuracy["stereo-agnostic"] == pytest.approx({1: 1 / 3, 2: 1.0})
+    assert accuracy["charge-normalized"] == pytest.approx({1: 2 / 3, 2: 1.0})
+    assert accuracy["inchikey-connectivity"] == pytest.approx({1: 2 / 3, 2: 1.0})
+
+
+def test_molecular_key_cache() -> None:
+    molecules = ["CCO", "C[NH3+]", "invalid", "CCO"]
+    with named_temporary_directory() as tmp_dir:
+        cache_file = tmp_dir / "keys.json"
+        keys = MolecularKeyCache(cache_file).get_keys(molecules)
+        assert set(keys) == {"CCO", "C[NH3+]", "invalid"}
+        assert keys["invalid"] is None
+
+        with open(cache_file, "rt") as f:
+            assert json.load(f)["CCO"] == ["CCO", "CCO", "LFQSCWFLJHTTHZ"]
+
+        # The saved keys are used as such
+        with open(cache_file, "wt") as f:
+            json.dump({"CCO": ["a", "b", "c"]}, f)
+        assert MolecularKeyCache(cache_file).get_keys(["CCO"])["CCO"] == (
+            "a",
+            "b",
+            "c",
+        )
+
+
+def test_molecular_key_cache_with_process_pool() -> None:
+    molecules = ["C" * i for i in range(1, 30)] + ["C[C@H](N)O", "invalid"]
+    keys = MolecularKeyCache().get_keys(molecules, n_workers=2, chunk_size=5)
+    assert keys == {m: molecule_keys(m) for m in molecules}
+
+
+def test_evaluate_metrics_with_tiered_accuracy() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = ForwardFiles(tmp_dir)
+        dump_list_to_file(["CC.O", "N.O"], files.gt_src)
+        dump_list_to_file(["C[C@H](N)O", "C[NH3+]"], files.gt_tgt)
+        dump_list_to_file(["CC(N)O", "CN"], files.predicted_canonical)
+
+        evaluate_metrics(
+            "forward", tmp_dir, options=EvaluationOptions(with_tiered_accuracy=True)
+        )
+
+        with open(files.metrics_file, "rt") as f:
+            tiered = json.load(f)["tiered-accuracy"]
+        assert tiered["exact"] == {"1": 0.0}
+        assert tiered["stereo-agnostic"] == {"1": 0.5}
+        assert tiered["charge-normalized"] == {"1": 1.0}
+        assert files.molecular_keys_file.exists()
@@ -0,0 +1,92 @@
+import gzip
+
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.compression import (
+    dump_lines,
+    iterate_lines,
+    load_lines,
+    resolve_path,
+)
+from rxn.metrics.forward_metrics import ForwardMetrics
+from rxn.metrics.manifest import line_count
+from rxn.metrics.metrics_files import ForwardFiles
+from rxn.metrics.scripts.ensure_data_dimension import ensure_data_dimension
+from rxn.metrics.scripts.join_data_files import join_data_files
+from rxn.metrics.utils import hash_file
+
+LINES = ["CC", "", "CCO", "N" * 1000]
+
+
+@pytest.mark.parametrize("extension", [".gz", ".zst"])
+def test_compressed_round_trip(extension: str) -> None:
+    if extension == ".zst":
+        pytest.importorskip("zstandard")
+    with named_temporary_directory() as tmp_dir:
+        plain = tmp_dir / "a.txt"
+        compressed = tmp_dir / f"b.txt{extension}"
+        dump_list_to_file(LINES, plain)
+        dump_lines(LINES, compressed)
+
+        assert load_lines(compressed) == LINES
+        assert line_count(compressed) == len(LINES)
+        assert hash_file(compressed) == hash_file(plain)
+
+
+def test_compressed_variant_is_found() -> None:
+    with named_temporary_directory() as tmp_dir:
+        dump_lines(LINES, tmp_dir / "a.txt.gz")
+
+        assert resolve_path(tmp_dir / "a.txt") == tmp_dir / "a.txt.gz"
+        assert list(iterate_lines(tmp_dir / "a.txt")) == LINES
+
+
+def test_iterating_over_large_compressed_file() -> None:
+    with named_temporary_directory() as tmp_dir:
+        lines = [f"C{i}" * (i % 5) for i in range(500000)]
+        dump_lines(lines, tmp_dir / "a.txt.gz")
+
+        # Stopping early does not block the background thread
+        iterator = iterate_lines(tmp_dir / "a.txt.gz")
+        assert next(iterator) == ""
+        iterator.close()
+
+        assert load_lines(tmp_dir / "a.txt.gz") == lines
+
+
+def test_metrics_from_compressed_files() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = ForwardFiles(tmp_dir)
+        dump_lines(["a", "b", "c"], str(files.gt_src) + ".gz")
+        dump_lines(["A", "B", "C"], str(files.gt_tgt) + ".gz")
+        dump_lines(
+            ["A", "X", "X", "B", "C", "X"], str(files.predicted_canonical) + ".gz"
+        )
+
+        metrics = ForwardMetrics.from_metrics_files(files).get_metrics()
+        assert metrics["accuracy"] == {1: pytest.approx(2 / 3), 2: 1.0}
+
+
+def test_split_and_join_compressed_files() -> None:
+    with named_temporary_directory() as tmp_dir:
+        lines = [str(i) for i in range(5)]
+        dump_lines(lines, tmp_dir / "a.txt.gz")
+
+        ensure_data_dimension([tmp_dir / "a.txt.gz"], tmp_dir / "split", 2)
+        with gzip.open(tmp_dir / "split" / "chunk_2" / "a.txt.gz", "rt") as f:
+            assert f.read() == "4\n"
+
+        join_data_files(tmp_dir / "split", tmp_dir / "joined")
+        assert load_lines(tmp_dir / "joined" / "a.txt.gz") == lines
+
+
+def test_compressed_lines_are_identical_to_plain_ones() -> None:
+    content = b"CC\r\nCCO\r\r\n\nN\r"
+    with named_temporary_directory() as tmp_dir:
+        plain = tmp_dir / "a.txt"
+        plain.write_bytes(content)
+        with gzip.open(tmp_dir / "b.txt.gz", "wb") as f:
+            f.write(content)
+
+        assert load_lines(tmp_dir / "b.txt.gz") == load_lines(plain)
@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.confidence_metrics import (
+    expected_calibration_error,
+    selective_prediction_curve,
+    summarize_curve,
+)
+from rxn.metrics.run_metrics import evaluate_metrics
+
+
+def test_selective_prediction_curve_matches_threshold_loop() -> None:
+    rng = np.random.default_rng(0)
+    # Rounded, to have identical confidences
+    confidences = np.round(rng.normal(size=200), 1)
+    correct = rng.random(200) < 0.6
+
+    thresholds, coverage, accuracy = selective_prediction_curve(confidences, correct)
+
+    assert list(thresholds) == sorted(set(confidences), reverse=True)
+    for threshold, cov, acc in zip(thresholds, coverage, accuracy):
+        selected = confidences >= threshold
+        assert cov == pytest.approx(selected.mean())
+        assert acc == pytest.approx(correct[selected].mean())
+
+
+def test_summarize_curve() -> None:
+    confidences = np.array([-0.1, -0.2, -0.3, -0.4])
+    correct = np.array([True, True, False, True])
+
+    summary = summarize_curve(
+        *selective_prediction_curve(confidences, correct), n_points=2
+    )
+
+    assert summary["coverage"] == [0.5, 1.0]
+    assert summary["accuracy"] == [1.0, 0.75]
+    assert summary["threshold"] == pytest.approx([-0.2, -0.4])
+    assert summary["area"] == pytest.approx((1 + 1 + 2 / 3 + 3 / 4) / 4)
+
+
+def test_summarize_curve_rounds_float32_values() -> None:
+    confidences = np.array([-0.0254, -0.5], dtype=np.float32)
+    correct = np.array([True, False])
+
+    summary = summarize_curve(
+        *selective_prediction_curve(confidences, correct), n_points=2
+    )
+
+    assert summary["threshold"] == [-0.0254, -0.5]
+
+
+def test_expected_calibration_error() -> None:
+    probabilities = np.array([0.95, 0.95, 0.15, 0.15])
+    correct = np.array([True, False, False, False])
+    # Bins: 0.9-1.0 (accuracy 0.5, confidence 0.95), 0.1-0.2 (0 vs 0.15)
+    assert expected_calibration_error(probabilities, correct) == pytest.approx(
+        (0.45 * 2 + 0.15 * 2) / 4
+    )
+    assert expected_calibration_error(np.array([]), np.array([])) == 0.0
+
+
+def test_retro_metrics_with_log_probs() -> None:
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["P1", "P2"], tmp_dir / "gt_products.txt")
+        dump_list_to_file(["R1", "R2"], tmp_dir / "gt_precursors.txt")
+        dump_list_to_file(
+            ["R1", "X", "Y", "R2"], tmp_dir / "predicted_precursors_canonical.txt"
+        )
+        dump_list_to_file(
+            ["P1", "P1", "Z", "P2"], tmp_dir / "predicted_products_canonical.txt"
+        )
+        dump_list_to_file(
+            ["-0.1", "-2.0", "-1.0", "-1.5"],
+            tmp_dir / "predicted_precursors.txt.tokenized_log_probs",
+        )
+
+        evaluate_metrics("retro", tmp_dir)
+
+        with open(tmp_dir / "metrics.json", "rt") as f:
+            metrics = json.load(f)
+        assert metrics["accuracy-coverage"]["coverage"][-1] == 1.0
+        assert metrics["accuracy-coverage"]["accuracy"][0] == 1.0
+        assert metrics["accuracy-coverage"]["accuracy"][-1] == 0.5
+        assert metrics["round-trip-coverage"]["accuracy"][-1] == 0.75
+        assert "expected-calibration-error" in metrics
+        # No forward log probabilities
+        assert "round-trip-expected-calibration-error" not in metrics
@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+import pytest
+from rdkit import Chem, DataStructs
+from rdkit.Chem import rdFingerprintGenerator
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.evaluation_options import EvaluationOptions
+from rxn.metrics.fingerprint_similarity import (
+    FINGERPRINT_BITS,
+    FINGERPRINT_RADIUS,
+    fingerprints,
+    parallel_fingerprints,
+    popcount,
+    similarity_metrics,
+    tanimoto_matrix,
+)
+from rxn.metrics.metrics_files import RetroFiles
+from rxn.metrics.run_metrics import evaluate_metrics
+
+SMILES = ["CCO", "CCCO", "c1ccccc1O", "c1ccccc1N", "CC(=O)O.N", "invalid", ""]
+
+
+def test_fingerprints() -> None:
+    packed, valid = fingerprints(SMILES)
+    assert packed.dtype == np.uint64
+    assert packed.shape == (len(SMILES), FINGERPRINT_BITS // 64)
+    assert valid.tolist() == [True] * 5 + [False] * 2
+    assert not packed[~valid].any()
+
+    sequential = fingerprints(SMILES * 3)
+    parallel = parallel_fingerprints(SMILES * 3, n_workers=2, chunk_size=4)
+    assert np.array_equal(parallel[0], sequential[0])
+    assert np.array_equal(parallel[1], sequential[1])
+
+
+@pytest.mark.parametrize("with_bitwise_count", [True, False])
+def test_popcount(with_bitwise_count: bool, monkeypatch: pytest.MonkeyPatch) -> None:
+    if not with_bitwise_count:
+        monkeypatch.delattr(np, "bitwise_count", raising=False)
+    values = np.random.default_rng(0).integers(0, 2**63, (5, 3), dtype=np.uint64)
+    expected = [sum(bin(int(v)).count("1") for v in row) for row in values]
+    assert popcount(values).tolist() == expected
+
+
+def test_tanimoto_matrix_matches_rdkit() -> None:
+    packed, _ = fingerprints(SMILES)
+    gt_ids = np.array([0, 2, 4])
+    prediction_ids = np.array([[0, 1, 5], [3, 2, 6], [1, 4, 0]])
+
+    similarities = tanimoto_matrix(packed, gt_ids, prediction_ids, block_size=2)
+
+    generator = rdFingerprintGenerator.GetMorganGenerator(
+        radius=FINGERPRINT_RADIUS, fpSize=FINGERPRINT_BITS
+    )
+
+    def expected(gt: int, prediction: int) -> float:
+        if prediction >= 5:
+            return 0.0
+        return float(
+            DataStructs.TanimotoSimilarity(
+                generator.GetFingerprint(Chem.MolFromSmiles(SMILES[gt])),
+                generator.GetFingerprint(Chem.MolFromSmiles(SMILES[prediction])),
+            )
+        )
+
+    for i, gt in enumerate(gt_ids):
+        for j, prediction in enumerate(prediction_ids[i]):
+            assert similarities[i, j] == pytest.approx(expected(gt, prediction))
+
+
+def test_similarity_metrics() -> None:
+    metrics = similarity_metrics(
+        ["CCO", "c1ccccc1O"],
+        ["CCCO", "CCO", "invalid", "c1ccccc1N"],
+        thresholds=[0.3, 1.0],
+    )
+
+    best = metrics["mean-best-similarity"]
+    assert 0 < best[1] < best[2] < 1
+    assert metrics["similarity-hit-rate"]["1.0"] == {1: 0.0, 2: 0.5}
+    assert metrics["similarity-hit-rate"]["0.3"][2] == 1.0
+
+
+def test_evaluate_metrics_with_similarity() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        dump_list_to_file(["CCOC(C)=O"], files.gt_src)
+        dump_list_to_file(["CC(=O)O.CCO"], files.gt_tgt)
+        dump_list_to_file(["CC(=O)O.CCO", "CCO"], files.predicted_canonical)
+        dump_list_to_file(["CCOC(C)=O", "CCO"], files.predicted_products_canonical)
+
+        evaluate_metrics(
+            "retro", tmp_dir, options=EvaluationOptions(with_similarity=True)
+        )
+
+        with open(files.metrics_file, "rt") as f:
+            metrics = json.load(f)
+        assert metrics["mean-best-similarity"] == {"1": 1.0, "2": 1.0}
+        assert metrics["similarity-hit-rate"]["0.9"] == {"1": 1.0, "2": 1.0}
@@ -0,0 +1,120 @@
+from typing import List
+
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.context_metrics import ContextMetrics
+from rxn.metrics.ground_truth import GroundTruth, SampleGroups, ground_truth_hash
+from rxn.metrics.metrics_files import ContextFiles, RetroFiles
+
+
+def test_ground_truth_cache() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir / "results")
+        files.directory.mkdir()
+        dump_list_to_file(["CCO", "CC", "CCO"], files.gt_src)
+        dump_list_to_file(["CC.O", "", "C.CO"], files.gt_tgt)
+        cache_dir = tmp_dir / "cache"
+
+        ground_truth = GroundTruth.from_metrics_files(files, cache_dir=cache_dir)
+        assert ground_truth.storage_dir is not None
+        assert ground_truth.storage_dir.parent == cache_dir
+
+        # Second time: loaded from the cache
+        cached = GroundTruth.from_metrics_files(files, cache_dir=cache_dir)
+        assert cached.src == ["CCO", "CC", "CCO"]
+        assert cached.tgt == ["CC.O", "", "C.CO"]
+        assert cached.src[0] is cached.src[2]
+        assert cached.n_samples == 3
+        assert cached.content_hash == ground_truth.content_hash
+        assert cached.table.strings == ground_truth.table.strings
+
+        # Different ground truth: different entry
+        dump_list_to_file(["CCO", "CC", "CCN"], files.gt_src)
+        other = GroundTruth.from_metrics_files(files, cache_dir=cache_dir)
+        assert other.src == ["CCO", "CC", "CCN"]
+        assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_ground_truth_derived_data() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        dump_list_to_file(["CCO", "CC"], files.gt_src)
+        dump_list_to_file(["CC.O", "C.C"], files.gt_tgt)
+        expected: List[SampleGroups] = [[["CC", "O"], []], None]
+        calls: List[int] = []
+
+        def compute() -> List[SampleGroups]:
+            calls.append(1)
+            return expected
+
+        ground_truth = GroundTruth.from_metrics_files(files, tmp_dir / "cache")
+        assert ground_truth.derived("split", compute) == expected
+        assert ground_truth.derived("split", compute) == expected
+        assert len(calls) == 1
+
+        # Reloaded from the cache without computing again
+        cached = GroundTruth.from_metrics_files(files, tmp_dir / "cache")
+        assert cached.derived("split", compute) == expected
+        assert len(calls) == 1
+
+
+def test_ground_truth_derived_data_from_two_loaders() -> None:
+    # Two evaluations sharing the cache entry, each saving different data
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        dump_list_to_file(["CCO", "CC"], files.gt_src)
+        dump_list_to_file(["CC.O", "C.C"], files.gt_tgt)
+        cache_dir = tmp_dir / "cache"
+        first: List[SampleGroups] = [[["alpha"]], [["beta"]]]
+        second: List[SampleGroups] = [[["gamma"]], [["delta"]]]
+
+        GroundTruth.from_metrics_files(files, cache_dir)
+        loader_a = GroundTruth.from_metrics_files(files, cache_dir)
+        loader_b = GroundTruth.from_metrics_files(files, cache_dir)
+        loader_a.derived("strata", lambda: first)
+        loader_b.derived("other", lambda: second)
+
+        def fail() -> List[SampleGroups]:
+            raise AssertionError("Expected to be loaded from the cache")
+
+        reloaded = GroundTruth.from_metrics_files(files, cache_dir)
+        assert reloaded.derived("strata", fail) == first
+        assert reloaded.derived("other", fail) == second
+        assert reloaded.src == ["CCO", "CC"]
+        assert reloaded.tgt == ["CC.O", "C.C"]
+
+
+def test_context_metrics_with_cached_ground_truth() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = ContextFiles(tmp_dir)
+        dump_list_to_file(["A>>", "B>>"], files.gt_src)
+        dump_list_to_file(["C.O>>", "N>>"], files.gt_tgt)
+        dump_list_to_file(["C.O>>", "C>>", "N>>", "N.O>>"], files.predicted_canonical)
+
+        expected = ContextMetrics.from_metrics_files(files).get_metrics()
+        for _ in range(2):
+            ground_truth = GroundTruth.from_metrics_files(files, tmp_dir / "cache")
+            metrics = ContextMetrics.from_metrics_files(files, ground_truth)
+            assert metrics.get_metrics() == expected
+        assert expected["partial_match"] == {1: 1.0, 2: 0.5 * (0.5 + 0.5)}
+
+
+def test_ground_truth_with_known_hash() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir / "results")
+        files.directory.mkdir()
+        dump_list_to_file(["CCO", "CC"], files.gt_src)
+        dump_list_to_file(["CC.O", ""], files.gt_tgt)
+        cache_dir = tmp_dir / "cache"
+
+        content_hash = ground_truth_hash(files)
+        assert GroundTruth.from_files(files.gt_src, files.gt_tgt).content_hash == (
+            content_hash
+        )
+
+        # The given hash is not computed again, and keys the cache entry
+        ground_truth = GroundTruth.from_metrics_files(
+            files, cache_dir=cache_dir, content_hash="known"
+        )
+        assert ground_truth.content_hash == "known"
+        assert ground_truth.storage_dir == cache_dir / "known"
@@ -0,0 +1,91 @@
+"""
+Guards against regressions in the cold-start latency of the evaluation scripts,
+which are typically launched many times in short-lived jobs.
+"""
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+# Modules that must not be loaded when evaluating metrics from existing files.
+HEAVY_MODULES = [
+    "onmt",
+    "rdkit",
+    "rxn.chemutils",
+    "rxn.onmt_models",
+    "rxn.onmt_utils",
+    "torch",
+]
+
+# Generous upper bound for the cumulative import time, in seconds.
+IMPORT_TIME_BUDGET = 2.0
+
+
+def import_times(module: str) -> Dict[str, float]:
+    """Cumulative import time (in seconds) of all the modules loaded when
+    importing the given one in a fresh interpreter, from "python -X importtime"."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def loaded_heavy_modules(script: str) -> Dict[str, bool]:
+    code = (
+        f"{script}\n"
+        "import sys\n"
+        f"for m in {HEAVY_MODULES!r}:\n"
+        "    print(m, m in sys.modules)\n"
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], universal_newlines=True
+    )
+    return {
+        name: loaded == "True"
+        for name, loaded in (line.split() for line in output.splitlines())
+    }
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "rxn.metrics.scripts.rxn_evaluate_metrics",
+        "rxn.metrics.scripts.parse_metrics_into_csv",
+    ],
+)
+def test_script_import_is_light(module: str) -> None:
+    times = import_times(module)
+
+    assert not [m for m in times if any(m.startswith(h) for h in HEAVY_MODULES)]
+    assert times[module] < IMPORT_TIME_BUDGET
+
+
+@pytest.mark.parametrize("task", ["forward", "retro"])
+def test_evaluation_does_not_load_heavy_modules(task: str) -> None:
+    with named_temporary_directory() as tmp_dir:
+        for filename in [
+            "gt_products.txt",
+            "gt_precursors.txt",
+            "predicted_products_canonical.txt",
+            "predicted_precursors_canonical.txt",
+        ]:
+            dump_list_to_file(["CCO", "CC"], tmp_dir / filename)
+
+        loaded = loaded_heavy_modules(
+            "from rxn.metrics.run_metrics import evaluate_metrics\n"
+            f"evaluate_metrics({task!r}, {str(tmp_dir)!r})"
+        )
+
+    assert not any(loaded.values()), loaded
@@ -0,0 +1,27 @@
+from rxn.metrics.interning import StringTable
+
+
+def test_string_table() -> None:
+    table = StringTable(["A", "B", "A"])
+    assert len(table) == 2
+    assert table.strings == ["A", "B"]
+
+    ids = table.add_all(["B", "C", "A", "C"])
+    assert ids.tolist() == [1, 2, 0, 2]
+    assert table.lookup(ids) == ["B", "C", "A", "C"]
+    assert table.get_id("C") == 2
+    assert table.get_id("D") == -1
+
+
+def test_string_table_share() -> None:
+    table = StringTable(["AB", "CD"])
+
+    # Strings built at runtime, to get objects different from the table ones
+    values = ["".join(["A", "B"]), "".join(["E", "F"])]
+    shared = table.share(values)
+
+    assert shared == ["AB", "EF"]
+    assert shared[0] is table.strings[0]
+    assert shared[1] is values[1]
+    # the table is not modified
+    assert len(table) == 2
@@ -0,0 +1,83 @@
+import gzip
+
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.line_index import (
+    LineIndex,
+    LineIndexCache,
+    SampleLookup,
+    compute_line_offsets,
+)
+from rxn.metrics.metrics_files import RetroFiles
+
+
+@pytest.mark.parametrize("content", ["", "A\n", "A\nBC", "A\n\nBC\n"])
+def test_compute_line_offsets(content: str) -> None:
+    with named_temporary_directory() as tmp_dir:
+        filename = tmp_dir / "a.txt"
+        with open(filename, "wt") as f:
+            f.write(content)
+
+        line_index = LineIndex.build(filename)
+        assert line_index.lines(0, len(line_index)) == content.splitlines()
+        line_index.close()
+
+
+def test_line_index() -> None:
+    with named_temporary_directory() as tmp_dir:
+        filename = tmp_dir / "a.txt"
+        dump_list_to_file(["CC", "", "CCO", "N"], filename)
+        cache = LineIndexCache(tmp_dir / "line_index")
+        assert cache.get(filename).offsets.tolist() == [0, 3, 4, 8, 10]
+
+        # A new instance loads the memory-mapped offsets
+        line_index = LineIndexCache(tmp_dir / "line_index").get(filename)
+        assert isinstance(line_index.offsets, np.memmap)
+        assert line_index.line(2) == "CCO"
+        assert line_index.lines(1, 3) == ["", "CCO"]
+        with pytest.raises(IndexError):
+            line_index.line(4)
+        line_index.close()
+
+
+def test_compute_line_offsets_over_several_blocks() -> None:
+    with named_temporary_directory() as tmp_dir:
+        filename = tmp_dir / "a.txt"
+        lines = [f"C{i}" * (i % 7) for i in range(300000)]
+        dump_list_to_file(lines, filename)
+
+        offsets = compute_line_offsets(filename)
+        assert len(offsets) == len(lines) + 1
+        assert offsets[-1] == filename.stat().st_size
+
+
+def test_sample_lookup() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        dump_list_to_file(["P1", "P2", "P3"], files.gt_src)
+        dump_list_to_file(["R1", "R2", "R3"], files.gt_tgt)
+        dump_list_to_file(["A", "B", "C", "D", "E", "F"], files.predicted_canonical)
+        dump_list_to_file(["X", "Y"], files.predicted_classes)
+
+        lookup = SampleLookup(files)
+        assert lookup.sample(1) == {
+            "gt_products.txt": ["P2"],
+            "gt_precursors.txt": ["R2"],
+            "predicted_precursors_canonical.txt": ["C", "D"],
+        }
+        assert [s["gt_products.txt"] for s in lookup.samples(1, 3)] == [["P2"], ["P3"]]
+        lookup.close()
+
+
+def test_sample_lookup_with_compressed_results() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        with gzip.open(str(files.gt_src) + ".gz", "wt") as f:
+            f.write("P1\nP2\n")
+
+        with pytest.raises(ValueError, match="compressed"):
+            SampleLookup(files)
+        with pytest.raises(ValueError):
+            SampleLookup(RetroFiles(tmp_dir / "missing"))
@@ -0,0 +1,97 @@
+import os
+import random
+from typing import List
+
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.log_probs import load_log_probs, log_probs_cache_file
+from rxn.metrics.scripts.reorder_retro_predictions_class_token import (
+    class_token_order,
+)
+
+
+def test_load_log_probs() -> None:
+    with named_temporary_directory() as tmp_dir:
+        log_probs_file = tmp_dir / "pred.txt.tokenized_log_probs"
+        dump_list_to_file(
+            ["-0.5", "-1.25", "-0.125", "-3.0", "0.0", "-2"], log_probs_file
+        )
+
+        values = load_log_probs(log_probs_file, multiplier=2, chunk_size=4)
+
+        assert values.dtype == np.float32
+        assert values.tolist() == [[-0.5, -1.25], [-0.125, -3.0], [0.0, -2.0]]
+        assert not log_probs_cache_file(log_probs_file).exists()
+        with pytest.raises(ValueError):
+            load_log_probs(log_probs_file, multiplier=4)
+
+
+def test_log_probs_cache() -> None:
+    with named_temporary_directory() as tmp_dir:
+        log_probs_file = tmp_dir / "pred.txt.tokenized_log_probs"
+        cache_file = log_probs_cache_file(log_probs_file)
+        dump_list_to_file(["-0.5", "-1.5"], log_probs_file)
+
+        load_log_probs(log_probs_file, multiplier=1, use_cache=True)
+        assert cache_file.exists()
+        # The cache is used instead of the text file
+        np.save(cache_file, np.array([-7.0, -8.0], dtype=np.float32))
+        cached = load_log_probs(log_probs_file, multiplier=1, use_cache=True)
+        assert cached.tolist() == [[-7.0], [-8.0]]
+
+        # Not used anymore once the text file is more recent
+        dump_list_to_file(["-0.25", "-0.75"], log_probs_file)
+        stat = cache_file.stat()
+        os.utime(log_probs_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        values = load_log_probs(log_probs_file, multiplier=1, use_cache=True)
+        assert values.tolist() == [[-0.25], [-0.75]]
+
+
+def reference_order(
+    confidences: List[float], n_class_tokens: int, multiplier: int
+) -> List[int]:
+    """Order from sorting the (index, confidence) pairs in Python."""
+    order = []
+    topx = multiplier // n_class_tokens
+    for sample_start in range(0, len(confidences), multiplier):
+        for topn in range(topx):
+            indices = [
+                sample_start + token * topx + topn for token in range(n_class_tokens)
+            ]
+            order.extend(sorted(indices, key=lambda i: confidences[i], reverse=True))
+    return order
+
+
+def test_class_token_order_matches_sorting() -> None:
+    rng = random.Random(0)
+    n_samples, n_class_tokens, topx = 50, 4, 3
+    multiplier = n_class_tokens * topx
+    # Few distinct values, to have ties
+    confidences = [
+        float(rng.choice([-0.5, -1.0, -2.0])) for _ in range(n_samples * multiplier)
+    ]
+
+    order = class_token_order(
+        np.array(confidences, dtype=np.float32).reshape(n_samples, multiplier),
+        n_class_tokens,
+    )
+
+    assert order.tolist() == reference_order(confidences, n_class_tokens, multiplier)
+
+
+def test_load_log_probs_as_float64() -> None:
+    with named_temporary_directory() as tmp_dir:
+        log_probs_file = tmp_dir / "pred.txt.tokenized_log_probs"
+        dump_list_to_file(["-1.00000001", "-1.0"], log_probs_file)
+
+        values = load_log_probs(
+            log_probs_file, multiplier=2, use_cache=True, dtype=np.float64
+        )
+
+        assert values.dtype == np.float64
+        assert values[0, 0] < values[0, 1]
+        # Separate cache from the float32 values
+        assert log_probs_cache_file(log_probs_file, np.float64).exists()
+        assert not log_probs_cache_file(log_probs_file).exists()
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+
+import pytest
+from rxn.utilities.files import (
+    count_lines,
+    dump_list_to_file,
+    named_temporary_directory,
+)
+
+from rxn.metrics.ground_truth import ground_truth_hash
+from rxn.metrics.manifest import FilesManifest, line_count, line_multiplier
+from rxn.metrics.metrics_files import RetroFiles
+from rxn.metrics.utils import hash_file
+
+
+def test_manifest_records_files() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        dump_list_to_file(["CC", "CCO"], files.gt_src)
+        dump_list_to_file(["A", "B", "", "D", "E", "F"], files.predicted)
+        files.record(files.gt_src, files.predicted)
+
+        with open(files.manifest.manifest_file, "rt") as f:
+            entries = json.load(f)
+        assert entries["predicted_precursors.txt"]["n_lines"] == 6
+        assert entries["predicted_precursors.txt"]["multiplier"] == 3
+        assert entries["gt_products.txt"]["multiplier"] == 1
+        assert entries["gt_products.txt"]["sha256"] == hash_file(files.gt_src)
+
+        # A new instance reads the recorded values
+        manifest = FilesManifest(files.manifest.manifest_file)
+        assert manifest.count_lines(files.predicted) == 6
+        assert manifest.multiplier(files.predicted, files.gt_src) == 3
+        assert line_count(files.predicted) == 6
+
+
+def test_manifest_is_updated_for_modified_files() -> None:
+    with named_temporary_directory() as tmp_dir:
+        manifest = FilesManifest(tmp_dir / "manifest.json")
+        filename = tmp_dir / "a.txt"
+        dump_list_to_file(["CC", "CCO"], filename)
+        manifest.record(filename)
+
+        dump_list_to_file(["N", "CC", "O"], filename)
+        # Make sure that the modification time differs
+        stat = filename.stat()
+        os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+        assert line_count(filename) == 3
+        assert manifest.count_lines(filename) == 3
+        assert manifest.content_hash(filename) == hash_file(filename)
+
+
+@pytest.mark.parametrize("content", ["", "A\n", "A\nB", "A\n\nB\n"])
+def test_line_count_is_consistent_with_count_lines(content: str) -> None:
+    with named_temporary_directory() as tmp_dir:
+        filename = tmp_dir / "a.txt"
+        with open(filename, "wt") as f:
+            f.write(content)
+
+        assert line_count(filename) == count_lines(filename)
+        assert FilesManifest(tmp_dir / "m.json").count_lines(filename) == count_lines(
+            filename
+        )
+
+
+def test_line_count_does_not_hash_unrecorded_files(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def fail(*args: object) -> None:
+        raise AssertionError("Unexpected hashing")
+
+    monkeypatch.setattr(hashlib, "sha256", fail)
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["A", "B"], tmp_dir / "a.txt")
+        assert line_count(tmp_dir / "a.txt") == 2
+
+
+def test_lookups_do_not_modify_the_manifest() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        dump_list_to_file(["CC", "CCO"], files.gt_src)
+        dump_list_to_file(["C", "O"], files.gt_tgt)
+        dump_list_to_file(["A", "B", "C", "D"], files.predicted)
+
+        assert files.manifest.count_lines(files.predicted) == 4
+        assert files.manifest.multiplier(files.predicted, files.gt_src) == 2
+        assert line_multiplier(files.predicted, files.gt_src) == 2
+        ground_truth_hash(files)
+
+        assert not files.manifest.manifest_file.exists()
+
+
+def test_manifest_records_files_with_invalid_multiplier() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        dump_list_to_file(["CC", "CCO"], files.gt_src)
+        dump_list_to_file(["A", "B", "C"], files.predicted)
+        dump_list_to_file(["A", "B", "C", "D"], files.predicted_canonical)
+        files.record(files.predicted, files.predicted_canonical)
+
+        with open(files.manifest.manifest_file, "rt") as f:
+            entries = json.load(f)
+        assert entries["predicted_precursors.txt"]["multiplier"] is None
+        assert entries["predicted_precursors.txt"]["n_lines"] == 3
+        # The later files are recorded as well
+        assert entries["predicted_precursors_canonical.txt"]["multiplier"] == 2
+
+        with pytest.raises(ValueError):
+            line_multiplier(files.predicted, files.gt_src)
@@ -0,0 +1,25 @@
+from rxn.utilities.files import named_temporary_directory
+
+from rxn.metrics.metrics_files import ContextFiles, RetroFiles
+
+
+def test_text_files() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        for path in [
+            files.gt_tgt,
+            files.gt_src,
+            files.predicted_products_log_probs,
+            files.log_file,
+            files.metrics_file,
+            files.first_hit_ranks_file,
+        ]:
+            path.touch()
+
+        assert files.text_files() == [
+            files.gt_src,
+            files.gt_tgt,
+            files.predicted_products_log_probs,
+        ]
+        # None of these files belongs to the context metrics
+        assert ContextFiles(tmp_dir).text_files() == []
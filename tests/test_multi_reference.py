@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.ground_truth import GroundTruth
+from rxn.metrics.multi_reference import (
+    ReferenceIndex,
+    canonical_sources,
+    multi_reference_metrics,
+)
+from rxn.metrics.retro_metrics import RetroMetrics
+
+
+def test_reference_index() -> None:
+    index = ReferenceIndex(["P1", "P2", "P1", "P3", "P1"], ["A", "B", "C", "A", "A"])
+
+    assert index.n_inputs == 3
+    assert index.first_samples.tolist() == [0, 1, 3]
+    assert index.references_per_input().tolist() == [2, 1, 1]
+
+
+def test_reference_index_matches() -> None:
+    index = ReferenceIndex(["P1", "P2", "P1", "P3"], ["A", "B", "C", "A"])
+    predictions = [
+        # P1: both references match, at different positions
+        "C",
+        "X",
+        "A",
+        # P2: reference of another product only
+        "A",
+        "C",
+        "",
+        # P1 again: not considered, the first sample of P1 is used
+        "X",
+        "X",
+        "X",
+        # P3
+        "B",
+        "A",
+        "A",
+    ]
+
+    np.testing.assert_array_equal(
+        index.matches(predictions),
+        [[True, False, True], [False, False, False], [False, True, True]],
+    )
+
+
+def test_reference_index_with_inconsistent_lengths() -> None:
+    with pytest.raises(ValueError):
+        ReferenceIndex(["P1", "P2"], ["A"])
+
+
+def test_multi_reference_metrics() -> None:
+    index = ReferenceIndex(["P1", "P2", "P1"], ["A", "B", "C"])
+    predictions = ["C", "A", "X", "B", "C", "A"]
+
+    metrics = multi_reference_metrics(index, predictions)
+
+    assert metrics["multi-reference-accuracy"] == {1: 0.5, 2: 1.0}
+    assert metrics["multi-reference-rank"]["mrr"] == pytest.approx(0.75)
+    assert metrics["n-distinct-inputs"] == 2
+    assert metrics["references-per-input"] == pytest.approx(1.5)
+
+    assert multi_reference_metrics(ReferenceIndex([], []), []) == {}
+
+
+def test_retro_multi_reference_metrics() -> None:
+    # The precursors of the second sample are not the top-1 prediction of
+    # its row, but they are the ones recorded for the first sample
+    metrics = RetroMetrics(
+        gt_precursors=["A", "B"],
+        gt_products=["P", "P"],
+        predicted_precursors=["A", "B", "A", "B"],
+        predicted_products=["P", "P", "P", "P"],
+    )
+
+    assert metrics.get_metrics()["accuracy"] == {1: 0.5, 2: 1.0}
+    assert metrics.multi_reference_metrics()["multi-reference-accuracy"] == {
+        1: 1.0,
+        2: 1.0,
+    }
+
+
+def test_retro_multi_reference_metrics_with_non_canonical_products() -> None:
+    # Same product, written differently
+    metrics = RetroMetrics(
+        gt_precursors=["A", "B"],
+        gt_products=["OCC", "CCO"],
+        predicted_precursors=["A", "B", "A", "B"],
+        predicted_products=["", "", "", ""],
+    )
+
+    results = metrics.multi_reference_metrics()
+    assert results["n-distinct-inputs"] == 1
+    assert results["multi-reference-accuracy"] == {1: 1.0, 2: 1.0}
+
+
+def test_canonical_sources() -> None:
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["OCC", "CCO", "C1CC"], tmp_dir / "src.txt")
+        dump_list_to_file(["A", "B", "C"], tmp_dir / "tgt.txt")
+        ground_truth = GroundTruth.from_files(tmp_dir / "src.txt", tmp_dir / "tgt.txt")
+
+        # Unparsable SMILES are kept as they are
+        assert canonical_sources(ground_truth) == ["CCO", "CCO", "C1CC"]
@@ -0,0 +1,133 @@
+import json
+
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.evaluation_options import EvaluationOptions
+from rxn.metrics.metrics_files import ContextFiles, RetroFiles
+from rxn.metrics.overlap_index import (
+    NOVEL_LABEL,
+    SEEN_LABEL,
+    OverlapIndex,
+    build_hash_array,
+    build_overlap_index,
+    hash_smiles,
+    smiles_hash,
+)
+from rxn.metrics.run_metrics import evaluate_metrics
+
+
+def test_hashes() -> None:
+    assert smiles_hash("CCO") == smiles_hash("CCO")
+    assert smiles_hash("CCO") != smiles_hash("OCC")
+
+    hashes = hash_smiles(["CCO", "CC"])
+    assert hashes.dtype == np.uint64
+    assert hashes.tolist() == [smiles_hash("CCO"), smiles_hash("CC")]
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_build_hash_array(n_workers: int) -> None:
+    lines = ["C C O", "CC", "CCO", "C(=O)O", "CC", "N"]
+    hashes = build_hash_array(lines, n_workers=n_workers, chunk_size=2)
+
+    assert hashes.tolist() == sorted(
+        {smiles_hash(s) for s in ["CCO", "CC", "C(=O)O", "N"]}
+    )
+    assert build_hash_array([]).tolist() == []
+
+
+def test_overlap_index() -> None:
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["C C O", "CCN"], tmp_dir / "products.txt")
+        dump_list_to_file(["OCC.O", "CC"], tmp_dir / "precursors.txt")
+
+        build_overlap_index(
+            tmp_dir / "index",
+            products_file=tmp_dir / "products.txt",
+            precursors_file=tmp_dir / "precursors.txt",
+            canonicalize=True,
+        )
+        index = OverlapIndex(tmp_dir / "index")
+
+        assert index.kinds == ["products", "precursors"]
+        assert index.contains("products", ["CCO", "CCN", "CCC"]).tolist() == [
+            True,
+            True,
+            False,
+        ]
+        # Canonicalized, with sorted molecules
+        assert index.labels("precursors", ["CCO.O", "OCC.O", "CC"]) == [
+            SEEN_LABEL,
+            NOVEL_LABEL,
+            SEEN_LABEL,
+        ]
+
+        with pytest.raises(ValueError):
+            build_overlap_index(tmp_dir / "other")
+
+
+def test_evaluate_metrics_with_overlap_index() -> None:
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["CCO", "CCN"], tmp_dir / "train_products.txt")
+        build_overlap_index(
+            tmp_dir / "index", products_file=tmp_dir / "train_products.txt"
+        )
+
+        results_dir = tmp_dir / "results"
+        results_dir.mkdir()
+        files = RetroFiles(results_dir)
+        dump_list_to_file(["CCO", "CCC", "CCN"], files.gt_src)
+        dump_list_to_file(["CC.O", "CC.C", "CC.N"], files.gt_tgt)
+        dump_list_to_file(["CC.O", "C", "CC.N"], files.predicted_canonical)
+        dump_list_to_file(["CCO", "C", "CCN"], files.predicted_products_canonical)
+
+        evaluate_metrics(
+            "retro",
+            results_dir,
+            options=EvaluationOptions(overlap_index_dir=tmp_dir / "index"),
+        )
+
+        with open(files.metrics_file, "rt") as f:
+            overlap = json.load(f)["train-overlap"]
+
+    assert list(overlap) == ["products"]
+    assert overlap["products"]["seen"]["count"] == 2
+    assert overlap["products"]["seen"]["accuracy"] == {"1": 1.0}
+    assert overlap["products"]["novel"]["count"] == 1
+    assert overlap["products"]["novel"]["accuracy"] == {"1": 0.0}
+
+
+def test_evaluate_context_metrics_with_overlap_index() -> None:
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["CCOC(C)=O.O"], tmp_dir / "train_products.txt")
+        dump_list_to_file(["CC(=O)O.CCO", "CC.O"], tmp_dir / "train_precursors.txt")
+        build_overlap_index(
+            tmp_dir / "index",
+            products_file=tmp_dir / "train_products.txt",
+            precursors_file=tmp_dir / "train_precursors.txt",
+        )
+
+        results_dir = tmp_dir / "results"
+        results_dir.mkdir()
+        files = ContextFiles(results_dir)
+        # Reactants (and products) not in sorted order in the reactions
+        dump_list_to_file(["CCO.CC(=O)O>>O.CCOC(C)=O", "CCN>>CC"], files.gt_src)
+        dump_list_to_file(["CCO.CC(=O)O>>O.CCOC(C)=O", "CCN>>CC"], files.gt_tgt)
+        dump_list_to_file(
+            ["CC(=O)O.CCO>>CCOC(C)=O.O", "CCN>>CC"], files.predicted_canonical
+        )
+
+        evaluate_metrics(
+            "context",
+            results_dir,
+            options=EvaluationOptions(overlap_index_dir=tmp_dir / "index"),
+        )
+
+        with open(files.metrics_file, "rt") as f:
+            overlap = json.load(f)["train-overlap"]
+
+    for kind in ["products", "precursors"]:
+        assert overlap[kind]["seen"]["count"] == 1
+        assert overlap[kind]["novel"]["count"] == 1
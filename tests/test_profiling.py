@@ -0,0 +1,67 @@
+import pstats
+import time
+
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.profiling import (
+    PROFILE_ENV_VAR,
+    PROFILE_INTERVAL_ENV_VAR,
+    PROFILE_STAGES_ENV_VAR,
+    profiled,
+)
+from rxn.metrics.run_metrics import evaluate_metrics
+
+
+def busy_wait(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_profiling_is_off_by_default(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv(PROFILE_ENV_VAR, raising=False)
+    with named_temporary_directory() as tmp_dir:
+        with profiled("stage", directory=tmp_dir):
+            pass
+        assert list(tmp_dir.iterdir()) == []
+
+
+def test_cprofile_of_evaluation(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(PROFILE_ENV_VAR, "cprofile")
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["A.B", "C.D"], tmp_dir / "gt_src.txt")
+        dump_list_to_file(["A.B>>C", "D>>E"], tmp_dir / "gt_tgt.txt")
+        dump_list_to_file(
+            ["A.B>>C", "D>>F"], tmp_dir / "predicted_context_canonical.txt"
+        )
+
+        evaluate_metrics("context", tmp_dir)
+
+        profiles = sorted(p.name for p in (tmp_dir / "profiles").iterdir())
+        # identical_fractions (profiled as fraction_of_identical_compounds) is
+        # nested in get_metrics
+        assert profiles == ["evaluation_loading.pstats", "get_metrics.pstats"]
+        stats = pstats.Stats(str(tmp_dir / "profiles" / "get_metrics.pstats"))
+        functions = {name for _, _, name in stats.stats}  # type: ignore[attr-defined]
+        assert "identical_fractions" in functions
+
+
+def test_sampling_profiler(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(PROFILE_ENV_VAR, "sample")
+    monkeypatch.setenv(PROFILE_INTERVAL_ENV_VAR, "0.001")
+    monkeypatch.setenv(PROFILE_STAGES_ENV_VAR, "busy")
+    with named_temporary_directory() as tmp_dir:
+        with profiled("busy", directory=tmp_dir):
+            busy_wait(0.1)
+        with profiled("other", directory=tmp_dir):
+            busy_wait(0.01)
+
+        assert [p.name for p in tmp_dir.iterdir()] == ["busy.collapsed"]
+        with open(tmp_dir / "busy.collapsed", "rt") as f:
+            lines = f.read().splitlines()
+        stacks = [line.rsplit(" ", 1) for line in lines]
+        assert sum(int(count) for _, count in stacks) > 0
+        assert any(
+            stack.endswith("busy_wait (test_profiling.py)") for stack, _ in stacks
+        )
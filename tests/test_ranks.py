@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.metrics_files import ForwardFiles
+from rxn.metrics.ranks import (
+    NO_HIT,
+    first_hit_ranks,
+    first_hit_ranks_from_predictions,
+    hit_at_k,
+    hits_from_ranks,
+    load_first_hit_ranks,
+    rank_metrics,
+    reciprocal_ranks,
+    save_first_hit_ranks,
+    top_n_from_ranks,
+)
+from rxn.metrics.run_metrics import evaluate_metrics
+
+
+def test_first_hit_ranks() -> None:
+    matches = np.array(
+        [[False, True, True], [False, False, False], [True, False, True]]
+    )
+    ranks = first_hit_ranks(matches)
+    assert ranks.dtype == np.int16
+    assert ranks.tolist() == [1, NO_HIT, 0]
+
+    ranks = first_hit_ranks_from_predictions(["A", "B"], ["X", "A", "A", "Y", "Z", "W"])
+    assert ranks.tolist() == [1, NO_HIT]
+
+
+def test_top_n_from_ranks_matches_loop() -> None:
+    rng = np.random.default_rng(0)
+    matches = rng.random((100, 5)) < 0.2
+    multiplier = matches.shape[1]
+
+    top_n = top_n_from_ranks(first_hit_ranks(matches), multiplier)
+
+    for n in range(1, multiplier + 1):
+        assert top_n[n] == pytest.approx(matches[:, :n].any(axis=1).mean())
+
+
+def test_rank_metrics() -> None:
+    ranks = np.array([0, 1, NO_HIT, 3], dtype=np.int16)
+
+    metrics = rank_metrics(ranks, ks=[1, 2, 10])
+
+    assert metrics["mrr"] == pytest.approx((1 + 1 / 2 + 0 + 1 / 4) / 4)
+    assert metrics["mean-rank"] == pytest.approx((1 + 2 + 4) / 3)
+    assert metrics["median-rank"] == 2.0
+    assert metrics["hit@1"] == 0.25
+    assert metrics["hit@2"] == 0.5
+    assert metrics["hit@10"] == 0.75
+    assert hit_at_k(ranks, 4) == 0.75
+
+    no_hit = rank_metrics(np.array([NO_HIT, NO_HIT], dtype=np.int16))
+    assert no_hit == {"mrr": 0.0, "mean-rank": None, "median-rank": None}
+
+
+def test_save_and_load_first_hit_ranks() -> None:
+    ranks = {
+        "precursors": np.array([0, NO_HIT], dtype=np.int16),
+        "products": np.array([2, 1], dtype=np.int16),
+    }
+    with named_temporary_directory() as tmp_dir:
+        save_first_hit_ranks(tmp_dir / "ranks.npz", ranks)
+        loaded = load_first_hit_ranks(tmp_dir / "ranks.npz")
+
+    assert set(loaded) == set(ranks)
+    for family, values in ranks.items():
+        assert loaded[family].dtype == np.int16
+        assert loaded[family].tolist() == values.tolist()
+
+
+def test_evaluate_metrics_saves_first_hit_ranks() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = ForwardFiles(tmp_dir)
+        dump_list_to_file(["C.O", "N.O"], files.gt_src)
+        dump_list_to_file(["CO", "NO"], files.gt_tgt)
+        dump_list_to_file(["C", "CO", "N", "O"], files.predicted_canonical)
+
+        evaluate_metrics("forward", tmp_dir)
+
+        ranks = load_first_hit_ranks(files.first_hit_ranks_file)
+        assert ranks["products"].tolist() == [1, NO_HIT]
+        assert files.first_hit_ranks_file not in files.text_files()
+
+
+def test_per_sample_values_from_ranks() -> None:
+    ranks = np.array([1, NO_HIT, 0, 2], dtype=np.int16)
+
+    hits = hits_from_ranks(ranks, 3)
+    assert hits.tolist() == [
+        [False, True, True],
+        [False, False, False],
+        [True, True, True],
+        [False, False, True],
+    ]
+    assert dict(enumerate(hits.mean(axis=0), 1)) == top_n_from_ranks(ranks, 3)
+
+    reciprocal = reciprocal_ranks(ranks)
+    assert reciprocal.tolist() == pytest.approx([0.5, 0.0, 1.0, 1 / 3])
+    assert reciprocal.mean() == pytest.approx(rank_metrics(ranks)["mrr"])
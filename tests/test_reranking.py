@@ -0,0 +1,119 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.metrics_files import RetroFiles
+from rxn.metrics.reranking import (
+    Reranker,
+    RerankingWeights,
+    best_weights,
+    rerank_retro_results,
+    weights_grid,
+)
+from rxn.metrics.retro_metrics import RetroMetrics
+
+
+def _write_results(directory: Path, with_forward_log_probs: bool = True) -> None:
+    dump_list_to_file(["P1", "P2"], directory / "gt_products.txt")
+    dump_list_to_file(["R1", "R2"], directory / "gt_precursors.txt")
+    dump_list_to_file(
+        ["X", "R1", "R2", "Y"], directory / "predicted_precursors_canonical.txt"
+    )
+    dump_list_to_file(
+        ["Z", "P1", "P2", "P2"], directory / "predicted_products_canonical.txt"
+    )
+    dump_list_to_file(
+        ["-0.1", "-0.5", "-0.2", "-1.0"],
+        directory / "predicted_precursors.txt.tokenized_log_probs",
+    )
+    if with_forward_log_probs:
+        dump_list_to_file(
+            ["-3.0", "-0.1", "-0.1", "-0.2"],
+            directory / "predicted_products.txt.tokenized_log_probs",
+        )
+
+
+def test_weights_grid() -> None:
+    grid = weights_grid(retro=[1.0], forward=[0.0, 0.5], round_trip=[0.0, 1.0])
+    assert [weights.as_dict() for weights in grid] == [
+        {"retro": 1.0, "forward": 0.0, "round_trip": 0.0},
+        {"retro": 1.0, "forward": 0.0, "round_trip": 1.0},
+        {"retro": 1.0, "forward": 0.5, "round_trip": 0.0},
+        {"retro": 1.0, "forward": 0.5, "round_trip": 1.0},
+    ]
+
+
+def test_retro_weights_only_reproduce_the_metrics() -> None:
+    with named_temporary_directory() as tmp_dir:
+        _write_results(tmp_dir)
+        retro_metrics = RetroMetrics.from_metrics_files(RetroFiles(tmp_dir))
+        result = Reranker.from_retro_metrics(retro_metrics).evaluate(RerankingWeights())
+        metrics = retro_metrics.get_metrics()
+
+    for key in ["accuracy", "round-trip", "coverage"]:
+        assert result[key] == pytest.approx(metrics[key])
+
+
+def test_reranking() -> None:
+    accuracy_matches = np.array([[False, True], [True, False]])
+    round_trip_matches = np.array([[False, True], [True, True]])
+    retro_log_probs = np.array([[-0.1, -0.5], [-0.2, -1.0]])
+    forward_log_probs = np.array([[-3.0, -0.1], [-0.1, -0.2]])
+    reranker = Reranker(
+        accuracy_matches, round_trip_matches, retro_log_probs, forward_log_probs
+    )
+
+    # Original order
+    result = reranker.evaluate(RerankingWeights(retro=1.0))
+    assert result["accuracy"] == {1: 0.5, 2: 1.0}
+    assert result["round-trip"] == {1: 0.5, 2: 0.75}
+    assert result["coverage"] == {1: 0.5, 2: 1.0}
+
+    # The round-trip success moves the correct prediction of the first sample up
+    for weights in [
+        RerankingWeights(retro=1.0, round_trip=1.0),
+        RerankingWeights(retro=1.0, forward=1.0),
+    ]:
+        result = reranker.evaluate(weights)
+        assert result["accuracy"] == {1: 1.0, 2: 1.0}
+        assert result["round-trip"] == {1: 1.0, 2: 0.75}
+        assert result["coverage"] == {1: 1.0, 2: 1.0}
+
+    # Ties keep the beam order
+    assert reranker.order(RerankingWeights(retro=0.0)).tolist() == [[0, 1], [0, 1]]
+
+    results = reranker.sweep(
+        weights_grid(retro=[1.0], forward=[0.0], round_trip=[0.0, 1.0])
+    )
+    assert best_weights(results)["weights"]["round_trip"] == 1.0
+
+
+def test_forward_weight_requires_forward_log_probs() -> None:
+    reranker = Reranker(
+        np.array([[True]]), np.array([[True]]), retro_log_probs=np.array([[-0.1]])
+    )
+    reranker.evaluate(RerankingWeights(round_trip=1.0))
+    with pytest.raises(ValueError):
+        reranker.evaluate(RerankingWeights(forward=1.0))
+
+
+def test_rerank_retro_results() -> None:
+    with named_temporary_directory() as tmp_dir:
+        _write_results(tmp_dir)
+        output_file = tmp_dir / "reranking.json"
+
+        report = rerank_retro_results(
+            tmp_dir,
+            weights_grid(retro=[1.0], forward=[0.0, 1.0], round_trip=[0.0]),
+            output_file=output_file,
+        )
+
+        with open(output_file, "rt") as f:
+            saved = json.load(f)
+
+    assert len(saved["results"]) == 2
+    assert saved["best"]["weights"] == {"retro": 1.0, "forward": 1.0, "round_trip": 0.0}
+    assert report["best"]["accuracy"][1] == 1.0
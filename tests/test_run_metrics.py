@@ -0,0 +1,141 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics import context_metrics, stratification
+from rxn.metrics.context_metrics import context_compound_groups
+from rxn.metrics.evaluation_options import EvaluationOptions
+from rxn.metrics.ground_truth import GroundTruth
+from rxn.metrics.metrics_files import ContextFiles
+from rxn.metrics.run_metrics import (
+    evaluate_metrics,
+    evaluate_metrics_for_directories,
+    group_by_ground_truth,
+    prepare_derived_data,
+)
+from rxn.metrics.stratification import stratum_labels
+
+
+def create_forward_dir(
+    directory: Path, gt_products: List[str], predictions: List[str]
+) -> None:
+    directory.mkdir()
+    dump_list_to_file(["C.O"] * len(gt_products), directory / "gt_precursors.txt")
+    dump_list_to_file(gt_products, directory / "gt_products.txt")
+    dump_list_to_file(predictions, directory / "predicted_products_canonical.txt")
+
+
+def load_metrics(directory: Path) -> Dict[str, Any]:
+    with open(directory / "metrics.json", "rt") as f:
+        metrics: Dict[str, Any] = json.load(f)
+    return metrics
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_evaluate_metrics_for_directories(n_workers: int) -> None:
+    with named_temporary_directory() as tmp_dir:
+        gt = ["CO", "CCO", "CCCO"]
+        create_forward_dir(tmp_dir / "a", gt, ["CO", "C", "C", "C", "CCCO", "C"])
+        create_forward_dir(tmp_dir / "b", gt, ["C", "CO", "CCO", "C", "C", "C"])
+        create_forward_dir(tmp_dir / "c", ["CO", "CCO"], ["CO", "C"])
+        directories = [tmp_dir / name for name in ["a", "b", "c"]]
+
+        groups = group_by_ground_truth("forward", directories)
+        assert sorted(groups.values()) == [directories[:2], directories[2:]]
+
+        evaluate_metrics_for_directories("forward", directories, n_workers)
+
+        assert load_metrics(tmp_dir / "a") == {
+            "accuracy": {"1": 2 / 3, "2": 2 / 3},
+            "rank": {"mrr": 2 / 3, "mean-rank": 1.0, "median-rank": 1.0},
+            "accuracy-filtered": {"1": 2 / 3, "2": 2 / 3},
+            "invalid-rate": {"1": 0.0, "2": 0.0},
+            "duplicate-rate": {"1": 0.0, "2": 1 / 3},
+        }
+        assert load_metrics(tmp_dir / "b") == {
+            "accuracy": {"1": 1 / 3, "2": 2 / 3},
+            "rank": {"mrr": 0.5, "mean-rank": 1.5, "median-rank": 1.5},
+            "accuracy-filtered": {"1": 1 / 3, "2": 2 / 3},
+            "invalid-rate": {"1": 0.0, "2": 0.0},
+            "duplicate-rate": {"1": 0.0, "2": 1 / 3},
+        }
+        assert load_metrics(tmp_dir / "c") == {
+            "accuracy": {"1": 0.5},
+            "rank": {"mrr": 0.5, "mean-rank": 1.0, "median-rank": 1.0},
+            "accuracy-filtered": {"1": 0.5},
+            "invalid-rate": {"1": 0.0},
+            "duplicate-rate": {"1": 0.0},
+        }
+
+        # Same as evaluating them one by one
+        for directory in directories:
+            batch_metrics = load_metrics(directory)
+            evaluate_metrics("forward", directory)
+            assert load_metrics(directory) == batch_metrics
+
+
+def test_evaluate_metrics_with_hit_at_k() -> None:
+    with named_temporary_directory() as tmp_dir:
+        directory = tmp_dir / "forward"
+        create_forward_dir(directory, ["CC", "CO"], ["X", "CC", "X", "X"])
+
+        evaluate_metrics(
+            "forward", directory, options=EvaluationOptions(hit_at=[1, 2, 50])
+        )
+
+        assert load_metrics(directory)["hit-at-k"] == {
+            "products": {"hit@1": 0.0, "hit@2": 0.5, "hit@50": 0.5}
+        }
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_evaluate_metrics_for_directories_with_options(n_workers: int) -> None:
+    options = EvaluationOptions(hit_at=[2], n_bootstrap=50, confidence_level=0.9)
+    with named_temporary_directory() as tmp_dir:
+        gt = ["CO", "CCO", "CCCO"]
+        create_forward_dir(tmp_dir / "a", gt, ["CO", "C", "C", "C", "CCCO", "C"])
+        create_forward_dir(tmp_dir / "b", gt, ["C", "CO", "CCO", "C", "C", "C"])
+        directories = [tmp_dir / "a", tmp_dir / "b"]
+
+        evaluate_metrics_for_directories(
+            "forward", directories, n_workers, options=options
+        )
+
+        for directory in directories:
+            batch_metrics = load_metrics(directory)
+            assert "hit-at-k" in batch_metrics
+            assert "confidence-intervals" in batch_metrics
+            evaluate_metrics("forward", directory, options=options)
+            assert load_metrics(directory) == batch_metrics
+
+
+def test_prepare_derived_data(monkeypatch: pytest.MonkeyPatch) -> None:
+    def fail(value: str) -> Any:
+        raise AssertionError(f"Not prepared: {value}")
+
+    with named_temporary_directory() as tmp_dir:
+        files = ContextFiles(tmp_dir)
+        dump_list_to_file(["CC.O>>CCO", "C.N>>CN"], files.gt_src)
+        dump_list_to_file(["CC.O>O>CCO", "C.N>>CN"], files.gt_tgt)
+        ground_truth = GroundTruth.from_metrics_files(files)
+
+        prepare_derived_data(
+            "context", files, ground_truth, EvaluationOptions(with_strata=True)
+        )
+
+        # Not computed again for the evaluation
+        monkeypatch.setattr(context_metrics, "compound_groups", fail)
+        monkeypatch.setattr(stratification, "heavy_atom_label", fail)
+        monkeypatch.setattr(stratification, "input_length_label", fail)
+        assert context_compound_groups(ground_truth)[0] == [
+            ["CC", "O"],
+            ["O"],
+            ["CCO"],
+        ]
+        assert stratum_labels("context", files, ground_truth)["n-precursors"] == [
+            "3",
+            "2",
+        ]
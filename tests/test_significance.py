@@ -0,0 +1,159 @@
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.forward_metrics import ForwardMetrics
+from rxn.metrics.ground_truth import GroundTruth
+from rxn.metrics.metrics_files import ForwardFiles
+from rxn.metrics.significance import (
+    compare_per_sample_metrics,
+    compare_per_sample_values,
+    compare_results_directories,
+    mcnemar_p_value,
+)
+
+
+def test_mcnemar_p_value() -> None:
+    assert mcnemar_p_value(0, 0) == 1.0
+    assert mcnemar_p_value(4, 4) == 1.0
+    # Exact binomial test: 2 * (1 + 13 + 78 + 286) / 2**13
+    assert mcnemar_p_value(3, 10) == pytest.approx(756 / 8192)
+    assert mcnemar_p_value(10, 3) == mcnemar_p_value(3, 10)
+    # Chi-squared approximation: statistic (|30 - 50| - 1)**2 / 80 = 4.5125
+    assert mcnemar_p_value(30, 50) == pytest.approx(0.033645, rel=1e-4)
+
+
+def test_compare_per_sample_values() -> None:
+    rng = np.random.default_rng(0)
+    a = rng.random((400, 2)) < 0.5
+    b = a.copy()
+    b[:60, 0] = True  # b is clearly better for n=1
+
+    comparison = compare_per_sample_values(a, b, n_resamples=500)
+
+    assert list(comparison) == [1, 2]
+    first = comparison[1]
+    assert first["a"] == pytest.approx(a[:, 0].mean())
+    assert first["delta"] == pytest.approx(b[:, 0].mean() - a[:, 0].mean())
+    assert 0 < first["delta-low"] < first["delta"] < first["delta-high"]
+    assert first["bootstrap-p-value"] < 0.01
+    assert first["mcnemar-p-value"] < 0.01
+
+    # Identical values for n=2
+    assert comparison[2]["delta"] == 0.0
+    assert comparison[2]["bootstrap-p-value"] == 1.0
+    assert comparison[2]["mcnemar-p-value"] == 1.0
+
+
+def test_compare_per_sample_values_non_binary() -> None:
+    a = np.array([[1.0, 0.5], [0.0, 0.5], [1.0, 1.0]])
+    b = np.array([[1.0, 1.0], [1.0, 0.5], [0.0, 0.0]])
+    comparison = compare_per_sample_values(a, b, n_resamples=50)
+    assert comparison[1]["mcnemar-p-value"] is not None
+    assert comparison[2]["mcnemar-p-value"] is None
+
+    with pytest.raises(ValueError):
+        compare_per_sample_values(a, b[:2])
+
+
+def test_compare_per_sample_metrics() -> None:
+    a = {"accuracy": np.array([[True], [False]]), "mrr": np.array([1.0, 0.0])}
+    b = {"accuracy": np.array([[True], [True]]), "mrr": np.array([1.0, 0.5])}
+    comparison = compare_per_sample_metrics(
+        a, b, metrics=["accuracy", "mrr", "coverage"], n_resamples=10
+    )
+    assert list(comparison) == ["accuracy", "mrr"]
+    assert comparison["mrr"][1]["delta"] == 0.25
+
+
+def _write_forward_dir(directory: Path, gt: List[str], predictions: List[str]) -> None:
+    directory.mkdir()
+    files = ForwardFiles(directory)
+    dump_list_to_file([f"src{i}" for i in range(len(gt))], files.gt_src)
+    dump_list_to_file(gt, files.gt_tgt)
+    dump_list_to_file(predictions, files.predicted_canonical)
+
+
+def test_compare_results_directories(monkeypatch: pytest.MonkeyPatch) -> None:
+    loaded = []
+    original_from_metrics_files = GroundTruth.from_metrics_files.__func__  # type: ignore[attr-defined]
+
+    def counting_from_metrics_files(cls, *args, **kwargs):  # type: ignore[no-untyped-def]
+        loaded.append(args)
+        return original_from_metrics_files(cls, *args, **kwargs)
+
+    monkeypatch.setattr(
+        GroundTruth, "from_metrics_files", classmethod(counting_from_metrics_files)
+    )
+
+    with named_temporary_directory() as tmp_dir:
+        gt = ["A", "B", "C", "D"]
+        _write_forward_dir(
+            tmp_dir / "base", gt, ["A", "X", "X", "B", "X", "X", "X", "X"]
+        )
+        _write_forward_dir(tmp_dir / "m1", gt, ["A", "X", "B", "X", "C", "X", "X", "D"])
+        _write_forward_dir(tmp_dir / "m2", gt, ["A", "X", "X", "B", "X", "X", "X", "X"])
+
+        results = compare_results_directories(
+            "forward",
+            [(tmp_dir / "base", tmp_dir / "m1"), (tmp_dir / "base", tmp_dir / "m2")],
+            n_resamples=100,
+        )
+
+        assert len(loaded) == 1
+        assert [r["b"] for r in results] == [str(tmp_dir / "m1"), str(tmp_dir / "m2")]
+        assert list(results[0]["metrics"]) == ["accuracy"]
+        assert results[0]["metrics"]["accuracy"][1]["delta"] == 0.5
+        assert results[0]["metrics"]["accuracy"][2]["delta"] == 0.5
+        assert results[1]["metrics"]["accuracy"][2]["delta"] == 0.0
+
+        # Different ground truth
+        _write_forward_dir(tmp_dir / "other", ["A", "B", "C", "E"], ["A"] * 8)
+        with pytest.raises(ValueError):
+            compare_results_directories(
+                "forward", [(tmp_dir / "base", tmp_dir / "other")]
+            )
+
+
+def test_compare_results_directories_computes_the_metrics_once(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    computed = []
+    original_per_sample_metrics = ForwardMetrics.per_sample_metrics
+
+    def recording_per_sample_metrics(self, names=None):  # type: ignore[no-untyped-def]
+        per_sample = original_per_sample_metrics(self, names)
+        computed.append(sorted(per_sample))
+        return per_sample
+
+    monkeypatch.setattr(
+        ForwardMetrics, "per_sample_metrics", recording_per_sample_metrics
+    )
+
+    with named_temporary_directory() as tmp_dir:
+        gt = ["A", "B"]
+        for name in ["base", "m1", "m2"]:
+            _write_forward_dir(tmp_dir / name, gt, ["A", "X", "X", "B"])
+
+        compare_results_directories(
+            "forward",
+            [(tmp_dir / "base", tmp_dir / "m1"), (tmp_dir / "base", tmp_dir / "m2")],
+            metrics=["accuracy", "rank.mrr"],
+            n_resamples=10,
+        )
+
+    # Once per directory, and only the compared metrics
+    assert computed == [["accuracy", "rank.mrr"]] * 3
+
+
+def test_per_sample_metrics_with_names() -> None:
+    calculator = ForwardMetrics(["A", "B"], ["A", "X", "X", "B"])
+
+    per_sample = calculator.per_sample_metrics(names=["accuracy", "unknown"])
+
+    assert list(per_sample) == ["accuracy"]
+    # The beams are not filtered for the accuracy
+    assert calculator._filtered_beams is None
@@ -0,0 +1,131 @@
+import json
+
+import numpy as np
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.evaluation_options import EvaluationOptions
+from rxn.metrics.metrics_files import RetroFiles
+from rxn.metrics.run_metrics import evaluate_metrics
+from rxn.metrics.stratification import (
+    INVALID_LABEL,
+    bin_label,
+    grouped_means,
+    heavy_atom_label,
+    input_length_label,
+    n_precursors_label,
+    stratified_metrics,
+)
+
+
+def test_labels() -> None:
+    bins = [0, 10, 20]
+    assert bin_label(0, bins) == "0-9"
+    assert bin_label(9, bins) == "0-9"
+    assert bin_label(10, bins) == "10-19"
+    assert bin_label(250, bins) == "20+"
+    assert bin_label(-1, bins) == INVALID_LABEL
+
+    assert heavy_atom_label("CCO") == "0-9"
+    assert heavy_atom_label("CCCCCCCCCC.O") == "10-19"
+    assert heavy_atom_label("invalid") == INVALID_LABEL
+    assert heavy_atom_label("") == INVALID_LABEL
+
+    assert input_length_label("CC(=O)O") == "0-24"
+    assert input_length_label("C" * 30) == "25-49"
+
+    assert n_precursors_label("CC.O") == "2"
+    assert n_precursors_label("C.C.C.C.C.C") == "5+"
+    assert n_precursors_label("") == INVALID_LABEL
+
+
+def test_grouped_means() -> None:
+    codes = np.array([0, 1, 0, 2, 0])
+    values = np.array([[1, 1], [0, 1], [0, 0], [1, 1], [0, 1]], dtype=bool)
+
+    means, counts = grouped_means(codes, 4, values)
+
+    assert counts.tolist() == [3, 1, 1, 0]
+    np.testing.assert_allclose(means[:3], np.array([[1 / 3, 2 / 3], [0, 1], [1, 1]]))
+    assert np.isnan(means[3]).all()
+
+    means, _ = grouped_means(codes, 3, np.arange(5.0))
+    assert means.tolist() == [2.0, 1.0, 3.0]
+
+
+def test_stratified_metrics() -> None:
+    labels = {"size": ["10-19", "0-9", "10-19", "invalid", "100+"]}
+    per_sample = {
+        "accuracy": np.array([[0, 1], [1, 1], [1, 1], [0, 0], [0, 0]], dtype=bool),
+        "mrr": np.array([0.5, 1.0, 1.0, 0.0, 0.0]),
+    }
+
+    strata = stratified_metrics(labels, per_sample)["size"]
+
+    assert list(strata) == ["0-9", "10-19", "100+", "invalid"]
+    assert strata["10-19"] == {
+        "count": 2,
+        "accuracy": {1: 0.5, 2: 1.0},
+        "mrr": 0.75,
+    }
+    assert strata["0-9"]["accuracy"] == {1: 1.0, 2: 1.0}
+
+
+def test_evaluate_metrics_with_strata() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        dump_list_to_file(["CCO", "CCCCCCCCCCCC", "CCN"], files.gt_src)
+        dump_list_to_file(["CC.O", "CCCCCC.CCCCCC", "C.C.N"], files.gt_tgt)
+        dump_list_to_file(
+            ["CC.O", "C", "C", "CCCCCC.CCCCCC", "C.C.N", "C"],
+            files.predicted_canonical,
+        )
+        dump_list_to_file(
+            ["CCO", "C", "C", "CCCCCCCCCCCC", "CCN", "C"],
+            files.predicted_products_canonical,
+        )
+        dump_list_to_file(["1.2.3", "2.1", "1.5"], files.gt_classes)
+        cache_dir = tmp_dir / "gt_cache"
+
+        evaluate_metrics(
+            "retro",
+            tmp_dir,
+            options=EvaluationOptions(gt_cache_dir=cache_dir, with_strata=True),
+        )
+
+        with open(files.metrics_file, "rt") as f:
+            strata = json.load(f)["strata"]
+        # The labels computed with RDKit are stored with the ground truth
+        (entry,) = cache_dir.iterdir()
+        assert (entry / "strata_retro_product_heavy_atoms_v1.valid.npy").exists()
+
+    assert list(strata) == [
+        "reaction-class",
+        "product-heavy-atoms",
+        "input-length",
+        "n-precursors",
+    ]
+    assert strata["reaction-class"]["1"]["count"] == 2
+    assert strata["reaction-class"]["1"]["accuracy"] == {"1": 1.0, "2": 1.0}
+    assert strata["reaction-class"]["2"]["accuracy"] == {"1": 0.0, "2": 1.0}
+    assert strata["product-heavy-atoms"]["10-19"]["count"] == 1
+    assert strata["n-precursors"]["2"]["count"] == 2
+    assert strata["n-precursors"]["3"]["round-trip"] == {"1": 1.0, "2": 0.5}
+
+
+def test_evaluate_metrics_with_invalid_class_file() -> None:
+    with named_temporary_directory() as tmp_dir:
+        files = RetroFiles(tmp_dir)
+        for filename in [
+            files.gt_src,
+            files.gt_tgt,
+            files.predicted_canonical,
+            files.predicted_products_canonical,
+        ]:
+            dump_list_to_file(["CCO", "CC"], filename)
+        dump_list_to_file(["1"], files.gt_classes)
+
+        with pytest.raises(ValueError):
+            evaluate_metrics(
+                "retro", tmp_dir, options=EvaluationOptions(with_strata=True)
+            )
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from rxn.utilities.files import dump_list_to_file, named_temporary_directory
+
+from rxn.metrics.run_metrics import evaluate_metrics
+from rxn.metrics.scripts.parse_metrics_into_csv import get_metric_from_dir
+from rxn.metrics.timing import StageTimer, load_timings
+
+
+def test_stage_timer() -> None:
+    with named_temporary_directory() as tmp_dir:
+        timer = StageTimer(tmp_dir / "timings.json")
+        output = tmp_dir / "out.txt"
+
+        with timer.stage("first", lines_of=output):
+            dump_list_to_file(["A", "B", "C"], output)
+        with timer.stage("second"):
+            pass
+
+        timings = load_timings(tmp_dir / "timings.json")
+        assert list(timings) == ["first", "second"]
+        assert timings["first"]["n_lines"] == 3
+        assert timings["first"]["wall_time_s"] >= 0
+        assert "n_lines" not in timings["second"]
+
+
+def test_stage_timer_memory() -> None:
+    pytest.importorskip("resource")
+    with named_temporary_directory() as tmp_dir:
+        timer = StageTimer(tmp_dir / "timings.json")
+
+        with timer.stage("large"):
+            data = bytearray(50_000_000)
+            data[::4096] = b"x" * len(data[::4096])
+            del data
+        with timer.stage("small"):
+            pass
+
+        timings = load_timings(tmp_dir / "timings.json")
+        # Process-wide high-water mark, not raised during the second stage
+        large, small = timings["large"], timings["small"]
+        assert small["process_peak_rss_mb"] == large["process_peak_rss_mb"]
+        assert large["peak_rss_increase_mb"] >= 0
+        assert small["peak_rss_increase_mb"] == 0
+
+
+def test_failed_stage_is_not_recorded() -> None:
+    with named_temporary_directory() as tmp_dir:
+        timer = StageTimer(tmp_dir / "timings.json")
+
+        with pytest.raises(ValueError):
+            with timer.stage("failing"):
+                raise ValueError()
+
+        assert load_timings(tmp_dir / "timings.json") == {}
+
+
+def test_evaluation_timings_are_parsed() -> None:
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["A", "B"], tmp_dir / "gt_precursors.txt")
+        dump_list_to_file(["C", "D"], tmp_dir / "gt_products.txt")
+        dump_list_to_file(["C", "X"], tmp_dir / "predicted_products_canonical.txt")
+        evaluate_metrics("forward", tmp_dir)
+
+        with open(tmp_dir / "metrics.json", "rt") as f:
+            assert "timings" not in json.load(f)
+        results = get_metric_from_dir(tmp_dir, with_timings=True)
+        assert results["timings"]["evaluation_metrics"]["n_lines"] == 2
+        assert "timings" not in get_metric_from_dir(tmp_dir)
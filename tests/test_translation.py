@@ -0,0 +1,164 @@
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+from rxn.utilities.files import (
+    dump_list_to_file,
+    load_list_from_file,
+    named_temporary_directory,
+)
+
+from rxn.metrics.translation import (
+    segment_directory,
+    translate_in_segments,
+    translate_unique_sources,
+    unique_source_directory,
+)
+
+EXPECTED_PREDICTIONS = ["A", "AA", "B", "BB", "C", "CC", "D", "DD", "E", "EE"]
+
+
+class FakeTranslator:
+    """Deterministic translation function, making two predictions per line,
+    and which can be made to fail on a given segment."""
+
+    def __init__(self, fail_on: Optional[str] = None):
+        self.fail_on = fail_on
+        self.translated: List[str] = []
+
+    def __call__(self, src: Path, tgt: Optional[Path], pred: Path) -> None:
+        if src.name == self.fail_on:
+            raise RuntimeError("Simulated crash")
+        self.translated.append(src.name)
+        lines = load_list_from_file(src)
+        dump_list_to_file([p for line in lines for p in [line, line * 2]], pred)
+        dump_list_to_file(
+            [str(-i) for i in range(2 * len(lines))],
+            str(pred) + ".tokenized_log_probs",
+        )
+
+
+def test_translate_in_segments() -> None:
+    with named_temporary_directory() as tmp_dir:
+        src = tmp_dir / "src.txt"
+        pred = tmp_dir / "pred.txt"
+        dump_list_to_file(["A", "B", "C", "D", "E"], src)
+
+        translate_in_segments(src, None, pred, FakeTranslator(), {}, segment_size=2)
+
+        assert load_list_from_file(pred) == EXPECTED_PREDICTIONS
+        assert load_list_from_file(str(pred) + ".tokenized_log_probs") == [
+            "0",
+            "-1",
+            "-2",
+            "-3",
+        ] * 2 + ["0", "-1"]
+        # only the progress manifest is left
+        assert [p.name for p in segment_directory(pred).iterdir()] == ["progress.json"]
+
+
+def test_translate_in_segments_resumes_after_crash() -> None:
+    with named_temporary_directory() as tmp_dir:
+        src = tmp_dir / "src.txt"
+        pred = tmp_dir / "pred.txt"
+        dump_list_to_file(["A", "B", "C", "D", "E"], src)
+
+        with pytest.raises(RuntimeError):
+            translate_in_segments(
+                src, None, pred, FakeTranslator(fail_on="src_1.txt"), {}, 2
+            )
+        assert not pred.exists()
+
+        # The restarted run only translates the remaining segments
+        translator = FakeTranslator()
+        translate_in_segments(src, None, pred, translator, {}, 2)
+        assert translator.translated == ["src_1.txt", "src_2.txt"]
+        assert load_list_from_file(pred) == EXPECTED_PREDICTIONS
+
+        # A completed translation is not run again
+        translator = FakeTranslator()
+        translate_in_segments(src, None, pred, translator, {}, 2)
+        assert translator.translated == []
+
+
+def test_translate_in_segments_refuses_different_settings() -> None:
+    with named_temporary_directory() as tmp_dir:
+        src = tmp_dir / "src.txt"
+        pred = tmp_dir / "pred.txt"
+        dump_list_to_file(["A", "B", "C"], src)
+
+        with pytest.raises(RuntimeError):
+            translate_in_segments(
+                src, None, pred, FakeTranslator("src_1.txt"), {"n_best": 2}, 2
+            )
+        with pytest.raises(RuntimeError, match="different settings"):
+            translate_in_segments(src, None, pred, FakeTranslator(), {"n_best": 3}, 2)
+
+
+def test_translate_in_segments_refuses_different_source() -> None:
+    with named_temporary_directory() as tmp_dir:
+        src = tmp_dir / "src.txt"
+        pred = tmp_dir / "pred.txt"
+        dump_list_to_file(["A", "B", "C"], src)
+        with pytest.raises(RuntimeError):
+            translate_in_segments(src, None, pred, FakeTranslator("src_1.txt"), {}, 2)
+
+        # Same number of lines, but the completed segment is stale
+        dump_list_to_file(["X", "B", "C"], src)
+        with pytest.raises(RuntimeError, match="different settings"):
+            translate_in_segments(src, None, pred, FakeTranslator(), {}, 2)
+
+
+def test_translate_unique_sources() -> None:
+    with named_temporary_directory() as tmp_dir:
+        src = tmp_dir / "src.txt"
+        tgt = tmp_dir / "tgt.txt"
+        pred = tmp_dir / "pred.txt"
+        dump_list_to_file(["B", "A", "B", "C", "A"], src)
+        dump_list_to_file(["b1", "a1", "b2", "c1", "a2"], tgt)
+
+        translator = FakeTranslator()
+        translate_unique_sources(src, tgt, pred, translator, n_best=2)
+
+        # Same output as translating all the lines
+        expected = ["B", "BB", "A", "AA", "B", "BB", "C", "CC", "A", "AA"]
+        assert load_list_from_file(pred) == expected
+        assert load_list_from_file(str(pred) + ".tokenized_log_probs") == [
+            "0",
+            "-1",
+            "-2",
+            "-3",
+            "0",
+            "-1",
+            "-4",
+            "-5",
+            "-2",
+            "-3",
+        ]
+        # Only the distinct lines were translated, with their first target
+        assert translator.translated == ["src.txt"]
+        unique_dir = unique_source_directory(pred)
+        assert load_list_from_file(unique_dir / "src.txt") == ["B", "A", "C"]
+        assert load_list_from_file(unique_dir / "tgt.txt") == ["b1", "a1", "c1"]
+
+
+def test_translate_unique_sources_without_duplicates() -> None:
+    with named_temporary_directory() as tmp_dir:
+        src = tmp_dir / "src.txt"
+        pred = tmp_dir / "pred.txt"
+        dump_list_to_file(["A", "B"], src)
+
+        translate_unique_sources(src, None, pred, FakeTranslator(), n_best=2)
+
+        assert load_list_from_file(pred) == ["A", "AA", "B", "BB"]
+        assert not unique_source_directory(pred).exists()
+
+
+def test_translate_unique_sources_with_unexpected_number_of_predictions() -> None:
+    with named_temporary_directory() as tmp_dir:
+        src = tmp_dir / "src.txt"
+        pred = tmp_dir / "pred.txt"
+        dump_list_to_file(["A", "B", "A"], src)
+
+        with pytest.raises(RuntimeError, match="expected 3 per"):
+            translate_unique_sources(src, None, pred, FakeTranslator(), n_best=3)
@@ -0,0 +1,195 @@
+from typing import List
+
+import pytest
+from rxn.utilities.files import (
+    dump_list_to_file,
+    load_list_from_file,
+    named_temporary_directory,
+)
+
+from rxn.metrics.translation import resumable_rxn_translation
+from rxn.metrics.translators import (
+    TRANSLATOR_ENV_VAR,
+    OnmtTranslator,
+    StandInTranslator,
+    get_translator,
+    use_translator,
+)
+
+
+def test_stand_in_translation_is_deterministic() -> None:
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["CCO", "CCN", "CCC"], tmp_dir / "src.txt")
+        dump_list_to_file(["CC.O", "CC.N", "C.CC"], tmp_dir / "tgt.txt")
+
+        for name in ["pred_1.txt", "pred_2.txt"]:
+            StandInTranslator(top1_rate=1.0).translate(
+                tmp_dir / "src.txt",
+                tmp_dir / "tgt.txt",
+                tmp_dir / name,
+                model="unused",
+                n_best=4,
+                beam_size=4,
+                batch_size=1,
+                gpu=False,
+            )
+
+        predictions = load_list_from_file(tmp_dir / "pred_1.txt")
+        assert predictions == load_list_from_file(tmp_dir / "pred_2.txt")
+        assert len(predictions) == 12
+        # top1_rate=1: the target comes first
+        assert predictions[::4] == ["CC.O", "CC.N", "C.CC"]
+        log_probs = [
+            float(p)
+            for p in load_list_from_file(tmp_dir / "pred_1.txt.tokenized_log_probs")
+        ]
+        assert len(log_probs) == 12
+        assert log_probs[:4] == sorted(log_probs[:4], reverse=True)
+
+
+def test_stand_in_round_trip() -> None:
+    translator = StandInTranslator(top1_rate=1.0, invalid_rate=0.0)
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["CCOC", "CCNC"], tmp_dir / "products.txt")
+        dump_list_to_file(["CC.OC", "CC.NC"], tmp_dir / "precursors.txt")
+        translator.translate(
+            tmp_dir / "products.txt",
+            tmp_dir / "precursors.txt",
+            tmp_dir / "retro.txt",
+            model="unused",
+            n_best=2,
+            beam_size=2,
+            batch_size=1,
+            gpu=False,
+        )
+        # Reordered molecules, as after canonicalization
+        dump_list_to_file(["OC.CC", "NC.CC"], tmp_dir / "retro_canonical.txt")
+        translator.translate(
+            tmp_dir / "retro_canonical.txt",
+            None,
+            tmp_dir / "forward.txt",
+            model="unused",
+            n_best=1,
+            beam_size=1,
+            batch_size=1,
+            gpu=False,
+        )
+
+        assert load_list_from_file(tmp_dir / "forward.txt") == ["CCOC", "CCNC"]
+
+        # A new round trip forgets the predictions of the previous one
+        translator.translate(
+            tmp_dir / "products.txt",
+            tmp_dir / "precursors.txt",
+            tmp_dir / "retro.txt",
+            model="unused",
+            n_best=2,
+            beam_size=2,
+            batch_size=1,
+            gpu=False,
+        )
+        assert len(translator._origins) <= 4
+
+
+def test_stand_in_miss_rate() -> None:
+    targets = ["CC.OC", "CC.NC", "CCC.OCC", "CN.CC"]
+
+    def beams(translator: StandInTranslator) -> List[List[str]]:
+        with named_temporary_directory() as tmp_dir:
+            dump_list_to_file(["CCOC", "CCNC", "CCCOCC", "CNCC"], tmp_dir / "src.txt")
+            dump_list_to_file(targets, tmp_dir / "tgt.txt")
+            translator.translate(
+                tmp_dir / "src.txt",
+                tmp_dir / "tgt.txt",
+                tmp_dir / "pred.txt",
+                model="unused",
+                n_best=3,
+                beam_size=3,
+                batch_size=1,
+                gpu=False,
+            )
+            predictions = load_list_from_file(tmp_dir / "pred.txt")
+        return [predictions[i * 3 : (i + 1) * 3] for i in range(len(targets))]
+
+    # Without misses, the target is at a later position of every beam
+    for target, beam in zip(
+        targets, beams(StandInTranslator(top1_rate=0.0, miss_rate=0.0))
+    ):
+        assert beam[0] != target
+        assert target in beam[1:]
+
+    for target, beam in zip(
+        targets, beams(StandInTranslator(top1_rate=0.0, miss_rate=1.0))
+    ):
+        assert target not in beam
+
+
+def test_resumable_translation_uses_translator() -> None:
+    with named_temporary_directory() as tmp_dir:
+        dump_list_to_file(["CCO", "CCN", "CCC"], tmp_dir / "src.txt")
+        dump_list_to_file(["CC.O", "CC.N", "C.CC"], tmp_dir / "tgt.txt")
+
+        with use_translator(StandInTranslator(top1_rate=1.0)):
+            resumable_rxn_translation(
+                src_file=tmp_dir / "src.txt",
+                tgt_file=tmp_dir / "tgt.txt",
+                pred_file=tmp_dir / "pred.txt",
+                model="unused",
+                n_best=2,
+                beam_size=2,
+                batch_size=1,
+                gpu=False,
+                segment_size=2,
+            )
+
+        predictions = load_list_from_file(tmp_dir / "pred.txt")
+        assert predictions[::2] == ["CC.O", "CC.N", "C.CC"]
+        assert len(load_list_from_file(tmp_dir / "pred.txt.tokenized_log_probs")) == 6
+
+
+def test_deduplicated_translation_gives_identical_files() -> None:
+    with named_temporary_directory() as tmp_dir:
+        sources = ["CCO", "CCN", "CCO", "CCC", "CCN", "CCO"]
+        dump_list_to_file(sources, tmp_dir / "src.txt")
+
+        for deduplicate in [False, True]:
+            with use_translator(StandInTranslator()):
+                resumable_rxn_translation(
+                    src_file=tmp_dir / "src.txt",
+                    tgt_file=None,
+                    pred_file=tmp_dir / f"pred_{deduplicate}.txt",
+                    model="unused",
+                    n_best=3,
+                    beam_size=3,
+                    batch_size=1,
+                    gpu=False,
+                    segment_size=2,
+                    deduplicate=deduplicate,
+                )
+
+        for suffix in ["", ".tokenized_log_probs"]:
+            assert load_list_from_file(
+                tmp_dir / f"pred_True.txt{suffix}"
+            ) == load_list_from_file(tmp_dir / f"pred_False.txt{suffix}")
+        assert len(load_list_from_file(tmp_dir / "pred_True.txt")) == 18
+
+
+def test_get_translator(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv(TRANSLATOR_ENV_VAR, raising=False)
+    assert isinstance(get_translator(), OnmtTranslator)
+
+    monkeypatch.setenv(TRANSLATOR_ENV_VAR, "stand-in")
+    translator = get_translator()
+    assert isinstance(translator, StandInTranslator)
+    # Same instance, to remember the earlier predictions
+    assert get_translator() is translator
+
+    stand_in = StandInTranslator()
+    monkeypatch.setenv(TRANSLATOR_ENV_VAR, "onmt")
+    with use_translator(stand_in):
+        assert get_translator() is stand_in
+    assert isinstance(get_translator(), OnmtTranslator)
+
+    monkeypatch.setenv(TRANSLATOR_ENV_VAR, "unknown")
+    with pytest.raises(ValueError):
+        get_translator()
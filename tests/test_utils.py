@@ -1,9 +1,12 @@
+import numpy as np
 import pytest
 from rxn.utilities.files import dump_list_to_file, named_temporary_directory
 
 from rxn.metrics.utils import (
+    by_n,
     combine_precursors_and_products_from_files,
     get_sequence_multiplier,
+    match_matrix,
 )
 
 
@@ -52,3 +55,17 @@ def test_get_sequence_multiplier() -> None:
         _ = get_sequence_multiplier([], [1, 2, 3])
     with pytest.raises(ValueError):
         _ = get_sequence_multiplier([1, 2, 3], [])
+
+
+def test_match_matrix() -> None:
+    matches = match_matrix(["A", "B"], ["A", "C", "D", "B"])
+    assert matches.tolist() == [[True, False], [False, True]]
+
+    with pytest.raises(ValueError):
+        match_matrix(["A", "B"], ["A", "C", "D"])
+
+
+def test_by_n() -> None:
+    assert by_n(np.array([0.25, 0.5, 1.0])) == {1: 0.25, 2: 0.5, 3: 1.0}
+    assert all(type(v) is float for v in by_n(np.array([1, 2])).values())
+    assert by_n([]) == {}